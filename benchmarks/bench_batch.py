@@ -0,0 +1,83 @@
+#! /usr/bin/env python3
+"""Benchmark the columnar batch analysis (see the batch module; requires
+NumPy): write a corpus of synthetic ISO 9660, UDF and hybrid images, and
+compare the rows per second of batch.analyzeBatch with those of the scalar
+path (processImage, and conversion of each result to a row). The images are
+read once before timing, so both paths read them from the page cache.
+
+Usage: python benchmarks/bench_batch.py [--images N] [--repeat N]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+# Root dir of isolyzer repo
+ISOLYZER_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ISOLYZER_DIR)
+sys.path.insert(0, os.path.join(ISOLYZER_DIR, "benchmarks"))
+
+from isolyzer import batch
+from isolyzer import isolyzer
+from synthimage import ImageBuilder
+
+MB = 1024 ** 2
+
+
+def writeCorpus(directory, images):
+    """Write images synthetic images (in equal numbers of ISO 9660, UDF and
+    ISO 9660 / UDF images, a quarter of them truncated) to directory, and
+    return list of their paths
+    """
+    builders = [ImageBuilder(64 * MB).addISO9660(), ImageBuilder(64 * MB).addUDF(),
+                ImageBuilder(64 * MB).addISO9660().addUDF()]
+    paths = []
+    for variant, builder in enumerate(builders):
+        share = images // len(builders)
+        for truncate, number in ((None, share - share // 4), (32 * MB, share // 4)):
+            variantPaths = [os.path.join(directory, "image%d_%s_%06d.iso" %
+                                         (variant, truncate, i)) for i in range(number)]
+            builder.writeCopies(variantPaths, truncate)
+            paths += variantPaths
+    return paths
+
+
+def scalarRows(paths):
+    """Analyse images with processImage, and return their rows"""
+    return [batch.resultRow(isolyzer.processImage(path, 0)) for path in paths]
+
+
+def main():
+    """Run benchmark"""
+    parser = argparse.ArgumentParser(description="Benchmark columnar batch analysis")
+    parser.add_argument('--images', type=int, default=3000,
+                        help="number of images in the corpus")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="number of repetitions per path")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tempDir:
+        paths = writeCorpus(tempDir, args.images)
+        columns = batch.analyzeBatch(paths)
+        print("%d images, %d on the fast path" % (len(paths), len(paths) -
+                                                   columns["scalar"].sum()))
+        print("%-10s %10s %12s %10s" % ("path", "time (s)", "rows/s", "speedup"))
+        reference = None
+        for name, run in (("scalar", scalarRows), ("batch", batch.analyzeBatch)):
+            best = None
+            for _ in range(args.repeat):
+                startTime = time.perf_counter()
+                run(paths)
+                elapsed = time.perf_counter() - startTime
+                if best is None or elapsed < best:
+                    best = elapsed
+            if reference is None:
+                reference = best
+            print("%-10s %10.3f %12.0f %10.2f" % (name, best, len(paths) / best,
+                                                  reference / best))
+
+
+if __name__ == "__main__":
+    main()
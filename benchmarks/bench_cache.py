@@ -0,0 +1,76 @@
+#! /usr/bin/env python3
+"""Benchmark the result cache: fill a cache with a number of entries (100000
+by default), and report the cost per image of a cache hit (stat plus lookup
+and decoding of the stored result), compared with a full analysis of the
+same image.
+
+Usage: python benchmarks/bench_cache.py [NUMBER_OF_ENTRIES]
+"""
+
+import os
+import sys
+import glob
+import time
+import tempfile
+import collections
+
+# Root dir of isolyzer repo
+ISOLYZER_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ISOLYZER_DIR)
+
+from isolyzer import isolyzer
+from isolyzer import cache as rc
+
+# Fake stat result for synthetic cache entries
+FakeStat = collections.namedtuple("FakeStat", ["st_dev", "st_ino", "st_size", "st_mtime_ns"])
+
+
+def main():
+    """Run benchmark"""
+    noEntries = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    images = sorted(glob.glob(os.path.join(ISOLYZER_DIR, "testFiles", "*.iso")))
+    template = isolyzer.processImage(images[0], 0)
+
+    with tempfile.TemporaryDirectory() as tempDir:
+        dbFile = os.path.join(tempDir, "cache.db")
+        with rc.ResultCache(dbFile, isolyzer.__version__) as cache:
+            startTime = time.perf_counter()
+            for i in range(noEntries):
+                fakeStat = FakeStat(1, i, 2048 * i, 10 ** 18 + i)
+                cache.store(fakeStat, 0, "/archive/image%d.iso" % i, template)
+            cache.commit()
+            fillTime = time.perf_counter() - startTime
+            for image in images:
+                isolyzer.processImage(image, 0, cache=cache)
+
+        print("entries: %d, database size: %.1f MB, fill time: %.2f s" %
+              (noEntries, os.path.getsize(dbFile) / 1e6, fillTime))
+
+        with rc.ResultCache(dbFile, isolyzer.__version__) as cache:
+            rounds = max(1, 2000 // len(images))
+            startTime = time.perf_counter()
+            for _ in range(rounds):
+                for image in images:
+                    isolyzer.processImage(image, 0, cache=cache)
+            hitTime = (time.perf_counter() - startTime) / (rounds * len(images))
+
+            startTime = time.perf_counter()
+            for i in range(0, noEntries, max(1, noEntries // 2000)):
+                cache.lookup(FakeStat(1, i, 2048 * i, 10 ** 18 + i), 0)
+            lookups = len(range(0, noEntries, max(1, noEntries // 2000)))
+            lookupTime = (time.perf_counter() - startTime) / lookups
+            print("hits: %d, misses: %d" % (cache.hits, cache.misses))
+
+    startTime = time.perf_counter()
+    for _ in range(rounds):
+        for image in images:
+            isolyzer.processImage(image, 0)
+    analysisTime = (time.perf_counter() - startTime) / (rounds * len(images))
+
+    print("lookup only:            %8.1f us/image" % (lookupTime * 1e6))
+    print("processImage, hit:      %8.1f us/image" % (hitTime * 1e6))
+    print("processImage, no cache: %8.1f us/image" % (analysisTime * 1e6))
+
+
+if __name__ == "__main__":
+    main()
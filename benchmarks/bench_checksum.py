@@ -0,0 +1,80 @@
+#! /usr/bin/env python3
+"""Benchmark whole-image checksums: compare the throughput of a plain
+sequential read of an image, of the Checksummer with the requested
+algorithms, and of processImage with checksums. When hashing keeps up
+with the disk, the last two are close to the first. If no image is given,
+a file of random data is used (which is then most likely in the page
+cache, so this measures CPU rather than disk bandwidth).
+
+Usage: python benchmarks/bench_checksum.py [--algorithms md5,sha1,sha256] [--size MB] [IMAGE]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+# Root dir of isolyzer repo
+ISOLYZER_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ISOLYZER_DIR)
+
+from isolyzer import isolyzer
+from isolyzer import checksum
+from isolyzer import model
+
+
+def readThroughput(image):
+    """Return MB/s of plain sequential read of image"""
+    buffer = bytearray(checksum.CHUNK_SIZE)
+    startTime = time.perf_counter()
+    with open(image, "rb", buffering=0) as f:
+        while f.readinto(buffer):
+            pass
+    return os.path.getsize(image) / 1e6 / (time.perf_counter() - startTime)
+
+
+def checksumThroughput(image, algorithms):
+    """Return MB/s of Checksummer"""
+    startTime = time.perf_counter()
+    checksummer = checksum.Checksummer(image, algorithms)
+    checksummer.start()
+    checksummer.digests()
+    return os.path.getsize(image) / 1e6 / (time.perf_counter() - startTime)
+
+
+def processThroughput(image, algorithms):
+    """Return MB/s of processImage with checksums"""
+    startTime = time.perf_counter()
+    isolyzer.processImage(image, 0, options=model.AnalysisOptions(checksums=algorithms))
+    return os.path.getsize(image) / 1e6 / (time.perf_counter() - startTime)
+
+
+def main():
+    """Run benchmark"""
+    argParser = argparse.ArgumentParser()
+    argParser.add_argument("image", nargs="?")
+    argParser.add_argument("--algorithms", default="md5,sha1,sha256")
+    argParser.add_argument("--size", type=int, default=256)
+    args = argParser.parse_args()
+    algorithms = checksum.parseAlgorithms(args.algorithms)
+
+    with tempfile.TemporaryDirectory() as tempDir:
+        image = args.image
+        if image is None:
+            image = os.path.join(tempDir, "random.iso")
+            with open(image, "wb") as f:
+                for _ in range(args.size):
+                    f.write(os.urandom(1024 * 1024))
+
+        print("image: %s (%.1f MB), algorithms: %s" %
+              (image, os.path.getsize(image) / 1e6, ",".join(algorithms)))
+        print("sequential read:           %8.1f MB/s" % readThroughput(image))
+        for name in algorithms:
+            print("checksummer, %-13s %8.1f MB/s" % (name + ":", checksumThroughput(image, [name])))
+        print("checksummer, all:          %8.1f MB/s" % checksumThroughput(image, algorithms))
+        print("processImage + checksums:  %8.1f MB/s" % processThroughput(image, algorithms))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#! /usr/bin/env python3
+"""Benchmark per-image serialisation cost of the available output formats,
+compared against the former writeElement path (ElementTree to string,
+minidom re-parse and toprettyxml; the conversion of the image records to
+elements is not included in its timing).
+
+Usage: python benchmarks/bench_formats.py [--repeat N]
+"""
+
+import io
+import os
+import sys
+import glob
+import timeit
+import argparse
+import xml.etree.ElementTree as ET
+from xml.dom import minidom
+
+# Root dir of isolyzer repo
+ISOLYZER_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ISOLYZER_DIR)
+
+from isolyzer import isolyzer
+from isolyzer import model
+from isolyzer import writers
+
+
+def minidomWrite(images, codec):
+    """Former writeElement path: one tree, serialised, re-parsed by minidom
+    and pretty-printed
+    """
+    root = ET.Element("isolyzer")
+    for image in images:
+        root.append(image)
+    xmlOut = ET.tostring(root, 'unicode', 'xml')
+    codec.write(minidom.parseString(xmlOut).toprettyxml('    '))
+
+
+def streamWrite(images, codec, outputFormat):
+    """Streaming writer path for outputFormat"""
+    writer = writers.writerClasses[outputFormat](codec)
+    root = ET.Element("isolyzer")
+    toolInfo = model.ToolInfo("isolyzer", isolyzer.__version__)
+    writer.start(root, toolInfo)
+    for image in images:
+        writer.writeImage(image)
+    writer.end()
+
+
+def main():
+    """Run benchmark"""
+    parser = argparse.ArgumentParser(description="Benchmark output serialisation cost")
+    parser.add_argument('--repeat', type=int, default=20,
+                        help="number of repetitions per format")
+    args = parser.parse_args()
+
+    testFiles = sorted(glob.glob(os.path.join(ISOLYZER_DIR, "testFiles", "*.iso")))
+    results = [isolyzer.processImage(image, 0) for image in testFiles]
+
+    def run(function, images, *fArgs):
+        """Time function on images, and return serialisation time per image
+        in microseconds
+        """
+        times = []
+        for _ in range(args.repeat):
+            codec = io.StringIO()
+            times.append(timeit.timeit(lambda: function(images, codec, *fArgs), number=1))
+        return 1e6 * min(times) / len(results)
+
+    reference = run(minidomWrite, [result.toElement() for result in results])
+    print("%-18s %14s %10s" % ("path", "us per image", "relative"))
+    print("%-18s %14.1f %10.2f" % ("writeElement (old)", reference, 1.0))
+    for outputFormat in sorted(writers.writerClasses):
+        perImage = run(streamWrite, results, outputFormat)
+        print("%-18s %14.1f %10.2f" % (outputFormat, perImage, perImage / reference))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#! /usr/bin/env python3
+"""Benchmark throughput of processImages for different numbers of worker
+processes. The images in the testFiles directory are replicated (as hard links
+where possible) to a temporary directory until the requested number of images
+is reached.
+
+Usage: python benchmarks/bench_jobs.py [--images N] [--jobs 1,2,4,8]
+"""
+
+import os
+import sys
+import time
+import glob
+import shutil
+import argparse
+import tempfile
+
+# Root dir of isolyzer repo
+ISOLYZER_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ISOLYZER_DIR)
+
+from isolyzer import isolyzer
+
+
+class DevNull:
+    """Stand-in for sys.stdout that discards all output"""
+    def __init__(self):
+        self.buffer = open(os.devnull, "wb")
+
+
+def replicateTestFiles(outDir, noImages):
+    """Replicate test files to outDir until noImages images exist, and return
+    list of image paths
+    """
+    testFiles = sorted(glob.glob(os.path.join(ISOLYZER_DIR, "testFiles", "*.iso")))
+    images = []
+    for i in range(noImages):
+        src = testFiles[i % len(testFiles)]
+        dst = os.path.join(outDir, "%06d_%s" % (i, os.path.basename(src)))
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copyfile(src, dst)
+        images.append(dst)
+    return images
+
+
+def timeRun(images, jobs):
+    """Run processImages on images with jobs workers, and return wall time"""
+    stdout = sys.stdout
+    sys.stdout = DevNull()
+    try:
+        start = time.perf_counter()
+        isolyzer.processImages(images, 0, jobs)
+        elapsed = time.perf_counter() - start
+    finally:
+        sys.stdout.buffer.close()
+        sys.stdout = stdout
+    return elapsed
+
+
+def main():
+    """Run benchmark"""
+    parser = argparse.ArgumentParser(description="Benchmark processImages --jobs scaling")
+    parser.add_argument('--images', type=int, default=5000,
+                        help="number of images in replicated corpus")
+    parser.add_argument('--jobs', type=str,
+                        default=",".join(str(2**i) for i in range(6) if 2**i <= (os.cpu_count() or 1)),
+                        help="comma-separated list of job counts")
+    args = parser.parse_args()
+
+    jobCounts = [int(j) for j in args.jobs.split(",")]
+
+    with tempfile.TemporaryDirectory() as tmpDir:
+        images = replicateTestFiles(tmpDir, args.images)
+        baseline = None
+        print("%6s %10s %12s %8s" % ("jobs", "time (s)", "images/s", "speedup"))
+        for jobs in jobCounts:
+            elapsed = timeRun(images, jobs)
+            if baseline is None:
+                baseline = elapsed
+            print("%6d %10.3f %12.1f %8.2f" % (jobs, elapsed, len(images) / elapsed,
+                                             baseline / elapsed))
+
+
+if __name__ == "__main__":
+    main()
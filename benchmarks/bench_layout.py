@@ -0,0 +1,69 @@
+#! /usr/bin/env python3
+"""Microbenchmark of the descriptor layouts: for each descriptor type, time
+unpacking all fields with the compiled struct (fast path), with per-field
+slicing and byteconv conversion (the slow path, which is equivalent to how
+descriptors used to be parsed), and the complete parse function (including
+the creation of the descriptor record).
+
+Usage: python benchmarks/bench_layout.py [NUMBER_OF_ITERATIONS]
+"""
+
+import os
+import sys
+import timeit
+
+# Root dir of isolyzer repo
+ISOLYZER_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ISOLYZER_DIR)
+
+from isolyzer import iso9660 as iso
+from isolyzer import hsf
+from isolyzer import udf
+from isolyzer import apple
+
+
+def readBytes(fileName, offset, length):
+    """Read length bytes from offset in test file"""
+    with open(os.path.join(ISOLYZER_DIR, "testFiles", fileName), "rb") as f:
+        f.seek(offset)
+        return f.read(length)
+
+
+# (name, layout, parse function, descriptor data)
+descriptors = [
+    ("primaryVolumeDescriptor", iso.primaryVolumeDescriptorLayout,
+     iso.parsePrimaryVolumeDescriptor, readBytes("iso9660.iso", 32768, 2048)),
+    ("sfsVolumeDescriptor", hsf.sfsVolumeDescriptorLayout,
+     hsf.parseSFSVolumeDescriptor, readBytes("iso9660.iso", 32768, 2048)),
+    ("logicalVolumeDescriptor", udf.logicalVolumeDescriptorLayout,
+     udf.parseLogicalVolumeDescriptor, readBytes("udf.iso", 32768, 2048)),
+    ("logicalVolumeIntegrityDescriptor", udf.logicalVolumeIntegrityDescriptorLayout,
+     udf.parseLogicalVolumeIntegrityDescriptor, readBytes("udf.iso", 32768, 2048)),
+    ("partitionDescriptor", udf.partitionDescriptorLayout,
+     udf.parsePartitionDescriptor, readBytes("udf.iso", 32768, 2048)),
+    ("appleZeroBlock", apple.zeroBlockLayout,
+     apple.parseZeroBlock, readBytes("hfs.iso", 0, 512)),
+    ("applePartitionMap", apple.partitionMapLayout,
+     apple.parsePartitionMap, readBytes("hfs.iso", 512, 512)),
+    ("masterDirectoryBlock", apple.masterDirectoryBlockLayout,
+     apple.parseMasterDirectoryBlock, readBytes("hfs.iso", 1024, 512)),
+    ("hfsPlusVolumeheader", apple.hfsPlusVolumeHeaderLayout,
+     apple.parseHFSPlusVolumeHeader, readBytes("hfs.iso", 1024, 512))
+]
+
+
+def main():
+    """Run benchmark"""
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    print("%-34s %6s %12s %12s %12s" % ("descriptor", "fields", "struct us",
+                                        "per-field us", "parse us"))
+    for name, layout, parse, data in descriptors:
+        fast = timeit.timeit(lambda: layout.unpack(data), number=number) / number
+        slow = timeit.timeit(lambda: layout.unpackFields(data), number=number) / number
+        full = timeit.timeit(lambda: parse(data), number=number) / number
+        print("%-34s %6d %12.2f %12.2f %12.2f" % (name, len(layout.fields), fast * 1e6,
+                                                  slow * 1e6, full * 1e6))
+
+
+if __name__ == "__main__":
+    main()
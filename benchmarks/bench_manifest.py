@@ -0,0 +1,74 @@
+#! /usr/bin/env python3
+"""Benchmark file manifests: write synthetic images with ISO 9660 directory
+hierarchies of increasing size (up to 400000 files by default), and report
+the time, read calls, bytes read and peak memory of listing all entries.
+The time per entry should stay roughly constant, and the peak memory
+should not grow with the number of files.
+
+Usage: python benchmarks/bench_manifest.py [MAXIMUM_NUMBER_OF_FILES]
+"""
+
+import os
+import sys
+import time
+import tempfile
+import tracemalloc
+
+# Root dir of isolyzer repo
+ISOLYZER_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ISOLYZER_DIR)
+sys.path.insert(0, os.path.join(ISOLYZER_DIR, "benchmarks"))
+
+from isolyzer import manifest
+from isolyzer import sectorreader as sr
+from synthimage import ImageBuilder
+
+# Files per directory in the synthetic hierarchies
+FILES_PER_DIRECTORY = 200
+
+
+def peakMemory(path):
+    """Return peak memory (in bytes) allocated while all entries in image
+    at path are listed
+    """
+    tracemalloc.start()
+    with sr.PReadReader(path) as reader:
+        for _ in manifest.iterManifest(reader):
+            pass
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    """Run benchmark"""
+    maxFiles = int(sys.argv[1]) if len(sys.argv) > 1 else 400000
+    noFiles = 12500
+    with tempfile.TemporaryDirectory() as tempDir:
+        path = os.path.join(tempDir, "tree.img")
+        print("%9s %8s %9s %10s %10s %12s" % ("entries", "time (s)", "us/entry",
+                                               "reads", "MB read", "peak MB"))
+        while noFiles <= maxFiles:
+            directories = noFiles // FILES_PER_DIRECTORY
+            ImageBuilder(16 * 1024 ** 3).addISO9660(
+                directories=directories, filesPerDirectory=FILES_PER_DIRECTORY).write(path)
+            # Peak memory is measured separately, since tracing slows down
+            # the listing
+            best = None
+            for _ in range(3):
+                with sr.PReadReader(path) as reader:
+                    startTime = time.perf_counter()
+                    noEntries = sum(1 for _ in manifest.iterManifest(reader))
+                    listTime = time.perf_counter() - startTime
+                if best is None or listTime < best[0]:
+                    best = (listTime, reader)
+            listTime, reader = best
+            peak = peakMemory(path)
+            print("%9d %8.3f %9.2f %10d %10.1f %12.2f" %
+                  (noEntries, listTime, 1e6 * listTime / noEntries, reader.reads,
+                   reader.bytesRead / 1e6, peak / 1e6))
+            noFiles *= 2
+
+
+if __name__ == "__main__":
+    main()
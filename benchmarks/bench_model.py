@@ -0,0 +1,87 @@
+#! /usr/bin/env python3
+"""Benchmark per-image cost of analysis plus XML serialisation on a batch
+of small images (the test files, repeated): time, the number of memory
+blocks that are held by each result, and peak traced memory per image
+(traced with tracemalloc).
+
+Usage: python benchmarks/bench_model.py [NUMBER_OF_ROUNDS]
+"""
+
+import io
+import os
+import sys
+import glob
+import time
+import tracemalloc
+
+# Root dir of isolyzer repo
+ISOLYZER_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ISOLYZER_DIR)
+
+from isolyzer import isolyzer
+from isolyzer import writers
+
+
+def analyse(images):
+    """Analyse images, and return list of results"""
+    return [isolyzer.processImage(image, 0) for image in images]
+
+
+def serialise(results):
+    """Serialise results with the streaming XML writer"""
+    writer = writers.XMLWriter(io.StringIO())
+    for result in results:
+        writer.writeImage(result)
+
+
+def traceMemory(function, *args):
+    """Return (number of memory blocks held by the return value, peak traced
+    memory in bytes) of function(*args)
+    """
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        value = function(*args)
+        after = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    del value
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, "filename")
+                 if stat.count_diff > 0)
+    return blocks, peak
+
+
+def main():
+    """Run benchmark"""
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    images = sorted(glob.glob(os.path.join(ISOLYZER_DIR, "testFiles", "*.iso")))
+    batch = images * rounds
+
+    # Warm up page cache and imports
+    serialise(analyse(images))
+
+    startTime = time.perf_counter()
+    results = analyse(batch)
+    analysisTime = (time.perf_counter() - startTime) / len(batch)
+    startTime = time.perf_counter()
+    serialise(results)
+    serialisationTime = (time.perf_counter() - startTime) / len(batch)
+    del results
+
+    blocks, peakAnalysis = traceMemory(analyse, images)
+    results = analyse(images)
+    _, peakSerialisation = traceMemory(serialise, results)
+
+    print("images: %d" % len(batch))
+    print("%-15s %12s %14s %14s" % ("stage", "us per image", "result blocks",
+                                    "peak KiB/image"))
+    print("%-15s %12.1f %14.0f %14.1f" % ("analysis", analysisTime * 1e6, blocks / len(images),
+                                          peakAnalysis / 1024 / len(images)))
+    print("%-15s %12.1f %14s %14.1f" % ("serialisation", serialisationTime * 1e6, "",
+                                        peakSerialisation / 1024 / len(images)))
+    print("%-15s %12.1f" % ("total", (analysisTime + serialisationTime) * 1e6))
+
+
+if __name__ == "__main__":
+    main()
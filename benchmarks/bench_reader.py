@@ -0,0 +1,62 @@
+#! /usr/bin/env python3
+"""Benchmark I/O per image for the available sector readers: number of read
+calls, bytes read and wall time of processImage. For the mmap reader, the
+size of the mapping is reported as well, since page faults on the mapping
+(and the kernel's readahead on network file systems) can pull in far more
+data than the bytes that are actually inspected.
+
+Usage: python benchmarks/bench_reader.py [IMAGE ...]
+"""
+
+import os
+import sys
+import glob
+import time
+
+# Root dir of isolyzer repo
+ISOLYZER_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ISOLYZER_DIR)
+
+from isolyzer import isolyzer
+from isolyzer import sectorreader as sr
+
+
+class CountingReader:
+    """Wraps a reader class, and keeps the counters of the last reader
+    instance that was created
+    """
+    def __init__(self, readerClass):
+        self.readerClass = readerClass
+        self.lastReader = None
+
+    def __call__(self, filename):
+        self.lastReader = self.readerClass(filename)
+        return self.lastReader
+
+
+def main():
+    """Run benchmark"""
+    images = sys.argv[1:] or sorted(glob.glob(os.path.join(ISOLYZER_DIR, "testFiles", "*.iso")))
+
+    print("%-8s %12s %12s %14s %12s" % ("reader", "reads/image", "bytes/image",
+                                        "mapped/image", "us/image"))
+    for name, readerClass in sorted(sr.readerClasses.items()):
+        counting = CountingReader(readerClass)
+        reads = 0
+        bytesRead = 0
+        mapped = 0
+        start = time.perf_counter()
+        for image in images:
+            isolyzer.processImage(image, 0, counting)
+            reads += counting.lastReader.reads
+            bytesRead += counting.lastReader.bytesRead
+            if name == "mmap":
+                mapped += counting.lastReader.size
+        elapsed = time.perf_counter() - start
+        noImages = len(images)
+        print("%-8s %12.1f %12.0f %14.0f %12.1f" % (name, reads / noImages, bytesRead / noImages,
+                                                   mapped / noImages, 1e6 * elapsed / noImages))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+#! /usr/bin/env python3
+"""Load test of isolyzer server mode: a number of client threads send
+analysis requests for batches of test files for a fixed duration, each over
+its own keep-alive connection, and the request rate and p50/p99 latency of
+successful requests are reported, along with the number of requests that the
+server refused because its queue limit was reached.
+
+Unless an existing server is given with --socket or --port, a local server
+is started on a temporary Unix domain socket (or on a free TCP port with
+--tcp) for the duration of the test.
+
+Usage: python benchmarks/bench_server.py [--clients 8] [--duration 10]
+    [--batch 1] [--format xml] [--jobs N] [--queue-limit N] [--tcp]
+    [--socket PATH | --port PORT]
+"""
+
+import os
+import re
+import sys
+import glob
+import math
+import time
+import argparse
+import tempfile
+import threading
+import subprocess
+
+# Root dir of isolyzer repo
+ISOLYZER_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ISOLYZER_DIR)
+
+from isolyzer import client as ic
+
+
+def percentile(values, fraction):
+    """Return percentile fraction (0-1) of sorted list values (nearest rank)"""
+    if not values:
+        return float("nan")
+    index = min(len(values) - 1, max(0, math.ceil(fraction * len(values)) - 1))
+    return values[index]
+
+
+def startServer(args, tempDir):
+    """Start local server as a subprocess, and return (process, socketPath,
+    port) tuple once it is accepting requests
+    """
+    command = [sys.executable, "-m", "isolyzer", "serve", "--queue-limit", str(args.queueLimit)]
+    if args.jobs is not None:
+        command += ["--jobs", str(args.jobs)]
+    if args.tcp:
+        command += ["--port", "0"]
+    else:
+        socketPath = os.path.join(tempDir, "isolyzer.sock")
+        command += ["--socket", socketPath]
+    process = subprocess.Popen(command, cwd=ISOLYZER_DIR, stderr=subprocess.PIPE,
+                               universal_newlines=True)
+    # The server reports its address once it is listening
+    line = process.stderr.readline()
+    if "serving on" not in line:
+        process.kill()
+        raise RuntimeError("server did not start: " + line + process.stderr.read())
+    sys.stderr.write(line)
+    if args.tcp:
+        return process, None, int(re.search(r":(\d+) ", line).group(1))
+    return process, socketPath, None
+
+
+def runClient(socketPath, port, batches, outputFormat, deadline, latencies, counts, lock):
+    """Send requests for batches (round robin) until deadline, and record the
+    latency of each successful request
+    """
+    client = ic.Client(socketPath, port, retries=0)
+    ownLatencies = []
+    rejected = 0
+    images = 0
+    i = 0
+    try:
+        while time.perf_counter() < deadline:
+            batch = batches[i % len(batches)]
+            i += 1
+            start = time.perf_counter()
+            try:
+                client.analyse(batch, outputFormat=outputFormat)
+            except ic.ServerError as ex:
+                if ex.status != 503:
+                    raise
+                rejected += 1
+                continue
+            ownLatencies.append(time.perf_counter() - start)
+            images += len(batch)
+    finally:
+        client.close()
+    with lock:
+        latencies.extend(ownLatencies)
+        counts["rejected"] += rejected
+        counts["images"] += images
+
+
+def main():
+    """Run load test"""
+    parser = argparse.ArgumentParser(description="Load test of isolyzer server mode")
+    parser.add_argument("--clients", type=int, default=8,
+                        help="number of concurrent clients (default: 8)")
+    parser.add_argument("--duration", type=float, default=10,
+                        help="duration of test in seconds (default: 10)")
+    parser.add_argument("--batch", type=int, default=1,
+                        help="number of images per request (default: 1)")
+    parser.add_argument("--format", choices=["xml", "json", "jsonl", "csv"], default="xml",
+                        dest="outputFormat", help="output format (default: xml)")
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="worker processes of local server (default: number of CPUs)")
+    parser.add_argument("--queue-limit", type=int, default=64, dest="queueLimit",
+                        help="queue limit of local server (default: 64)")
+    parser.add_argument("--tcp", action="store_true",
+                        help="start local server on TCP instead of a Unix domain socket")
+    parser.add_argument("--socket", type=str, default=None, dest="socketPath",
+                        help="test existing server on this Unix domain socket")
+    parser.add_argument("--port", type=int, default=None,
+                        help="test existing server on this TCP port of localhost")
+    args = parser.parse_args()
+
+    testFiles = sorted(glob.glob(os.path.join(ISOLYZER_DIR, "testFiles", "*.iso")))
+    batches = [[testFiles[(i + j) % len(testFiles)] for j in range(args.batch)]
+               for i in range(len(testFiles))]
+
+    with tempfile.TemporaryDirectory() as tempDir:
+        process = None
+        socketPath, port = args.socketPath, args.port
+        if socketPath is None and port is None:
+            process, socketPath, port = startServer(args, tempDir)
+        try:
+            # One request before measuring, so the workers are warm
+            ic.Client(socketPath, port).analyse(batches[0], outputFormat=args.outputFormat)
+
+            latencies = []
+            counts = {"rejected": 0, "images": 0}
+            lock = threading.Lock()
+            start = time.perf_counter()
+            deadline = start + args.duration
+            threads = [threading.Thread(target=runClient,
+                                        args=(socketPath, port, batches, args.outputFormat,
+                                              deadline, latencies, counts, lock))
+                       for _ in range(args.clients)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+    latencies.sort()
+    print("clients %d, batch %d, format %s, %.1f s" %
+          (args.clients, args.batch, args.outputFormat, elapsed))
+    print("%10s %10s %10s %10s %10s %10s" %
+          ("requests", "rejected", "req/s", "images/s", "p50 ms", "p99 ms"))
+    print("%10d %10d %10.1f %10.1f %10.2f %10.2f" %
+          (len(latencies), counts["rejected"], len(latencies) / elapsed,
+           counts["images"] / elapsed, 1000 * percentile(latencies, 0.5),
+           1000 * percentile(latencies, 0.99)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#! /usr/bin/env python3
+"""Benchmark the session scan: write a multisession image (filled with
+random data, so that it is not sparse) with its last session near the end,
+and compare the time of the session scan (with 1 and with several threads)
+to the time of a plain sequential read of the image. The pages of the image
+are dropped from the page cache before each run where the platform allows.
+
+Usage: python benchmarks/bench_sessions.py [IMAGE_SIZE_IN_MB]
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+# Root dir of isolyzer repo
+ISOLYZER_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ISOLYZER_DIR)
+sys.path.insert(0, os.path.join(ISOLYZER_DIR, "benchmarks"))
+
+from isolyzer import multisession
+from isolyzer import sectorreader as sr
+from synthimage import ImageBuilder, writeStructures
+
+MB = 1024 ** 2
+
+
+def writeImage(path, size):
+    """Write image of size bytes with random data and two sessions, the
+    second one in the last 4 MB
+    """
+    first = ImageBuilder(4 * MB).addISO9660("FIRST")
+    second = ImageBuilder(4 * MB, sessionStart=(size - 4 * MB) // 2048).addISO9660("SECOND")
+    block = os.urandom(multisession.SCAN_CHUNK_SIZE)
+    with open(path, "wb") as f:
+        for _ in range(size // len(block)):
+            f.write(block)
+    structures = first.structures() + [(second.sessionStart * 2048 + offset, data)
+                                       for offset, data in second.structures()]
+    with open(path, "r+b") as f:
+        for offset, data in structures:
+            f.seek(offset)
+            f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def dropCache(path):
+    """Drop pages of path from the page cache (if possible)"""
+    if hasattr(os, "posix_fadvise"):
+        fd = os.open(path, os.O_RDONLY)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        os.close(fd)
+
+
+def sequentialRead(path):
+    """Read image sequentially, and return number of bytes read"""
+    total = 0
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            data = f.read(multisession.SCAN_CHUNK_SIZE)
+            if not data:
+                return total
+            total += len(data)
+
+
+def scan(path, jobs):
+    """Scan image for sessions, and return number of bytes read"""
+    with sr.PReadReader(path) as reader:
+        sessions = multisession.findSessions(reader, jobs=jobs)
+        assert len(sessions) == 2
+        return reader.bytesRead
+
+
+def main():
+    """Run benchmark"""
+    size = (int(sys.argv[1]) if len(sys.argv) > 1 else 1024) * MB
+    with tempfile.TemporaryDirectory() as tempDir:
+        path = os.path.join(tempDir, "disc.iso")
+        writeImage(path, size)
+        print("%-22s %8s %10s %8s" % ("method", "time (s)", "MB/s", "MB read"))
+        runs = [("sequential read", lambda: sequentialRead(path))]
+        for jobs in (1, multisession.SCAN_THREADS):
+            runs.append(("scan, %d thread%s" % (jobs, "s" if jobs > 1 else ""),
+                         lambda jobs=jobs: scan(path, jobs)))
+        for name, run in runs:
+            best = None
+            for _ in range(3):
+                dropCache(path)
+                startTime = time.perf_counter()
+                bytesRead = run()
+                elapsed = time.perf_counter() - startTime
+                if best is None or elapsed < best:
+                    best = elapsed
+            print("%-22s %8.3f %10.1f %8.1f" % (name, best, size / MB / best, bytesRead / MB))
+
+
+if __name__ == "__main__":
+    main()
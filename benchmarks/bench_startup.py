@@ -0,0 +1,106 @@
+#! /usr/bin/env python3
+"""Cold-start benchmark: measures, in fresh interpreter processes, the
+import time of isolyzer.isolyzer (from `python -X importtime`) and the wall
+time of a single-image command line run, with the start-up time of a bare
+interpreter for reference. Also lists the modules that a single-image run
+imports from a set of modules that only some runs need.
+
+The script exits with status 1 if the median import time of
+isolyzer.isolyzer exceeds the budget, so it can be used to catch start-up
+time regressions (the default budget leaves some headroom on a typical
+workstation; pass a budget that suits the machine that runs the check).
+
+Usage: python benchmarks/bench_startup.py [--runs 20] [--budget 25] [IMAGE]
+"""
+
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+import time
+
+# Root dir of isolyzer repo
+ISOLYZER_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+# Default import time budget of isolyzer.isolyzer, in milliseconds
+DEFAULT_BUDGET = 25
+
+# Modules that a single-image run on an ISO 9660 image with XML output
+# should not need (re is not on the list, as argparse needs it)
+OPTIONAL_MODULES = ["concurrent.futures", "csv", "glob", "json", "platform", "sqlite3",
+                    "hashlib", "queue", "isolyzer.cache", "isolyzer.checksum",
+                    "isolyzer.hsf", "isolyzer.apple", "isolyzer.compressed",
+                    "xml.dom.minidom"]
+
+# Script that runs isolyzer on one image, and writes the names of all
+# imported modules to stderr
+LIST_MODULES = """
+import sys
+sys.argv = ["isolyzer", sys.argv[1]]
+from isolyzer import isolyzer
+isolyzer.main()
+sys.stderr.write("\\n".join(sorted(sys.modules)))
+"""
+
+
+def run(args):
+    """Run python with args in repo dir, and return (wall time, stderr)"""
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable] + args, cwd=ISOLYZER_DIR,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                            universal_newlines=True, check=True)
+    return time.perf_counter() - start, result.stderr
+
+
+def importTime(module):
+    """Return cumulative import time of module in seconds, as reported by
+    python -X importtime in a fresh process
+    """
+    _, stderr = run(["-X", "importtime", "-c", "import " + module])
+    for line in stderr.splitlines():
+        fields = line.split("|")
+        if len(fields) == 3 and fields[2].strip() == module:
+            return int(fields[1]) / 1e6
+    raise RuntimeError("no import time reported for " + module)
+
+
+def main():
+    """Run benchmark"""
+    parser = argparse.ArgumentParser(description="Cold-start benchmark of isolyzer")
+    parser.add_argument("image", nargs="?",
+                        default=os.path.join(ISOLYZER_DIR, "testFiles", "iso9660.iso"),
+                        help="image used for single-image runs")
+    parser.add_argument("--runs", type=int, default=20,
+                        help="number of runs of each measurement (default: 20)")
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET,
+                        help="import time budget of isolyzer.isolyzer in ms (default: %d)" %
+                        DEFAULT_BUDGET)
+    args = parser.parse_args()
+
+    imports = [importTime("isolyzer.isolyzer") for _ in range(args.runs)]
+    bare = [run(["-c", "pass"])[0] for _ in range(args.runs)]
+    single = [run(["-m", "isolyzer", args.image])[0] for _ in range(args.runs)]
+
+    print("%-36s %10s %10s" % ("measurement", "median ms", "min ms"))
+    for name, values in [("import isolyzer.isolyzer", imports),
+                         ("python -c pass", bare),
+                         ("isolyzer single image", single)]:
+        print("%-36s %10.1f %10.1f" % (name, 1000 * statistics.median(values),
+                                       1000 * min(values)))
+
+    _, stderr = run(["-c", LIST_MODULES, args.image])
+    modules = set(stderr.splitlines())
+    loaded = [name for name in OPTIONAL_MODULES if name in modules]
+    print("optional modules imported by single-image run: %s" %
+          (", ".join(loaded) if loaded else "none"))
+
+    median = 1000 * statistics.median(imports)
+    if median > args.budget:
+        print("FAIL: import time %.1f ms exceeds budget of %.1f ms" % (median, args.budget))
+        sys.exit(1)
+    print("OK: import time %.1f ms within budget of %.1f ms" % (median, args.budget))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,381 @@
+#! /usr/bin/env python3
+"""Reproducible benchmark suite on synthetic images
+
+Builds a fixed set of synthetic images with the synthimage module (sparse
+multi-GB images of each file system and hybrid, long descriptor chains, a
+large Apple Partition Map, a truncated image, and a corpus of many small
+images), and measures for each scenario the per-image latency (mean, p50 and
+p99), throughput in images/s, peak RSS, and the number of read calls and
+bytes read per image. Single-image scenarios call processImage repeatedly on
+the same image; the corpus scenario runs processImages (with --jobs worker
+processes, and the report written to the null device) over all of its
+images. Each scenario is measured in several rounds, of which the best is
+reported. Every scenario runs in a fresh interpreter process, so its peak RSS
+is not inflated by earlier scenarios. The images are in the page cache, so
+the timings measure the parsing and system call overhead, not disk I/O.
+
+Results can be stored as a JSON baseline with --save-baseline, and compared
+against a stored baseline with --compare. A scenario regresses if a timing or
+memory metric is worse than the baseline by more than the tolerance (three
+times the tolerance for the p99 latency), or if
+it reads more bytes or makes more read calls than the baseline (these
+counts do not depend on the machine). The script exits with status 1 if any
+scenario regresses.
+
+Usage: python benchmarks/bench_suite.py [--scenarios NAME,...] [--repeat 1000]
+    [--rounds 5] [--round-time 1] [--corpus-size 10000] [--jobs 1] [--work-dir DIR]
+    [--save-baseline FILE] [--compare FILE] [--tolerance 0.15] [--list]
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+
+# Root dir of isolyzer repo
+ISOLYZER_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ISOLYZER_DIR)
+
+from isolyzer import isolyzer
+from isolyzer import perf
+
+from synthimage import ImageBuilder
+
+# Version of the baseline file format
+BASELINE_FORMAT = 1
+
+KB = 1024
+MB = 1024 ** 2
+GB = 1024 ** 3
+
+# Scenarios: name -> (function that returns an ImageBuilder, truncated size
+# or None, True for the corpus scenario)
+SCENARIOS = {
+    "iso9660-4g": (lambda: ImageBuilder(4 * GB).addISO9660(), None, False),
+    "hsf-650m": (lambda: ImageBuilder(650 * MB).addHighSierra(), None, False),
+    "udf-25g": (lambda: ImageBuilder(25 * GB).addUDF(revision=3), None, False),
+    "iso9660-udf-8g": (lambda: ImageBuilder(8 * GB).addISO9660().addUDF(), None, False),
+    "iso9660-udf-hfsplus-8g": (lambda: ImageBuilder(8 * GB).addISO9660().addUDF().addHFSPlus(),
+                               None, False),
+    "iso9660-apm-hfs-1g": (lambda: ImageBuilder(GB).addISO9660().addApplePartitionMap(2048),
+                           None, False),
+    "hfs-1g": (lambda: ImageBuilder(GB).addHFS(), None, False),
+    "hfsplus-64g": (lambda: ImageBuilder(64 * GB).addHFSPlus(), None, False),
+    "iso9660-chain-2000": (lambda: ImageBuilder(4 * GB).addISO9660(supplementary=2000),
+                           None, False),
+    "udf-vds-chain-100": (lambda: ImageBuilder(8 * GB).addUDF(implementationUseDescriptors=100),
+                          None, False),
+    "apple-map-10000": (lambda: ImageBuilder(GB).addApplePartitionMap(partitionEntries=10000),
+                        None, False),
+    "iso9660-truncated": (lambda: ImageBuilder(4 * GB).addISO9660().addUDF(), 1 * MB, False),
+    "tiny-corpus": (None, None, True),
+}
+
+# Small images that make up the corpus scenario (used in turn)
+CORPUS_BUILDERS = [
+    lambda: ImageBuilder(600 * KB).addISO9660(),
+    lambda: ImageBuilder(600 * KB).addISO9660().addUDF(),
+    lambda: ImageBuilder(600 * KB).addHighSierra(),
+    lambda: ImageBuilder(600 * KB).addUDF(),
+    lambda: ImageBuilder(600 * KB).addHFSPlus(),
+    lambda: ImageBuilder(600 * KB).addISO9660().addHFS(),
+]
+
+# Metrics: (whether higher values are better, multiple of the tolerance
+# that is allowed). Tail latencies are noisier than the rest, and the I/O
+# counts are deterministic, so they must not increase at all
+METRICS = {
+    "latencyMean": (False, 1),
+    "latencyP50": (False, 1),
+    "latencyP99": (False, 3),
+    "imagesPerSecond": (True, 1),
+    "peakRSS": (False, 1),
+    "readsPerImage": (False, 0),
+    "bytesReadPerImage": (False, 0),
+}
+
+
+class DevNull:
+    """Stand-in for sys.stdout that discards all output"""
+    def __init__(self):
+        self.buffer = open(os.devnull, "wb")
+
+
+def percentile(values, fraction):
+    """Return percentile fraction (0-1) of sorted list values (nearest rank)"""
+    if not values:
+        return float("nan")
+    index = min(len(values) - 1, max(0, math.ceil(fraction * len(values)) - 1))
+    return values[index]
+
+
+def peakRSS():
+    """Return peak resident set size of this process (or of its worker
+    processes, if that is higher) in bytes, or None if this cannot be
+    established
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in bytes on macOS, and in kilobytes elsewhere
+    scale = 1 if sys.platform == "darwin" else 1024
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    # On Linux ru_maxrss survives exec, so it includes the parent process
+    # that started this one; VmHWM does not
+    try:
+        with open("/proc/self/status", "r", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    peak = int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return max(peak, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale)
+
+
+def buildScenario(name, workDir, corpusSize):
+    """Write the images of scenario name to workDir, and return list of
+    image paths
+    """
+    factory, truncate, corpus = SCENARIOS[name]
+    if not corpus:
+        path = os.path.join(workDir, name + ".img")
+        factory().write(path, truncate)
+        return [path]
+    corpusDir = os.path.join(workDir, name)
+    os.makedirs(corpusDir, exist_ok=True)
+    paths = [os.path.join(corpusDir, "%06d.img" % i) for i in range(corpusSize)]
+    for i, builder in enumerate(CORPUS_BUILDERS):
+        builder().writeCopies(paths[i::len(CORPUS_BUILDERS)])
+    return paths
+
+
+def summarise(latencies, wallTime, reads, bytesRead):
+    """Return dictionary with metrics of a run"""
+    images = len(latencies)
+    latencies = sorted(latencies)
+    return {"images": images,
+            "latencyMean": sum(latencies) / images,
+            "latencyP50": percentile(latencies, 0.5),
+            "latencyP99": percentile(latencies, 0.99),
+            "imagesPerSecond": images / wallTime,
+            "peakRSS": peakRSS(),
+            "readsPerImage": reads / images,
+            "bytesReadPerImage": bytesRead / images}
+
+
+def runSingle(path, repeat, rounds, roundTime):
+    """Call processImage repeat times on path (or for roundTime seconds, if
+    that is shorter, with a minimum of 5 calls) in each of rounds rounds, and
+    return metrics of the round with the lowest mean latency
+    """
+    # Warm-up call, which also loads the parser modules
+    isolyzer.processImage(path, 0)
+    best = None
+    for _ in range(rounds):
+        latencies = []
+        reads = 0
+        bytesRead = 0
+        start = time.perf_counter()
+        deadline = start + roundTime
+        for i in range(repeat):
+            if i >= 5 and time.perf_counter() > deadline:
+                break
+            profiler = perf.Profiler()
+            imageStart = time.perf_counter()
+            isolyzer.processImage(path, 0, profiler=profiler)
+            latencies.append(time.perf_counter() - imageStart)
+            reads += profiler.reads
+            bytesRead += profiler.bytesRead
+        metrics = summarise(latencies, time.perf_counter() - start, reads, bytesRead)
+        if best is None or metrics["latencyMean"] < best["latencyMean"]:
+            best = metrics
+    return best
+
+
+def runCorpus(paths, jobs, rounds):
+    """Run processImages on paths with jobs workers in each of rounds
+    rounds, and return metrics of the round with the highest throughput. The
+    latency of an image is the sum of its stage timings
+    """
+    best = None
+    for _ in range(rounds):
+        metrics = runProcessImages(paths, jobs)
+        if best is None or metrics["imagesPerSecond"] > best["imagesPerSecond"]:
+            best = metrics
+    return best
+
+
+def runProcessImages(paths, jobs):
+    """Run processImages once on paths with jobs workers, and return metrics"""
+    stdout = sys.stdout
+    with tempfile.TemporaryFile("w+") as profileFile:
+        sys.stdout = DevNull()
+        try:
+            start = time.perf_counter()
+            isolyzer.processImages(paths, 0, jobs, profileFile=profileFile)
+            wallTime = time.perf_counter() - start
+        finally:
+            sys.stdout.buffer.close()
+            sys.stdout = stdout
+        profileFile.seek(0)
+        records = [json.loads(line) for line in profileFile]
+    summary = records.pop()["summary"]
+    latencies = [sum(record["stages"].values()) for record in records]
+    return summarise(latencies, wallTime, summary["reads"], summary["bytesRead"])
+
+
+def runScenario(name, workDir, args):
+    """Run scenario name (whose images are in workDir) in a fresh process,
+    and return its metrics
+    """
+    command = [sys.executable, os.path.realpath(__file__), "--run", name,
+               "--work-dir", workDir, "--repeat", str(args.repeat),
+               "--corpus-size", str(args.corpusSize), "--jobs", str(args.jobs),
+               "--rounds", str(args.rounds), "--round-time", str(args.roundTime)]
+    result = subprocess.run(command, stdout=subprocess.PIPE, universal_newlines=True,
+                            check=True)
+    return json.loads(result.stdout)
+
+
+def compare(baseline, results, tolerance):
+    """Print comparison of results with baseline, and return list of
+    (scenario, metric) tuples that regressed
+    """
+    regressions = []
+    print("%-26s %-18s %14s %14s %8s" % ("scenario", "metric", "baseline", "current", "change"))
+    for name, metrics in results.items():
+        if name not in baseline["scenarios"]:
+            print("%-26s (not in baseline)" % name)
+            continue
+        reference = baseline["scenarios"][name]
+        for metric, (higherIsBetter, scale) in METRICS.items():
+            old, new = reference.get(metric), metrics.get(metric)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old if old else 0.0
+            worse = -change if higherIsBetter else change
+            limit = scale * tolerance
+            flag = ""
+            if worse > limit:
+                regressions.append((name, metric))
+                flag = "  REGRESSION"
+            print("%-26s %-18s %14.6g %14.6g %+7.1f%%%s" %
+                  (name, metric, old, new, 100 * change, flag))
+    return regressions
+
+
+def main():
+    """Run benchmark suite"""
+    parser = argparse.ArgumentParser(description="Benchmark suite on synthetic images")
+    parser.add_argument("--scenarios", type=str, default=",".join(SCENARIOS),
+                        help="comma-separated list of scenarios (default: all)")
+    parser.add_argument("--repeat", type=int, default=1000,
+                        help="calls of processImage per round of a single-image scenario "
+                        "(default: 1000)")
+    parser.add_argument("--rounds", type=int, default=5,
+                        help="measurement rounds per scenario; the best round is "
+                        "reported (default: 5)")
+    parser.add_argument("--round-time", type=float, default=1.0, dest="roundTime",
+                        help="maximum duration of a round of a single-image scenario in "
+                        "seconds (default: 1)")
+    parser.add_argument("--corpus-size", type=int, default=10000, dest="corpusSize",
+                        help="number of images in corpus scenario (default: 10000)")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="worker processes in corpus scenario (default: 1)")
+    parser.add_argument("--work-dir", type=str, default=None, dest="workDir",
+                        help="directory for the images (default: temporary directory); "
+                        "existing images in it are reused")
+    parser.add_argument("--save-baseline", type=str, default=None, dest="saveBaseline",
+                        help="store results as baseline in this JSON file")
+    parser.add_argument("--compare", type=str, default=None,
+                        help="compare results with baseline in this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="allowed relative regression of timing and memory metrics "
+                        "(default: 0.15)")
+    parser.add_argument("--list", action="store_true", help="list scenarios and exit")
+    parser.add_argument("--run", type=str, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.list:
+        print("\n".join(SCENARIOS))
+        return
+
+    if args.run is not None:
+        # Child process: the images were built by the parent
+        if SCENARIOS[args.run][2]:
+            corpusDir = os.path.join(args.workDir, args.run)
+            paths = sorted(os.path.join(corpusDir, name) for name in os.listdir(corpusDir))
+            metrics = runCorpus(paths[:args.corpusSize], args.jobs, args.rounds)
+        else:
+            metrics = runSingle(os.path.join(args.workDir, args.run + ".img"), args.repeat,
+                                args.rounds, args.roundTime)
+        sys.stdout.write(json.dumps(metrics))
+        return
+
+    names = [name for name in args.scenarios.split(",") if name]
+    for name in names:
+        if name not in SCENARIOS:
+            parser.error("unknown scenario: %s" % name)
+
+    baseline = None
+    if args.compare is not None:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    with tempfile.TemporaryDirectory() as tempDir:
+        workDir = args.workDir or tempDir
+        os.makedirs(workDir, exist_ok=True)
+        results = {}
+        print("%-26s %8s %10s %10s %10s %10s %8s %10s" %
+              ("scenario", "images", "mean ms", "p50 ms", "p99 ms", "images/s", "RSS MB",
+               "bytes/img"))
+        for name in names:
+            marker = os.path.join(workDir, name + ".done")
+            if not os.path.exists(marker):
+                buildScenario(name, workDir, args.corpusSize)
+                with open(marker, "w", encoding="utf-8") as f:
+                    f.write("%d\n" % args.corpusSize)
+                # Write back the new images first, so that this does not
+                # happen while the scenario is measured
+                if hasattr(os, "sync"):
+                    os.sync()
+            metrics = runScenario(name, workDir, args)
+            results[name] = metrics
+            rss = metrics["peakRSS"]
+            print("%-26s %8d %10.3f %10.3f %10.3f %10.1f %8s %10.0f" %
+                  (name, metrics["images"], 1000 * metrics["latencyMean"],
+                   1000 * metrics["latencyP50"], 1000 * metrics["latencyP99"],
+                   metrics["imagesPerSecond"], "-" if rss is None else "%.1f" % (rss / MB),
+                   metrics["bytesReadPerImage"]))
+
+    if args.saveBaseline is not None:
+        with open(args.saveBaseline, "w", encoding="utf-8") as f:
+            json.dump({"format": BASELINE_FORMAT,
+                       "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                       "isolyzer": isolyzer.__version__,
+                       "python": platform.python_version(),
+                       "platform": platform.platform(),
+                       "options": {"repeat": args.repeat, "rounds": args.rounds,
+                                   "roundTime": args.roundTime,
+                                   "corpusSize": args.corpusSize, "jobs": args.jobs},
+                       "scenarios": results}, f, indent=2)
+            f.write("\n")
+        print("baseline written to %s" % args.saveBaseline)
+
+    if baseline is not None:
+        print()
+        regressions = compare(baseline, results, args.tolerance)
+        if regressions:
+            print("FAIL: %d regressions" % len(regressions))
+            sys.exit(1)
+        print("OK: no regressions")
+
+
+if __name__ == "__main__":
+    main()
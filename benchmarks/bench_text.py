@@ -0,0 +1,75 @@
+#! /usr/bin/env python3
+"""Microbenchmark of text decoding on identifier fields from the test files:
+the former path (UTF-8 decoding, followed by a per-character Unicode
+category lookup to remove control characters), the textconv decoders
+without their LRU cache, and the textconv decoders (with cache, i.e. as
+used by the parsers for identifiers that recur across images).
+
+Usage: python benchmarks/bench_text.py [NUMBER_OF_ITERATIONS]
+"""
+
+import os
+import sys
+import timeit
+import unicodedata
+
+# Root dir of isolyzer repo
+ISOLYZER_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ISOLYZER_DIR)
+
+from isolyzer import textconv
+
+
+def readBytes(fileName, offset, length):
+    """Read length bytes from offset in test file"""
+    with open(os.path.join(ISOLYZER_DIR, "testFiles", fileName), "rb") as f:
+        f.seek(offset)
+        return f.read(length)
+
+
+def formerDecode(bytesData):
+    """Former bytesToText path, followed by strip"""
+    string = bytesData.decode(encoding="utf-8", errors="ignore")
+    allowedChars = ['\t', '\n', '\r']
+    return "".join(ch for ch in string if unicodedata.category(ch)[0] != "C" or
+                   ch in allowedChars).strip()
+
+
+def uncachedDstring(bytesData):
+    """dstringToText without the LRU cache"""
+    length = min(bytesData[-1], len(bytesData) - 1)
+    return textconv._cs0ToText.__wrapped__(bytesData[:length])
+
+
+# (name, uncached decoder, cached decoder, field data)
+fields = [
+    ("PVD volumeIdentifier", textconv._decodeText.__wrapped__, textconv.decodeText,
+     readBytes("iso9660.iso", 32768 + 40, 32)),
+    ("PVD systemIdentifier", textconv._decodeText.__wrapped__, textconv.decodeText,
+     readBytes("iso9660.iso", 32768 + 8, 32)),
+    ("PVD volumeSetIdentifier", textconv._decodeText.__wrapped__, textconv.decodeText,
+     readBytes("iso9660.iso", 32768 + 190, 128)),
+    ("PVD applicationIdentifier", textconv._decodeText.__wrapped__, textconv.decodeText,
+     readBytes("iso9660.iso", 32768 + 574, 128)),
+    ("LVD logicalVolumeIdentifier (8)", uncachedDstring, textconv.dstringToText,
+     readBytes("udf.iso", 21 * 2048 + 84, 128)),
+    ("LVD logicalVolumeIdentifier (16)", uncachedDstring, textconv.dstringToText,
+     readBytes("is9660_udf_imgburn.iso", 35 * 2048 + 84, 128)),
+]
+
+
+def main():
+    """Run benchmark"""
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    print("%-34s %10s %12s %10s %8s" % ("field", "former us", "uncached us",
+                                       "cached us", "speedup"))
+    for name, uncached, cached, data in fields:
+        former = timeit.timeit(lambda: formerDecode(data), number=number) / number
+        direct = timeit.timeit(lambda: uncached(data), number=number) / number
+        memoised = timeit.timeit(lambda: cached(data), number=number) / number
+        print("%-34s %10.2f %12.2f %10.2f %8.1f" % (name, former * 1e6, direct * 1e6,
+                                                   memoised * 1e6, former / memoised))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#! /usr/bin/env python3
+"""Benchmark triage mode: compare the per-image time of analysing and
+reporting the test files in full mode with that of the triage projection
+(see the projection module), for each output format, and for triage with
+only anomalies reported. Speedups are relative to full mode in the same
+output format.
+
+Usage: python benchmarks/bench_triage.py [--repeat N] [--copies N]
+"""
+
+import io
+import os
+import sys
+import glob
+import time
+import argparse
+import xml.etree.ElementTree as ET
+
+# Root dir of isolyzer repo
+ISOLYZER_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ISOLYZER_DIR)
+
+from isolyzer import isolyzer
+from isolyzer import model
+from isolyzer import projection
+from isolyzer import writers
+
+
+def analyseAndWrite(images, outputFormat, fields=None, anomaliesOnly=False):
+    """Analyse images and write their report in outputFormat (as
+    processImages does), and return number of images reported
+    """
+    writer = writers.writerClasses[outputFormat](io.StringIO(), fields=fields)
+    writer.start(ET.Element("isolyzer"), model.ToolInfo("isolyzer", isolyzer.__version__))
+    reported = 0
+    for image in images:
+        result = isolyzer.processImage(image, 0, options=model.AnalysisOptions(fields=fields))
+        if anomaliesOnly and not projection.isAnomaly(result):
+            continue
+        if fields is not None:
+            result = projection.projectResult(result, fields)
+        writer.writeImage(result)
+        reported += 1
+    writer.end()
+    return reported
+
+
+def main():
+    """Run benchmark"""
+    parser = argparse.ArgumentParser(description="Benchmark triage mode")
+    parser.add_argument('--repeat', type=int, default=5,
+                        help="number of repetitions per run")
+    parser.add_argument('--copies', type=int, default=50,
+                        help="number of times each test file is analysed per repetition")
+    args = parser.parse_args()
+
+    images = sorted(glob.glob(os.path.join(ISOLYZER_DIR, "testFiles", "*.iso"))) * args.copies
+
+    def run(*fArgs):
+        """Return best time per image in microseconds, and number of images
+        reported
+        """
+        best = None
+        for _ in range(args.repeat):
+            startTime = time.perf_counter()
+            reported = analyseAndWrite(images, *fArgs)
+            elapsed = time.perf_counter() - startTime
+            if best is None or elapsed < best:
+                best = elapsed
+        return 1e6 * best / len(images), reported
+
+    # Warm up (imports of parser modules)
+    analyseAndWrite(images[:len(images) // args.copies], "xml")
+
+    triage = projection.TRIAGE_FIELDS
+    print("%-28s %14s %10s %9s" % ("mode", "us per image", "speedup", "reported"))
+    for outputFormat in sorted(writers.writerClasses):
+        full, reported = run(outputFormat)
+        print("%-28s %14.1f %10s %9d" % ("full, " + outputFormat, full, "", reported))
+        perImage, reported = run(outputFormat, triage)
+        print("%-28s %14.1f %10.2f %9d" % ("triage, " + outputFormat, perImage,
+                                           full / perImage, reported))
+        if outputFormat == "csv":
+            perImage, reported = run("csv", triage, True)
+            print("%-28s %14.1f %10.2f %9d" % ("triage, csv, anomalies only", perImage,
+                                               full / perImage, reported))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+#! /usr/bin/env python3
+"""Benchmark the truncation report: write synthetic truncated images with
+ISO 9660 directory hierarchies of increasing size (up to 400000 files by
+default), and report the time, read calls and bytes read of the directory
+walk. The time per file should stay roughly constant as the number of files
+grows.
+
+Usage: python benchmarks/bench_truncation.py [MAXIMUM_NUMBER_OF_FILES]
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+# Root dir of isolyzer repo
+ISOLYZER_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ISOLYZER_DIR)
+sys.path.insert(0, os.path.join(ISOLYZER_DIR, "benchmarks"))
+
+from isolyzer import isolyzer
+from isolyzer import model
+from isolyzer import perf
+from synthimage import ImageBuilder
+
+# Files per directory in the synthetic hierarchies
+FILES_PER_DIRECTORY = 200
+
+
+def main():
+    """Run benchmark"""
+    maxFiles = int(sys.argv[1]) if len(sys.argv) > 1 else 400000
+    noFiles = 12500
+    options = model.AnalysisOptions(truncationReport=True)
+    with tempfile.TemporaryDirectory() as tempDir:
+        path = os.path.join(tempDir, "tree.img")
+        print("%9s %12s %8s %8s %10s %10s" % ("files", "beyond EOF", "time (s)", "us/file",
+                                               "reads", "MB read"))
+        while noFiles <= maxFiles:
+            directories = noFiles // FILES_PER_DIRECTORY
+            builder = ImageBuilder(16 * 1024 ** 3).addISO9660(
+                directories=directories, filesPerDirectory=FILES_PER_DIRECTORY)
+            # Cut off the last quarter of the image
+            builder.write(path, truncate=builder.size * 3 // 4)
+            best = None
+            for _ in range(3):
+                profiler = perf.Profiler()
+                result = isolyzer.processImage(path, 0, profiler=profiler, options=options)
+                walkTime = profiler.stages["truncation"]
+                if best is None or walkTime < best[0]:
+                    best = (walkTime, profiler, result.truncationReport)
+            walkTime, profiler, report = best
+            print("%9d %12d %8.3f %8.2f %10d %10.1f" %
+                  (report.filesWalked, report.filesBeyondEOF, walkTime,
+                   1e6 * walkTime / report.filesWalked, profiler.reads,
+                   profiler.bytesRead / 1e6))
+            noFiles *= 2
+
+
+if __name__ == "__main__":
+    main()
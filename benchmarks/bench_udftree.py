@@ -0,0 +1,59 @@
+#! /usr/bin/env python3
+"""Benchmark the UDF file tree walk: write synthetic UDF images with file
+trees of increasing size (up to 200000 files by default) in a metadata
+partition, as on Blu-ray discs, and report the time, read calls, bytes
+read of a full walk. The time per entry should stay
+roughly constant as the number of files grows.
+
+Usage: python benchmarks/bench_udftree.py [MAXIMUM_NUMBER_OF_FILES]
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+# Root dir of isolyzer repo
+ISOLYZER_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ISOLYZER_DIR)
+sys.path.insert(0, os.path.join(ISOLYZER_DIR, "benchmarks"))
+
+from isolyzer import udf
+from isolyzer import sectorreader as sr
+from synthimage import ImageBuilder
+
+# Files per directory in the synthetic trees
+FILES_PER_DIRECTORY = 500
+
+
+def main():
+    """Run benchmark"""
+    maxFiles = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    noFiles = 12500
+    with tempfile.TemporaryDirectory() as tempDir:
+        path = os.path.join(tempDir, "tree.img")
+        print("%9s %8s %9s %10s %10s" % ("entries", "time (s)", "us/entry", "reads",
+                                         "MB read"))
+        while noFiles <= maxFiles:
+            directories = noFiles // FILES_PER_DIRECTORY
+            # Blu-ray size (25 GB)
+            ImageBuilder(25 * 1000 ** 3).addUDF(
+                revision=3, directories=directories, filesPerDirectory=FILES_PER_DIRECTORY,
+                metadata=True).write(path)
+            best = None
+            for _ in range(3):
+                with sr.PReadReader(path) as reader:
+                    startTime = time.perf_counter()
+                    noEntries = sum(1 for _ in udf.walkFileTree(reader))
+                    walkTime = time.perf_counter() - startTime
+                if best is None or walkTime < best[0]:
+                    best = (walkTime, reader)
+            walkTime, reader = best
+            print("%9d %8.3f %9.2f %10d %10.1f" %
+                  (noEntries, walkTime, 1e6 * walkTime / noEntries, reader.reads,
+                   reader.bytesRead / 1e6))
+            noFiles *= 2
+
+
+if __name__ == "__main__":
+    main()
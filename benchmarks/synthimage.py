@@ -0,0 +1,1022 @@
+#! /usr/bin/env python3
+"""Synthetic image builder for benchmarks and tests
+
+Writes the headers of ISO 9660, High Sierra, UDF, HFS, HFS+ and Apple
+Partition Map file systems (and hybrids of these) for images of any declared
+size. Only the structures are written; everything else is left as a hole in
+a sparse file, so a multi-GB image takes a few KB of disk space. Images are
+deterministic: the same parameters always give the same bytes.
+
+All structures declare the full volume: ISO 9660 and High Sierra volume
+space sizes, the UDF partition (between the volume descriptors and a final
+Anchor Volume Descriptor Pointer), Apple block counts. sizeExpected() gives
+the size that isolyzer should report for the image. Stress options:
+
+- supplementary: number of (Joliet) Supplementary Volume Descriptors that
+  follow the Primary Volume Descriptor (long descriptor chains)
+- directories, filesPerDirectory: ISO 9660 directory hierarchy of
+  directories subdirectories of the root, with filesPerDirectory files each
+  (large directory trees); the file extents are spread over the volume
+- implementationUseDescriptors: number of Implementation Use Volume
+  Descriptors in the UDF Volume Descriptor Sequence
+- UDF directories, filesPerDirectory and metadata: UDF file tree with
+  directories subdirectories of the root, with filesPerDirectory files each,
+  optionally in a metadata partition (UDF 2.50, as on Blu-ray discs)
+- partitionEntries: number of Apple Partition Map entries
+- truncate: write a truncated image (the declared size is not changed)
+- sessionStart: logical block number of the first sector of the image, as
+  in a later session of a multisession disc (ISO 9660 locations and volume
+  space size are counted from the start of the disc); writeSessions writes
+  several sessions to one image
+
+writeAdversarial writes hostile images (see ADVERSARIAL_IMAGES), whose
+descriptor chains do not end where they should (or whose sessions send the
+session scan on long searches), for testing the parsing budgets of isolyzer.
+
+Usage as a script:
+
+    python benchmarks/synthimage.py OUTPUT --size 4G --iso9660 --udf
+"""
+
+import os
+import sys
+import struct
+import argparse
+import binascii
+
+
+# Size of ISO 9660 / UDF sectors
+SECTOR_SIZE = 2048
+
+# First sector of the volume descriptor area
+VOLUME_DESCRIPTOR_START = 16
+
+# Sector of the (first) UDF Anchor Volume Descriptor Pointer
+ANCHOR_SECTOR = 256
+
+# Recording date and time of all structures
+ISO_DATE = b"2024010112000000\x00"
+HSF_DATE = b"2024010112000000"
+UDF_TIMESTAMP = struct.pack("<HhBBBBBBBB", 0x1000, 2024, 1, 1, 12, 0, 0, 0, 0, 0)
+DIRECTORY_DATE = bytes([124, 1, 1, 12, 0, 0, 0])
+
+# Byte size suffixes accepted by parseSize
+SIZE_SUFFIXES = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+
+
+def both16(value):
+    """Return value as both-byte order 16-bit field"""
+    return struct.pack("<H", value) + struct.pack(">H", value)
+
+
+def both32(value):
+    """Return value as both-byte order 32-bit field"""
+    return struct.pack("<I", value) + struct.pack(">I", value)
+
+
+def padded(text, length, fill=b" "):
+    """Return ASCII text padded with fill to length bytes"""
+    return text.encode("ascii")[:length].ljust(length, fill)
+
+
+def ucs2Padded(text, length):
+    """Return text as UCS-2 (big-endian), padded with spaces to length bytes"""
+    data = text.encode("utf-16-be")[:length & ~1]
+    return data + b"\x00 " * ((length - len(data)) // 2) + b"\x00" * (length % 2)
+
+
+def directoryRecord(extent, dataLength, identifier, flags=2):
+    """Return ISO 9660 / High Sierra directory record"""
+    length = 33 + len(identifier)
+    length += length % 2
+    record = bytearray(length)
+    record[0] = length
+    record[2:10] = both32(extent)
+    record[10:18] = both32(dataLength)
+    record[18:25] = DIRECTORY_DATE
+    record[25] = flags
+    record[28:32] = both16(1)
+    record[32] = len(identifier)
+    record[33:33 + len(identifier)] = identifier
+    return bytes(record)
+
+
+def directorySectors(names):
+    """Return number of sectors of a directory with files (or
+    subdirectories) names, and its "." and ".." records
+    """
+    lengths = [34, 34] + [len(directoryRecord(0, 0, name)) for name in names]
+    sectors, used = 1, 0
+    for length in lengths:
+        if used + length > SECTOR_SIZE:
+            sectors += 1
+            used = 0
+        used += length
+    return sectors
+
+
+def directoryExtent(records):
+    """Return directory records as a directory extent: records do not cross
+    sector boundaries, and the rest of each sector is padded with zeros
+    """
+    sectors = []
+    current = b""
+    for record in records:
+        if len(current) + len(record) > SECTOR_SIZE:
+            sectors.append(current.ljust(SECTOR_SIZE, b"\x00"))
+            current = b""
+        current += record
+    sectors.append(current.ljust(SECTOR_SIZE, b"\x00"))
+    return b"".join(sectors)
+
+
+def pathTableRecord(byteOrder, extent, parent, identifier):
+    """Return type L (byteOrder "<") or type M (">") path table record"""
+    record = struct.pack(byteOrder + "BBIH", len(identifier), 0, extent, parent) + identifier
+    return record + b"\x00" * (len(identifier) % 2)
+
+
+def udfTag(identifier, location, body):
+    """Return UDF descriptor with tag identifier, tag location location and
+    contents body (everything after the 16-byte descriptor tag)
+    """
+    tag = bytearray(struct.pack("<HHBBHHHI", identifier, 2, 0, 0, 1,
+                                binascii.crc_hqx(body, 0), len(body), location))
+    tag[4] = (sum(tag[0:4]) + sum(tag[5:16])) & 0xff
+    return bytes(tag) + body
+
+
+def charspec():
+    """Return UDF OSTA CS0 character set specification"""
+    return (b"\x00" + b"OSTA Compressed Unicode").ljust(64, b"\x00")
+
+
+def regid(identifier, suffix=b""):
+    """Return UDF entity identifier"""
+    return b"\x00" + identifier.encode("ascii").ljust(23, b"\x00") + suffix.ljust(8, b"\x00")
+
+
+def dstring(text, length):
+    """Return text as fixed-length UDF dstring (8-bit CS0)"""
+    data = b"\x08" + text.encode("latin-1")[:length - 2]
+    return data.ljust(length - 1, b"\x00") + bytes([len(data)])
+
+
+def longAD(length, block, reference):
+    """Return UDF long allocation descriptor"""
+    return struct.pack("<IIH6x", length, block, reference)
+
+
+def fileIdentifier(location, icb, name, characteristics=0):
+    """Return UDF File Identifier Descriptor at block location for name
+    (empty for the parent directory), whose File Entry is at icb (a
+    (block, partition reference) tuple)
+    """
+    identifier = b"\x08" + name.encode("latin-1") if name else b""
+    body = struct.pack("<HBB", 1, characteristics, len(identifier)) + \
+        longAD(SECTOR_SIZE, *icb) + struct.pack("<H", 0) + identifier
+    body += b"\x00" * (-(16 + len(body)) % 4)
+    return udfTag(257, location, body)
+
+
+def fileEntry(location, fileType, informationLength, descriptors, adType, extended):
+    """Return UDF File Entry (or Extended File Entry if extended is True) at
+    block location, with allocation descriptors descriptors of type adType
+    """
+    body = bytearray(200 if extended else 160)
+    # ICB tag: strategy type 4, one entry, file type and flags
+    body[4:12] = struct.pack("<HHH", 4, 0, 1)
+    body[11] = fileType
+    body[18:20] = struct.pack("<H", adType)
+    body[32:34] = struct.pack("<H", 1)
+    body[40:48] = struct.pack("<Q", informationLength)
+    blocks = -(-informationLength // SECTOR_SIZE)
+    if extended:
+        body[48:56] = struct.pack("<Q", informationLength)
+        body[56:64] = struct.pack("<Q", blocks)
+        for offset in (64, 76, 88, 100):
+            body[offset:offset + 12] = UDF_TIMESTAMP
+        body[152:184] = regid("*isolyzer synthimage")
+        body[196:200] = struct.pack("<I", len(descriptors))
+    else:
+        body[48:56] = struct.pack("<Q", blocks)
+        for offset in (56, 68, 80):
+            body[offset:offset + 12] = UDF_TIMESTAMP
+        body[112:144] = regid("*isolyzer synthimage")
+        body[156:160] = struct.pack("<I", len(descriptors))
+    return udfTag(266 if extended else 261, location, bytes(body) + descriptors)
+
+
+def parseSize(text):
+    """Parse size with optional K, M, G or T suffix (powers of 1024)"""
+    text = text.strip().upper()
+    if text and text[-1] in SIZE_SUFFIXES:
+        return int(float(text[:-1]) * SIZE_SUFFIXES[text[-1]])
+    return int(text)
+
+
+class ImageBuilder:
+    """Builder of a synthetic image of size bytes (rounded down to whole
+    sectors). File systems are added with the add methods, after which the
+    image is written with write(). Structures are laid out when the image is
+    written, in the order in which they occur on real discs. If sessionStart
+    is given, the image is a session that starts at that logical block
+    """
+
+    def __init__(self, size, sessionStart=0):
+        self.sectors = size // SECTOR_SIZE
+        self.size = self.sectors * SECTOR_SIZE
+        if self.sectors < 300:
+            raise ValueError("image must be at least 300 sectors")
+        self.sessionStart = sessionStart
+        self.iso9660 = None
+        self.highSierra = None
+        self.udf = None
+        self.hfs = None
+        self.hfsPlus = None
+        self.apple = None
+
+    def addISO9660(self, volumeIdentifier="SYNTHETIC", supplementary=0, directories=0,
+                   filesPerDirectory=0):
+        """Add ISO 9660 file system with a Primary Volume Descriptor, and
+        supplementary Joliet Supplementary Volume Descriptors. If directories
+        is not 0, the root directory holds directories directories
+        (DIR00000 etc.) with filesPerDirectory files (FILE00000.DAT etc.)
+        each; the directory hierarchy and path tables are then written after
+        the first Anchor Volume Descriptor Pointer
+        """
+        if self.highSierra is not None:
+            raise ValueError("image cannot contain both ISO 9660 and High Sierra")
+        self.iso9660 = {"volumeIdentifier": volumeIdentifier, "supplementary": supplementary,
+                        "directories": directories, "filesPerDirectory": filesPerDirectory}
+        return self
+
+    def addHighSierra(self, volumeIdentifier="SYNTHETIC"):
+        """Add High Sierra file system"""
+        if self.iso9660 is not None:
+            raise ValueError("image cannot contain both ISO 9660 and High Sierra")
+        self.highSierra = {"volumeIdentifier": volumeIdentifier}
+        return self
+
+    def addUDF(self, volumeIdentifier="Synthetic UDF", revision=2, blockSize=SECTOR_SIZE,
+               implementationUseDescriptors=0, directories=0, filesPerDirectory=0,
+               metadata=False):
+        """Add UDF file system (NSR02 for revision 2, NSR03 for revision 3).
+        If directories is not 0, the root directory holds directories
+        directories (dir00000 etc.) with filesPerDirectory files
+        (file00000.dat etc.) each, as File Entries (Extended File Entries if
+        metadata is True) at the start of the partition. If metadata is
+        True, these are recorded in a metadata partition (UDF 2.50)
+        """
+        if blockSize != SECTOR_SIZE:
+            raise ValueError("only 2048-byte UDF blocks are supported")
+        self.udf = {"volumeIdentifier": volumeIdentifier, "revision": revision,
+                    "blockSize": blockSize,
+                    "implementationUseDescriptors": implementationUseDescriptors,
+                    "directories": directories, "filesPerDirectory": filesPerDirectory,
+                    "metadata": metadata}
+        return self
+
+    def addHFS(self, volumeName="Synthetic HFS"):
+        """Add HFS Master Directory Block at byte 1024 (no partition map)"""
+        if self.hfsPlus is not None or self.apple is not None:
+            raise ValueError("image can contain only one Apple volume header or partition map")
+        # HFS counts allocation blocks in 16 bits, so the block size grows
+        # with the volume size
+        blockSize = 512 * -(-self.size // (65535 * 512))
+        self.hfs = {"volumeName": volumeName, "blockSize": blockSize,
+                    "blockCount": self.size // blockSize}
+        return self
+
+    def addHFSPlus(self, blockSize=4096):
+        """Add HFS+ Volume Header at byte 1024 (no partition map)"""
+        if self.hfs is not None or self.apple is not None:
+            raise ValueError("image can contain only one Apple volume header or partition map")
+        self.hfsPlus = {"blockSize": blockSize, "blockCount": self.size // blockSize}
+        return self
+
+    def addApplePartitionMap(self, blockSize=512, partitionEntries=2, volumeName="Synthetic HFS"):
+        """Add Apple Zero Block and Partition Map with partitionEntries
+        entries: the map itself, an Apple_HFS partition (whose Master
+        Directory Block is written), and Apple_Free entries for the rest
+        """
+        if self.hfs is not None or self.hfsPlus is not None:
+            raise ValueError("image can contain only one Apple volume header or partition map")
+        if partitionEntries < 2:
+            raise ValueError("partition map must have at least 2 entries")
+        self.apple = {"blockSize": blockSize, "partitionEntries": partitionEntries,
+                      "volumeName": volumeName}
+        return self
+
+    def sizeExpected(self):
+        """Return the expected size of the image, as isolyzer computes it
+        from the declared sizes (with sessionStart as the sector offset)
+        """
+        estimates = [0]
+        if self.iso9660 is not None or self.highSierra is not None:
+            estimates.append(self.sectors * SECTOR_SIZE)
+        if self.apple is not None:
+            blockSize = self.apple["blockSize"]
+            estimates.append((self.size // blockSize) * blockSize)
+        if self.hfs is not None:
+            estimates.append(self.hfs["blockCount"] * self.hfs["blockSize"])
+        if self.hfsPlus is not None:
+            estimates.append(self.hfsPlus["blockCount"] * self.hfsPlus["blockSize"])
+        if self.udf is not None:
+            start, length = self.udfPartition()
+            estimates.append((start + length) * self.udf["blockSize"])
+        return max(estimates)
+
+    def fileSystems(self):
+        """Return list of file system types that isolyzer should report"""
+        types = []
+        if self.iso9660 is not None:
+            types.append("ISO 9660")
+        if self.highSierra is not None:
+            types.append("High Sierra")
+        if self.apple is not None or self.hfs is not None:
+            types.append("HFS")
+        if self.hfsPlus is not None:
+            types.append("HFS+")
+        if self.udf is not None:
+            types.append("UDF")
+        return types
+
+    def udfPartition(self):
+        """Return (start, length) of UDF partition in sectors: it starts
+        after the first Anchor Volume Descriptor Pointer, and ends before the
+        last one
+        """
+        start = ANCHOR_SECTOR + 1
+        return start, self.sectors - start - 1
+
+    def structures(self):
+        """Lay out all structures, and return list of (byte offset, data)
+        tuples, sorted by offset. Raises ValueError if structures overlap
+        """
+        chunks = []
+        sector = VOLUME_DESCRIPTOR_START
+
+        if self.apple is not None:
+            chunks += self.appleStructures()
+        if self.hfs is not None:
+            chunks.append((1024, self.masterDirectoryBlock(self.hfs)))
+        if self.hfsPlus is not None:
+            header = self.hfsPlusVolumeHeader()
+            chunks.append((1024, header))
+            # Alternate volume header
+            chunks.append((self.size - 1024, header))
+
+        if self.iso9660 is not None:
+            descriptors = 2 + self.iso9660["supplementary"]
+            tables = sector + descriptors + (3 if self.udf is not None else 0)
+            chunks += self.iso9660Structures(sector, tables)
+            sector = tables + 3
+        elif self.highSierra is not None:
+            tables = sector + 2 + (3 if self.udf is not None else 0)
+            chunks += self.highSierraStructures(sector, tables)
+            sector = tables + 3
+
+        if self.udf is not None:
+            if self.sessionStart:
+                raise ValueError("UDF can only be added to the first session")
+            if self.udf["directories"] and self.iso9660 is not None and \
+                    self.iso9660["directories"]:
+                raise ValueError("image cannot contain both ISO 9660 and UDF directory trees")
+            udfChunks, sector = self.udfStructures(sector)
+            chunks += udfChunks
+            if self.udf["directories"] or self.udf["metadata"]:
+                chunks += self.udfTree()
+
+        chunks.sort(key=lambda chunk: chunk[0])
+        end = 0
+        for offset, data in chunks:
+            if offset < end:
+                raise ValueError("structures overlap at byte %d" % offset)
+            end = offset + len(data)
+        return chunks
+
+    def iso9660Structures(self, sector, tables):
+        """Return ISO 9660 volume descriptors from sector, with path tables
+        and root directory from sector tables (or the directory hierarchy
+        after the first anchor, see directoryTree)
+        """
+        settings = self.iso9660
+        if settings["directories"]:
+            treeChunks, pathTables, root = self.directoryTree()
+        else:
+            treeChunks = self.pathTablesAndRoot(tables)
+            pathTables = (self.sessionStart + tables, self.sessionStart + tables + 1, 10)
+            root = directoryRecord(self.sessionStart + tables + 2, SECTOR_SIZE, b"\x00")
+        chunks = [(sector * SECTOR_SIZE,
+                   self.volumeDescriptor(1, settings["volumeIdentifier"], pathTables, root))]
+        for i in range(settings["supplementary"]):
+            chunks.append(((sector + 1 + i) * SECTOR_SIZE,
+                           self.volumeDescriptor(2, settings["volumeIdentifier"], pathTables,
+                                                 root)))
+        terminator = b"\xffCD001\x01".ljust(SECTOR_SIZE, b"\x00")
+        chunks.append(((sector + 1 + settings["supplementary"]) * SECTOR_SIZE, terminator))
+        if self.udf is not None:
+            chunks += self.volumeRecognitionSequence(sector + 2 + settings["supplementary"])
+        chunks += treeChunks
+        return chunks
+
+    def directoryTree(self):
+        """Return (chunks, path tables, root directory record) tuple for the
+        ISO 9660 directory hierarchy, where path tables is a (type L location,
+        type M location, size) tuple. The chunks hold the path tables, the root
+        directory, the subdirectories and the (unwritten) file extents, which
+        take the rest of the volume
+        """
+        settings = self.iso9660
+        directories = settings["directories"]
+        filesPerDirectory = settings["filesPerDirectory"]
+        directoryNames = [b"DIR%05d" % i for i in range(directories)]
+        fileNames = [b"FILE%05d.DAT;1" % i for i in range(filesPerDirectory)]
+
+        # Everything is laid out first, since the sizes of the path tables
+        # and directories do not depend on the locations they hold
+        tables = ANCHOR_SECTOR + 1
+        pathTableSize = sum(len(pathTableRecord("<", 0, 1, name))
+                            for name in [b"\x00"] + directoryNames)
+        pathTableSectors = -(-pathTableSize // SECTOR_SIZE)
+        rootSector = tables + 2 * pathTableSectors
+        rootSectors = directorySectors(directoryNames)
+        subdirectorySectors = directorySectors(fileNames)
+        firstSubdirectory = rootSector + rootSectors
+        dataStart = firstSubdirectory + directories * subdirectorySectors
+        noFiles = directories * filesPerDirectory
+        dataSectors = self.sectors - 1 - dataStart
+        if dataSectors < noFiles:
+            raise ValueError("directory tree does not fit in the volume")
+        fileSectors = dataSectors // noFiles if noFiles else 0
+        fileLength = min(fileSectors * SECTOR_SIZE, 0xffffffff)
+
+        # Locations in records and path tables are logical block numbers
+        base = self.sessionStart
+        rootLength = rootSectors * SECTOR_SIZE
+        rootRecords = [directoryRecord(base + rootSector, rootLength, b"\x00"),
+                       directoryRecord(base + rootSector, rootLength, b"\x01")]
+        typeL = [pathTableRecord("<", base + rootSector, 1, b"\x00")]
+        typeM = [pathTableRecord(">", base + rootSector, 1, b"\x00")]
+        chunks = []
+        for i, name in enumerate(directoryNames):
+            location = firstSubdirectory + i * subdirectorySectors
+            rootRecords.append(directoryRecord(base + location,
+                                               subdirectorySectors * SECTOR_SIZE, name))
+            typeL.append(pathTableRecord("<", base + location, 1, name))
+            typeM.append(pathTableRecord(">", base + location, 1, name))
+            records = [directoryRecord(base + location, subdirectorySectors * SECTOR_SIZE,
+                                       b"\x00"),
+                       directoryRecord(base + rootSector, rootLength, b"\x01")]
+            for j, fileName in enumerate(fileNames):
+                fileSector = dataStart + (i * filesPerDirectory + j) * fileSectors
+                records.append(directoryRecord(base + fileSector, fileLength, fileName,
+                                               flags=0))
+            chunks.append((location * SECTOR_SIZE, directoryExtent(records)))
+
+        chunks[:0] = [(tables * SECTOR_SIZE, b"".join(typeL)),
+                      ((tables + pathTableSectors) * SECTOR_SIZE, b"".join(typeM)),
+                      (rootSector * SECTOR_SIZE, directoryExtent(rootRecords))]
+        pathTables = (base + tables, base + tables + pathTableSectors, pathTableSize)
+        return chunks, pathTables, directoryRecord(base + rootSector, rootLength, b"\x00")
+
+    def volumeDescriptor(self, typeCode, volumeIdentifier, pathTables, root):
+        """Return ISO 9660 Primary (typeCode 1) or Joliet Supplementary
+        (typeCode 2) Volume Descriptor, with path tables (a (type L location,
+        type M location, size) tuple) and root directory record root
+        """
+        data = bytearray(SECTOR_SIZE)
+        data[0] = typeCode
+        data[1:6] = b"CD001"
+        data[6] = 1
+        if typeCode == 1:
+            text = padded
+        else:
+            text = ucs2Padded
+            # Escape sequence of UCS-2 level 3
+            data[88:91] = b"%/E"
+        data[8:40] = text("SYNTHIMAGE", 32)
+        data[40:72] = text(volumeIdentifier, 32)
+        data[80:88] = both32(self.sessionStart + self.sectors)
+        data[120:124] = both16(1)
+        data[124:128] = both16(1)
+        data[128:132] = both16(SECTOR_SIZE)
+        typeLTable, typeMTable, pathTableSize = pathTables
+        data[132:140] = both32(pathTableSize)
+        data[140:144] = struct.pack("<I", typeLTable)
+        data[148:152] = struct.pack(">I", typeMTable)
+        data[156:156 + len(root)] = root
+        for offset, length in ((190, 128), (318, 128), (446, 128), (574, 128), (702, 37),
+                               (739, 37), (776, 37)):
+            data[offset:offset + length] = text("", length)
+        data[574:702] = text("ISOLYZER SYNTHETIC IMAGE BUILDER", 128)
+        for offset in (813, 830, 864):
+            data[offset:offset + 17] = ISO_DATE
+        data[847:864] = b"0000000000000000\x00"
+        data[881] = 1
+        return bytes(data)
+
+    def pathTablesAndRoot(self, tables):
+        """Return type L and type M path tables (one entry, for the root) and
+        root directory, from sector tables
+        """
+        rootSector = tables + 2
+        location = self.sessionStart + rootSector
+        typeL = struct.pack("<BBIHBx", 1, 0, location, 1, 0)
+        typeM = struct.pack(">BBIHBx", 1, 0, location, 1, 0)
+        root = directoryRecord(location, SECTOR_SIZE, b"\x00") + \
+            directoryRecord(location, SECTOR_SIZE, b"\x01")
+        return [(tables * SECTOR_SIZE, typeL), ((tables + 1) * SECTOR_SIZE, typeM),
+                (rootSector * SECTOR_SIZE, root)]
+
+    def highSierraStructures(self, sector, tables):
+        """Return High Sierra volume descriptors from sector, with path tables
+        and root directory from sector tables
+        """
+        data = bytearray(SECTOR_SIZE)
+        data[0:8] = both32(sector)
+        data[8] = 1
+        data[9:14] = b"CDROM"
+        data[14] = 1
+        data[16:48] = padded("SYNTHIMAGE", 32)
+        data[48:80] = padded(self.highSierra["volumeIdentifier"], 32)
+        data[88:96] = both32(self.sectors)
+        data[128:132] = both16(1)
+        data[132:136] = both16(1)
+        data[136:140] = both16(SECTOR_SIZE)
+        data[140:148] = both32(10)
+        data[148:152] = struct.pack("<I", tables)
+        data[164:168] = struct.pack("<I", tables + 1)
+        root = directoryRecord(tables + 2, SECTOR_SIZE, b"\x00")
+        data[180:180 + len(root)] = root
+        for offset, length in ((214, 128), (342, 128), (470, 128), (598, 128), (726, 32),
+                               (758, 32)):
+            data[offset:offset + length] = padded("", length)
+        for offset in (790, 806, 838):
+            data[offset:offset + 16] = HSF_DATE
+        data[822:838] = b"0000000000000000"
+        data[854] = 1
+        terminator = bytearray(SECTOR_SIZE)
+        terminator[0:8] = both32(sector + 1)
+        terminator[8] = 255
+        terminator[9:14] = b"CDROM"
+        terminator[14] = 1
+        chunks = [(sector * SECTOR_SIZE, bytes(data)),
+                  ((sector + 1) * SECTOR_SIZE, bytes(terminator))]
+        if self.udf is not None:
+            chunks += self.volumeRecognitionSequence(sector + 2)
+        chunks += self.pathTablesAndRoot(tables)
+        return chunks
+
+    def volumeRecognitionSequence(self, sector):
+        """Return UDF Volume Recognition Sequence from sector"""
+        identifiers = [b"BEA01", b"NSR0%d" % self.udf["revision"], b"TEA01"]
+        return [((sector + i) * SECTOR_SIZE, (b"\x00" + identifier + b"\x01").ljust(SECTOR_SIZE, b"\x00"))
+                for i, identifier in enumerate(identifiers)]
+
+    def udfStructures(self, sector):
+        """Return (chunks, next free sector) tuple with the UDF structures
+        (other than the Volume Recognition Sequence), using sectors from
+        sector for the Volume Descriptor Sequences and Logical Volume
+        Integrity Descriptor
+        """
+        settings = self.udf
+        chunks = []
+        if self.iso9660 is None and self.highSierra is None:
+            chunks += self.volumeRecognitionSequence(sector)
+            sector += 3
+        start, length = self.udfPartition()
+        volumeIdentifier = settings["volumeIdentifier"]
+
+        # Volume Descriptor Sequence: Primary, Implementation Use, Partition,
+        # Logical Volume and Terminating Descriptors
+        bodies = []
+        body = bytearray(496)
+        body[4:8] = struct.pack("<I", 0)
+        body[8:40] = dstring(volumeIdentifier, 32)
+        body[40:44] = struct.pack("<HH", 1, 1)
+        body[44:48] = struct.pack("<HH", 2, 3)
+        body[48:56] = struct.pack("<II", 1, 1)
+        body[56:184] = dstring(volumeIdentifier, 128)
+        body[184:248] = charspec()
+        body[248:312] = charspec()
+        body[328:360] = regid("*isolyzer synthimage")
+        body[360:372] = UDF_TIMESTAMP
+        body[372:404] = regid("*isolyzer synthimage")
+        bodies.append((1, bytes(body)))
+        for _ in range(settings["implementationUseDescriptors"]):
+            body = bytearray(496)
+            body[4:36] = regid("*UDF LV Info", b"\x02\x01")
+            bodies.append((4, bytes(body)))
+        body = bytearray(496)
+        body[4:6] = struct.pack("<H", 1)
+        body[8:40] = regid("+NSR0%d" % settings["revision"])
+        body[168:180] = struct.pack("<III", 1, start, length)
+        body[180:212] = regid("*isolyzer synthimage")
+        bodies.append((5, bytes(body)))
+        sequenceLength = len(bodies) + 2
+        integritySector = sector + 2 * sequenceLength
+        body = bytearray(430)
+        body[4:68] = charspec()
+        body[68:196] = dstring(volumeIdentifier, 128)
+        body[196:200] = struct.pack("<I", settings["blockSize"])
+        body[200:232] = regid("*OSTA UDF Compliant",
+                              b"\x50\x02\x03" if settings["metadata"] else b"\x02\x01\x03")
+        # File Set Descriptor, at the start of the (metadata) partition
+        body[232:248] = longAD(SECTOR_SIZE, 0, 1 if settings["metadata"] else 0)
+        body[248:256] = struct.pack("<II", 6, 1)
+        body[256:288] = regid("*isolyzer synthimage")
+        body[416:424] = struct.pack("<II", SECTOR_SIZE, integritySector)
+        body[424:430] = struct.pack("<BBHH", 1, 6, 1, 0)
+        if settings["metadata"]:
+            # Type 2 map of the metadata partition, with the locations of
+            # the Metadata File and its mirror in partition 0
+            metadataMap = bytearray(64)
+            metadataMap[0:2] = b"\x02\x40"
+            metadataMap[4:36] = regid("*UDF Metadata Partition", b"\x50\x02")
+            metadataMap[36:48] = struct.pack("<HHII", 1, 0, 0, 1)
+            metadataMap[48:56] = struct.pack("<II", 0xffffffff, 32)
+            metadataMap[56:58] = struct.pack("<H", 1)
+            body[248:256] = struct.pack("<II", 70, 2)
+            body += metadataMap
+        bodies.append((6, bytes(body)))
+        bodies.append((8, bytes(496)))
+
+        # Main and reserve sequences, which are identical apart from the tag
+        # locations
+        for sequenceStart in (sector, sector + sequenceLength):
+            for i, (identifier, body) in enumerate(bodies):
+                body = bytearray(body)
+                body[0:4] = struct.pack("<I", i)
+                chunks.append(((sequenceStart + i) * SECTOR_SIZE,
+                               udfTag(identifier, sequenceStart + i, bytes(body))))
+
+        body = bytearray(118)
+        body[0:12] = UDF_TIMESTAMP
+        body[12:16] = struct.pack("<I", 1)
+        body[56:72] = struct.pack("<IIII", 1, 46, 0, length)
+        chunks.append((integritySector * SECTOR_SIZE, udfTag(9, integritySector, bytes(body))))
+        sector = integritySector + 1
+
+        if sector > ANCHOR_SECTOR:
+            raise ValueError("UDF volume descriptors do not fit before the anchor")
+        anchorBody = struct.pack("<IIII", sequenceLength * SECTOR_SIZE, integritySector -
+                                 2 * sequenceLength, sequenceLength * SECTOR_SIZE,
+                                 integritySector - sequenceLength).ljust(496, b"\x00")
+        for anchor in (ANCHOR_SECTOR, self.sectors - 1):
+            chunks.append((anchor * SECTOR_SIZE, udfTag(2, anchor, anchorBody)))
+        return chunks, sector
+
+    def udfTree(self):
+        """Return chunks of the UDF file tree: the File Set Descriptor, the
+        File Entries and directories, and (with a metadata partition) the
+        Metadata File and its mirror. File extents (which are not written)
+        are spread over the rest of the partition
+        """
+        settings = self.udf
+        start, length = self.udfPartition()
+        metadata = settings["metadata"]
+        directories = settings["directories"]
+        filesPerDirectory = settings["filesPerDirectory"]
+        directoryNames = ["dir%05d" % i for i in range(directories)]
+        fileNames = ["file%05d.dat" % i for i in range(filesPerDirectory)]
+        # File Entries are in partition reference 1 (the metadata partition)
+        # or 0; with a metadata partition, the Metadata File and its mirror
+        # take the first two blocks of the physical partition
+        reference = 1 if metadata else 0
+        base = 2 if metadata else 0
+
+        # Directories are laid out first: the File Set Descriptor, the root
+        # File Entry and directory, and the File Entry and directory of each
+        # subdirectory, followed by the File Entries of all files
+        def directoryBlocks(names):
+            size = 40 + sum(len(fileIdentifier(0, (0, 0), name)) for name in names)
+            return size, -(-size // SECTOR_SIZE)
+
+        rootSize, rootBlocks = directoryBlocks(directoryNames)
+        subdirectorySize, subdirectoryBlocks = directoryBlocks(fileNames)
+        rootEntry = 1
+        firstSubdirectory = rootEntry + 1 + rootBlocks
+        firstFile = firstSubdirectory + directories * (1 + subdirectoryBlocks)
+        metadataBlocks = firstFile + directories * filesPerDirectory
+        dataStart = base + metadataBlocks
+        noFiles = directories * filesPerDirectory
+        dataBlocks = length - dataStart
+        if dataBlocks < noFiles:
+            raise ValueError("UDF file tree does not fit in the partition")
+        fileBlocks = dataBlocks // noFiles if noFiles else 0
+        fileLength = min(fileBlocks * SECTOR_SIZE, 0x3fffffff)
+
+        blocks = {}
+        extended = metadata
+
+        def directory(entry, parent, size, children):
+            # File Entry at block entry, directory data in the blocks after it
+            blocks[entry] = fileEntry(entry, 4, size, struct.pack(
+                "<II", size, entry + 1), 0, extended)
+            data = fileIdentifier(entry + 1, (parent, reference), "", 0x0a)
+            for name, icb, characteristics in children:
+                data += fileIdentifier(entry + 1, (icb, reference), name, characteristics)
+            data = data.ljust(-(-len(data) // SECTOR_SIZE) * SECTOR_SIZE, b"\x00")
+            for i in range(0, len(data), SECTOR_SIZE):
+                blocks[entry + 1 + i // SECTOR_SIZE] = data[i:i + SECTOR_SIZE]
+
+        body = bytearray(496)
+        body[0:12] = UDF_TIMESTAMP
+        body[12:24] = struct.pack("<HHII", 3, 3, 1, 1)
+        body[32:96] = charspec()
+        body[96:224] = dstring(settings["volumeIdentifier"], 128)
+        body[224:288] = charspec()
+        body[288:320] = dstring(settings["volumeIdentifier"], 32)
+        body[384:400] = longAD(SECTOR_SIZE, rootEntry, reference)
+        body[400:432] = regid("*OSTA UDF Compliant", b"\x50\x02" if metadata else b"\x02\x01")
+        blocks[0] = udfTag(256, 0, bytes(body))
+
+        directory(rootEntry, rootEntry, rootSize,
+                  [(name, firstSubdirectory + i * (1 + subdirectoryBlocks), 0x02)
+                   for i, name in enumerate(directoryNames)])
+        for i in range(directories):
+            entry = firstSubdirectory + i * (1 + subdirectoryBlocks)
+            files = firstFile + i * filesPerDirectory
+            directory(entry, rootEntry, subdirectorySize,
+                      [(name, files + j, 0) for j, name in enumerate(fileNames)])
+            for j in range(filesPerDirectory):
+                fileBlock = dataStart + (i * filesPerDirectory + j) * fileBlocks
+                if metadata:
+                    # File data is in the physical partition
+                    descriptors, adType = longAD(fileLength, fileBlock, 0), 1
+                else:
+                    descriptors, adType = struct.pack("<II", fileLength, fileBlock), 0
+                blocks[files + j] = fileEntry(files + j, 5, fileLength, descriptors, adType,
+                                              extended)
+
+        chunks = [((start + base + block) * SECTOR_SIZE, data)
+                  for block, data in sorted(blocks.items())]
+        if metadata:
+            # Metadata File (file type 250) and its mirror (251), whose one
+            # extent is the metadata partition
+            descriptors = struct.pack("<II", metadataBlocks * SECTOR_SIZE, base)
+            chunks[:0] = [((start + i) * SECTOR_SIZE,
+                           fileEntry(i, 250 + i, metadataBlocks * SECTOR_SIZE, descriptors, 0,
+                                     True)) for i in range(2)]
+        return chunks
+
+    def masterDirectoryBlock(self, settings, blockCount=None):
+        """Return HFS Master Directory Block"""
+        data = bytearray(512)
+        data[0:2] = b"BD"
+        data[18:20] = struct.pack(">H", min(settings["blockCount"] if blockCount is None
+                                            else blockCount, 65535))
+        data[20:24] = struct.pack(">I", settings["blockSize"])
+        name = settings["volumeName"].encode("ascii")[:27]
+        data[36] = len(name)
+        data[37:37 + len(name)] = name
+        return bytes(data)
+
+    def hfsPlusVolumeHeader(self):
+        """Return HFS+ Volume Header"""
+        data = bytearray(512)
+        data[0:2] = b"H+"
+        data[2:4] = struct.pack(">H", 4)
+        data[8:12] = b"10.0"
+        data[40:48] = struct.pack(">II", self.hfsPlus["blockSize"], self.hfsPlus["blockCount"])
+        return bytes(data)
+
+    def appleStructures(self):
+        """Return Apple Zero Block, Partition Map entries, and the Master
+        Directory Block of the HFS partition
+        """
+        settings = self.apple
+        blockSize = settings["blockSize"]
+        entries = settings["partitionEntries"]
+        blockCount = self.size // blockSize
+        zeroBlock = bytearray(512)
+        zeroBlock[0:2] = b"ER"
+        zeroBlock[2:8] = struct.pack(">HI", blockSize, blockCount)
+        chunks = [(0, bytes(zeroBlock))]
+
+        # The HFS partition takes the blocks after the map, up to the ISO 9660
+        # volume descriptors (as in hybrid discs), or up to the end
+        hfsStart = 1 + entries
+        if self.iso9660 is not None or self.highSierra is not None or self.udf is not None:
+            hfsCount = VOLUME_DESCRIPTOR_START * SECTOR_SIZE // blockSize - hfsStart
+        else:
+            hfsCount = blockCount - hfsStart
+        if hfsCount < 4:
+            raise ValueError("partition map leaves no room for the HFS partition")
+        partitions = [("Apple", "Apple_partition_map", 1, entries),
+                      ("Synthetic HFS", "Apple_HFS", hfsStart, hfsCount)]
+        partitions += [("Extra", "Apple_Free", hfsStart + hfsCount, 0)] * (entries - 2)
+        for i, (name, partitionType, start, count) in enumerate(partitions):
+            entry = bytearray(blockSize)
+            entry[0:2] = b"PM"
+            entry[4:16] = struct.pack(">III", entries, start, count)
+            entry[16:48] = name.encode("ascii").ljust(32, b"\x00")
+            entry[48:80] = partitionType.encode("ascii").ljust(32, b"\x00")
+            entry[84:92] = struct.pack(">II", count, 0x33 if partitionType == "Apple_HFS" else 0)
+            chunks.append(((1 + i) * blockSize, bytes(entry[:512])))
+        hfs = {"volumeName": settings["volumeName"], "blockSize": blockSize,
+               "blockCount": hfsCount}
+        chunks.append((hfsStart * blockSize + 1024, self.masterDirectoryBlock(hfs)))
+        return chunks
+
+    def write(self, path, truncate=None):
+        """Write image to path as a sparse file. If truncate is given, the
+        file is cut off after truncate bytes (structures beyond that point
+        are not written). Returns path
+        """
+        size = self.size if truncate is None else min(truncate, self.size)
+        writeStructures(path, self.structures(), size)
+        return path
+
+    def writeCopies(self, paths, truncate=None):
+        """Write image to each of paths (the structures are only laid out
+        once, which makes this much faster than calling write for each path)
+        """
+        size = self.size if truncate is None else min(truncate, self.size)
+        structures = self.structures()
+        for path in paths:
+            writeStructures(path, structures, size)
+
+
+def writeSessions(path, builders, truncate=None):
+    """Write the images of builders (whose sessionStart values must increase)
+    to path as the sessions of one multisession image, with each session at
+    the sector of its sessionStart. Returns path
+    """
+    structures = []
+    end = 0
+    for builder in builders:
+        start = builder.sessionStart * SECTOR_SIZE
+        if start < end:
+            raise ValueError("sessions overlap at byte %d" % start)
+        structures += [(start + offset, data) for offset, data in builder.structures()]
+        end = start + builder.size
+    writeStructures(path, structures, end if truncate is None else min(truncate, end))
+    return path
+
+
+def withoutTerminators(structures, isTerminator):
+    """Return structures without those whose data isTerminator returns
+    True for
+    """
+    return [(offset, data) for offset, data in structures if not isTerminator(data)]
+
+
+def unterminatedISO9660(size):
+    """ISO 9660 volume descriptors without Volume Descriptor Set Terminator,
+    followed by (mostly) empty sectors up to the end of the image
+    """
+    structures = ImageBuilder(size).addISO9660(supplementary=1).structures()
+    return withoutTerminators(structures, lambda data: data[:6] == b"\xffCD001")
+
+
+def isoDescriptorChain(size, descriptors=65536):
+    """ISO 9660 Primary Volume Descriptor, followed by descriptors
+    (unterminated) Supplementary Volume Descriptor headers, which take the
+    place of the path tables and root directory
+    """
+    primary = unterminatedISO9660(size)[0]
+    return [primary] + [(sector * SECTOR_SIZE, b"\x02CD001\x01")
+                        for sector in range(VOLUME_DESCRIPTOR_START + 1,
+                                            VOLUME_DESCRIPTOR_START + 1 + descriptors)]
+
+
+def unterminatedHighSierra(size):
+    """High Sierra volume descriptors without terminator"""
+    structures = ImageBuilder(size).addHighSierra().structures()
+    return withoutTerminators(structures, lambda data: data[8:14] == b"\xffCDROM")
+
+
+def unterminatedUDF(size):
+    """UDF Volume Descriptor Sequences without Terminating Descriptors"""
+    structures = ImageBuilder(size).addUDF().structures()
+    return withoutTerminators(structures, lambda data: data[:2] == b"\x08\x00")
+
+
+def applePartitionEntries(size, entries=0xffffffff):
+    """Apple Partition Map whose first entry declares entries entries"""
+    structures = ImageBuilder(size).addApplePartitionMap().structures()
+    offset, entry = structures[1]
+    return [structures[0], (offset, entry[:4] + struct.pack(">I", entries) + entry[8:])] + \
+        structures[2:]
+
+
+def sessionCandidates(size, candidates=1024, spacing=64):
+    """Primary Volume Descriptors (without terminators) every spacing
+    sectors, whose root directories are nowhere to be found, so the session
+    scan searches for each of them
+    """
+    offset, pvd = ImageBuilder(size).addISO9660().structures()[0]
+    pvd = pvd[:158] + both32(0x7fffffff) + pvd[166:]
+    return [(offset + candidate * spacing * SECTOR_SIZE, pvd)
+            for candidate in range(candidates)]
+
+
+# Adversarial images, by name: functions that return the structures of an
+# image of the given size
+ADVERSARIAL_IMAGES = {
+    "unterminatedISO9660": unterminatedISO9660,
+    "isoDescriptorChain": isoDescriptorChain,
+    "unterminatedHighSierra": unterminatedHighSierra,
+    "unterminatedUDF": unterminatedUDF,
+    "applePartitionEntries": applePartitionEntries,
+    "sessionCandidates": sessionCandidates
+}
+
+
+def writeAdversarial(path, name, size):
+    """Write adversarial image name (see ADVERSARIAL_IMAGES) of size bytes
+    to path as a sparse file. Returns path
+    """
+    writeStructures(path, ADVERSARIAL_IMAGES[name](size), size // SECTOR_SIZE * SECTOR_SIZE)
+    return path
+
+
+def writeStructures(path, structures, size):
+    """Write structures (list of (byte offset, data) tuples, sorted by
+    offset) to path as a sparse file of size bytes
+    """
+    with open(path, "wb") as f:
+        for offset, data in structures:
+            if offset >= size:
+                break
+            f.seek(offset)
+            f.write(data[:size - offset])
+        f.truncate(size)
+
+
+def main():
+    """Write synthetic image as specified on the command line"""
+    parser = argparse.ArgumentParser(description="Write synthetic (sparse) image")
+    parser.add_argument("output", help="output file")
+    parser.add_argument("--size", type=parseSize, default=parseSize("650M"),
+                        help="declared image size, with optional K, M, G or T suffix "
+                        "(default: 650M)")
+    parser.add_argument("--iso9660", action="store_true", help="add ISO 9660 file system")
+    parser.add_argument("--supplementary", type=int, default=0,
+                        help="number of Joliet Supplementary Volume Descriptors")
+    parser.add_argument("--directories", type=int, default=0,
+                        help="number of ISO 9660 directories in the root directory")
+    parser.add_argument("--files-per-directory", type=int, default=0,
+                        dest="filesPerDirectory",
+                        help="number of files in each ISO 9660 directory")
+    parser.add_argument("--high-sierra", action="store_true", dest="highSierra",
+                        help="add High Sierra file system")
+    parser.add_argument("--udf", action="store_true", help="add UDF file system")
+    parser.add_argument("--udf-revision", type=int, choices=[2, 3], default=2,
+                        dest="udfRevision", help="UDF NSR revision (default: 2)")
+    parser.add_argument("--implementation-use", type=int, default=0,
+                        dest="implementationUse",
+                        help="number of UDF Implementation Use Volume Descriptors")
+    parser.add_argument("--udf-directories", type=int, default=0, dest="udfDirectories",
+                        help="number of UDF directories in the root directory")
+    parser.add_argument("--udf-files-per-directory", type=int, default=0,
+                        dest="udfFilesPerDirectory",
+                        help="number of files in each UDF directory")
+    parser.add_argument("--udf-metadata", action="store_true", dest="udfMetadata",
+                        help="record the UDF file tree in a metadata partition")
+    parser.add_argument("--hfs", action="store_true", help="add HFS Master Directory Block")
+    parser.add_argument("--hfsplus", action="store_true", help="add HFS+ Volume Header")
+    parser.add_argument("--apm", action="store_true",
+                        help="add Apple Partition Map with an HFS partition")
+    parser.add_argument("--partition-entries", type=int, default=2, dest="partitionEntries",
+                        help="number of Apple Partition Map entries (default: 2)")
+    parser.add_argument("--apm-block-size", type=int, default=512, dest="apmBlockSize",
+                        help="Apple Partition Map block size (default: 512)")
+    parser.add_argument("--truncate", type=parseSize, default=None,
+                        help="truncate image to this size")
+    args = parser.parse_args()
+
+    try:
+        builder = ImageBuilder(args.size)
+        if args.iso9660:
+            builder.addISO9660(supplementary=args.supplementary,
+                               directories=args.directories,
+                               filesPerDirectory=args.filesPerDirectory)
+        if args.highSierra:
+            builder.addHighSierra()
+        if args.udf:
+            builder.addUDF(revision=args.udfRevision,
+                           implementationUseDescriptors=args.implementationUse,
+                           directories=args.udfDirectories,
+                           filesPerDirectory=args.udfFilesPerDirectory,
+                           metadata=args.udfMetadata)
+        if args.hfs:
+            builder.addHFS()
+        if args.hfsplus:
+            builder.addHFSPlus()
+        if args.apm:
+            builder.addApplePartitionMap(args.apmBlockSize, args.partitionEntries)
+        builder.write(args.output, args.truncate)
+    except ValueError as ex:
+        sys.stderr.write("Error: %s\n" % ex)
+        sys.exit(1)
+    sys.stdout.write("%s: %d bytes declared, expected size %d (%s)\n" %
+                     (os.path.basename(args.output), builder.size, builder.sizeExpected(),
+                      ", ".join(builder.fileSystems()) or "no file system"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#! /usr/bin/env python3
+"""asyncio API for embedding isolyzer in asynchronous applications
+
+Images are analysed with isolyzer.processImage in a bounded pool of worker
+threads, so the event loop is never blocked by reads on the images. Reads
+release the GIL, so analyses overlap with each other and with the event
+loop. Example:
+
+    async for path, result in aio.analyzeImages(paths, concurrency=16):
+        print(path, result.tests.sizeAsExpected)
+"""
+
+import asyncio
+import functools
+import concurrent.futures
+from . import isolyzer
+from . import model
+from . import sectorreader as sr
+
+
+# Default number of images that are analysed at the same time
+DEFAULT_CONCURRENCY = 8
+
+
+async def analyzeImage(path, *, offset=0, readerClass=sr.PReadReader,
+                       options=model.defaultOptions, executor=None):
+    """Analyse image at path with sector offset offset and options (a
+    model.AnalysisOptions record) in executor (or the event loop's default
+    executor if executor is None), and return its model.ImageResult. Raises
+    FileNotFoundError if the image does not exist
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(
+        isolyzer.processImage, path, offset, readerClass, options=options))
+
+
+async def iteratePaths(paths):
+    """Yield paths from iterable or asynchronous iterable paths"""
+    if hasattr(paths, "__aiter__"):
+        async for path in paths:
+            yield path
+    else:
+        for path in paths:
+            yield path
+
+
+async def analyzeImages(paths, concurrency=DEFAULT_CONCURRENCY, *, offset=0,
+                        readerClass=sr.PReadReader, options=model.defaultOptions):
+    """Analyse images at paths (an iterable or asynchronous iterable), and
+    yield (path, model.ImageResult) tuples in order of completion. At most
+    concurrency images are analysed at the same time, by a pool of as many
+    threads, and paths are consumed no faster than that. If an analysis
+    raises an exception (e.g. FileNotFoundError), the remaining analyses are
+    cancelled and the exception is raised
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency must be 1 or more")
+
+    loop = asyncio.get_running_loop()
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency,
+                                                     thread_name_prefix="isolyzer")
+    # Pending analyses, with their paths
+    pending = {}
+    items = iteratePaths(paths).__aiter__()
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(pending) < concurrency:
+                try:
+                    path = await items.__anext__()
+                except StopAsyncIteration:
+                    exhausted = True
+                    break
+                task = asyncio.ensure_future(analyzeImage(
+                    path, offset=offset, readerClass=readerClass, options=options,
+                    executor=executor))
+                pending[task] = path
+            if not pending:
+                break
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                path = pending.pop(task)
+                yield path, task.result()
+    finally:
+        # Cancelling a task also cancels its analysis if it has not started
+        # yet; analyses that already started are not waited for
+        for task in pending:
+            task.cancel()
+        executor.shutdown(wait=False)
+
+
+# The names of the asyncio API in PEP 8 style, as in asyncio itself
+analyze_image = analyzeImage
+analyze_images = analyzeImages
@@ -1,134 +1,335 @@
 #! /usr/bin/env python3
 """Parser functions for Apple file systems"""
 
-import xml.etree.ElementTree as ET
+from . import budgets
 from . import byteconv as bc
-from . import shared as shared
-
-
-def parseZeroBlock(bytesData):
-
-    """Parse Zero Block and return extracted properties"""
-
-    # Based on code at:
-    # https://opensource.apple.com/source/IOStorageFamily/IOStorageFamily-116/IOApplePartitionScheme.h
-
-    # Set up elemement object to store extracted properties
-    properties = ET.Element("appleZeroBlock")
-
-    shared.addProperty(properties, "signature",
-                       bc.bytesToText(bytesData[0:2]))
-    shared.addProperty(properties, "blockSize",
-                       bc.bytesToUShortInt(bytesData[2:4]))
-    shared.addProperty(properties, "blockCount",
-                       bc.bytesToUInt(bytesData[4:8]))
-    shared.addProperty(properties, "deviceType",
-                       bc.bytesToUShortInt(bytesData[8:10]))
-    shared.addProperty(properties, "deviceID",
-                       bc.bytesToUShortInt(bytesData[10:12]))
-    shared.addProperty(properties, "driverData",
-                       bc.bytesToUInt(bytesData[12:16]))
-    shared.addProperty(properties, "driverDescriptorCount",
-                       bc.bytesToUShortInt(bytesData[80:82]))
-    shared.addProperty(properties, "driverDescriptorBlockStart",
-                       bc.bytesToUInt(bytesData[82:86]))
-    shared.addProperty(properties, "driverDescriptorBlockCount",
-                       bc.bytesToUShortInt(bytesData[86:88]))
-    shared.addProperty(properties, "driverDescriptorSystemType",
-                       bc.bytesToUShortInt(bytesData[88:90]))
-
-    return properties
-
-
-def parsePartitionMap(bytesData):
-
-    """Parse Partition Map and return extracted properties"""
-
-    # Based on description at:
-    # https://en.wikipedia.org/wiki/Apple_Partition_Map#Layout
-    # and code at:
-    # https://opensource.apple.com/source/IOStorageFamily/IOStorageFamily-116/IOApplePartitionScheme.h
-    # Variable naming mostly follows Apple's code.
-
-    # Set up elemement object to store extracted properties
-    properties = ET.Element("applePartitionMap")
-
-    shared.addProperty(properties, "signature",
-                       bc.bytesToText(bytesData[0:2]))
-    shared.addProperty(properties, "numberOfPartitionEntries",
-                       bc.bytesToUInt(bytesData[4:8]))
-    shared.addProperty(properties, "partitionBlockStart",
-                       bc.bytesToUInt(bytesData[8:12]))
-    shared.addProperty(properties, "partitionBlockCount",
-                       bc.bytesToUInt(bytesData[12:16]))
-    shared.addProperty(properties, "partitionName",
-                       bc.bytesToText(bytesData[16:48]))
-    shared.addProperty(properties, "partitionType",
-                       bc.bytesToText(bytesData[48:80]))
-    shared.addProperty(properties, "partitionLogicalBlockStart",
-                       bc.bytesToUInt(bytesData[80:84]))
-    shared.addProperty(properties, "partitionLogicalBlockCount",
-                       bc.bytesToUInt(bytesData[84:88]))
-    shared.addProperty(properties, "partitionFlags",
-                       bc.bytesToUInt(bytesData[88:92]))
-    shared.addProperty(properties, "bootCodeBlockStart",
-                       bc.bytesToUInt(bytesData[92:96]))
-    shared.addProperty(properties, "bootCodeSizeInBytes",
-                       bc.bytesToUInt(bytesData[96:100]))
-    shared.addProperty(properties, "bootCodeLoadAddress",
-                       bc.bytesToUInt(bytesData[100:104]))
-    shared.addProperty(properties, "bootCodeJumpAddress",
-                       bc.bytesToUInt(bytesData[108:112]))
-    shared.addProperty(properties, "bootCodeChecksum",
-                       bc.bytesToUInt(bytesData[116:120]))
-    shared.addProperty(properties, "processorType",
-                       bc.bytesToText(bytesData[120:136]))
-
-    return properties
-
-
-def parseMasterDirectoryBlock(bytesData):
-
-    """Parse Master Directory Block and return extracted properties"""
-
-    # Based on description at:
-    # https://developer.apple.com/legacy/library/documentation/mac/Files/Files-102.html
-    # and https://github.com/libyal/libfshfs/blob/master/documentation/Hierarchical%20File%20System%20(HFS).asciidoc
-
-    # Set up elemement object to store extracted properties
-    properties = ET.Element("masterDirectoryBlock")
-
-    shared.addProperty(properties, "signature",
-                       bc.bytesToText(bytesData[0:2]))
-    shared.addProperty(properties, "blockCount",
-                       bc.bytesToUShortInt(bytesData[18:20]))
-    shared.addProperty(properties, "blockSize",
-                       bc.bytesToUInt(bytesData[20:24]))
-
-    charsVolumeName = bc.bytesToUnsignedChar(bytesData[36:37])
-
-    shared.addProperty(properties, "volumeName",
-                       bc.bytesToText(bytesData[37:37 + charsVolumeName]))
-
-    return properties
-
-
-def parseHFSPlusVolumeHeader(bytesData):
-
-    """Parse HFS Plus Volume header and return extracted properties"""
-
-    # Based on https://opensource.apple.com/source/xnu/xnu-344/bsd/hfs/hfs_format.h
-
-    # Set up elemement object to store extracted properties
-    properties = ET.Element("hfsPlusVolumeheader")
-
-    shared.addProperty(properties, "signature",
-                       bc.bytesToText(bytesData[0:2]))
-    shared.addProperty(properties, "version",
-                       bc.bytesToUShortInt(bytesData[2:4]))
-    shared.addProperty(properties, "blockSize",
-                       bc.bytesToUInt(bytesData[40:44]))
-    shared.addProperty(properties, "blockCount",
-                       bc.bytesToUInt(bytesData[44:48]))
-
-    return properties
+from . import detect
+from . import layout
+from . import model
+
+
+# Layout of the Zero Block, based on code at:
+# https://opensource.apple.com/source/IOStorageFamily/IOStorageFamily-116/IOApplePartitionScheme.h
+zeroBlockLayout = layout.Layout(">", [
+    ("signature", 0, "text", 2),
+    ("blockSize", 2, "uint16be"),
+    ("blockCount", 4, "uint32be"),
+    ("deviceType", 8, "uint16be"),
+    ("deviceID", 10, "uint16be"),
+    ("driverData", 12, "uint32be"),
+    ("driverDescriptorCount", 80, "uint16be"),
+    ("driverDescriptorBlockStart", 82, "uint32be"),
+    ("driverDescriptorBlockCount", 86, "uint16be"),
+    ("driverDescriptorSystemType", 88, "uint16be")
+])
+
+# Layout of the Partition Map, based on description at:
+# https://en.wikipedia.org/wiki/Apple_Partition_Map#Layout
+# and code at:
+# https://opensource.apple.com/source/IOStorageFamily/IOStorageFamily-116/IOApplePartitionScheme.h
+# Field naming mostly follows Apple's code.
+partitionMapLayout = layout.Layout(">", [
+    ("signature", 0, "text", 2),
+    ("numberOfPartitionEntries", 4, "uint32be"),
+    ("partitionBlockStart", 8, "uint32be"),
+    ("partitionBlockCount", 12, "uint32be"),
+    ("partitionName", 16, "text", 32),
+    ("partitionType", 48, "text", 32),
+    ("partitionLogicalBlockStart", 80, "uint32be"),
+    ("partitionLogicalBlockCount", 84, "uint32be"),
+    ("partitionFlags", 88, "uint32be"),
+    ("bootCodeBlockStart", 92, "uint32be"),
+    ("bootCodeSizeInBytes", 96, "uint32be"),
+    ("bootCodeLoadAddress", 100, "uint32be"),
+    ("bootCodeJumpAddress", 108, "uint32be"),
+    ("bootCodeChecksum", 116, "uint32be"),
+    ("processorType", 120, "text", 16)
+])
+
+# Layout of the Master Directory Block, based on description at:
+# https://developer.apple.com/legacy/library/documentation/mac/Files/Files-102.html
+# and https://github.com/libyal/libfshfs/blob/master/documentation/Hierarchical%20File%20System%20(HFS).asciidoc
+# The volume name is a Pascal string (length byte followed by the name)
+masterDirectoryBlockLayout = layout.Layout(">", [
+    ("signature", 0, "text", 2),
+    ("blockCount", 18, "uint16be"),
+    ("blockSize", 20, "uint32be"),
+    ("volumeName", 36, "pascal")
+])
+
+# Layout of the HFS Plus Volume header, based on
+# https://opensource.apple.com/source/xnu/xnu-344/bsd/hfs/hfs_format.h
+hfsPlusVolumeHeaderLayout = layout.Layout(">", [
+    ("signature", 0, "text", 2),
+    ("version", 2, "uint16be"),
+    ("blockSize", 40, "uint32be"),
+    ("blockCount", 44, "uint32be")
+])
+
+
+class ZeroBlock(model.Descriptor):
+    """Zero Block, with one property per field of zeroBlockLayout"""
+
+    __slots__ = zeroBlockLayout.names
+    tag = "appleZeroBlock"
+    layout = zeroBlockLayout
+
+
+class PartitionMap(model.Descriptor):
+    """Partition Map entry, with one property per field of partitionMapLayout"""
+
+    __slots__ = partitionMapLayout.names
+    tag = "applePartitionMap"
+    layout = partitionMapLayout
+
+
+class MasterDirectoryBlock(model.Descriptor):
+    """Master Directory Block, with one property per field of
+    masterDirectoryBlockLayout
+    """
+
+    __slots__ = masterDirectoryBlockLayout.names
+    tag = "masterDirectoryBlock"
+    layout = masterDirectoryBlockLayout
+
+
+class HFSPlusVolumeHeader(model.Descriptor):
+    """HFS Plus Volume header, with one property per field of
+    hfsPlusVolumeHeaderLayout
+    """
+
+    __slots__ = hfsPlusVolumeHeaderLayout.names
+    tag = "hfsPlusVolumeheader"
+    layout = hfsPlusVolumeHeaderLayout
+
+
+def parseZeroBlock(bytesData, names=None):
+
+    """Parse Zero Block and return ZeroBlock record"""
+
+    return ZeroBlock.fromBytes(bytesData, names)
+
+
+def parsePartitionMap(bytesData, names=None):
+
+    """Parse Partition Map and return PartitionMap record"""
+
+    return PartitionMap.fromBytes(bytesData, names)
+
+
+def parseMasterDirectoryBlock(bytesData, names=None):
+
+    """Parse Master Directory Block and return MasterDirectoryBlock record"""
+
+    return MasterDirectoryBlock.fromBytes(bytesData, names)
+
+
+def parseHFSPlusVolumeHeader(bytesData, names=None):
+
+    """Parse HFS Plus Volume header and return HFSPlusVolumeHeader record"""
+
+    return HFSPlusVolumeHeader.fromBytes(bytesData, names)
+
+
+def parseFileSystem(reader, offset, profiler, fields=None, budget=budgets.nullBudget):
+    """Parse the Zero Block, Apple Partition Map, Master Directory Block and
+    HFS Plus Volume Header of an image (parse callback of the Apple detector,
+    see the detect module). The file system type is established from the
+    partition types. Returns None if the image only has a Zero Block
+    """
+
+    # Properties that are unpacked (those needed for the size tests, and
+    # the requested fields)
+    zeroBlockNames = ZeroBlock.projection(fields, ("blockSize", "blockCount"))
+    partitionMapNames = PartitionMap.projection(fields, ("numberOfPartitionEntries",
+                                                         "partitionBlockStart", "partitionType"))
+    mdbNames = MasterDirectoryBlock.projection(fields, ("blockSize", "blockCount"))
+    hfsPlusNames = HFSPlusVolumeHeader.projection(fields, ("blockSize", "blockCount"))
+
+    # Set these flags to initial value
+    containsApplePartitionMap = False
+    containsAppleMasterDirectoryBlock = False
+    containsHFSPlusVolumeHeader = False
+    parsedAppleZeroBlock = False
+    parsedMasterDirectoryBlock = False
+    parsedHFSPlusVolumeHeader = False
+    appleBlockSize = 512
+    fileSystemApple = None
+
+    # Does image contain Apple Zero Block?
+    containsAppleZeroBlock = reader.read(0, 2) == b'\x45\x52'
+
+    if containsAppleZeroBlock:
+        # Read block size
+        appleBlockSize = bc.bytesToUShortInt(reader.read(2, 2))
+
+    # Look for Apple Partition Map. Since we cannot rely on the block size
+    # defined in the zero block, we do this by trial and error. First create
+    # a list with all possible start offsets (not sure if 1024 and 1536 are even used in the wild)
+    pmOffsets = [512, 1024, 1536, 2048, appleBlockSize]
+    # Remove duplicates and sort
+    pmOffsets = sorted(list(set(pmOffsets)))
+
+    # Iterate over offsets, and stop at first match
+    for pmOffset in pmOffsets:
+        if reader.read(pmOffset, 2) == b'\x50\x4D':
+            containsApplePartitionMap = True
+            partitionMapOffset = pmOffset
+            appleBlockSize = pmOffset
+            break
+
+    # Does image contain HFS Plus Header or Master Directory Block? This also allows us to
+    # identify the specific file system
+    # (Note: the HFS Plus Header replaces the Master Directory Block of HFS)
+    headerSignature = reader.read(1024, 2)
+
+    if headerSignature == b'\x42\x44':
+        # Hierarchical File System
+        containsAppleMasterDirectoryBlock = True
+        fileSystemApple = "HFS"
+    if headerSignature == b'\xd2\xd7':
+        # Macintosh File System
+        containsAppleMasterDirectoryBlock = True
+        fileSystemApple = "MFS"
+    if headerSignature == b'\x48\x2B':
+        # HFS Plus
+        containsHFSPlusVolumeHeader = True
+        fileSystemApple = "HFS+"
+    if headerSignature == b'\x48\x58':
+        # HFS X (record as HFS+ for consistency with Partition Map fields)
+        containsHFSPlusVolumeHeader = True
+        fileSystemApple = "HFS+"
+
+    # Create element to store properties of Apple filesystems
+    fsApple = model.FileSystem()
+
+    if containsAppleZeroBlock:
+
+        # Based on description at: https://en.wikipedia.org/wiki/Apple_Partition_Map#Layout and
+        # https://opensource.apple.com/source/IOStorageFamily/IOStorageFamily-116/IOApplePartitionScheme.h
+
+        # Get zero block data
+        appleZeroBlockData = reader.read(0, 512)
+        try:
+            appleZeroBlockInfo = parseZeroBlock(appleZeroBlockData, zeroBlockNames)
+            fsApple.append(appleZeroBlockInfo)
+            parsedAppleZeroBlock = True
+        except Exception:
+            parsedAppleZeroBlock = False
+
+    if containsApplePartitionMap:
+
+        # Set up list to store all values of 'partionType' in partition map
+        partitionTypes = []
+
+        # Get partition map data
+        applePartitionMapData = reader.read(partitionMapOffset, appleBlockSize)
+        try:
+            applePartitionMapInfo = parsePartitionMap(applePartitionMapData, partitionMapNames)
+            # Add partition type value to list
+            partitionType = applePartitionMapInfo.partitionType
+            partitionTypes.append(partitionType)
+            fsApple.append(applePartitionMapInfo)
+        except Exception:
+            partitionType = ''
+
+        # If partitionType is Apple_HFS, parse corresponding Master Directory Block
+        if partitionType == 'Apple_HFS':
+            offsetHFS = appleBlockSize * applePartitionMapInfo.partitionBlockStart
+            masterDirectoryBlockData = reader.read(offsetHFS + 1024, 512)
+            try:
+                masterDirectoryBlockInfo = parseMasterDirectoryBlock(masterDirectoryBlockData,
+                                                                     mdbNames)
+                fsApple.append(masterDirectoryBlockInfo)
+                parsedMasterDirectoryBlock = True
+            except Exception:
+                parsedMasterDirectoryBlock = False
+
+        # Iterate over remaining partition map entries
+        pOffset = partitionMapOffset + appleBlockSize
+        for pMap in range(0, applePartitionMapInfo.numberOfPartitionEntries - 1):
+            # The number of entries comes from the image, so it is bounded by
+            # the budget
+            budget.countPartitionEntries()
+            applePartitionMapData = reader.read(pOffset, appleBlockSize)
+            try:
+                applePartitionMapInfo = parsePartitionMap(applePartitionMapData, partitionMapNames)
+                # Add partition type value to list
+                partitionType = applePartitionMapInfo.partitionType
+                partitionTypes.append(partitionType)
+                fsApple.append(applePartitionMapInfo)
+            except Exception:
+                partitionType = ''
+
+            # If partitionType is Apple_HFS, parse corresponding Master Directory Block
+            if partitionType == 'Apple_HFS':
+                offsetHFS = appleBlockSize * applePartitionMapInfo.partitionBlockStart
+                masterDirectoryBlockData = reader.read(offsetHFS + 1024, 512)
+
+                try:
+                    masterDirectoryBlockInfo = parseMasterDirectoryBlock(masterDirectoryBlockData,
+                                                                         mdbNames)
+                    fsApple.append(masterDirectoryBlockInfo)
+                    parsedMasterDirectoryBlock = True
+                except Exception:
+                    parsedMasterDirectoryBlock = False
+
+            pOffset += appleBlockSize
+            profiler.countDescriptors()
+
+        # Establish file system type from partitionType values in all partition maps
+        # Source: https://en.wikipedia.org/wiki/Apple_Partition_Map#Partition_identifiers
+        # Note that this doesn't cover all possible types (but no idea if any of the other types
+        # are used for optical media)
+
+        if 'Apple_MFS' in partitionTypes:
+            # Macintosh File System
+            fileSystemApple = "MFS"
+        elif 'Apple_HFS' in partitionTypes:
+            # Hierarchical File System
+            fileSystemApple = "HFS"
+        elif 'Apple_HFSX' in partitionTypes:
+            # HFS Plus
+            fileSystemApple = "HFS+"
+        else:
+            # Unknown file system
+            fileSystemApple = "Unknown"
+
+    if containsHFSPlusVolumeHeader:
+
+        hfsPlusHeaderData = reader.read(1024, 512)
+        try:
+            hfsPlusHeaderInfo = parseHFSPlusVolumeHeader(hfsPlusHeaderData, hfsPlusNames)
+            fsApple.append(hfsPlusHeaderInfo)
+            parsedHFSPlusVolumeHeader = True
+        except Exception:
+            parsedHFSPlusVolumeHeader = False
+
+    if containsAppleMasterDirectoryBlock:
+
+        masterDirectoryBlockData = reader.read(1024, 512)  # Size of MDB?
+        try:
+            masterDirectoryBlockInfo = parseMasterDirectoryBlock(masterDirectoryBlockData,
+                                                                 mdbNames)
+            fsApple.append(masterDirectoryBlockInfo)
+            parsedMasterDirectoryBlock = True
+        except Exception:
+            parsedMasterDirectoryBlock = False
+
+    if not (containsApplePartitionMap or containsAppleMasterDirectoryBlock or
+            containsHFSPlusVolumeHeader):
+        return None
+    fsApple.type = fileSystemApple
+
+    # Expected size from the zero block (only for images with a partition
+    # map), Master Directory Block and HFS Plus Volume Header
+    sizeExpected = 0
+    if containsApplePartitionMap and parsedAppleZeroBlock:
+        sizeExpected = appleZeroBlockInfo.blockCount * appleZeroBlockInfo.blockSize
+    if containsAppleMasterDirectoryBlock and parsedMasterDirectoryBlock:
+        sizeExpected = max(sizeExpected, masterDirectoryBlockInfo.blockCount *
+                           masterDirectoryBlockInfo.blockSize)
+    if containsHFSPlusVolumeHeader and parsedHFSPlusVolumeHeader:
+        sizeExpected = max(sizeExpected, hfsPlusHeaderInfo.blockCount *
+                           hfsPlusHeaderInfo.blockSize)
+    return detect.Detection(fsApple, sizeExpected)
@@ -0,0 +1,436 @@
+#! /usr/bin/env python3
+"""Columnar batch analysis of image headers (requires NumPy)
+
+analyzeBatch analyses many images at once, and returns the outcome as
+columns (NumPy arrays with one element per image), which can be loaded into
+e.g. a pandas DataFrame as they are. The header window of each image (see
+the detect module) is read into one preallocated buffer, and the signatures
+of all detectors, the ISO 9660 volume descriptors and the UDF Volume
+Recognition Sequence are evaluated for all images in one vectorised pass,
+with the descriptors viewed as NumPy structured arrays. For images with UDF,
+the Anchor Volume Descriptor Pointer and the Volume Descriptor Sequence are
+read into two more buffers, and decoded in the same way. Images are
+analysed in chunks, which share one header buffer, so memory use does not
+grow with the number of images beyond that of the columns.
+
+Images that do not fit this fast path are analysed with processImage, and
+their columns are taken from its result: images with High Sierra or Apple
+file systems (or with file systems of detectors that were registered
+later), descriptor chains that do not end within the buffers, compressed
+images, block devices, images smaller than the header window, and images
+that cannot be read. The columns of all images are identical to those that
+processImage gives (see resultRow); the scalar column tells which images
+took the slow path.
+"""
+
+import os
+import stat
+
+import numpy as np
+
+from . import detect
+from . import iso9660
+from . import sectorreader as sr
+from . import udf
+from .isolyzer import cleanFileName, processImage
+
+
+# Columns, in order, with their NumPy dtypes. ISO 9660 columns are those of
+# the last Primary Volume Descriptor, and UDF columns those of the last
+# Logical Volume and Partition Descriptors (the ones the size tests use);
+# they are 0 or "" if there is no such descriptor
+COLUMNS = [
+    ("path", object),
+    ("success", bool),
+    ("sizeActual", np.int64),
+    ("containsKnownFileSystem", bool),
+    ("iso9660", bool),
+    ("udf", bool),
+    ("volumeSpaceSize", np.int64),
+    ("logicalBlockSize", np.int64),
+    ("volumeCreationDateAndTime", object),
+    ("volumeModificationDateAndTime", object),
+    ("udfLogicalBlockSize", np.int64),
+    ("partitionStartingLocation", np.int64),
+    ("partitionLength", np.int64),
+    ("sizeExpected", np.int64),
+    ("sizeDifference", np.int64),
+    ("sizeAsExpected", bool),
+    ("smallerThanExpected", bool),
+    ("scalar", bool)
+]
+
+# Extensions of compressed images (see isolyzer.openReader)
+COMPRESSED_EXTENSIONS = (".gz", ".gzip", ".xz")
+
+# Detectors whose file systems are decoded by the fast path
+FAST_DETECTORS = ("ISO 9660", "UDF")
+
+# Number of sectors of the UDF Volume Descriptor Sequence that are read
+SEQUENCE_SECTORS = 32
+
+# First sector of the header window that holds volume descriptors
+FIRST_DESCRIPTOR = 16
+
+# ISO 9660 volume descriptor fields (the big-endian halves of both-endian
+# fields, as in the PrimaryVolumeDescriptor layout)
+volumeDescriptorDtype = np.dtype({
+    "names": ["typeCode", "volumeSpaceSize", "logicalBlockSize",
+              "volumeCreationDateAndTime", "volumeModificationDateAndTime"],
+    "formats": ["u1", ">u4", ">u2", ("u1", 17), ("u1", 17)],
+    "offsets": [0, 84, 130, 813, 830],
+    "itemsize": sr.SECTOR_SIZE})
+
+# Identifiers of the Volume Recognition Sequence, and the High Sierra
+# identifier (which follows the 8-byte location of the descriptor)
+recognitionDtype = np.dtype({
+    "names": ["identifier", "highSierraIdentifier"],
+    "formats": [("u1", 5), ("u1", 5)],
+    "offsets": [1, 9],
+    "itemsize": sr.SECTOR_SIZE})
+
+# Anchor Volume Descriptor Pointer (main Volume Descriptor Sequence extent)
+anchorDtype = np.dtype({
+    "names": ["tagIdentifier", "extentLength", "extentLocation"],
+    "formats": ["<u2", "<u4", "<u4"],
+    "offsets": [0, 16, 20],
+    "itemsize": 512})
+
+# Fields of the Logical Volume and Partition Descriptors, which share the
+# tag at the start of each sector of the Volume Descriptor Sequence
+sequenceDtype = np.dtype({
+    "names": ["tagIdentifier", "partitionStartingLocation", "partitionLength",
+              "logicalBlockSize"],
+    "formats": ["<u2", "<u4", "<u4", "<u4"],
+    "offsets": [0, 188, 192, 212],
+    "itemsize": sr.SECTOR_SIZE})
+
+
+def readInto(path, buffers, offsets):
+    """Read image at path into each of buffers (writable NumPy arrays), from
+    the byte offsets in offsets, and return the stat result of the image, or
+    None if it cannot be read or is not a regular file. Each buffer must be
+    filled completely
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+    except OSError:
+        return None
+    try:
+        imageStat = os.fstat(fd)
+        if not stat.S_ISREG(imageStat.st_mode):
+            return None
+        for buffer, offset in zip(buffers, offsets):
+            view = memoryview(buffer).cast("B")
+            position = 0
+            while position < len(view):
+                # One system call per buffer where preadv is available
+                if hasattr(os, 'preadv'):
+                    count = os.preadv(fd, [view[position:]], offset + position)
+                else:
+                    os.lseek(fd, offset + position, os.SEEK_SET)
+                    data = os.read(fd, len(view) - position)
+                    count = len(data)
+                    view[position:position + count] = data
+                if not count:
+                    return None
+                position += count
+        return imageStat
+    except OSError:
+        return None
+    finally:
+        os.close(fd)
+
+
+def matchSignatures(headers, detector):
+    """Return boolean array that is True for the rows of header windows
+    headers that match the signatures of detector
+    """
+    matches = []
+    for offset, values in detector.signatures:
+        found = np.zeros(len(headers), bool)
+        for value in values:
+            signature = np.frombuffer(value, np.uint8)
+            found |= (headers[:, offset:offset + len(value)] == signature).all(axis=1)
+        matches.append(found)
+    return np.logical_and.reduce(matches) if detector.requireAll else \
+        np.logical_or.reduce(matches)
+
+
+def identifierMask(identifiers, candidates):
+    """Return boolean array that is True where identifiers (an array of
+    5-byte identifiers) is in candidates (bytes objects)
+    """
+    found = np.zeros(identifiers.shape[:-1], bool)
+    for candidate in candidates:
+        found |= (identifiers == np.frombuffer(candidate, np.uint8)).all(axis=-1)
+    return found
+
+
+def volumeRecognition(headers):
+    """Return (udf, determined) tuple of boolean arrays: udf is the outcome of
+    detect.volumeRecognitionSequence for each of header windows headers, and
+    determined is False where the volume descriptors continue beyond the
+    header window (so the outcome is not known)
+    """
+    sectors = headers[:, FIRST_DESCRIPTOR * sr.SECTOR_SIZE:].view(recognitionDtype)
+    extended = identifierMask(sectors["identifier"], detect.EXTENDED_IDENTIFIERS)
+    continues = identifierMask(sectors["identifier"], detect.VOLUME_RECOGNITION_IDENTIFIERS) | \
+        identifierMask(sectors["highSierraIdentifier"], [b"CDROM"])
+    # Descriptors that are reached: all preceding ones continue the sequence
+    reached = np.ones_like(continues)
+    reached[:, 1:] = np.logical_and.accumulate(continues, axis=1)[:, :-1]
+    matched = (extended & reached).any(axis=1)
+    return matched, matched | ~continues.all(axis=1)
+
+
+def lastBefore(values, code, end):
+    """Return (index, found) tuple of arrays with the column of the last
+    element of each row of 2-dimensional array values that equals code
+    before column end (array with one column per row), and whether there is
+    one
+    """
+    columns = np.arange(values.shape[1])
+    candidates = np.where((values == code) & (columns < end[:, None]), columns, -1)
+    index = candidates.max(axis=1, initial=-1)
+    return np.maximum(index, 0), index >= 0
+
+
+def firstOf(values, code):
+    """Return (index, found) tuple of arrays with the column of the first
+    element of each row of values that equals code, and whether there is one
+    """
+    matches = values == code
+    return matches.argmax(axis=1), matches.any(axis=1)
+
+
+def decodeDates(dates):
+    """Return object array with the date strings of array of 17-byte ISO 9660
+    dates (each distinct date is converted once)
+    """
+    converted = np.empty(len(dates), object)
+    if len(dates):
+        distinct, inverse = np.unique(dates, axis=0, return_inverse=True)
+        strings = np.empty(len(distinct), object)
+        strings[:] = [iso9660.decDateTimeToDate(row.tobytes()) for row in distinct]
+        converted[:] = strings[inverse.reshape(-1)]
+    return converted
+
+
+def detectFileSystems(headers, scalar):
+    """Evaluate the detectors against header windows headers, and return
+    (iso, udf) tuple of boolean arrays for the ISO 9660 and UDF file systems.
+    Images whose file systems are not decoded by the fast path are marked
+    in scalar
+    """
+    iso = np.zeros(len(headers), bool)
+    udfFound = np.zeros(len(headers), bool)
+    for detector in detect.detectors:
+        if detector.probe is detect.volumeRecognitionSequence:
+            matched, determined = volumeRecognition(headers)
+            scalar |= ~determined
+        elif detector.probe is not None:
+            # Probe functions cannot be vectorised
+            scalar[:] = True
+            matched = np.zeros(len(headers), bool)
+        else:
+            matched = matchSignatures(headers, detector)
+        if detector.name == "ISO 9660":
+            iso = matched
+        elif detector.name == "UDF":
+            udfFound = matched
+        else:
+            scalar |= matched
+    if [detector.name for detector in detect.detectors if detector.name in FAST_DETECTORS] != \
+            list(FAST_DETECTORS):
+        scalar[:] = True
+    return iso, udfFound
+
+
+def decodeISO9660(headers, iso, offset, scalar, columns):
+    """Decode the Primary Volume Descriptors of the images in header windows
+    headers that contain ISO 9660 (boolean array iso) into columns, and return
+    array with the expected sizes. Images whose volume descriptors are not
+    terminated within the header window are marked in scalar
+    """
+    descriptors = headers[:, FIRST_DESCRIPTOR * sr.SECTOR_SIZE:].view(volumeDescriptorDtype)
+    terminator, terminated = firstOf(descriptors["typeCode"], 255)
+    scalar |= iso & ~terminated
+    # The last Primary Volume Descriptor is reported and used
+    index, found = lastBefore(descriptors["typeCode"], 1, terminator)
+    found &= iso & ~scalar
+    primary = descriptors[np.arange(len(headers)), index]
+    columns["volumeSpaceSize"][found] = primary["volumeSpaceSize"][found]
+    columns["logicalBlockSize"][found] = primary["logicalBlockSize"][found]
+    for name in ("volumeCreationDateAndTime", "volumeModificationDateAndTime"):
+        columns[name][found] = decodeDates(primary[name][found])
+    return np.where(found, (columns["volumeSpaceSize"] - offset) * columns["logicalBlockSize"],
+                    0)
+
+
+def readRows(paths, rows, scalar, itemSize, offsets, lengths=None):
+    """Read itemSize bytes (or the number of bytes in lengths, if given)
+    from byte offsets offsets of the images with indexes rows into a new
+    zero-filled buffer (one row per image), and return (rows, buffer) tuple
+    for the images that could be read; the others are marked in scalar
+    """
+    buffer = np.zeros((len(rows), itemSize), np.uint8)
+    if lengths is None:
+        lengths = np.full(len(rows), itemSize)
+    readable = np.array([readInto(paths[row], [data[:length]], [offset]) is not None
+                         for row, data, offset, length in zip(rows, buffer, offsets, lengths)],
+                        bool)
+    scalar[rows[~readable]] = True
+    return rows[readable], buffer[readable]
+
+
+def decodeUDF(paths, sizes, udfFound, scalar, columns):
+    """Read and decode the Anchor Volume Descriptor Pointer and main Volume
+    Descriptor Sequence of the images that contain UDF (boolean array
+    udfFound) into columns, and return array with the expected sizes.
+    Images whose sequence does not fit the fast path are marked in scalar
+    """
+    sizeExpected = np.zeros(len(paths), np.int64)
+    anchorEnd = 256 * sr.SECTOR_SIZE + anchorDtype.itemsize
+    scalar |= udfFound & (sizes < anchorEnd)
+    rows = np.flatnonzero(udfFound & ~scalar)
+    rows, anchors = readRows(paths, rows, scalar, anchorDtype.itemsize,
+                             [256 * sr.SECTOR_SIZE] * len(rows))
+    anchors = anchors.view(anchorDtype)[:, 0]
+    location = anchors["extentLocation"].astype(np.int64)
+    # Only the sectors of the extent of the sequence are read (at most
+    # SEQUENCE_SECTORS); the rest of the buffer stays zero, so sequences
+    # that do not terminate within it go to the scalar path. The sequence
+    # is not read if the anchor's tag is that of a Terminating Descriptor
+    sectors = np.clip(anchors["extentLength"].astype(np.int64) // sr.SECTOR_SIZE,
+                      1, SEQUENCE_SECTORS)
+    fits = (anchors["tagIdentifier"] != udf.TAG_TERMINATING_DESCRIPTOR) & \
+        ((location + sectors) * sr.SECTOR_SIZE <= sizes[rows])
+    scalar[rows[~fits]] = True
+    rows, sequences = readRows(paths, rows[fits], scalar, SEQUENCE_SECTORS * sr.SECTOR_SIZE,
+                               location[fits] * sr.SECTOR_SIZE,
+                               sectors[fits] * sr.SECTOR_SIZE)
+    sequences = sequences.view(sequenceDtype)
+    tags = sequences["tagIdentifier"]
+    terminator, terminated = firstOf(tags, udf.TAG_TERMINATING_DESCRIPTOR)
+    # The last Logical Volume and Partition Descriptors are used
+    lvdIndex, lvdFound = lastBefore(tags, udf.TAG_LOGICAL_VOLUME_DESCRIPTOR, terminator)
+    pdIndex, pdFound = lastBefore(tags, udf.TAG_PARTITION_DESCRIPTOR, terminator)
+    # A Logical Volume Descriptor without Partition Descriptor is an error
+    fits = terminated & (pdFound | ~lvdFound)
+    scalar[rows[~fits]] = True
+
+    sequence = np.arange(len(rows))
+    lvdRows = rows[fits & lvdFound]
+    pdRows = rows[fits & pdFound]
+    columns["udfLogicalBlockSize"][lvdRows] = \
+        sequences[sequence, lvdIndex]["logicalBlockSize"][fits & lvdFound]
+    partitions = sequences[sequence, pdIndex][fits & pdFound]
+    columns["partitionStartingLocation"][pdRows] = partitions["partitionStartingLocation"]
+    columns["partitionLength"][pdRows] = partitions["partitionLength"]
+    sizeExpected[lvdRows] = (columns["partitionLength"][lvdRows] +
+                             columns["partitionStartingLocation"][lvdRows]) * \
+        columns["udfLogicalBlockSize"][lvdRows]
+    return sizeExpected
+
+
+def resultRow(result):
+    """Return dictionary with the columns of model.ImageResult result (as
+    returned by processImage)
+    """
+    row = {name: "" if dtype is object else dtype(0) for name, dtype in COLUMNS}
+    row["path"] = result.fileInfo.filePath
+    row["success"] = bool(result.statusInfo.success)
+    row["scalar"] = True
+    tests = result.tests
+    for name in ("sizeActual", "sizeExpected", "sizeDifference"):
+        row[name] = getattr(tests, name) or 0
+    for name in ("containsKnownFileSystem", "sizeAsExpected", "smallerThanExpected"):
+        row[name] = bool(getattr(tests, name))
+    for fileSystem in result.fileSystems:
+        # The last descriptor of each kind is the one the size tests use
+        descriptors = {descriptor.tag: descriptor for descriptor in fileSystem.descriptors}
+        if fileSystem.type == "ISO 9660":
+            row["iso9660"] = True
+            pvd = descriptors.get("primaryVolumeDescriptor")
+            if pvd is not None:
+                row["volumeSpaceSize"] = pvd.volumeSpaceSize
+                row["logicalBlockSize"] = pvd.logicalBlockSize
+                row["volumeCreationDateAndTime"] = pvd.volumeCreationDateAndTime
+                row["volumeModificationDateAndTime"] = pvd.volumeModificationDateAndTime
+        elif fileSystem.type == "UDF":
+            row["udf"] = True
+            lvd = descriptors.get("logicalVolumeDescriptor")
+            if lvd is not None:
+                row["udfLogicalBlockSize"] = lvd.logicalBlockSize
+            pd = descriptors.get("partitionDescriptor")
+            if pd is not None:
+                row["partitionStartingLocation"] = pd.partitionStartingLocation
+                row["partitionLength"] = pd.partitionLength
+    return row
+
+
+def analyzeChunk(paths, offset, headers, columns):
+    """Analyse images (list of paths) with sector offset offset into
+    columns (dictionary with one array per column, with one element per
+    image), with headers (array with at least one header window per image)
+    as buffer for the header windows
+    """
+    count = len(paths)
+    # Rows of images that cannot be read completely keep the data of an
+    # earlier chunk, but these images take the scalar path
+    headers = headers[:count]
+    sizes = np.zeros(count, np.int64)
+    scalar = np.zeros(count, bool)
+    for row, path in enumerate(paths):
+        imageStat = None
+        if not path.lower().endswith(COMPRESSED_EXTENSIONS):
+            imageStat = readInto(path, [headers[row]], [0])
+        if imageStat is None:
+            scalar[row] = True
+        else:
+            sizes[row] = imageStat.st_size
+
+    iso, udfFound = detectFileSystems(headers, scalar)
+    sizeExpected = np.maximum(decodeISO9660(headers, iso, offset, scalar, columns),
+                              decodeUDF(paths, sizes, udfFound, scalar, columns))
+    sizeExpected = np.maximum(sizeExpected, 0)
+
+    # Size tests, as in processImage
+    difference = sizes - sizeExpected
+    columns["success"][:] = True
+    columns["sizeActual"][:] = sizes
+    columns["containsKnownFileSystem"][:] = iso | udfFound
+    columns["iso9660"][:] = iso
+    columns["udf"][:] = udfFound
+    columns["sizeExpected"][:] = sizeExpected
+    columns["sizeDifference"][:] = difference
+    columns["sizeAsExpected"][:] = (difference == 0) & (sizeExpected != 0)
+    columns["smallerThanExpected"][:] = ~columns["sizeAsExpected"] & (difference <= 0)
+
+    # All other images are analysed by processImage
+    for row in np.flatnonzero(scalar):
+        for name, value in resultRow(processImage(paths[row], offset)).items():
+            columns[name][row] = value
+
+
+def analyzeBatch(images, offset=0, chunkSize=1024):
+    """Analyse images (a sequence of paths) with sector offset offset, and
+    return dictionary with one NumPy array per column (see COLUMNS), with
+    one element per image, in the order of images. Images are analysed in
+    chunks of chunkSize images, which share one header buffer. Raises
+    FileNotFoundError if an image does not exist
+    """
+    paths = list(images)
+    count = len(paths)
+    columns = {name: np.zeros(count, dtype) for name, dtype in COLUMNS}
+    for name in ("volumeCreationDateAndTime", "volumeModificationDateAndTime"):
+        columns[name][:] = ""
+    columns["path"][:] = [cleanFileName(os.path.abspath(path)) for path in paths]
+
+    headers = np.empty((min(count, chunkSize), detect.HEADER_WINDOW_SIZE), np.uint8)
+    for start in range(0, count, chunkSize):
+        chunk = slice(start, start + chunkSize)
+        analyzeChunk(paths[chunk], offset, headers,
+                     {name: column[chunk] for name, column in columns.items()})
+    return columns
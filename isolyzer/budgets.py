@@ -0,0 +1,150 @@
+#! /usr/bin/env python3
+"""Budgets that bound the work spent on parsing one image
+
+The parsers follow chains of descriptors whose length comes from the image
+itself (e.g. the ISO 9660 volume descriptors up to the Volume Descriptor Set
+Terminator, or the number of entries of an Apple Partition Map). On a
+corrupt or hostile image, these could be followed for millions of
+descriptors. A Budget is charged by the parse loops, and raises
+BudgetExceeded as soon as any of its Limits is exceeded, which processImage
+reports as a failure of the analysis of the image. processImage also sets the
+budget as the budget of the sector reader of the image, which checks it
+before each read (so the time limit also holds between descriptors). The
+budget is created before the image is opened, so the time limit also
+covers opening it (e.g. the decompression of a compressed image to establish
+its size).
+"""
+
+import time
+from . import sectorreader as sr
+
+
+# Default limits: far beyond what real images need
+DEFAULT_MAX_DESCRIPTORS = 1024
+DEFAULT_MAX_SECTORS = 65536
+DEFAULT_MAX_PARTITION_ENTRIES = 1024
+
+
+class BudgetExceeded(Exception):
+    """Raised when the analysis of an image exceeds its budget"""
+
+
+class Limits:
+    """Limits of the budget of each image: the maximum number of volume
+    descriptors that are visited (per file system), of sectors that are read
+    from the image while the file systems are parsed, of Apple Partition Map
+    entries, and the time (in seconds) after which the analysis of an image
+    is given up (None for no limit). Limits are not changed during analysis,
+    so one instance can be shared by all images (and sent to worker
+    processes)
+    """
+
+    def __init__(self, maxDescriptors=DEFAULT_MAX_DESCRIPTORS, maxSectors=DEFAULT_MAX_SECTORS,
+                 maxPartitionEntries=DEFAULT_MAX_PARTITION_ENTRIES, timeout=None):
+        self.maxDescriptors = maxDescriptors
+        self.maxSectors = maxSectors
+        self.maxPartitionEntries = maxPartitionEntries
+        self.timeout = timeout
+
+
+class Budget:
+    """Budget of the image that is read by sector reader reader (which may
+    be attached later), within limits (a Limits instance; default limits if
+    None). Sectors are counted from the creation of the budget or from the
+    attachment of the reader, and time from the creation of the budget
+    """
+
+    def __init__(self, reader=None, limits=None):
+        self.reader = reader
+        self.limits = Limits() if limits is None else limits
+        self.bytesReadStart = 0 if reader is None else reader.bytesRead
+        self.deadline = None
+        if self.limits.timeout is not None:
+            self.deadline = time.monotonic() + self.limits.timeout
+        self.descriptors = {}
+        self.partitionEntries = 0
+
+    def attach(self, reader):
+        """Set the budget as the budget of (unopened) sector reader reader,
+        whose sectors are counted from now on
+        """
+        self.reader = reader
+        self.bytesReadStart = reader.bytesRead
+        reader.budget = self
+
+    def check(self):
+        """Raise BudgetExceeded if the reader has read more sectors than
+        allowed, or if the time is up
+        """
+        bytesRead = 0 if self.reader is None else self.reader.bytesRead
+        sectorsRead = (bytesRead - self.bytesReadStart) // sr.SECTOR_SIZE
+        if sectorsRead > self.limits.maxSectors:
+            raise BudgetExceeded("budget exceeded: more than %d sectors read" %
+                                 self.limits.maxSectors)
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise BudgetExceeded("budget exceeded: analysis took more than %g seconds" %
+                                 self.limits.timeout)
+
+    def exempt(self, byteCount):
+        """Leave byteCount bytes that the reader has read out of the count
+        of sectors read (e.g. those of the scan of the whole image for
+        sessions, which is bounded by the size of the image)
+        """
+        self.bytesReadStart += byteCount
+
+    def charge(self, byteCount):
+        """Count byteCount bytes as read, in addition to those the reader has
+        read (e.g. the uncompressed data of a compressed image, whose
+        compressed data is exempt)
+        """
+        self.bytesReadStart -= byteCount
+
+    def countDescriptors(self, fileSystem, number=1):
+        """Add number to count of visited descriptors of fileSystem, and
+        check the budget
+        """
+        count = self.descriptors.get(fileSystem, 0) + number
+        self.descriptors[fileSystem] = count
+        if count > self.limits.maxDescriptors:
+            raise BudgetExceeded("budget exceeded: more than %d %s volume descriptors" %
+                                 (self.limits.maxDescriptors, fileSystem))
+        self.check()
+
+    def countPartitionEntries(self, number=1):
+        """Add number to count of visited Apple Partition Map entries, and
+        check the budget
+        """
+        self.partitionEntries += number
+        if self.partitionEntries > self.limits.maxPartitionEntries:
+            raise BudgetExceeded("budget exceeded: more than %d partition map entries" %
+                                 self.limits.maxPartitionEntries)
+        self.check()
+
+
+class NullBudget(Budget):
+    """Budget without limits"""
+
+    def __init__(self):
+        pass
+
+    def check(self):
+        pass
+
+    def attach(self, reader):
+        pass
+
+    def exempt(self, byteCount):
+        pass
+
+    def charge(self, byteCount):
+        pass
+
+    def countDescriptors(self, fileSystem, number=1):
+        pass
+
+    def countPartitionEntries(self, number=1):
+        pass
+
+
+# Shared instance that is used when no budget is given
+nullBudget = NullBudget()
@@ -3,7 +3,7 @@
 
 import struct
 import binascii
-import unicodedata
+from . import textconv
 
 
 def _doConv(bytestr, bOrder, formatCharacter):
@@ -129,11 +129,8 @@ def containsControlCharacters(bytestring):
 def removeControlCharacters(string):
     """Remove control characters from string"""
 
-    # Adapted from: http://stackoverflow.com/a/19016117/1209004
-
     # Tab, newline and return are part of C0, but are allowed in XML
-    allowedChars = [u'\t', u'\n', u'\r']
-    return "".join(ch for ch in string if unicodedata.category(ch)[0] != "C" or ch in allowedChars)
+    return textconv.removeControlCharacters(string)
 
 
 def removeNullTerminator(bytestring):
@@ -158,7 +155,7 @@ def bytesToText(bytestring):
         string = bytestring.decode(encoding=enc, errors=errorMode)
 
         # Remove control characters
-        result = removeControlCharacters(string)
+        result = string.translate(textconv.controlCharacterTable)
 
     except:
         # Return empty string if bytestring cannot be decoded
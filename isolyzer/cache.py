@@ -0,0 +1,137 @@
+#! /usr/bin/env python3
+"""Persistent SQLite-backed cache of image results
+
+Results are keyed on the device, inode, size and modification time (in
+nanoseconds) of the image, the sector offset, the analysis options that
+affect the result (e.g. checksum algorithms) and the isolyzer version, so
+a cached result can be looked up from a stat result alone, without opening
+the image. Stat results without an inode number (st_ino is 0, e.g. those of
+os.DirEntry on Windows, or of file systems without file IDs) do not identify
+the image, so their results are only used for the path they were stored
+for. Results are ImageResult records, which are stored as JSON of their
+plain representation (see model.toPlain).
+"""
+
+import os
+import json
+import sqlite3
+from . import model
+# Imported to register their descriptor records, which are restored by name
+from . import iso9660, hsf, udf, apple
+
+
+# Cache modes: use cached results, re-analyse all images and refresh the
+# stored results, or discard all stored results first
+CACHE_MODES = ["use", "revalidate", "rebuild"]
+
+# Number of stored results after which changes are committed
+COMMIT_INTERVAL = 1000
+
+# Version of the stored result format, which is part of the version key, so
+# results in an older format are never used (and are removed by prune)
+RESULT_FORMAT = 4
+
+
+class ResultCache:
+    """Cache of image results in SQLite database dbFile"""
+
+    def __init__(self, dbFile, version, mode="use"):
+        if mode not in CACHE_MODES:
+            raise ValueError("unknown cache mode " + mode)
+        self.version = "%s/%d" % (version, RESULT_FORMAT)
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+        self.pendingWrites = 0
+        self.connection = sqlite3.connect(dbFile)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS results (
+                                   device INTEGER, inode INTEGER, size INTEGER,
+                                   mtimeNs INTEGER, offset INTEGER, options TEXT,
+                                   version TEXT, path TEXT, result TEXT,
+                                   PRIMARY KEY (device, inode, size, mtimeNs, offset,
+                                                options, version))""")
+        if mode == "rebuild":
+            self.connection.execute("DELETE FROM results")
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def key(self, imageStat, offset, options=""):
+        """Return cache key for stat result, sector offset and options string"""
+        return (imageStat.st_dev, imageStat.st_ino, imageStat.st_size,
+                imageStat.st_mtime_ns, offset, options, self.version)
+
+    def lookup(self, imageStat, offset, options="", path=None):
+        """Return cached ImageResult for image with stat result imageStat,
+        or None if there is no matching result (or if the cache mode does not
+        allow using cached results). If imageStat has no inode number, the
+        result must have been stored for the image at path
+        """
+        if self.mode != "use":
+            self.misses += 1
+            return None
+        row = self.connection.execute("""SELECT path, result FROM results WHERE device=?
+                                      AND inode=? AND size=? AND mtimeNs=? AND offset=?
+                                      AND options=? AND version=?""",
+                                      self.key(imageStat, offset, options)).fetchone()
+        if row is None or (imageStat.st_ino == 0 and row[0] != path):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return model.fromPlain(json.loads(row[1]))
+
+    def store(self, imageStat, offset, path, result, options=""):
+        """Store ImageResult for image at path with stat result imageStat"""
+        self.connection.execute("INSERT OR REPLACE INTO results VALUES "
+                                "(?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                self.key(imageStat, offset, options) +
+                                (path, json.dumps(model.toPlain(result))))
+        self.pendingWrites += 1
+        if self.pendingWrites >= COMMIT_INTERVAL:
+            self.commit()
+
+    def commit(self):
+        """Commit stored results"""
+        self.connection.commit()
+        self.pendingWrites = 0
+
+    def prune(self):
+        """Delete entries of other isolyzer versions, and entries whose image
+        no longer exists or has changed since it was stored. Returns the
+        number of deleted entries
+        """
+        stale = []
+        rows = self.connection.execute("""SELECT device, inode, size, mtimeNs, offset, options,
+                                       version, path FROM results""")
+        for row in rows:
+            key = tuple(row[:7])
+            if key[6] == self.version:
+                try:
+                    if self.key(os.stat(row[7]), key[4], key[5]) == key:
+                        continue
+                except OSError:
+                    pass
+            stale.append(key)
+        self.connection.executemany("""DELETE FROM results WHERE device=? AND inode=?
+                                    AND size=? AND mtimeNs=? AND offset=? AND options=?
+                                    AND version=?""", stale)
+        self.commit()
+        return len(stale)
+
+    def hitRate(self):
+        """Return fraction of lookups that were hits"""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def close(self):
+        """Commit and close database"""
+        if self.connection is not None:
+            self.commit()
+            self.connection.close()
+            self.connection = None
@@ -0,0 +1,125 @@
+#! /usr/bin/env python3
+"""Whole-image checksums that are computed alongside the structural analysis
+
+A Checksummer reads an image sequentially in large aligned chunks in a
+helper thread, and hands each chunk buffer to one hashing thread per
+algorithm, which all feed the same buffer to their hash object. File reads
+and hashlib updates both release the GIL, so reading, hashing and the
+structural analysis in the main thread all overlap, and the image is read
+only once for all algorithms.
+"""
+
+import os
+import queue
+import hashlib
+import threading
+
+
+# Supported algorithms, in the order in which they are reported
+CHECKSUM_ALGORITHMS = ["md5", "sha1", "sha224", "sha256", "sha384", "sha512",
+                       "blake2b", "blake2s"]
+
+# Size of sequential reads (a multiple of the page and sector size)
+CHUNK_SIZE = 4 * 1024 * 1024
+
+# Number of chunk buffers that circulate between reading and hashing threads
+NO_BUFFERS = 3
+
+
+def parseAlgorithms(algorithmList):
+    """Parse comma-separated list of algorithm names, and return list of
+    algorithms in reporting order. Raises ValueError for unknown algorithms
+    """
+    algorithms = [name.strip().lower() for name in algorithmList.split(",") if name.strip()]
+    for name in algorithms:
+        if name not in CHECKSUM_ALGORITHMS:
+            raise ValueError("unsupported checksum algorithm " + name)
+    return [name for name in CHECKSUM_ALGORITHMS if name in algorithms]
+
+
+class Checksummer:
+    """Computes checksums of file filename with all of algorithms"""
+
+    def __init__(self, filename, algorithms, chunkSize=CHUNK_SIZE, noBuffers=NO_BUFFERS):
+        self.filename = filename
+        self.algorithms = algorithms
+        self.hashes = [hashlib.new(name) for name in algorithms]
+        self.bytesHashed = 0
+        self.error = None
+        self.buffers = [bytearray(chunkSize) for _ in range(noBuffers)]
+        # Number of hashing threads that still need each buffer
+        self.usersLeft = [0] * noBuffers
+        self.lock = threading.Lock()
+        # Indices of buffers that can be read into
+        self.freeBuffers = queue.Queue()
+        # Filled chunks, as (buffer index, number of bytes) tuples, for each
+        # hashing thread
+        self.filledChunks = [queue.Queue() for _ in self.hashes]
+        self.threads = [threading.Thread(target=self.readChunks, daemon=True)]
+        self.threads += [threading.Thread(target=self.hashChunks, args=(checksum, chunks),
+                                          daemon=True)
+                         for checksum, chunks in zip(self.hashes, self.filledChunks)]
+
+    def start(self):
+        """Start reading and hashing"""
+        for index in range(len(self.buffers)):
+            self.freeBuffers.put(index)
+        for thread in self.threads:
+            thread.start()
+
+    def readChunks(self):
+        """Read file sequentially into free buffers, and pass them on to the
+        hashing threads; None marks the end of the file (or a read error)
+        """
+        try:
+            with open(self.filename, "rb", buffering=0) as f:
+                if hasattr(os, 'posix_fadvise'):
+                    try:
+                        os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+                    except OSError:
+                        pass
+                while True:
+                    index = self.freeBuffers.get()
+                    noBytes = f.readinto(self.buffers[index])
+                    if not noBytes:
+                        break
+                    self.bytesHashed += noBytes
+                    self.usersLeft[index] = len(self.hashes)
+                    for chunks in self.filledChunks:
+                        chunks.put((index, noBytes))
+        except OSError as ex:
+            self.error = ex
+        finally:
+            for chunks in self.filledChunks:
+                chunks.put(None)
+
+    def hashChunks(self, checksum, chunks):
+        """Feed filled chunks to hash object checksum, and return each buffer
+        to the reading thread once all hashing threads are done with it. Each
+        algorithm has its own thread, so the algorithms are computed in
+        parallel
+        """
+        while True:
+            item = chunks.get()
+            if item is None:
+                break
+            index, noBytes = item
+            with memoryview(self.buffers[index]) as view:
+                with view[:noBytes] as chunk:
+                    checksum.update(chunk)
+            with self.lock:
+                self.usersLeft[index] -= 1
+                if self.usersLeft[index] == 0:
+                    self.freeBuffers.put(index)
+
+    def digests(self):
+        """Wait until the whole file is hashed, and return list of
+        (algorithm, hex digest) tuples. Raises OSError if the file could not
+        be read
+        """
+        for thread in self.threads:
+            thread.join()
+        if self.error is not None:
+            raise self.error
+        return [(name, checksum.hexdigest())
+                for name, checksum in zip(self.algorithms, self.hashes)]
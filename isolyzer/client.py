@@ -0,0 +1,214 @@
+#! /usr/bin/env python3
+"""Thin client for isolyzer server mode (see the server module)
+
+The client only imports what it needs to talk to the server, so it starts
+much faster than isolyzer itself. Paths are made absolute before they are
+sent, and the report is written to stdout as it is returned by the server.
+Requests that are refused because the server is busy are retried after the
+delay the server asks for.
+
+Usage: isolyzer-client (--socket PATH | --port PORT) [options] ISOImages
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import http.client
+
+
+# Maximum number of times a request is retried while the server is busy
+DEFAULT_RETRIES = 10
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection over a Unix domain socket"""
+
+    def __init__(self, socketPath, timeout=None):
+        http.client.HTTPConnection.__init__(self, "localhost", timeout=timeout)
+        self.socketPath = socketPath
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            sock.settimeout(self.timeout)
+        sock.connect(self.socketPath)
+        self.sock = sock
+
+
+class ServerError(Exception):
+    """Error response from server, with its HTTP status code"""
+
+    def __init__(self, status, message):
+        Exception.__init__(self, message)
+        self.status = status
+
+
+class Client:
+    """Client for an isolyzer server on Unix domain socket socketPath, or on
+    TCP port port of localhost. The connection is kept open between requests
+    """
+
+    def __init__(self, socketPath=None, port=None, timeout=None, retries=DEFAULT_RETRIES):
+        if (socketPath is None) == (port is None):
+            raise ValueError("specify either socketPath or port")
+        self.socketPath = socketPath
+        self.port = port
+        self.timeout = timeout
+        self.retries = retries
+        self.connection = None
+
+    def connect(self):
+        """Return connection to server, and open it if needed"""
+        if self.connection is None:
+            if self.socketPath is not None:
+                self.connection = UnixHTTPConnection(self.socketPath, self.timeout)
+            else:
+                self.connection = http.client.HTTPConnection("127.0.0.1", self.port,
+                                                             timeout=self.timeout)
+        return self.connection
+
+    def close(self):
+        """Close connection to server"""
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def request(self, method, path, body=None):
+        """Send request, and return (status, headers, body) tuple of response.
+        A connection that was closed by the server (e.g. after its idle
+        timeout) is reopened once
+        """
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        for attempt in range(2):
+            connection = self.connect()
+            try:
+                connection.request(method, path, body, headers)
+                response = connection.getresponse()
+                data = response.read()
+            except (http.client.RemoteDisconnected, BrokenPipeError,
+                    ConnectionResetError):
+                self.close()
+                if attempt:
+                    raise
+                continue
+            if response.getheader("Connection", "").lower() == "close":
+                self.close()
+            return response.status, response, data
+
+    def status(self):
+        """Return server status as a dictionary"""
+        status, _, data = self.request("GET", "/status")
+        if status != 200:
+            raise ServerError(status, data.decode("utf-8", "replace"))
+        return json.loads(data.decode("utf-8"))
+
+    def analyse(self, paths, offset=0, outputFormat="xml", checksums=None):
+        """Analyse images at paths on server, and return report in
+        outputFormat as UTF-8 encoded bytes. Raises ServerError if the server
+        refuses the request, or is still busy after all retries
+        """
+        request = {"paths": [os.path.abspath(path) for path in paths],
+                   "offset": offset,
+                   "format": outputFormat}
+        if checksums:
+            request["checksums"] = list(checksums)
+        body = json.dumps(request).encode("utf-8")
+
+        for attempt in range(self.retries + 1):
+            status, response, data = self.request("POST", "/analyze", body)
+            if status != 503 or attempt == self.retries:
+                break
+            # Server is busy: back off for as long as it asks
+            try:
+                delay = float(response.getheader("Retry-After", "1"))
+            except ValueError:
+                delay = 1
+            time.sleep(delay)
+
+        if status != 200:
+            try:
+                message = json.loads(data.decode("utf-8"))["error"]
+            except (ValueError, KeyError, TypeError):
+                message = data.decode("utf-8", "replace")
+            raise ServerError(status, message)
+        return data
+
+
+def parseCommandLine(parser):
+    """Parse command line with argparse.ArgumentParser parser"""
+    parser.add_argument('ISOImages',
+                        action="store",
+                        type=str,
+                        nargs='*',
+                        help="input ISO image(s)")
+    address = parser.add_mutually_exclusive_group(required=True)
+    address.add_argument('--socket', '-s',
+                         type=str,
+                         help="Unix domain socket of server",
+                         action='store',
+                         dest='socketPath')
+    address.add_argument('--port', '-p',
+                         type=int,
+                         help="TCP port of server on localhost",
+                         action='store',
+                         dest='port')
+    parser.add_argument('--offset', '-o',
+                        type=int,
+                        help="offset (in sectors) of ISO image on CD",
+                        action='store',
+                        dest='sectorOffset',
+                        default=0)
+    parser.add_argument('--format', '-f',
+                        choices=['xml', 'json', 'jsonl', 'csv'],
+                        help="output format (default: xml)",
+                        action='store',
+                        dest='outputFormat',
+                        default='xml')
+    parser.add_argument('--checksum',
+                        type=str,
+                        help="comma-separated list of whole-image checksums to compute",
+                        action='store',
+                        dest='checksums',
+                        default=None)
+    parser.add_argument('--status',
+                        help="print server status instead of analysing images",
+                        action='store_true',
+                        dest='status')
+    return parser.parse_args()
+
+
+def main():
+    """Command line client"""
+    parser = argparse.ArgumentParser(
+        description="Analyse ISO images with a running isolyzer server")
+    args = parseCommandLine(parser)
+
+    client = Client(args.socketPath, args.port)
+    try:
+        if args.status:
+            sys.stdout.write(json.dumps(client.status(), indent=4) + "\n")
+            return
+        if not args.ISOImages:
+            parser.error("no input images")
+        checksums = None
+        if args.checksums is not None:
+            checksums = [name.strip() for name in args.checksums.split(",") if name.strip()]
+        report = client.analyse(args.ISOImages, args.sectorOffset, args.outputFormat,
+                                checksums)
+    except ServerError as ex:
+        sys.stderr.write("Error: %s\n" % ex)
+        sys.exit(1)
+    except OSError as ex:
+        sys.stderr.write("Error: cannot connect to server: %s\n" % ex)
+        sys.exit(1)
+    finally:
+        client.close()
+    sys.stdout.buffer.write(report)
+    sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,763 @@
+#! /usr/bin/env python3
+"""Random access to gzip- and xz-compressed images
+
+A CompressedReader is a sector reader that serves reads on the uncompressed
+contents of a compressed image, so a .iso.gz or .iso.xz file can be
+analysed without decompressing it to scratch space first. The uncompressed
+data is decompressed in chunks, which are kept in an LRU cache. A chunk is
+decompressed from the nearest restart point before it:
+
+- xz: the start of each xz block, from the index at the end of the file
+  (files written by multi-threaded xz have many blocks; a file with a single
+  block is decompressed from its start)
+- gzip: the start of each gzip member (as in files written by bgzip, or
+  concatenated gzip files), and checkpoints within members (see the inflate
+  module), which are made at intervals of CHECKPOINT_INTERVAL bytes while
+  the image is scanned. If the zlib library cannot be loaded for
+  checkpoints, snapshots of the decompressor are taken at regular intervals
+  instead, which only last for the rest of the analysis
+
+The uncompressed size of a gzip file is only stored in the file modulo
+4 GiB, in the trailer of each member, and a complete file cannot be told
+from a truncated one without decompressing it. Only if all members record
+their compressed size (as in files written by bgzip), the sizes are taken
+from the trailers. Otherwise, the first analysis of a gzip-compressed image
+scans it: it decompresses it once from start to end, without writing the
+output anywhere. The size, the restart points and the checkpoints are then
+stored in a seek index in the index directory (the ISOLYZER_INDEX_DIR
+environment variable, or an isolyzer/seekindex directory in the user's
+cache directory), which is reused for as long as the size and modification
+time of the image are unchanged. The uncompressed size of an xz file is
+read from its index.
+
+Reads and bytes read count the compressed data that is read from the file;
+bytesDecompressed counts the uncompressed data that was produced.
+
+If the reader has a budget (see the budgets module), it is checked for
+every chunk that is decompressed, including those of the scan when the
+image is opened. The compressed data is exempt from the budget's count of
+sectors read; the uncompressed data that is read from the reader is
+charged instead.
+"""
+
+import os
+import sys
+import json
+import base64
+import hashlib
+from collections import OrderedDict
+from . import sectorreader as sr
+
+
+# File name suffixes (lower case) of compressed images, and their formats
+COMPRESSED_SUFFIXES = {".gz": "gzip", ".gzip": "gzip", ".xz": "xz"}
+
+# Size of the chunks of uncompressed data that are cached
+CHUNK_SIZE = 65536
+
+# Maximum number of cached chunks
+MAX_CACHED_CHUNKS = 256
+
+# Size of the blocks of compressed data that are read from the file
+INPUT_SIZE = 262144
+
+# Number of chunks before a requested chunk that are cached as well, if they
+# have to be decompressed to get to it
+READ_BEHIND = 16
+
+# Interval (in chunks) between decompressor snapshots (gzip only, if there
+# are no checkpoints)
+SNAPSHOT_INTERVAL = 512
+
+# Minimum interval (in bytes of uncompressed data) between checkpoints, and
+# between checkpoints and the starts of members (gzip only)
+CHECKPOINT_INTERVAL = 16 * 1024 * 1024
+
+# Version of the seek index format
+INDEX_FORMAT = 2
+
+# Magic bytes of gzip members and xz streams
+GZIP_MAGIC = b"\x1f\x8b"
+XZ_MAGIC = b"\xfd7zXZ\x00"
+
+# Start of the header of a gzip member with the compressed size of the member
+# as its only extra field, as written by bgzip: magic bytes, compression
+# method (deflate), flags (FEXTRA); and the extra field after modification
+# time, extra flags and operating system: length of the extra field, "BC"
+# subfield and length of the subfield
+BGZF_HEADER_START = GZIP_MAGIC + b"\x08\x04"
+BGZF_EXTRA_START = b"\x06\x00BC\x02\x00"
+
+# Size of the header of such a member
+BGZF_HEADER_SIZE = 18
+
+
+def compressionFormat(image):
+    """Return compression format of image from its file name suffix, or None
+    if it is not a compressed image
+    """
+    return COMPRESSED_SUFFIXES.get(os.path.splitext(image)[1].lower())
+
+
+def readerFor(image):
+    """Return compressed sector reader for image, or None if it is not a
+    compressed image
+    """
+    compression = compressionFormat(image)
+    if compression == "gzip":
+        return GzipReader(image)
+    if compression == "xz":
+        return XZReader(image)
+    return None
+
+
+def indexDirectory():
+    """Return directory in which seek indexes are stored"""
+    directory = os.environ.get("ISOLYZER_INDEX_DIR")
+    if directory:
+        return directory
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"),
+                                                                ".cache")
+    return os.path.join(base, "isolyzer", "seekindex")
+
+
+def indexPath(image):
+    """Return path of seek index file of image"""
+    name = hashlib.sha1(os.path.abspath(image).encode("utf-8", "surrogateescape")).hexdigest()
+    return os.path.join(indexDirectory(), name + ".json")
+
+
+def loadIndex(image, imageStat, compression):
+    """Return stored seek index of image as a dictionary, or None if there is
+    no index, or if it does not match the current size and modification
+    time of the image
+    """
+    try:
+        with open(indexPath(image), "r", encoding="utf-8") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if (not isinstance(index, dict) or index.get("format") != INDEX_FORMAT or
+            index.get("compression") != compression or
+            index.get("compressedSize") != imageStat.st_size or
+            index.get("mtimeNs") != imageStat.st_mtime_ns):
+        return None
+    return index
+
+
+def storeIndex(image, imageStat, compression, size, points, checkpoints=()):
+    """Store seek index of image, with its restart points and checkpoints (as
+    (offset, compressed offset, bits, window) tuples). Failures are ignored,
+    as the index only saves work
+    """
+    import zlib
+    path = indexPath(image)
+    index = {"format": INDEX_FORMAT,
+             "compression": compression,
+             "path": os.path.abspath(image),
+             "compressedSize": imageStat.st_size,
+             "mtimeNs": imageStat.st_mtime_ns,
+             "size": size,
+             "points": points,
+             # Windows are compressed, and stored as base64 text
+             "checkpoints": [[offset, compressedOffset, bits,
+                              base64.b64encode(zlib.compress(window)).decode("ascii")]
+                             for offset, compressedOffset, bits, window in checkpoints]}
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to temporary file first, so concurrent readers never see a
+        # partial index
+        tempPath = "%s.%d.tmp" % (path, os.getpid())
+        with open(tempPath, "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        os.replace(tempPath, path)
+    except OSError:
+        pass
+
+
+def readVarint(data, position):
+    """Read xz variable-length integer from data at position, and return
+    (value, next position) tuple
+    """
+    value = 0
+    for i in range(9):
+        if position >= len(data):
+            break
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7f) << (7 * i)
+        if not byte & 0x80:
+            return value, position
+    raise ValueError("invalid xz integer")
+
+
+class Cursor:
+    """Position in the uncompressed data, with the decompressor state that is
+    needed to continue from there
+    """
+
+    __slots__ = ("decompressor", "offset", "compressedOffset", "tail", "block")
+
+    def __init__(self, decompressor, offset, compressedOffset, block=None):
+        self.decompressor = decompressor
+        # Offset of the next uncompressed byte
+        self.offset = offset
+        # Offset of the next compressed byte that has not been read yet
+        self.compressedOffset = compressedOffset
+        # Compressed input that was read but not consumed yet
+        self.tail = b''
+        # Number of current xz block
+        self.block = block
+
+
+class CompressedReader(sr.SectorReader):
+    """Base class for sector readers on compressed images"""
+
+    compression = None
+
+    def __init__(self, filename):
+        sr.SectorReader.__init__(self, filename)
+        # Size of the compressed file
+        self.compressedSize = 0
+        self.bytesDecompressed = 0
+        # Restart points as sorted list of (offset, compressed offset)
+        self.points = []
+        # Checkpoints as sorted list of (offset, compressed offset, bits,
+        # window) tuples
+        self.checkpoints = []
+        # Decompressor snapshots as sorted list of cursors
+        self.snapshots = []
+        # Cached chunks by chunk number, least recently used first
+        self.chunks = OrderedDict()
+        # Cursor of the last decompression, which sequential reads continue
+        self.cursor = None
+        # True if the seek index was loaded from the index directory
+        self.indexLoaded = False
+        # Exceptions that indicate corrupt data (set by openStream)
+        self.errors = (ValueError,)
+
+    def open(self, stat=None):
+        """Open image, establish its uncompressed size, and return the stat
+        result of the (compressed) image. Raises IOError if the image is not
+        in the expected compression format
+        """
+        stat = sr.SectorReader.open(self, stat)
+        self.compressedSize = stat.st_size
+        try:
+            self.openStream(stat)
+        except BaseException:
+            self.close()
+            raise
+        return stat
+
+    def close(self):
+        """Close image and discard cached chunks"""
+        self.chunks = OrderedDict()
+        self.snapshots = []
+        self.cursor = None
+        sr.SectorReader.close(self)
+
+    def readInput(self, offset, length):
+        """Read length bytes of compressed data from offset"""
+        self.reads += 1
+        if hasattr(os, 'pread'):
+            data = os.pread(self.fd, length, offset)
+        else:
+            os.lseek(self.fd, offset, os.SEEK_SET)
+            data = os.read(self.fd, length)
+        self.bytesRead += len(data)
+        if self.budget is not None:
+            self.budget.exempt(len(data))
+        return data
+
+    def openStream(self, stat):
+        """Set size and restart points; to be implemented by subclasses"""
+        raise NotImplementedError
+
+    def startCursor(self, offset, compressedOffset):
+        """Return cursor at restart point; to be implemented by subclasses"""
+        raise NotImplementedError
+
+    def resumeCursor(self, checkpoint):
+        """Return cursor at checkpoint; to be implemented by subclasses that
+        make checkpoints
+        """
+        raise NotImplementedError
+
+    def decompress(self, cursor, maxLength):
+        """Decompress at most maxLength bytes at cursor, and return them
+        (empty at the end of the data); to be implemented by subclasses
+        """
+        raise NotImplementedError
+
+    def nextChunk(self, cursor):
+        """Decompress chunk at cursor (which must be at a chunk boundary),
+        and return it; the last chunk may be short, and is empty at the end
+        of the data
+        """
+        self.checkBudget()
+        pieces = []
+        remaining = CHUNK_SIZE
+        while remaining:
+            piece = self.decompress(cursor, remaining)
+            if not piece:
+                break
+            pieces.append(piece)
+            remaining -= len(piece)
+        chunk = b''.join(pieces)
+        self.bytesDecompressed += len(chunk)
+        return chunk
+
+    def scan(self):
+        """Decompress the whole image to establish its size, recording restart
+        points and decompressor snapshots, and caching the first chunks.
+        Returns the size
+        """
+        cursor = self.startCursor(0, 0)
+        chunkNumber = 0
+        while True:
+            if chunkNumber % SNAPSHOT_INTERVAL == 0 and chunkNumber:
+                self.takeSnapshot(cursor)
+            chunk = self.nextChunk(cursor)
+            if not chunk:
+                break
+            if chunkNumber < MAX_CACHED_CHUNKS:
+                self.chunks[chunkNumber] = chunk
+            chunkNumber += 1
+            if len(chunk) < CHUNK_SIZE:
+                break
+        return cursor.offset
+
+    def takeSnapshot(self, cursor):
+        """Keep copy of cursor's decompressor state, if the decompressor
+        supports this
+        """
+
+    def cursorAt(self, offset):
+        """Return cursor at a chunk boundary at or before offset (which must
+        be at a chunk boundary), starting from the nearest restart point,
+        checkpoint, snapshot or current cursor before it
+        """
+        best = None
+        if self.cursor is not None and self.cursor.offset <= offset:
+            best = self.cursor
+        for snapshot in reversed(self.snapshots):
+            if snapshot.offset <= offset:
+                if best is None or snapshot.offset > best.offset:
+                    best = self.copyCursor(snapshot)
+                break
+        for point in reversed(self.points):
+            if point[0] <= offset:
+                if best is None or point[0] > best.offset:
+                    best = self.startCursor(*point)
+                break
+        for checkpoint in reversed(self.checkpoints):
+            if checkpoint[0] <= offset:
+                if best is None or checkpoint[0] > best.offset:
+                    best = self.resumeCursor(checkpoint)
+                break
+        if best is None:
+            best = self.startCursor(0, 0)
+
+        # Skip data up to offset, except for the chunks just before it, which
+        # are decompressed (and cached) anyway, since headers tend to be close
+        # to each other
+        skipTo = max(offset - READ_BEHIND * CHUNK_SIZE, best.offset)
+        skipTo = -(-skipTo // CHUNK_SIZE) * CHUNK_SIZE
+        while best.offset < skipTo:
+            self.checkBudget()
+            piece = self.decompress(best, min(skipTo - best.offset, CHUNK_SIZE))
+            if not piece:
+                break
+            self.bytesDecompressed += len(piece)
+        return best
+
+    def copyCursor(self, cursor):
+        """Return independent copy of snapshot cursor"""
+        copy = Cursor(cursor.decompressor.copy(), cursor.offset, cursor.compressedOffset,
+                      cursor.block)
+        copy.tail = cursor.tail
+        return copy
+
+    def chunk(self, chunkNumber):
+        """Return chunk chunkNumber of the uncompressed data"""
+        chunk = self.chunks.get(chunkNumber)
+        if chunk is not None:
+            self.chunks.move_to_end(chunkNumber)
+            return chunk
+
+        try:
+            cursor = self.cursorAt(chunkNumber * CHUNK_SIZE)
+            while True:
+                number = cursor.offset // CHUNK_SIZE
+                if number % SNAPSHOT_INTERVAL == 0 and number:
+                    self.takeSnapshot(cursor)
+                chunk = self.nextChunk(cursor)
+                self.chunks[number] = chunk
+                if len(self.chunks) > MAX_CACHED_CHUNKS:
+                    self.chunks.popitem(last=False)
+                if number >= chunkNumber or len(chunk) < CHUNK_SIZE:
+                    break
+        except self.errors as ex:
+            # Corrupt data is reported as an I/O error
+            raise IOError("cannot decompress %s: %s" % (self.filename, ex))
+        self.cursor = cursor
+        return chunk if number == chunkNumber else b''
+
+    def readRaw(self, offset, length):
+        """Read length bytes from offset of the uncompressed data"""
+        if self.budget is not None:
+            self.budget.charge(length)
+        firstChunk, start = divmod(offset, CHUNK_SIZE)
+        lastChunk = (offset + length - 1) // CHUNK_SIZE
+        if firstChunk == lastChunk:
+            return self.chunk(firstChunk)[start:start + length]
+        data = b''.join(self.chunk(number) for number in range(firstChunk, lastChunk + 1))
+        return data[start:start + length]
+
+
+class GzipReader(CompressedReader):
+    """Sector reader on gzip-compressed image"""
+
+    compression = "gzip"
+
+    def __init__(self, filename):
+        CompressedReader.__init__(self, filename)
+        # Member starts (after the first) found while scanning
+        self.memberStarts = []
+        self.scanning = False
+        # The inflate module, if checkpoints can be made
+        self.inflate = None
+
+    def openStream(self, stat):
+        """Set size, restart points and checkpoints from the stored seek
+        index, or from the trailers of the members, or by decompressing the
+        whole image (and store the index)
+        """
+        import zlib
+        from . import inflate
+        self.zlib = zlib
+        if inflate.available():
+            self.inflate = inflate
+        self.errors = (zlib.error, ValueError)
+        if self.readInput(0, 2) != GZIP_MAGIC:
+            raise IOError("not a gzip file: " + self.filename)
+        index = loadIndex(self.filename, stat, self.compression)
+        if index is not None:
+            try:
+                self.checkpoints = self.decodeCheckpoints(index)
+            except (zlib.error, ValueError, TypeError):
+                # Damaged index
+                index = None
+        if index is not None:
+            self.size = index["size"]
+            self.points = [tuple(point) for point in index["points"]]
+            self.indexLoaded = True
+            return
+        members = self.readTrailers()
+        if members is not None:
+            self.size, self.points = members
+            storeIndex(self.filename, stat, self.compression, self.size,
+                       [list(point) for point in self.points])
+            return
+        self.points = [(0, 0)]
+        self.scanning = True
+        try:
+            self.size = self.scan()
+        except self.errors as ex:
+            raise IOError("cannot decompress %s: %s" % (self.filename, ex))
+        finally:
+            self.scanning = False
+        self.points += self.memberStarts
+        storeIndex(self.filename, stat, self.compression, self.size,
+                   [list(point) for point in self.points], self.checkpoints)
+
+    def decodeCheckpoints(self, index):
+        """Return checkpoints stored in index, or an empty list if they
+        cannot be used
+        """
+        if self.inflate is None:
+            return []
+        return [(offset, compressedOffset, bits, self.zlib.decompress(base64.b64decode(window)))
+                for offset, compressedOffset, bits, window in index.get("checkpoints", [])]
+
+    def readTrailers(self):
+        """Return (uncompressed size, restart points) tuple from the headers
+        and trailers of the members, if all members record their compressed
+        size (as in files written by bgzip) and the last one ends at the end
+        of the file; None otherwise
+        """
+        size = 0
+        points = []
+        position = 0
+        while position < self.compressedSize:
+            self.checkBudget()
+            header = self.readInput(position, BGZF_HEADER_SIZE)
+            if len(header) != BGZF_HEADER_SIZE or \
+                    header[:4] != BGZF_HEADER_START or header[10:16] != BGZF_EXTRA_START:
+                return None
+            end = position + int.from_bytes(header[16:18], "little") + 1
+            if end > self.compressedSize or end - BGZF_HEADER_SIZE < 8:
+                return None
+            # ISIZE is the uncompressed size of the member (modulo 4 GiB, but
+            # members of such files hold at most 64 KiB)
+            memberSize = int.from_bytes(self.readInput(end - 4, 4), "little")
+            if memberSize:
+                points.append((size, position))
+                size += memberSize
+            position = end
+        if not points:
+            return None
+        return size, points
+
+    def newDecompressor(self):
+        """Return decompressor for a gzip member"""
+        if self.inflate is not None:
+            return self.inflate.Inflater()
+        return self.zlib.decompressobj(31)
+
+    def startCursor(self, offset, compressedOffset):
+        """Return cursor at start of member"""
+        return Cursor(self.newDecompressor(), offset, compressedOffset)
+
+    def resumeCursor(self, checkpoint):
+        """Return cursor at checkpoint"""
+        offset, compressedOffset, bits, window = checkpoint
+        byteBefore = self.readInput(compressedOffset - 1, 1)[0] if bits else 0
+        return Cursor(self.inflate.Inflater.resume(bits, byteBefore, window),
+                      offset, compressedOffset)
+
+    def takeSnapshot(self, cursor):
+        """Keep copy of decompressor state at cursor, unless checkpoints are
+        made instead
+        """
+        if self.inflate is not None:
+            return
+        if not self.snapshots or self.snapshots[-1].offset < cursor.offset:
+            self.snapshots.append(self.copyCursor(cursor))
+
+    def makeCheckpoint(self, cursor):
+        """Make checkpoint at cursor (at the end of a deflate block) while
+        scanning, if it is far enough from the previous restart point or
+        checkpoint
+        """
+        previous = max(self.memberStarts[-1][0] if self.memberStarts else 0,
+                       self.checkpoints[-1][0] if self.checkpoints else 0)
+        if cursor.offset - previous >= CHECKPOINT_INTERVAL:
+            decompressor = cursor.decompressor
+            self.checkpoints.append((cursor.offset, cursor.compressedOffset - len(cursor.tail),
+                                     decompressor.bits, decompressor.window()))
+
+    def decompress(self, cursor, maxLength):
+        """Decompress at most maxLength bytes at cursor"""
+        while True:
+            decompressor = cursor.decompressor
+            if decompressor.eof:
+                # Next member starts after the end of this one (and after its
+                # trailer, if the decompressor did not read it), unless there
+                # is only padding or trailing garbage
+                start = cursor.compressedOffset - len(decompressor.unused_data) + \
+                    getattr(decompressor, "trailerSize", 0)
+                if self.readInput(start, 2) != GZIP_MAGIC:
+                    return b''
+                if self.scanning:
+                    self.memberStarts.append((cursor.offset, start))
+                cursor.decompressor = self.newDecompressor()
+                cursor.compressedOffset = start
+                cursor.tail = b''
+                continue
+            if cursor.tail:
+                data = cursor.tail
+            else:
+                data = self.readInput(cursor.compressedOffset, INPUT_SIZE)
+                if not data:
+                    # Truncated file
+                    return b''
+                cursor.compressedOffset += len(data)
+            piece = decompressor.decompress(data, maxLength)
+            cursor.tail = decompressor.unconsumed_tail
+            if piece:
+                cursor.offset += len(piece)
+            if self.scanning and getattr(decompressor, "blockEnd", False):
+                self.makeCheckpoint(cursor)
+            if piece:
+                return piece
+
+
+class XZReader(CompressedReader):
+    """Sector reader on xz-compressed image. Blocks are decompressed
+    independently, using the block index at the end of each stream. Files
+    whose index cannot be read (e.g. truncated files) are decompressed
+    sequentially, like gzip files
+    """
+
+    compression = "xz"
+
+    def __init__(self, filename):
+        CompressedReader.__init__(self, filename)
+        # Blocks as list of (offset, compressed offset of block header)
+        self.blocks = []
+        self.sequential = False
+
+    def openStream(self, stat):
+        """Set size and restart points from the xz index, or from the stored
+        seek index, or by decompressing the whole image
+        """
+        import lzma
+        self.lzma = lzma
+        self.errors = (lzma.LZMAError, EOFError, ValueError)
+        if self.readInput(0, 6) != XZ_MAGIC:
+            raise IOError("not an xz file: " + self.filename)
+        try:
+            self.size, self.blocks = self.readBlockIndex()
+            self.points = list(self.blocks)
+            return
+        except ValueError:
+            self.sequential = True
+        index = loadIndex(self.filename, stat, self.compression)
+        if index is not None:
+            self.size = index["size"]
+            self.points = [tuple(point) for point in index["points"]]
+            self.indexLoaded = True
+            return
+        self.points = [(0, 0)]
+        try:
+            self.size = self.scan()
+        except self.errors as ex:
+            raise IOError("cannot decompress %s: %s" % (self.filename, ex))
+        storeIndex(self.filename, stat, self.compression, self.size, [[0, 0]])
+
+    def readBlockIndex(self):
+        """Read the indexes of all streams, and return (uncompressed size,
+        blocks) tuple. Raises ValueError if an index cannot be read
+        """
+        blocks = []
+        end = self.compressedSize
+        while end > 0:
+            footer = self.readInput(end - 12, 12)
+            if len(footer) == 12 and footer == bytes(12):
+                # Stream padding
+                end -= 12
+                continue
+            if len(footer) != 12 or footer[10:12] != b"YZ":
+                raise ValueError("no xz stream footer")
+            indexSize = (int.from_bytes(footer[4:8], "little") + 1) * 4
+            indexStart = end - 12 - indexSize
+            if indexStart < 12:
+                raise ValueError("invalid xz index size")
+            data = self.readInput(indexStart, indexSize)
+            if len(data) != indexSize or data[0] != 0:
+                raise ValueError("no xz index")
+            count, position = readVarint(data, 1)
+            records = []
+            for _ in range(count):
+                unpaddedSize, position = readVarint(data, position)
+                uncompressedSize, position = readVarint(data, position)
+                records.append((unpaddedSize, uncompressedSize))
+            streamStart = indexStart - sum((unpadded + 3) & ~3 for unpadded, _ in records) - 12
+            if streamStart < 0 or self.readInput(streamStart, 6) != XZ_MAGIC:
+                raise ValueError("xz index does not match stream")
+            compressedOffset = streamStart + 12
+            streamBlocks = []
+            for unpaddedSize, uncompressedSize in records:
+                streamBlocks.append((compressedOffset, uncompressedSize))
+                compressedOffset += (unpaddedSize + 3) & ~3
+            blocks[:0] = streamBlocks
+            end = streamStart
+        size = 0
+        points = []
+        for compressedOffset, uncompressedSize in blocks:
+            if uncompressedSize:
+                points.append((size, compressedOffset))
+            size += uncompressedSize
+        return size, points
+
+    def blockFilters(self, compressedOffset):
+        """Parse header of block at compressedOffset, and return (filters,
+        offset of compressed data) tuple
+        """
+        headerSize = (self.readInput(compressedOffset, 1) or b"\x00")[0]
+        if headerSize == 0:
+            raise ValueError("invalid xz block header")
+        headerSize = (headerSize + 1) * 4
+        header = self.readInput(compressedOffset, headerSize)
+        flags = header[1]
+        position = 2
+        if flags & 0x40:
+            _, position = readVarint(header, position)
+        if flags & 0x80:
+            _, position = readVarint(header, position)
+        filters = []
+        for _ in range((flags & 0x03) + 1):
+            filterID, position = readVarint(header, position)
+            propertiesSize, position = readVarint(header, position)
+            properties = header[position:position + propertiesSize]
+            position += propertiesSize
+            if filterID == self.lzma.FILTER_LZMA2:
+                dictionary = properties[0]
+                if dictionary > 40:
+                    raise ValueError("invalid LZMA2 dictionary size")
+                dictSize = 0xffffffff if dictionary == 40 else \
+                    (2 | (dictionary & 1)) << (dictionary // 2 + 11)
+                filters.append({"id": filterID, "dict_size": dictSize})
+            elif filterID == self.lzma.FILTER_DELTA:
+                filters.append({"id": filterID, "dist": properties[0] + 1})
+            elif 0x04 <= filterID <= 0x0b:
+                # Branch/call/jump filters, with optional start offset
+                bcj = {"id": filterID}
+                if propertiesSize == 4:
+                    bcj["start_offset"] = int.from_bytes(properties, "little")
+                filters.append(bcj)
+            else:
+                raise ValueError("unsupported xz filter %d" % filterID)
+        return filters, compressedOffset + headerSize
+
+    def startCursor(self, offset, compressedOffset):
+        """Return cursor at start of block (or of the file, if decompressed
+        sequentially)
+        """
+        if self.sequential:
+            return Cursor(self.lzma.LZMADecompressor(self.lzma.FORMAT_XZ), offset,
+                          compressedOffset)
+        block = self.blocks.index((offset, compressedOffset))
+        filters, dataOffset = self.blockFilters(compressedOffset)
+        return Cursor(self.lzma.LZMADecompressor(self.lzma.FORMAT_RAW, filters=filters),
+                      offset, dataOffset, block)
+
+    def decompress(self, cursor, maxLength):
+        """Decompress at most maxLength bytes at cursor"""
+        while True:
+            decompressor = cursor.decompressor
+            if decompressor.eof:
+                if self.sequential:
+                    # Next stream (if any) starts after the end of this one
+                    start = cursor.compressedOffset - len(decompressor.unused_data)
+                    while self.readInput(start, 4) == bytes(4):
+                        start += 4
+                    if self.readInput(start, 6) != XZ_MAGIC:
+                        return b''
+                    cursor.decompressor = self.lzma.LZMADecompressor(self.lzma.FORMAT_XZ)
+                    cursor.compressedOffset = start
+                    continue
+                if cursor.block + 1 >= len(self.blocks):
+                    return b''
+                nextCursor = self.startCursor(*self.blocks[cursor.block + 1])
+                cursor.decompressor = nextCursor.decompressor
+                cursor.compressedOffset = nextCursor.compressedOffset
+                cursor.block = nextCursor.block
+                continue
+            if decompressor.needs_input:
+                data = self.readInput(cursor.compressedOffset, INPUT_SIZE)
+                if not data:
+                    # Truncated file
+                    return b''
+                cursor.compressedOffset += len(data)
+            else:
+                data = b''
+            piece = decompressor.decompress(data, maxLength)
+            if piece:
+                cursor.offset += len(piece)
+                return piece
@@ -0,0 +1,176 @@
+#! /usr/bin/env python3
+"""Registry of file system detectors
+
+Each Detector declares the byte signatures of a file system (or a probe
+function, for signatures that cannot be given as fixed offsets), and the
+name of a parse callback in a parser module. All detectors are evaluated
+together against one header window (the first HEADER_WINDOW_SIZE bytes of
+the image), which is read with a single call; the parser module of a
+detector is only imported if the detector matches.
+
+A parse callback is called as callback(reader, offset, profiler, fields,
+budget), where reader is the (open) sector reader of the image, offset is
+the sector offset, profiler a perf.Profiler, fields the descriptor
+properties to unpack (see model.Descriptor.projection; None for all), and
+budget a budgets.Budget, which is charged for each descriptor that is
+visited. It returns a Detection, or None if the file system turns out not
+to be there after all. Reads within the header window are served from the
+reader's window of sectors.
+
+To add a file system, write its parse callback, and add a Detector to
+detectors (or pass one to register()); processImage does not need to change.
+"""
+
+import importlib
+from . import budgets
+from . import sectorreader as sr
+
+
+# Size of the header window (the system area, and the volume descriptors
+# that follow it)
+HEADER_WINDOW_SIZE = 64 * 1024
+
+# Identifiers of the descriptors in the ISO 9660 volume descriptor area and
+# the UDF Volume Recognition Sequence, and those that indicate UDF
+VOLUME_RECOGNITION_IDENTIFIERS = (b"CD001", b"BEA01", b"NSR02", b"NSR03", b"BOOT2", b"TEA01")
+EXTENDED_IDENTIFIERS = VOLUME_RECOGNITION_IDENTIFIERS[1:]
+
+# Maximum number of sectors of the volume descriptor area that are searched
+# for the Volume Recognition Sequence
+MAX_RECOGNITION_SECTORS = 4096
+
+
+class Detection:
+    """Outcome of a parse callback: a model.FileSystem record (which is
+    reported), the expected size of the image in bytes according to this
+    file system (0 if it cannot be established), and a dictionary with
+    values that later stages may need (e.g. the Primary Volume Descriptor
+    for the truncation report)
+    """
+
+    __slots__ = ("fileSystem", "sizeExpected", "details")
+
+    def __init__(self, fileSystem, sizeExpected=0, details=None):
+        self.fileSystem = fileSystem
+        self.sizeExpected = sizeExpected
+        self.details = {} if details is None else details
+
+
+class Detector:
+    """Detector of file system name. signatures is a list of (offset,
+    value) tuples, where value is a bytes object or a tuple of alternative
+    bytes objects; the detector matches if any signature (or all, if
+    requireAll is True) is found in the header window. Alternatively, probe
+    is a function that is called with the header window and the reader, and
+    returns True on a match. The parse callback is function parse of parser
+    module module (a name relative to the isolyzer package if it starts with
+    a dot, as ".iso9660"); the time it takes is recorded as profiler stage stage
+    """
+
+    def __init__(self, name, module, parse, stage, signatures=(), requireAll=False,
+                 probe=None):
+        self.name = name
+        self.module = module
+        self.parse = parse
+        self.stage = stage
+        self.signatures = [(offset, value if isinstance(value, tuple) else (value,))
+                           for offset, value in signatures]
+        self.requireAll = requireAll
+        self.probe = probe
+        self.callback = None
+
+    def matches(self, header, reader):
+        """Return True if the detector matches header window header"""
+        if self.probe is not None:
+            return self.probe(header, reader)
+        found = (header[offset:offset + len(values[0])] in values
+                 for offset, values in self.signatures)
+        return all(found) if self.requireAll else any(found)
+
+    def parser(self):
+        """Return parse callback (this imports the parser module on first
+        use)
+        """
+        if self.callback is None:
+            self.callback = getattr(importlib.import_module(self.module, __package__),
+                                    self.parse)
+        return self.callback
+
+
+def volumeRecognitionSequence(header, reader):
+    """Return True if the volume descriptor area holds any UDF Volume
+    Recognition Sequence descriptors, after the ISO 9660 or High Sierra
+    volume descriptors (if any). Sectors that follow the header window
+    (after long chains of volume descriptors) are read from reader, a
+    window at a time, up to MAX_RECOGNITION_SECTORS sectors
+    """
+    window = header
+    windowStart = 0
+    byteStart = 32768
+    while byteStart < 32768 + MAX_RECOGNITION_SECTORS * sr.SECTOR_SIZE:
+        if byteStart + sr.SECTOR_SIZE > windowStart + len(window):
+            if len(window) < HEADER_WINDOW_SIZE:
+                # End of image
+                return False
+            window = reader.read(byteStart, HEADER_WINDOW_SIZE)
+            windowStart = byteStart
+        position = byteStart - windowStart
+        identifier = bytes(window[position + 1:position + 6])
+        if identifier in EXTENDED_IDENTIFIERS:
+            return True
+        if identifier not in VOLUME_RECOGNITION_IDENTIFIERS and \
+                window[position + 9:position + 14] != b"CDROM":
+            return False
+        byteStart += sr.SECTOR_SIZE
+    return False
+
+
+# Detectors, in the order in which their file systems are reported
+detectors = [
+    Detector("ISO 9660", ".iso9660", "parseFileSystem", "iso9660",
+             [(32769, b"CD001"), (34817, b"CD001")], requireAll=True),
+    Detector("High Sierra", ".hsf", "parseFileSystem", "highSierra", [(32777, b"CDROM")]),
+    Detector("Apple", ".apple", "parseFileSystem", "apple",
+             [(0, b"ER"), (512, b"PM"), (1024, b"PM"), (1536, b"PM"), (2048, b"PM"),
+              (1024, (b"BD", b"\xd2\xd7", b"H+", b"HX"))]),
+    Detector("UDF", ".udf", "parseFileSystem", "udf", probe=volumeRecognitionSequence)
+]
+
+
+def register(detector, before=None):
+    """Add detector to the registry, before the detector named before (or
+    at the end)
+    """
+    names = [existing.name for existing in detectors]
+    detectors.insert(names.index(before) if before in names else len(detectors), detector)
+
+
+def readHeaderWindow(reader):
+    """Read header window of image with one call, keep its sectors in the
+    reader's sector cache, and return it
+    """
+    return reader.readSectors(0, HEADER_WINDOW_SIZE // sr.SECTOR_SIZE)
+
+
+def detectFileSystems(reader, offset, profiler, fields=None, budget=budgets.nullBudget):
+    """Evaluate all detectors against the header window of the image that
+    is read by (open) sector reader reader, run the parse callbacks of those
+    that match (which only unpack the descriptor properties in fields, if
+    given, and are charged to budget), and return list of Detection
+    objects, in report order. The time spent is recorded as profiler stage
+    detection, and the stage of each detector (whether it matched or not).
+    Raises budgets.BudgetExceeded if the budget is exceeded
+    """
+    header = readHeaderWindow(reader)
+    matched = [detector for detector in detectors if detector.matches(header, reader)]
+    budget.check()
+    profiler.checkpoint("detection")
+
+    detections = []
+    for detector in detectors:
+        if detector in matched:
+            detection = detector.parser()(reader, offset, profiler, fields, budget)
+            if detection is not None:
+                detections.append(detection)
+        profiler.checkpoint(detector.stage)
+    return detections
@@ -1,9 +1,11 @@
 #! /usr/bin/env python3
 """Parser functions for the High Sierra file system"""
 
-import xml.etree.ElementTree as ET
+from . import budgets
 from . import byteconv as bc
-from . import shared as shared
+from . import detect
+from . import layout
+from . import model
 
 
 def decDateTimeToDate(datetime):
@@ -26,99 +28,107 @@ def decDateTimeToDate(datetime):
     return dateTimeString
 
 
-def getVolumeDescriptor(bytesData, byteStart):
+def getVolumeDescriptor(reader, byteStart):
 
-    """Read one 2048-byte HSF volume descriptor and return its descriptor
-    code and contents
+    """Read one 2048-byte HSF volume descriptor from sector reader and return
+    its descriptor code and contents
     """
     byteEnd = byteStart + 2048
-    volumeDescriptorType = bc.bytesToUnsignedChar(bytesData[byteStart+8:byteStart+9])
-    volumeDescriptorData = bytesData[byteStart:byteEnd]
+    volumeDescriptorData = reader.read(byteStart, 2048)
+    volumeDescriptorType = bc.bytesToUnsignedChar(volumeDescriptorData[8:9])
 
     return(volumeDescriptorType, volumeDescriptorData, byteEnd)
 
 
-def parseSFSVolumeDescriptor(bytesData):
+# Layout of the Standard File Structure Volume Descriptor, based on section
+# 11.4 in:
+# https://www.os2museum.com/files/docs/cdrom/CDROM_Working_Paper-1986.pdf
+# Fields that are stored as both little-endian and big-endian are reported
+# as big-endian; the path table locations are stored as little-endian only
+sfsVolumeDescriptorLayout = layout.Layout(">", [
+    ("volumeDescriptorLBN", 0, "uint32both"),
+    ("volumeDescriptorType", 8, "uint8"),
+    ("volumeStructureStandardIdentifier", 9, "text", 5),
+    ("volumeStructureStandardVersion", 14, "uint8"),
+    ("systemIdentifier", 16, "text", 32),
+    ("volumeIdentifier", 48, "text", 32),
+    ("volumeSpaceSize", 88, "uint32both"),
+    ("volumeSetSize", 128, "uint16both"),
+    ("volumeSetSequenceNumber", 132, "uint16both"),
+    ("logicalBlockSize", 136, "uint16both"),
+    ("pathTableSize", 140, "uint32both"),
+    ("firstMandatoryPathTableLocation", 148, "uint32le"),
+    ("optionalPathTableLocation", 152, "uint32le"),
+    ("optionalPathTableLocation", 156, "uint32le"),
+    ("optionalPathTableLocation", 160, "uint32le"),
+    ("secondMandatoryPathTableLocation", 164, "uint32le"),
+    ("optionalPathTableLocation", 168, "uint32le"),
+    ("optionalPathTableLocation", 172, "uint32le"),
+    ("optionalPathTableLocation", 176, "uint32le"),
+    ("volumeSetIdentifier", 214, "text", 128),
+    ("publisherIdentifier", 342, "text", 128),
+    ("dataPreparerIdentifier", 470, "text", 128),
+    ("applicationIdentifier", 598, "text", 128),
+    ("copyrightFileIdentifier", 726, "text", 32),
+    ("abstractFileIdentifier", 758, "text", 32),
+    ("volumeCreationDateAndTime", 790, "bytes", 16, decDateTimeToDate),
+    ("volumeModificationDateAndTime", 806, "bytes", 16, decDateTimeToDate),
+    ("volumeExpirationDateAndTime", 822, "bytes", 16, decDateTimeToDate),
+    ("volumeEffectiveDateAndTime", 838, "bytes", 16, decDateTimeToDate),
+    ("fileStructureStandardVersion", 854, "uint8")
+])
+
+
+class SFSVolumeDescriptor(model.Descriptor):
+    """Standard File Structure Volume Descriptor, with one property per field
+    of sfsVolumeDescriptorLayout. The six optional path table locations are
+    reported as one tuple
+    """
 
-    """Parse Standard File Structure Volume Descriptor
-    and return extracted properties. Based on section
-    11.4 in:
-    https://www.os2museum.com/files/docs/cdrom/CDROM_Working_Paper-1986.pdf
+    __slots__ = sfsVolumeDescriptorLayout.names
+    tag = "standardFileStructureVolumeDescriptor"
+    layout = sfsVolumeDescriptorLayout
+
+
+def parseSFSVolumeDescriptor(bytesData, names=None):
 
-    For fields that are stored as both little-endian and big-endian, only
-    big-endian values are read here!
+    """Parse Standard File Structure Volume Descriptor
+    and return SFSVolumeDescriptor record
     """
 
-    # Set up elemement object to store extracted properties
-    properties = ET.Element("standardFileStructureVolumeDescriptor")
-
-    shared.addProperty(properties, "volumeDescriptorLBN",
-                       bc.bytesToUInt(bytesData[4:8]))
-    shared.addProperty(properties, "volumeDescriptorType",
-                       bc.bytesToUnsignedChar(bytesData[8:9]))
-    shared.addProperty(properties, "volumeStructureStandardIdentifier",
-                       bc.bytesToText(bytesData[9:14]))
-    shared.addProperty(properties, "volumeStructureStandardVersion",
-                       bc.bytesToUnsignedChar(bytesData[14:15]))
-    shared.addProperty(properties, "systemIdentifier",
-                       bc.bytesToText(bytesData[16:48]))
-    shared.addProperty(properties, "volumeIdentifier",
-                       bc.bytesToText(bytesData[48:80]))
-    shared.addProperty(properties, "volumeSpaceSize",
-                       bc.bytesToUInt(bytesData[92:96]))
-    shared.addProperty(properties, "volumeSetSize",
-                       bc.bytesToUShortInt(bytesData[130:132]))
-    shared.addProperty(properties, "volumeSetSequenceNumber",
-                       bc.bytesToUShortInt(bytesData[134:136]))
-    shared.addProperty(properties, "logicalBlockSize",
-                       bc.bytesToUShortInt(bytesData[138:140]))
-    shared.addProperty(properties, "pathTableSize",
-                       bc.bytesToUInt(bytesData[144:148]))
-
-    # Following fields are stored as little-endian only, hence
-    # byte swap
-    shared.addProperty(properties, "firstMandatoryPathTableLocation",
-                       bc.swap32(bc.bytesToUInt(bytesData[148:152])))
-    shared.addProperty(properties, "optionalPathTableLocation",
-                       bc.swap32(bc.bytesToUInt(bytesData[152:156])))
-    shared.addProperty(properties, "optionalPathTableLocation",
-                       bc.swap32(bc.bytesToUInt(bytesData[156:160])))
-    shared.addProperty(properties, "optionalPathTableLocation",
-                       bc.swap32(bc.bytesToUInt(bytesData[160:164])))
-    shared.addProperty(properties, "secondMandatoryPathTableLocation",
-                       bc.swap32(bc.bytesToUInt(bytesData[164:168])))
-    shared.addProperty(properties, "optionalPathTableLocation",
-                       bc.swap32(bc.bytesToUInt(bytesData[168:172])))
-    shared.addProperty(properties, "optionalPathTableLocation",
-                       bc.swap32(bc.bytesToUInt(bytesData[172:176])))
-    shared.addProperty(properties, "optionalPathTableLocation",
-                       bc.swap32(bc.bytesToUInt(bytesData[176:180])))
-
-    # Following fields are all text strings
-    shared.addProperty(properties, "volumeSetIdentifier",
-                       bc.bytesToText(bytesData[214:342]))
-    shared.addProperty(properties, "publisherIdentifier",
-                       bc.bytesToText(bytesData[342:470]))
-    shared.addProperty(properties, "dataPreparerIdentifier",
-                       bc.bytesToText(bytesData[470:598]))
-    shared.addProperty(properties, "applicationIdentifier",
-                       bc.bytesToText(bytesData[598:726]))
-    shared.addProperty(properties, "copyrightFileIdentifier",
-                       bc.bytesToText(bytesData[726:758]))
-    shared.addProperty(properties, "abstractFileIdentifier",
-                       bc.bytesToText(bytesData[758:790]))
-
-    # Following fields are all date-time values
-    shared.addProperty(properties, "volumeCreationDateAndTime",
-                       decDateTimeToDate(bytesData[790:806]))
-    shared.addProperty(properties, "volumeModificationDateAndTime",
-                       decDateTimeToDate(bytesData[806:822]))
-    shared.addProperty(properties, "volumeExpirationDateAndTime",
-                       decDateTimeToDate(bytesData[822:838]))
-    shared.addProperty(properties, "volumeEffectiveDateAndTime",
-                       decDateTimeToDate(bytesData[838:854]))
-
-    shared.addProperty(properties, "fileStructureStandardVersion",
-                       bc.bytesToUnsignedChar(bytesData[854:855]))
-
-    return properties
+    return SFSVolumeDescriptor.fromBytes(bytesData, names)
+
+
+def parseFileSystem(reader, offset, profiler, fields=None, budget=budgets.nullBudget):
+    """Read through the High Sierra volume descriptors and parse the Standard
+    File Structure Volume Descriptor (parse callback of the High Sierra
+    detector, see the detect module)
+    """
+    sfsvdNames = SFSVolumeDescriptor.projection(fields, ("volumeSpaceSize", "logicalBlockSize"))
+    # Create element to store properties of High Sierra filesystem
+    fsHSF = model.FileSystem(type="High Sierra")
+    sizeExpected = 0
+
+    # Read through all 2048-byte volume descriptors, until Volume Descriptor
+    # Set Terminator is found (or unexpected EOF, which will result in -9999
+    # value for volumeDescriptorType)
+    volumeDescriptorType = -1
+    byteStart = 32768
+    while volumeDescriptorType != 255 and volumeDescriptorType != -9999:
+        volumeDescriptorType, volumeDescriptorData, byteStart = \
+            getVolumeDescriptor(reader, byteStart)
+        profiler.countDescriptors()
+        budget.countDescriptors("High Sierra")
+
+        if volumeDescriptorType == 1:
+            # Get info from Standard File Structure Volume Descriptor (as record)
+            try:
+                sfsvdInfo = parseSFSVolumeDescriptor(volumeDescriptorData, sfsvdNames)
+            except Exception:
+                sizeExpected = 0
+                continue
+            fsHSF.append(sfsvdInfo)
+            # Calculation is identical to ISO 9660 case
+            sizeExpected = (sfsvdInfo.volumeSpaceSize - offset) * sfsvdInfo.logicalBlockSize
+
+    return detect.Detection(fsHSF, sizeExpected)
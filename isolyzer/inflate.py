@@ -0,0 +1,197 @@
+#! /usr/bin/env python3
+"""Deflate decompression that can be resumed at checkpoints
+
+Python's zlib module can only decompress a deflate stream from its start, as
+it does not expose the position of the inflater in the compressed data,
+which is not at a byte boundary in general. An Inflater decompresses with
+the zlib library itself (through ctypes), stops at the end of each deflate
+block, and reports the position there. At the end of a block, the state of
+the decompression is fully described by a checkpoint: the offset of the
+next compressed byte, the number of bits of the byte before it that are not
+used yet, and the window of the last 32 KiB of uncompressed data. An
+Inflater can be resumed from a checkpoint, as in the zran.c example of the
+zlib distribution. Checkpoints do not depend on the process that made them,
+so they can be stored in the seek index of an image (see the compressed
+module).
+
+Inflaters need zlib 1.2.8 or later as a shared library. It cannot always be
+loaded (e.g. on Windows, where Python has its own copy of zlib built in);
+available() returns False then.
+"""
+
+import sys
+import ctypes
+import ctypes.util
+
+
+# Return codes and flush modes of zlib
+Z_OK = 0
+Z_STREAM_END = 1
+Z_BUF_ERROR = -5
+Z_BLOCK = 5
+
+# Bits of data_type after inflate: end of a block (or of the header), and
+# last block of the stream
+END_OF_BLOCK = 128
+LAST_BLOCK = 64
+
+# Maximum size of the deflate window
+WINDOW_SIZE = 32768
+
+# Size of the trailer of a gzip member
+GZIP_TRAILER_SIZE = 8
+
+# Names of the zlib shared library to try, before searching for it
+LIBRARY_NAMES = {"darwin": ["libz.1.dylib", "libz.dylib"]}.get(sys.platform, ["libz.so.1"])
+
+
+class ZStream(ctypes.Structure):
+    """zlib's z_stream structure"""
+
+    _fields_ = [("next_in", ctypes.c_void_p),
+                ("avail_in", ctypes.c_uint),
+                ("total_in", ctypes.c_ulong),
+                ("next_out", ctypes.c_void_p),
+                ("avail_out", ctypes.c_uint),
+                ("total_out", ctypes.c_ulong),
+                ("msg", ctypes.c_char_p),
+                ("state", ctypes.c_void_p),
+                ("zalloc", ctypes.c_void_p),
+                ("zfree", ctypes.c_void_p),
+                ("opaque", ctypes.c_void_p),
+                ("data_type", ctypes.c_int),
+                ("adler", ctypes.c_ulong),
+                ("reserved", ctypes.c_ulong)]
+
+
+def loadLibrary():
+    """Return the zlib shared library, with the argument types of the
+    functions that are used declared, or None if it cannot be loaded or is
+    too old
+    """
+    names = list(LIBRARY_NAMES)
+    found = ctypes.util.find_library("z")
+    if found:
+        names.append(found)
+    for name in names:
+        try:
+            library = ctypes.CDLL(name)
+        except OSError:
+            continue
+        if not hasattr(library, "inflateGetDictionary"):
+            # zlib before 1.2.8
+            return None
+        stream = ctypes.POINTER(ZStream)
+        library.zlibVersion.restype = ctypes.c_char_p
+        library.zlibVersion.argtypes = []
+        library.inflateInit2_.argtypes = [stream, ctypes.c_int, ctypes.c_char_p, ctypes.c_int]
+        library.inflate.argtypes = [stream, ctypes.c_int]
+        library.inflateEnd.argtypes = [stream]
+        library.inflatePrime.argtypes = [stream, ctypes.c_int, ctypes.c_int]
+        library.inflateSetDictionary.argtypes = [stream, ctypes.c_char_p, ctypes.c_uint]
+        library.inflateGetDictionary.argtypes = [stream, ctypes.c_char_p,
+                                                 ctypes.POINTER(ctypes.c_uint)]
+        return library
+    return None
+
+
+# The zlib library, once it is loaded (False if it cannot be loaded)
+_library = None
+
+
+def library():
+    """Return the zlib shared library, or None if it cannot be loaded"""
+    global _library
+    if _library is None:
+        _library = loadLibrary() or False
+    return _library or None
+
+
+def available():
+    """Return True if Inflaters can be used"""
+    return library() is not None
+
+
+class Inflater:
+    """Decompressor of a gzip member (or, if raw is True, of a raw deflate
+    stream), with the attributes and the decompress method of the objects
+    that zlib.decompressobj returns. After each call of decompress,
+    blockEnd tells if the decompression stopped at the end of a deflate
+    block (or of the gzip header), where a checkpoint can be made; bits is
+    the number of bits of the last byte used that are not used yet.
+    trailerSize is the size of the gzip trailer that follows the end of the
+    stream, if it is not read by the Inflater (i.e. of raw streams)
+    """
+
+    def __init__(self, raw=False):
+        self.library = library()
+        self.stream = ZStream()
+        self.active = False
+        result = self.library.inflateInit2_(ctypes.byref(self.stream), -15 if raw else 31,
+                                            self.library.zlibVersion(),
+                                            ctypes.sizeof(ZStream))
+        if result != Z_OK:
+            raise MemoryError("cannot initialise zlib inflater")
+        self.active = True
+        self.trailerSize = GZIP_TRAILER_SIZE if raw else 0
+        self.eof = False
+        self.unused_data = b''
+        self.unconsumed_tail = b''
+        self.blockEnd = False
+        self.bits = 0
+
+    @classmethod
+    def resume(cls, bits, byteBefore, window):
+        """Return raw Inflater at a checkpoint, where bits bits of byte
+        byteBefore are not used yet, and window is the window
+        """
+        inflater = cls(raw=True)
+        stream = ctypes.byref(inflater.stream)
+        if bits:
+            inflater.library.inflatePrime(stream, bits, byteBefore >> (8 - bits))
+        if inflater.library.inflateSetDictionary(stream, window, len(window)) != Z_OK:
+            raise ValueError("invalid checkpoint window")
+        return inflater
+
+    def __del__(self):
+        if self.active:
+            self.library.inflateEnd(ctypes.byref(self.stream))
+
+    def decompress(self, data, maxLength):
+        """Decompress data, and return at most maxLength bytes of output.
+        Decompression stops at the end of each deflate block. Input that is
+        not consumed is kept as unconsumed_tail, and input after the end of
+        the stream as unused_data. Raises ValueError if data is invalid
+        """
+        output = ctypes.create_string_buffer(maxLength)
+        stream = self.stream
+        stream.next_in = ctypes.cast(data, ctypes.c_void_p).value
+        stream.avail_in = len(data)
+        stream.next_out = ctypes.addressof(output)
+        stream.avail_out = maxLength
+        result = self.library.inflate(ctypes.byref(stream), Z_BLOCK)
+        if result not in (Z_OK, Z_STREAM_END, Z_BUF_ERROR):
+            message = stream.msg.decode("ascii", "replace") if stream.msg else str(result)
+            raise ValueError("invalid deflate data: " + message)
+        rest = data[len(data) - stream.avail_in:]
+        if result == Z_STREAM_END:
+            self.eof = True
+            self.unused_data = rest
+            self.unconsumed_tail = b''
+        else:
+            self.unconsumed_tail = rest
+        self.blockEnd = bool(stream.data_type & END_OF_BLOCK) and \
+            not stream.data_type & LAST_BLOCK and not self.eof
+        self.bits = stream.data_type & 7
+        # Pointers into data and output are not kept
+        stream.next_in = None
+        stream.next_out = None
+        return ctypes.string_at(output, maxLength - stream.avail_out)
+
+    def window(self):
+        """Return the current window (up to 32 KiB)"""
+        window = ctypes.create_string_buffer(WINDOW_SIZE)
+        length = ctypes.c_uint(0)
+        self.library.inflateGetDictionary(ctypes.byref(self.stream), window,
+                                          ctypes.byref(length))
+        return window.raw[:length.value]
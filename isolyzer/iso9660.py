@@ -1,9 +1,48 @@
 #! /usr/bin/env python3
 """Parser functions for the ISO 9660 file system"""
 
-import xml.etree.ElementTree as ET
+import heapq
+import bisect
+import struct
+from . import budgets
 from . import byteconv as bc
-from . import shared as shared
+from . import detect
+from . import layout
+from . import model
+from . import textconv
+
+
+# Fixed part of a Directory Record (ECMA-119, 9.1): length of the record,
+# length of the extended attribute record, location of the extent and data
+# length (the little-endian halves of the both-byte order fields), file
+# flags and length of the file identifier
+directoryRecordStruct = struct.Struct("<BBI4xI4x7xB6xB")
+
+# Offset of the root Directory Record in the Primary Volume Descriptor
+ROOT_DIRECTORY_RECORD_OFFSET = 156
+
+# File flags of directories, and of records that are followed by another
+# extent of the same file
+FLAG_DIRECTORY = 0x02
+FLAG_MULTI_EXTENT = 0x80
+
+# Fixed part of a (type L) Path Table Record: length of directory
+# identifier, length of extended attribute record, location of extent and
+# parent directory number
+pathTableRecordStruct = struct.Struct("<BBIH")
+
+# Joliet escape sequences (UCS-2 levels 1, 2 and 3), and offset of the
+# escape sequences field in a Supplementary Volume Descriptor
+JOLIET_ESCAPE_SEQUENCES = (b"%/@", b"%/C", b"%/E")
+ESCAPE_SEQUENCES_OFFSET = 88
+
+# Maximum number of sectors of adjacent directories that are read in one call
+# while the directory hierarchy is walked
+MAX_BATCH_SECTORS = 64
+
+# Maximum data length of a directory that is read while the directory
+# hierarchy is walked; larger directories only occur in corrupt images
+MAX_DIRECTORY_SIZE = 16 * 1024 * 1024
 
 
 def decDateTimeToDate(datetime):
@@ -26,94 +65,420 @@ def decDateTimeToDate(datetime):
     return dateTimeString
 
 
-def getVolumeDescriptor(bytesData, byteStart):
+def getVolumeDescriptor(reader, byteStart):
 
-    """Read one 2048-byte ISO volume descriptor and return its descriptor
-    code and contents
+    """Read one 2048-byte ISO volume descriptor from sector reader and return
+    its descriptor code and contents
     """
     byteEnd = byteStart + 2048
-    volumeDescriptorType = bc.bytesToUnsignedChar(bytesData[byteStart:byteStart+1])
-    volumeDescriptorData = bytesData[byteStart:byteEnd]
+    volumeDescriptorData = reader.read(byteStart, 2048)
+    volumeDescriptorType = bc.bytesToUnsignedChar(volumeDescriptorData[0:1])
 
     return(volumeDescriptorType, volumeDescriptorData, byteEnd)
 
 
-def parsePrimaryVolumeDescriptor(bytesData):
-
-    """Parse Primary volume Descriptor and return extracted properties"""
-
-    # Set up elemement object to store extracted properties
-    properties = ET.Element("primaryVolumeDescriptor")
-
-    shared.addProperty(properties, "typeCode",
-                       bc.bytesToUnsignedChar(bytesData[0:1]))
-    shared.addProperty(properties, "standardIdentifier",
-                       bc.bytesToText(bytesData[1:6]))
-    shared.addProperty(properties, "version",
-                       bc.bytesToUnsignedChar(bytesData[6:7]))
-    shared.addProperty(properties, "systemIdentifier",
-                       bc.bytesToText(bytesData[8:40]))
-    shared.addProperty(properties, "volumeIdentifier",
-                       bc.bytesToText(bytesData[40:72]))
-
-    # Fields below are stored as both little-endian and big-endian; only
-    # big-endian values read here!
-
+# Layout of the Primary Volume Descriptor. Fields that are stored as both
+# little-endian and big-endian are reported as big-endian; the path table
+# locations are stored in one byte order only
+primaryVolumeDescriptorLayout = layout.Layout(">", [
+    ("typeCode", 0, "uint8"),
+    ("standardIdentifier", 1, "text", 5),
+    ("version", 6, "uint8"),
+    ("systemIdentifier", 8, "text", 32),
+    ("volumeIdentifier", 40, "text", 32),
     # Number of Logical Blocks in which the volume is recorded
-    shared.addProperty(properties, "volumeSpaceSize",
-                       bc.bytesToUInt(bytesData[84:88]))
+    ("volumeSpaceSize", 80, "uint32both"),
     # The size of the set in this logical volume (number of disks)
-    shared.addProperty(properties, "volumeSetSize",
-                       bc.bytesToUShortInt(bytesData[122:124]))
+    ("volumeSetSize", 120, "uint16both"),
     # The number of this disk in the Volume Set
-    shared.addProperty(properties, "volumeSequenceNumber",
-                       bc.bytesToUShortInt(bytesData[126:128]))
+    ("volumeSequenceNumber", 124, "uint16both"),
     # The size in bytes of a logical block
-    shared.addProperty(properties, "logicalBlockSize",
-                       bc.bytesToUShortInt(bytesData[130:132]))
+    ("logicalBlockSize", 128, "uint16both"),
     # The size in bytes of the path table
-    shared.addProperty(properties, "pathTableSize",
-                       bc.bytesToUInt(bytesData[136:140]))
-    # Location of Type-L Path Table (note this is stored as little-endian only, hence
-    # byte swap!)
-    shared.addProperty(properties, "typeLPathTableLocation",
-                       bc.swap32(bc.bytesToUInt(bytesData[140:144])))
-    # Location of Optional Type-L Path Table
-    shared.addProperty(properties, "optionalTypeLPathTableLocation",
-                       bc.swap32(bc.bytesToUInt(bytesData[144:148])))
-    # Location of Type-M Path Table
-    shared.addProperty(properties, "typeMPathTableLocation",
-                       bc.bytesToUInt(bytesData[148:152]))
-    # Location of Optional Type-M Path Table
-    shared.addProperty(properties, "optionalTypeMPathTableLocation",
-                       bc.bytesToUInt(bytesData[152:156]))
-
-    # Following fields are all text strings
-    shared.addProperty(properties, "volumeSetIdentifier",
-                       bc.bytesToText(bytesData[190:318]))
-    shared.addProperty(properties, "publisherIdentifier",
-                       bc.bytesToText(bytesData[318:446]))
-    shared.addProperty(properties, "dataPreparerIdentifier",
-                       bc.bytesToText(bytesData[446:574]))
-    shared.addProperty(properties, "applicationIdentifier",
-                       bc.bytesToText(bytesData[574:702]))
-    shared.addProperty(properties, "copyrightFileIdentifier",
-                       bc.bytesToText(bytesData[702:740]))
-    shared.addProperty(properties, "abstractFileIdentifier",
-                       bc.bytesToText(bytesData[740:776]))
-    shared.addProperty(properties, "bibliographicFileIdentifier",
-                       bc.bytesToText(bytesData[776:813]))
-
-    # Following fields are all date-time values
-    shared.addProperty(properties, "volumeCreationDateAndTime",
-                       decDateTimeToDate(bytesData[813:830]))
-    shared.addProperty(properties, "volumeModificationDateAndTime",
-                       decDateTimeToDate(bytesData[830:847]))
-    shared.addProperty(properties, "volumeExpirationDateAndTime",
-                       decDateTimeToDate(bytesData[847:864]))
-    shared.addProperty(properties, "volumeEffectiveDateAndTime",
-                       decDateTimeToDate(bytesData[864:881]))
-    shared.addProperty(properties, "fileStructureVersion",
-                       bc.bytesToUnsignedChar(bytesData[881:882]))
-
-    return properties
+    ("pathTableSize", 132, "uint32both"),
+    # Location of Type-L Path Table and Optional Type-L Path Table
+    ("typeLPathTableLocation", 140, "uint32le"),
+    ("optionalTypeLPathTableLocation", 144, "uint32le"),
+    # Location of Type-M Path Table and Optional Type-M Path Table
+    ("typeMPathTableLocation", 148, "uint32be"),
+    ("optionalTypeMPathTableLocation", 152, "uint32be"),
+    ("volumeSetIdentifier", 190, "text", 128),
+    ("publisherIdentifier", 318, "text", 128),
+    ("dataPreparerIdentifier", 446, "text", 128),
+    ("applicationIdentifier", 574, "text", 128),
+    ("copyrightFileIdentifier", 702, "text", 38),
+    ("abstractFileIdentifier", 740, "text", 36),
+    ("bibliographicFileIdentifier", 776, "text", 37),
+    ("volumeCreationDateAndTime", 813, "bytes", 17, decDateTimeToDate),
+    ("volumeModificationDateAndTime", 830, "bytes", 17, decDateTimeToDate),
+    ("volumeExpirationDateAndTime", 847, "bytes", 17, decDateTimeToDate),
+    ("volumeEffectiveDateAndTime", 864, "bytes", 17, decDateTimeToDate),
+    ("fileStructureVersion", 881, "uint8")
+])
+
+
+# Identifier fields of the Primary Volume Descriptor that are restricted to
+# d-characters or a-characters (ECMA-119, 8.4), as (name, offset, length,
+# check) tuples. The publisher, data preparer and application identifiers
+# may also hold "_" followed by a file identifier, which are a-characters too
+identifierCharacterChecks = [
+    ("systemIdentifier", 8, 32, textconv.isACharacters),
+    ("volumeIdentifier", 40, 32, textconv.isDCharacters),
+    ("volumeSetIdentifier", 190, 128, textconv.isDCharacters),
+    ("publisherIdentifier", 318, 128, textconv.isACharacters),
+    ("dataPreparerIdentifier", 446, 128, textconv.isACharacters),
+    ("applicationIdentifier", 574, 128, textconv.isACharacters)
+]
+
+
+class PrimaryVolumeDescriptor(model.Descriptor):
+    """Primary Volume Descriptor, with one property per field of
+    primaryVolumeDescriptorLayout, and nonConformingIdentifiers (see
+    nonConformingIdentifiers)
+    """
+
+    __slots__ = primaryVolumeDescriptorLayout.names + ("nonConformingIdentifiers",)
+    tag = "primaryVolumeDescriptor"
+    layout = primaryVolumeDescriptorLayout
+
+
+def nonConformingIdentifiers(bytesData):
+    """Return space-separated names of the identifier fields of Primary
+    Volume Descriptor bytesData that hold characters other than the d- or
+    a-characters they are restricted to, or None if all fields conform
+    """
+    names = [name for name, start, length, check in identifierCharacterChecks
+             if not check(bytesData[start:start + length])]
+    return " ".join(names) if names else None
+
+
+def parsePrimaryVolumeDescriptor(bytesData, names=None):
+
+    """Parse Primary volume Descriptor and return PrimaryVolumeDescriptor record"""
+
+    pvdInfo = PrimaryVolumeDescriptor.fromBytes(bytesData, names)
+    if names is None or "nonConformingIdentifiers" in names:
+        pvdInfo.nonConformingIdentifiers = nonConformingIdentifiers(bytesData)
+    return pvdInfo
+
+
+def parseRootDirectoryRecord(bytesData):
+    """Return (location of extent, data length) of the root Directory Record
+    in Primary Volume Descriptor bytesData
+    """
+    _, _, location, dataLength, _, _ = directoryRecordStruct.unpack_from(
+        bytesData, ROOT_DIRECTORY_RECORD_OFFSET)
+    return location, dataLength
+
+
+def iterRecordPositions(bytesData, blockSize):
+    """Yield (position, length, location, dataLength, flags, identifierLength)
+    tuple for each Directory Record in bytesData (the extent of a directory,
+    or a part of it). Records do not cross logical block boundaries; a record
+    length of 0 means that the rest of the block is unused
+    """
+    position = 0
+    end = len(bytesData) - directoryRecordStruct.size
+    while position <= end:
+        length, _, location, dataLength, flags, identifierLength = \
+            directoryRecordStruct.unpack_from(bytesData, position)
+        if length == 0:
+            position = (position // blockSize + 1) * blockSize
+            continue
+        if length < 34 or 33 + identifierLength > length:
+            # Invalid record; skip the rest of the block
+            position = (position // blockSize + 1) * blockSize
+            continue
+        yield position, length, location, dataLength, flags, identifierLength
+        position += length
+
+
+def iterDirectoryRecords(bytesData, blockSize):
+    """Yield (location, dataLength, flags, identifier) tuple for each
+    Directory Record in bytesData (see iterRecordPositions)
+    """
+    for position, _, location, dataLength, flags, identifierLength in \
+            iterRecordPositions(bytesData, blockSize):
+        yield location, dataLength, flags, bytes(bytesData[position + 33:
+                                                           position + 33 + identifierLength])
+
+
+def recordingDateTime(bytesData):
+    """Convert 7 byte Recording Date and Time of a Directory Record to
+    formatted date-time string (empty if not specified)
+    """
+    if len(bytesData) < 7 or not any(bytesData[:6]):
+        return ""
+    year, month, day, hour, minute, second = bytesData[:6]
+    return "%d/%02d/%02d, %02d:%02d:%02d" % (1900 + year, month, day, hour, minute, second)
+
+
+def parsePathTable(bytesData):
+    """Parse (type L) path table, and return list of (location of extent,
+    parent directory number, identifier) tuples, in path table order.
+    Directory numbers start at 1 (the root directory)
+    """
+    directories = []
+    position = 0
+    end = len(bytesData) - pathTableRecordStruct.size
+    while position <= end:
+        identifierLength, _, location, parent = pathTableRecordStruct.unpack_from(
+            bytesData, position)
+        if identifierLength == 0:
+            break
+        start = position + pathTableRecordStruct.size
+        directories.append((location, parent, bytes(bytesData[start:start + identifierLength])))
+        position = start + identifierLength + (identifierLength & 1)
+    return directories
+
+
+def isJoliet(bytesData):
+    """Return True if Supplementary Volume Descriptor bytesData is a Joliet
+    descriptor (UCS-2 level 1, 2 or 3 escape sequence)
+    """
+    escapeSequences = bytes(bytesData[ESCAPE_SEQUENCES_OFFSET:ESCAPE_SEQUENCES_OFFSET + 32])
+    return any(sequence in escapeSequences for sequence in JOLIET_ESCAPE_SEQUENCES)
+
+
+def iterSystemUseEntries(bytesData):
+    """Yield (signature, data) tuple for each System Use Sharing Protocol
+    entry in System Use area bytesData, where data is everything after the
+    4-byte entry header
+    """
+    position = 0
+    end = len(bytesData) - 4
+    while position <= end:
+        signature = bytes(bytesData[position:position + 2])
+        length = bytesData[position + 2]
+        if length < 4 or signature == b"ST":
+            break
+        yield signature, bytesData[position + 4:position + length]
+        position += length
+
+
+def rockRidgeSkipLength(bytesData):
+    """Return number of bytes to skip at the start of each System Use area
+    if System Use area bytesData (of the "." record of the root directory)
+    starts with a SUSP "SP" entry, or None if it does not (the image has no
+    Rock Ridge extensions)
+    """
+    if len(bytesData) >= 7 and bytesData[0:2] == b"SP" and bytesData[4:6] == b"\xbe\xef":
+        return bytesData[6]
+    return None
+
+
+def rockRidgeName(entries):
+    """Return Rock Ridge alternate name from the SUSP entries of a Directory
+    Record (iterable of (signature, data) tuples), or None if there is none.
+    The names of "." and ".." (flags CURRENT and PARENT) are not reported
+    """
+    parts = []
+    for signature, data in entries:
+        if signature == b"NM" and len(data) >= 1:
+            flags = data[0]
+            if flags & 0x06:
+                return None
+            parts.append(bytes(data[1:]))
+            if not flags & 0x01:
+                break
+    if not parts:
+        return None
+    return textconv.decodeText(b"".join(parts))
+
+
+class ExtentIndex:
+    """Extents of all files and directories in an ISO 9660 directory
+    hierarchy, as parallel lists (one item per Directory Record, in the order
+    in which the records were read): location (logical block number), data
+    length, whether it is a directory, index of the parent directory (-1 for
+    the root) and identifier. Paths are only built when they are asked for
+    """
+
+    def __init__(self, blockSize):
+        self.blockSize = blockSize
+        self.locations = []
+        self.dataLengths = []
+        self.isDirectory = []
+        self.parents = []
+        self.identifiers = []
+
+    def __len__(self):
+        return len(self.locations)
+
+    def add(self, location, dataLength, isDirectory, parent, identifier):
+        """Add extent, and return its index"""
+        self.locations.append(location)
+        self.dataLengths.append(dataLength)
+        self.isDirectory.append(isDirectory)
+        self.parents.append(parent)
+        self.identifiers.append(identifier)
+        return len(self.locations) - 1
+
+    def path(self, index):
+        """Return path of extent index"""
+        names = []
+        while self.parents[index] >= 0:
+            identifier = self.identifiers[index]
+            if not self.isDirectory[index]:
+                # Strip version number, and separator of names without extension
+                identifier = identifier.split(b";")[0]
+                if identifier.endswith(b".") and len(identifier) > 1:
+                    identifier = identifier[:-1]
+            names.append(textconv.decodeText(identifier))
+            index = self.parents[index]
+        return "/" + "/".join(reversed(names))
+
+    def endOffsets(self, offset=0):
+        """Return list of the image byte offsets at which the extents end, for
+        an image whose first sector is logical block offset
+        """
+        blockSize = self.blockSize
+        return [(location - offset) * blockSize + dataLength
+                for location, dataLength in zip(self.locations, self.dataLengths)]
+
+    def highestSector(self):
+        """Return highest (2048-byte) sector that any non-empty extent
+        occupies, or None if all extents are empty
+        """
+        blockSize = self.blockSize
+        ends = [location * blockSize + dataLength
+                for location, dataLength in zip(self.locations, self.dataLengths)
+                if dataLength > 0]
+        return (max(ends) - 1) // 2048 if ends else None
+
+    def extentsBeyond(self, size, offset=0):
+        """Return list of (index, bytes beyond size) tuples of the non-empty
+        extents that run past byte size of an image whose first sector is
+        logical block offset, in order of their end offsets
+        """
+        ends = self.endOffsets(offset)
+        # Sorted extent index; extents that end after size are at its end
+        order = sorted(range(len(ends)), key=ends.__getitem__)
+        sortedEnds = [ends[index] for index in order]
+        first = bisect.bisect_right(sortedEnds, size)
+        return [(index, min(ends[index] - size, self.dataLengths[index]))
+                for index in order[first:] if self.dataLengths[index] > 0]
+
+
+def walkDirectories(reader, rootLocation, rootLength, blockSize, offset=0, profiler=None):
+    """Walk the directory hierarchy from the root directory (with extent
+    location rootLocation and data length rootLength), and return an
+    ExtentIndex. The walk is iterative: directories that are yet to be read
+    are kept in a heap, so their extents are read in ascending order, and
+    adjacent extents (up to MAX_BATCH_SECTORS sectors) are read in one call.
+    Each directory is read only once, so loops in a damaged hierarchy end
+    the walk. Extents that lie (partly) outside the image are read as far as
+    they go; offset is the logical block of the first sector of the image.
+    Directories with a data length over MAX_DIRECTORY_SIZE are added to the
+    index, but not read
+    """
+    index = ExtentIndex(blockSize)
+    root = index.add(rootLocation, rootLength, True, -1, b"\x00")
+    pending = [(rootLocation, rootLength, root)] if rootLength <= MAX_DIRECTORY_SIZE else []
+    visited = {rootLocation}
+    maxBatch = MAX_BATCH_SECTORS * 2048 // blockSize
+
+    while pending:
+        # Batch of adjacent (or overlapping) directory extents
+        batch = [heapq.heappop(pending)]
+        start = batch[0][0]
+        end = start + -(-batch[0][1] // blockSize)
+        while pending and pending[0][0] <= end and \
+                pending[0][0] + -(-pending[0][1] // blockSize) - start <= maxBatch:
+            location, dataLength, parent = heapq.heappop(pending)
+            batch.append((location, dataLength, parent))
+            end = max(end, location + -(-dataLength // blockSize))
+
+        if start < offset:
+            # Extents before the image (e.g. in an earlier session)
+            continue
+        data = reader.read((start - offset) * blockSize, (end - start) * blockSize)
+        if profiler is not None:
+            profiler.countDescriptors(len(batch))
+
+        for location, dataLength, parent in batch:
+            begin = (location - start) * blockSize
+            records = iterDirectoryRecords(data[begin:begin + dataLength], blockSize)
+            for childLocation, childLength, flags, identifier in records:
+                if identifier in (b"\x00", b"\x01"):
+                    # This directory and its parent
+                    continue
+                isDirectory = bool(flags & FLAG_DIRECTORY)
+                child = index.add(childLocation, childLength, isDirectory, parent, identifier)
+                if isDirectory and childLocation not in visited and \
+                        childLength <= MAX_DIRECTORY_SIZE:
+                    visited.add(childLocation)
+                    heapq.heappush(pending, (childLocation, childLength, child))
+    return index
+
+
+def truncationReport(reader, pvdInfo, pvdData, offset, imageSize, profiler=None):
+    """Walk the directory hierarchy of the Primary Volume Descriptor (record
+    pvdInfo, data pvdData) of an image of imageSize bytes, whose first sector
+    is logical block offset, and return a model.TruncationReport with the
+    files and directories whose extents run past the end of the image
+    """
+    blockSize = pvdInfo.logicalBlockSize
+    if blockSize not in (512, 1024, 2048):
+        blockSize = 2048
+    rootLocation, rootLength = parseRootDirectoryRecord(pvdData)
+    index = walkDirectories(reader, rootLocation, rootLength, blockSize, offset, profiler)
+
+    extents = [model.ExtentBeyondEOF(index.path(item),
+                                     "directory" if index.isDirectory[item] else "file",
+                                     index.locations[item], index.dataLengths[item],
+                                     bytesBeyondEOF)
+               for item, bytesBeyondEOF in index.extentsBeyond(imageSize, offset)]
+    directories = sum(index.isDirectory)
+    directoriesBeyondEOF = sum(extent.type == "directory" for extent in extents)
+    return model.TruncationReport(directories, len(index) - directories,
+                                  index.highestSector(), directoriesBeyondEOF,
+                                  len(extents) - directoriesBeyondEOF,
+                                  sum(extent.bytesBeyondEOF for extent in extents), extents)
+
+
+def parseFileSystem(reader, offset, profiler, fields=None, budget=budgets.nullBudget):
+    """Read through the ISO 9660 volume descriptors and parse the Primary
+    Volume Descriptor (parse callback of the ISO 9660 detector, see the
+    detect module). The Primary Volume Descriptor is also returned as details
+    pvdInfo and pvdData, for the truncation report
+    """
+    pvdNames = PrimaryVolumeDescriptor.projection(fields, ("volumeSpaceSize",
+                                                           "logicalBlockSize"))
+    # Create element to store properties of ISO9660 filesystem
+    fsISO = model.FileSystem(type="ISO 9660")
+    details = {}
+    sizeExpected = 0
+
+    # Read through all 2048-byte ISO volume descriptors, until Volume Descriptor
+    # Set Terminator is found (or unexpected EOF, which will result in -9999
+    # value for volumeDescriptorType)
+    volumeDescriptorType = -1
+    byteStart = 32768
+    while volumeDescriptorType != 255 and volumeDescriptorType != -9999:
+        volumeDescriptorType, volumeDescriptorData, byteStart = \
+            getVolumeDescriptor(reader, byteStart)
+        profiler.countDescriptors()
+        budget.countDescriptors("ISO 9660")
+
+        if volumeDescriptorType == 1:
+            # Get info from Primary Volume Descriptor (as record)
+            try:
+                pvdInfo = parsePrimaryVolumeDescriptor(volumeDescriptorData, pvdNames)
+            except Exception:
+                # No size (and no truncation report) if the last Primary
+                # Volume Descriptor cannot be parsed
+                details = {}
+                sizeExpected = 0
+                continue
+            fsISO.append(pvdInfo)
+            details = {"pvdInfo": pvdInfo, "pvdData": volumeDescriptorData}
+            # Subtracting offset from volumeSpaceSize gives the correct size in case of image
+            # from 2nd session of multisession disc
+            sizeExpected = (pvdInfo.volumeSpaceSize - offset) * pvdInfo.logicalBlockSize
+            # NOTE: this might be off if logicalBlockSize != 2048 (since Sys area and
+            # Volume Descriptors are ALWAYS multiples of 2048 bytes!). Also, even for
+            # non-hybrid FS actual size is sometimes slightly larger than expected size.
+            # Not entirely sure why (padding bytes?)
+
+    return detect.Detection(fsISO, sizeExpected, details)
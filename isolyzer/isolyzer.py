@@ -21,28 +21,25 @@ its filesystem-level headers.
 from __future__ import division
 import sys
 import os
-import mmap
 import time
-import glob
-import platform
-import re
+import stat
 import codecs
-import argparse
-import xml.etree.ElementTree as ET
-from xml.dom import minidom
-from . import iso9660 as iso
-from . import hsf as hsf
-from . import udf as udf
-from . import apple as apple
+import itertools
+from . import budgets
 from . import byteconv as bc
-from . import shared as shared
+from . import detect
+from . import model
+from . import sectorreader as sr
+from . import perf
+from . import projection
+from . import walker
+from . import writers
 
+# Modules that only some runs need (the file system parsers, argument
+# parsing, worker pools, checksums, the result cache and Windows wildcard
+# expansion) are imported where they are used, which keeps the start-up
+# time of single-image runs low (see benchmarks/bench_startup.py)
 
-scriptPath, scriptName = os.path.split(sys.argv[0])
-
-# Fix empty scriptName if isolyzer is called from Java/Jython
-if len(scriptName) == 0:
-    scriptName = 'isolyzer'
 
 __version__ = '1.4.0'
 
@@ -53,9 +50,18 @@ schemaString = 'http://kb.nl/ns/isolyzer/v1/ \
 https://raw.githubusercontent.com/KBNLresearch/isolyzer/main/xsd/isolyzer-v-1-0.xsd'
 xsiNsString = 'http://www.w3.org/2001/XMLSchema-instance'
 
-# Create parser
-parser = argparse.ArgumentParser(
-    description="Verify file size of ISO image and extract technical information")
+
+def getScriptName():
+    """Return name of the script isolyzer was called from, which is reported
+    as toolName
+    """
+    argv = getattr(sys, "argv", None) or [""]
+    scriptName = os.path.basename(argv[0])
+
+    # Fix empty scriptName if isolyzer is called from Java/Jython
+    if len(scriptName) == 0:
+        scriptName = 'isolyzer'
+    return scriptName
 
 
 def printWarning(msg):
@@ -71,108 +77,28 @@ def errorExit(msg):
     sys.exit()
 
 
-def checkFileExists(fileIn):
-    """Check if file exists and exit if not"""
-    if not os.path.isfile(fileIn):
-        msg = fileIn + " does not exist"
-        errorExit(msg)
-
-
-def fileToMemoryMap(filename):
-    """Read contents of filename to memory map object"""
-
-    # Open filename
-    f = open(filename, "rb")
-
-    # Call to mmap is different on Linux and Windows, so we need to know
-    # the current platform
-    platform = sys.platform
-
-    try:
-        if platform == "win32":
-            # Parameters for Windows may need further fine-tuning ...
-            fileData = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
-        else:
-            # This works for Linux (and Cygwin on Windows). Not too sure
-            # about other platforms like Mac OS though
-            fileData = mmap.mmap(f.fileno(), 0, mmap.MAP_SHARED, mmap.PROT_READ)
-    except ValueError:
-        # mmap fails on empty files.
-        fileData = ""
-
-    f.close()
-
-    return fileData
-
-
-def makeHumanReadable(element, remapTable={}):
-    """Takes element object, and returns a modified version in which all
-    non-printable 'text' fields (which may contain numeric data or binary strings)
-    are replaced by printable strings
-
-    Property values in original tree may be mapped to alternative (more user-friendly)
-    reportable values using a remapTable, which is a nested dictionary.
-    TODO: add to separate module
+def isImageMode(mode):
+    """Return True if mode (st_mode of a stat result) is that of a regular
+    file or a block device
     """
+    return stat.S_ISREG(mode) or stat.S_ISBLK(mode)
 
-    for elt in element.iter():
-        # Text field of this element
-        textIn = elt.text
 
-        # Tag name
-        tag = elt.tag
-
-        # Step 1: replace property values by values defined in enumerationsMap,
-        # if applicable
-        try:
-            # If tag is in enumerationsMap, replace property values
-            parameterMap = remapTable[tag]
-            try:
-                # Map original property values to values in dictionary
-                remappedValue = parameterMap[textIn]
-            except KeyError:
-                # If value doesn't match any key: use original value
-                # instead
-                remappedValue = textIn
-        except KeyError:
-            # If tag doesn't match any key in enumerationsMap, use original
-            # value
-            remappedValue = textIn
-
-        # Step 2: convert all values to text strings.
-
-        # First set up list of all numeric data types,
-        numericTypes = [int, float, bool]
-
-        # Convert
-
-        if remappedValue is not None:
-            # Data type
-            textType = type(remappedValue)
-
-            # Convert text field, depending on type
-            if textType == bytes:
-                textOut = bc.bytesToText(remappedValue)
-            elif textType in numericTypes:
-                textOut = str(remappedValue)
-            else:
-                # Remove control chars and strip leading/ trailing whitespaces
-                textOut = bc.removeControlCharacters(remappedValue).strip()
-
-            # Update output tree
-            elt.text = textOut
+def checkFileExists(fileIn):
+    """Check if file (or block device) exists and raise FileNotFoundError if not"""
+    try:
+        mode = os.stat(fileIn).st_mode
+    except OSError:
+        mode = 0
+    if not isImageMode(mode):
+        raise FileNotFoundError(fileIn + " does not exist")
 
 
 def writeElement(elt, codec):
     """Writes element as XML to stdout using defined codec"""
 
-    # Element to string
-    xmlOut = ET.tostring(elt, 'unicode', 'xml')
-
-    # Make xml pretty
-    xmlPretty = minidom.parseString(xmlOut).toprettyxml('    ')
-
-    xmlOut = xmlPretty
+    # Element to indented XML string
+    xmlOut = "<?xml version=\"1.0\" ?>\n" + writers.prettyXML(elt)
 
     # Write output
     codec.write(xmlOut)
@@ -195,13 +121,20 @@ def stripSurrogatePairs(ustring):
     return ustring
 
 
-def parseCommandLine():
-    """Parse command line"""
+def cleanFileName(name):
+    """Remove surrogate pairs, control characters and leading/trailing white
+    space from file name or path, to avoid problems when writing it to XML
+    """
+    return bc.removeControlCharacters(stripSurrogatePairs(name)).strip()
+
+
+def parseCommandLine(parser):
+    """Parse command line with argparse.ArgumentParser parser"""
     # Add arguments
     parser.add_argument('ISOImages',
                         action="store",
                         type=str,
-                        nargs='+',
+                        nargs='*',
                         help="input ISO image(s) (wildcards allowed)")
     parser.add_argument('--version', '-v',
                         action='version',
@@ -213,6 +146,168 @@ def parseCommandLine():
                         action='store',
                         dest='sectorOffset',
                         default=0)
+    parser.add_argument('--jobs', '-j',
+                        type=int,
+                        help="number of worker processes used to analyse images in \
+                        parallel (default: 1)",
+                        action='store',
+                        dest='jobs',
+                        default=1)
+    parser.add_argument('--format', '-f',
+                        choices=['xml', 'json', 'jsonl', 'csv'],
+                        help="output format (default: xml, or jsonl for manifests)",
+                        action='store',
+                        dest='outputFormat',
+                        default=None)
+    parser.add_argument('--reader',
+                        choices=['pread', 'mmap', 'device'],
+                        help="method for reading images: positional reads of the \
+                        required sectors only, memory mapping, or positional reads \
+                        aligned to the logical block size of a block device \
+                        (default: pread; block devices are always read as devices)",
+                        action='store',
+                        dest='reader',
+                        default='pread')
+    parser.add_argument('--index-dir',
+                        type=str,
+                        help="directory for the seek indexes of gzip-compressed \
+                        images (default: isolyzer/seekindex in the user cache \
+                        directory)",
+                        action='store',
+                        dest='indexDir',
+                        default=None)
+    parser.add_argument('--profile',
+                        type=str,
+                        help="write per-image stage timings, I/O counters and a \
+                        batch summary to this file (JSON Lines)",
+                        action='store',
+                        dest='profileFile',
+                        default=None)
+    parser.add_argument('--recursive', '-r',
+                        type=str,
+                        help="recursively process all files in directory (may be \
+                        repeated)",
+                        action='append',
+                        dest='directories',
+                        default=[])
+    parser.add_argument('--include',
+                        type=str,
+                        help="only process files whose name matches this pattern \
+                        (wildcards allowed; may be repeated)",
+                        action='append',
+                        dest='includes',
+                        default=[])
+    parser.add_argument('--exclude',
+                        type=str,
+                        help="skip files and directories whose name matches this \
+                        pattern (wildcards allowed; may be repeated)",
+                        action='append',
+                        dest='excludes',
+                        default=[])
+    parser.add_argument('--input-list',
+                        type=str,
+                        help="read image paths from this file ('-' for stdin); paths \
+                        are newline or NUL delimited",
+                        action='append',
+                        dest='inputLists',
+                        default=[])
+    parser.add_argument('--checksum',
+                        type=str,
+                        help="comma-separated list of whole-image checksums to \
+                        compute alongside the analysis (md5, sha1, sha224, sha256, \
+                        sha384, sha512, blake2b, blake2s)",
+                        action='store',
+                        dest='checksums',
+                        default=None)
+    parser.add_argument('--truncation-report',
+                        help="for images that are smaller than expected, walk the \
+                        ISO 9660 directory hierarchy and report the files and \
+                        directories that lie beyond the end of the image",
+                        action='store_true',
+                        dest='truncationReport')
+    parser.add_argument('--sessions',
+                        help="scan the images for the volume descriptor sets of all \
+                        sessions, and report the sector offset and size tests of \
+                        each session; the size tests of the image use the sector \
+                        offset of the session at its start (unless --offset is given)",
+                        action='store_true',
+                        dest='sessions')
+    parser.add_argument('--fields',
+                        type=str,
+                        help="comma-separated list of the fields to report (e.g. \
+                        filePath,sizeExpected,primaryVolumeDescriptor.volumeIdentifier); \
+                        only the descriptor fields that are needed for these and for \
+                        the size tests are unpacked",
+                        action='store',
+                        dest='fields',
+                        default=None)
+    parser.add_argument('--triage',
+                        help="only report the file path, status and the outcome of the \
+                        size tests (filePath, success, failureMessage, \
+                        containsKnownFileSystem, sizeExpected, sizeDifferenceSectors \
+                        and smallerThanExpected), for a fast first pass",
+                        action='store_true',
+                        dest='triage')
+    parser.add_argument('--anomalies-only',
+                        help="only report images whose analysis failed, that contain no \
+                        known file system, or that are smaller than expected",
+                        action='store_true',
+                        dest='anomaliesOnly')
+    parser.add_argument('--max-descriptors',
+                        type=int,
+                        help="maximum number of volume descriptors that are read per \
+                        file system (default: %d)" % budgets.DEFAULT_MAX_DESCRIPTORS,
+                        action='store',
+                        dest='maxDescriptors',
+                        default=budgets.DEFAULT_MAX_DESCRIPTORS)
+    parser.add_argument('--max-sectors',
+                        type=int,
+                        help="maximum number of sectors that are read while the file \
+                        systems of an image are parsed (default: %d)" %
+                        budgets.DEFAULT_MAX_SECTORS,
+                        action='store',
+                        dest='maxSectors',
+                        default=budgets.DEFAULT_MAX_SECTORS)
+    parser.add_argument('--max-partition-entries',
+                        type=int,
+                        help="maximum number of Apple Partition Map entries that are \
+                        read (default: %d)" % budgets.DEFAULT_MAX_PARTITION_ENTRIES,
+                        action='store',
+                        dest='maxPartitionEntries',
+                        default=budgets.DEFAULT_MAX_PARTITION_ENTRIES)
+    parser.add_argument('--timeout',
+                        type=float,
+                        help="give up parsing the file systems of an image after this \
+                        number of seconds (default: no timeout)",
+                        action='store',
+                        dest='timeout',
+                        default=None)
+    parser.add_argument('--manifest',
+                        help="instead of the report, write a listing of all files \
+                        and directories in the ISO 9660, Joliet and UDF file trees \
+                        of the images (jsonl or csv)",
+                        action='store_true',
+                        dest='manifest')
+    parser.add_argument('--cache',
+                        type=str,
+                        help="keep results in this SQLite database, and reuse them \
+                        for images that have not changed since",
+                        action='store',
+                        dest='cacheFile',
+                        default=None)
+    parser.add_argument('--cache-mode',
+                        choices=['use', 'revalidate', 'rebuild'],
+                        help="use cached results, re-analyse all images and refresh \
+                        the cache (revalidate), or discard the cache first (rebuild) \
+                        (default: use)",
+                        action='store',
+                        dest='cacheMode',
+                        default='use')
+    parser.add_argument('--cache-prune',
+                        help="remove cache entries of images that no longer exist or \
+                        have changed, and of other isolyzer versions",
+                        action='store_true',
+                        dest='cachePrune')
 
     # Parse arguments
     args = parser.parse_args()
@@ -220,528 +315,295 @@ def parseCommandLine():
     return args
 
 
-def processImage(image, offset):
-    """Process one image"""
+def openImage(reader, imageStat=None):
+    """Open image with sector reader and return its stat result (which may
+    be passed as imageStat if it is already known). Raises FileNotFoundError
+    if the image does not exist (or is not a file or block device); returns
+    None if it exists but cannot be opened, or if the budget of the reader
+    ran out while it was opened
+    """
+    try:
+        imageStat = reader.open(imageStat)
+    except OSError:
+        # Does image exist?
+        checkFileExists(reader.filename)
+        return None
+    except budgets.BudgetExceeded:
+        # Time ran out while the size of a compressed image was established;
+        # processImage reports this when it checks the budget
+        return None
+
+    if not isImageMode(imageStat.st_mode):
+        reader.close()
+        checkFileExists(reader.filename)
+    return imageStat
+
+
+def openReader(image, readerClass=sr.PReadReader, imageStat=None, budget=None):
+    """Open image with a sector reader of class readerClass, and return
+    (reader, stat result) tuple. Compressed images are read through a
+    decompression layer, and block devices with a DeviceReader, whatever the
+    reader class. If a budgets.Budget is given, it is attached to the reader
+    before the image is opened. Raises FileNotFoundError if the image does
+    not exist; if it exists but cannot be opened, the reader is returned
+    unopened
+    """
+    reader = None
+    if image.lower().endswith((".gz", ".gzip", ".xz")):
+        from . import compressed
+        reader = compressed.readerFor(image)
+    if reader is None:
+        reader = readerClass(image)
+    if budget is not None:
+        budget.attach(reader)
+    openedStat = openImage(reader, imageStat)
+    if openedStat is None:
+        # Image exists but cannot be opened (with this reader class), fall
+        # back to stat for file info
+        imageStat = os.stat(image)
+    else:
+        imageStat = openedStat
+    if stat.S_ISBLK(imageStat.st_mode) and not isinstance(reader, sr.DeviceReader):
+        # Block devices are always read as devices, since stat does not
+        # report their size (and they cannot be mapped to memory)
+        reader.close()
+        reader = sr.DeviceReader(image)
+        if budget is not None:
+            budget.attach(reader)
+        openImage(reader, imageStat)
+    return reader, imageStat
+
+
+def cacheOptions(options=model.defaultOptions, readerClass=sr.PReadReader):
+    """Return string with the options (a model.AnalysisOptions record) and
+    the sector reader class that a cached result depends on
+    """
+    text = ",".join(options.checksums or [])
+    if options.truncationReport:
+        text += ";truncationReport"
+    if options.sessions:
+        text += ";sessions"
+    if options.fields is not None:
+        text += ";fields=" + ",".join(options.fields)
+    # A result within one set of limits may be a failure within another
+    limits = options.limits or budgets.Limits()
+    text += ";limits=%d,%d,%d,%s" % (limits.maxDescriptors, limits.maxSectors,
+                                     limits.maxPartitionEntries, limits.timeout)
+    text += ";reader=" + sr.readerName(readerClass)
+    return text
+
+
+def lookupCache(cache, image, imageStat, offset, readerClass=sr.PReadReader,
+                options=model.defaultOptions):
+    """Look up image in result cache, and return (stat, result) tuple, where
+    result is the cached ImageResult (of an analysis with options and a
+    sector reader of class readerClass), or None
+    if there is no cached result. The image itself is not opened
+    """
+    if imageStat is None or imageStat.st_ino == 0:
+        # Stat results from a directory scan have no inode number on
+        # Windows, which os.stat does give
+        try:
+            imageStat = os.stat(image)
+        except OSError:
+            return None, None
+    if not stat.S_ISREG(imageStat.st_mode):
+        return imageStat, None
+
+    result = cache.lookup(imageStat, offset, cacheOptions(options, readerClass),
+                          os.path.abspath(image))
+    if result is None:
+        return imageStat, None
+
+    # Image may have been renamed (or hard linked) since it was cached
+    result.fileInfo.fileName = cleanFileName(os.path.basename(image))
+    result.fileInfo.filePath = cleanFileName(os.path.abspath(image))
+    return imageStat, result
+
+
+def storeCache(cache, image, imageStat, offset, result, readerClass=sr.PReadReader,
+               options=model.defaultOptions):
+    """Store ImageResult (of an analysis with options and a sector reader of
+    class readerClass) in result cache.
+    Failed analyses are not stored,
+    as their cause (e.g. an I/O error) may be transient, and neither are
+    block devices, whose stat result does not change with the medium
+    """
+    if imageStat is not None and stat.S_ISREG(imageStat.st_mode) and result.statusInfo.success:
+        cache.store(imageStat, offset, os.path.abspath(image), result,
+                    cacheOptions(options, readerClass))
+
+
+def sizeTests(containsKnownFileSystem, sizeActual, sizeExpected):
+    """Return model.Tests record with the outcome of the size tests of an
+    image of sizeActual bytes, whose file systems (if any known ones were
+    found) have an expected size of sizeExpected bytes
+    """
+
+    # Size difference
+    diffSize = sizeActual - sizeExpected
 
-    # Does image exist?
-    checkFileExists(image)
+    # Size difference, expressed in 2048-byte sectors
+    diffSizeSectors = diffSize / 2048
 
-    # Create root element for image
-    imageRoot = ET.Element('image')
+    imageSmallerThanExpected = False
+
+    # If sizeExpected is 0 something is seriously wrong, shouldn't be flagged as expected
+    if diffSize == 0 and sizeExpected != 0:
+        imageHasExpectedSize = True
+    elif diffSize > 0:
+        # Image larger than expected, probably OK
+        imageHasExpectedSize = False
+    else:
+        # Image smaller than expected size, probably indicates a problem
+        imageHasExpectedSize = False
+        imageSmallerThanExpected = True
+
+    return model.Tests(containsKnownFileSystem, sizeExpected, sizeActual, diffSize,
+                       diffSizeSectors, imageHasExpectedSize, imageSmallerThanExpected)
+
+
+def processImage(image, offset, readerClass=sr.PReadReader, profiler=None, imageStat=None,
+                 cache=None, options=model.defaultOptions):
+    """Process one image, and return its result as a model.ImageResult
+    record. All reads on the image go through a sector reader
+    of class readerClass. If a perf.Profiler is passed as profiler, it records
+    stage timings and I/O counters. If the stat result of the image is already
+    known, it can be passed as imageStat. If a cache.ResultCache is passed as
+    cache, a cached result is returned if the image has not changed, and new
+    results are stored in it. The analysis is set up by options, a
+    model.AnalysisOptions record:
+
+    - if a list of algorithms (see checksum.CHECKSUM_ALGORITHMS) is given as
+      checksums, whole-image checksums are computed in a helper thread while
+      the image is analysed
+    - if truncationReport is True and the image is smaller than expected,
+      the ISO 9660 directory hierarchy is walked to report the files and
+      directories that lie (partly) beyond the end of the image
+    - if sessions is True, the image is scanned for the sessions of a
+      multisession disc (see the multisession module), and if offset is 0,
+      the size tests use the sector offset of the session at the start of
+      the image
+    - if a projection (see the projection module) is given as fields, only
+      the descriptor properties that are needed for the size tests and for
+      the projection are unpacked (the others are None)
+    - opening the image, the session scan, the parsing of the file systems
+      and the truncation report are bounded by the budgets.Limits that are given as limits (default limits if None);
+      if a limit is exceeded, the analysis fails, and the size tests are
+      reported as for an image without known file systems
+
+    Raises FileNotFoundError if the image does not exist.
+
+    processImage keeps no state between calls, so it can be called from
+    several threads at once (see the aio module); a ResultCache can only be
+    used by the thread that created it
+    """
 
-    # Create elements for file and status meta info
-    fileInfo = ET.Element('fileInfo')
-    statusInfo = ET.Element('statusInfo')
+    if profiler is None:
+        profiler = perf.nullProfiler
+    profiler.start()
+
+    if cache is not None:
+        imageStat, result = lookupCache(cache, image, imageStat, offset, readerClass,
+                                        options)
+        profiler.checkpoint("cache")
+        if result is not None:
+            return result
+
+    # The session scan, the parsing of the file systems and the truncation
+    # report share one budget, which the reader checks before each read. It
+    # is created before the image is opened, as opening a compressed image
+    # may take long
+    budget = budgets.Budget(limits=options.limits)
+
+    # Open image; this also checks if it exists
+    reader, imageStat = openReader(image, readerClass, imageStat, budget)
+
+    # Checksums are computed in the background while the image is analysed
+    checksummer = None
+    if options.checksums and reader.fd is not None:
+        from . import checksum
+        checksummer = checksum.Checksummer(image, options.checksums)
+        checksummer.start()
 
     # File name and path
     fileName = os.path.basename(image)
     filePath = os.path.abspath(image)
 
-    # If file name / path contain any surrogate pairs, remove them to
-    # avoid problems when writing to XML
-    fileNameCleaned = stripSurrogatePairs(fileName)
-    filePathCleaned = stripSurrogatePairs(filePath)
-
-    # Produce some general file meta info
-    shared.addProperty(fileInfo, "fileName", fileNameCleaned)
-    shared.addProperty(fileInfo, "filePath", filePathCleaned)
-    shared.addProperty(fileInfo, "fileSizeInBytes", str(os.path.getsize(image)))
     try:
-        lastModifiedDate = time.ctime(os.path.getmtime(image))
+        lastModifiedDate = time.ctime(imageStat.st_mtime)
     except ValueError:
         # Dates earlier than 1 Jan 1970 can raise ValueError on Windows
         # Workaround: replace by lowest possible value (typically 1 Jan 1970)
         lastModifiedDate = time.ctime(0)
-    shared.addProperty(fileInfo, "fileLastModified", lastModifiedDate)
 
-    tests = ET.Element("tests")
-    fileSystems = ET.Element("fileSystems")
+    # Produce some general file meta info; the size of block devices is
+    # queried by the reader
+    fileSize = reader.size if stat.S_ISBLK(imageStat.st_mode) else imageStat.st_size
+    fileInfo = model.FileInfo(cleanFileName(fileName), cleanFileName(filePath),
+                              fileSize, lastModifiedDate)
+    if isinstance(reader, sr.DeviceReader) and reader.fd is not None:
+        fileInfo.deviceInfo = model.DeviceInfo(reader.isDevice, reader.blockSize,
+                                               reader.physicalBlockSize,
+                                               -(-reader.size // reader.blockSize))
+    statusInfo = model.StatusInfo()
+
+    tests = model.Tests()
+    fileSystems = []
+    truncation = None
+    sessionList = None
+    # Sector offset of the size tests (may be derived from the sessions)
+    sectorOffset = offset
+    # Descriptor properties to unpack (None for all)
+    descriptorFields = projection.descriptorFields(options.fields)
+    profiler.checkpoint("open")
 
     # Initialise success flag
     success = True
+    # Size of the image, once it is known
+    isoFileSize = None
 
     try:
-        # Get file size in bytes
-        isoFileSize = os.path.getsize(image)
-
-        # Set these flags to initial value
-        containsAppleMasterDirectoryBlock = False
-        containsHFSPlusVolumeHeader = False
-        containsAppleFS = False
-        containsApplePartitionMap = False
-        parsedAppleZeroBlock = False
-        containsUDF = False
-        appleBlockSize = 512
-
-        # Contents of file to memory map object
-        isoBytes = fileToMemoryMap(image)
-
-        # Does image match byte signature for an ISO 9660 file system?
-        containsISO9660Signature = isoBytes[32769:32774] == b'CD001' \
-            and isoBytes[34817:34822] == b'CD001'
-
-        # Does image match byte signature for a High Sierra file system?
-        containsHSFSignature = isoBytes[32777:32782] == b'CDROM'
-      
-        # Does image contain Apple Zero Block?
-        containsAppleZeroBlock = isoBytes[0:2] == b'\x45\x52'
-
-        if containsAppleZeroBlock:
-            # Read block size
-            appleBlockSize = bc.bytesToUShortInt(isoBytes[2:4])
-
-        # Look for Apple Partition Map. Since we cannot rely on the block size
-        # defined in the zero block, we do this by trial and error. First create
-        # a list with all possible start offsets (not sure if 1024 and 1536 are even used in the wild)
-        pmOffsets = [512, 1024, 1536, 2048, appleBlockSize]
-        # Remove duplicates and sort
-        pmOffsets = sorted(list(set(pmOffsets)))
-
-        # Iterate over offsets, and stop at first match
-        for pmOffset in pmOffsets:
-            if isoBytes[pmOffset:pmOffset + 2] == b'\x50\x4D':
-                containsApplePartitionMap = True
-                partitionMapOffset = pmOffset
-                appleBlockSize = pmOffset
-                break
-
-        # Does image contain HFS Plus Header or Master Directory Block? This also allows us to
-        # identify the specific file system
-        # (Note: the HFS Plus Header replaces the Master Directory Block of HFS)
-
-        if isoBytes[1024:1026] == b'\x42\x44':
-            # Hierarchical File System
-            containsAppleMasterDirectoryBlock = True
-            fileSystemApple = "HFS"
-        if isoBytes[1024:1026] == b'\xd2\xd7':
-            # Macintosh File System
-            containsAppleMasterDirectoryBlock = True
-            fileSystemApple = "MFS"
-        if isoBytes[1024:1026] == b'\x48\x2B':
-            # HFS Plus
-            containsHFSPlusVolumeHeader = True
-            fileSystemApple = "HFS+"
-        if isoBytes[1024:1026] == b'\x48\x58':
-            # HFS X (record as HFS+ for consistency with Partition Map fields)
-            containsHFSPlusVolumeHeader = True
-            fileSystemApple = "HFS+"
-
-        # Create element to store properties of Apple filesystems
-        if (containsApplePartitionMap or containsAppleMasterDirectoryBlock or
-                containsHFSPlusVolumeHeader):
-            containsAppleFS = True
-            fsApple = ET.Element("fileSystem")
-
-        if containsAppleZeroBlock:
-
-            # Based on description at: https://en.wikipedia.org/wiki/Apple_Partition_Map#Layout and
-            # https://opensource.apple.com/source/IOStorageFamily/IOStorageFamily-116/IOApplePartitionScheme.h
-
-            # Get zero block data
-            appleZeroBlockData = isoBytes[0:512]
-            try:
-                appleZeroBlockInfo = apple.parseZeroBlock(appleZeroBlockData)
-                fsApple.append(appleZeroBlockInfo)
-                parsedAppleZeroBlock = True
-            except Exception:
-                parsedAppleZeroBlock = False
-
-            # shared.addProperty(tests, "parsedAppleZeroBlock", str(parsedAppleZeroBlock))
-        if containsApplePartitionMap:
-
-            # Set up list to store all values of 'partionType' in partition map
-            partitionTypes = []
-
-            # Get partition map data
-            applePartitionMapData = isoBytes[partitionMapOffset:partitionMapOffset + appleBlockSize]
-            try:
-                applePartitionMapInfo = apple.parsePartitionMap(applePartitionMapData)
-                # Add partition type value to list
-                partitionType = applePartitionMapInfo.find('partitionType').text
-                partitionTypes.append(partitionType)
-                fsApple.append(applePartitionMapInfo)
-                parsedApplePartitionMap = True
-            except Exception:
-                parsedApplePartitionMap = False
-                partitionType = ''
-
-            # If partitionType is Apple_HFS, parse corresponding Master Directory Block
-            if partitionType == 'Apple_HFS':
-                offsetHFS = appleBlockSize * applePartitionMapInfo.find('partitionBlockStart').text
-                masterDirectoryBlockData = isoBytes[offsetHFS + 1024:offsetHFS + 1536]
-                try:
-                    masterDirectoryBlockInfo = apple.parseMasterDirectoryBlock(masterDirectoryBlockData)
-                    fsApple.append(masterDirectoryBlockInfo)
-                    parsedMasterDirectoryBlock = True
-                except Exception:
-                    parsedMasterDirectoryBlock = False
-
-            # Iterate over remaining partition map entries
-            pOffset = partitionMapOffset + appleBlockSize
-            for pMap in range(0, applePartitionMapInfo.find('numberOfPartitionEntries').text - 1):
-                applePartitionMapData = isoBytes[pOffset:pOffset + appleBlockSize]
-                try:
-                    applePartitionMapInfo = apple.parsePartitionMap(applePartitionMapData)
-                    # Add partition type value to list
-                    partitionType = applePartitionMapInfo.find('partitionType').text
-                    partitionTypes.append(partitionType)
-                    fsApple.append(applePartitionMapInfo)
-                    parsedApplePartitionMap = True
-                except Exception:
-                    parsedApplePartitionMap = False
-                    partitionType = ''
-
-                # If partitionType is Apple_HFS, parse corresponding Master Directory Block
-                if partitionType == 'Apple_HFS':
-                    offsetHFS = appleBlockSize * applePartitionMapInfo.find('partitionBlockStart').text
-                    masterDirectoryBlockData = isoBytes[offsetHFS + 1024:offsetHFS + 1536]
-
-                    try:
-                        masterDirectoryBlockInfo = apple.parseMasterDirectoryBlock(masterDirectoryBlockData)
-                        fsApple.append(masterDirectoryBlockInfo)
-                        parsedMasterDirectoryBlock = True
-                    except Exception:
-                        parsedMasterDirectoryBlock = False
-
-                pOffset += appleBlockSize
-
-            # Establish file system type from partitionType values in all partition maps
-            # Source: https://en.wikipedia.org/wiki/Apple_Partition_Map#Partition_identifiers
-            # Note that this doesn't cover all possible types (but no idea if any of the other types
-            # are used for optical media)
-
-            if 'Apple_MFS' in partitionTypes:
-                # Macintosh File System
-                fileSystemApple = "MFS"
-            elif 'Apple_HFS' in partitionTypes:
-                # Hierarchical File System
-                fileSystemApple = "HFS"
-            elif 'Apple_HFSX' in partitionTypes:
-                # HFS Plus
-                fileSystemApple = "HFS+"
-            else:
-                # Unknown file system
-                fileSystemApple = "Unknown"
-
-        if containsHFSPlusVolumeHeader:
-
-            hfsPlusHeaderData = isoBytes[1024:1536]
-            try:
-                hfsPlusHeaderInfo = apple.parseHFSPlusVolumeHeader(hfsPlusHeaderData)
-                fsApple.append(hfsPlusHeaderInfo)
-                parsedHFSPlusVolumeHeader = True
-            except Exception:
-                parsedHFSPlusVolumeHeader = False
-
-            # shared.addProperty(tests, "parsedHFSPlusVolumeHeader", str(parsedHFSPlusVolumeHeader))
-
-        if containsAppleMasterDirectoryBlock:
-
-            masterDirectoryBlockData = isoBytes[1024:1536]  # Size of MDB?
-            try:
-                masterDirectoryBlockInfo = apple.parseMasterDirectoryBlock(masterDirectoryBlockData)
-                fsApple.append(masterDirectoryBlockInfo)
-                parsedMasterDirectoryBlock = True
-            except Exception:
-                parsedMasterDirectoryBlock = False
-
-            # shared.addProperty(tests, "parsedMasterDirectoryBlock",\
-            # str(parsedMasterDirectoryBlock))
-
-        # This is a dummy value
-        volumeDescriptorType = -1
-
-        # Count volume descriptors (ISO + High Sierra)
-        noISOVolumeDescriptors = 0
-        noHSFVolumeDescriptors = 0
-
-        # Flag that indicates primary volume descriptor (ISO) / Standard File Structure Volume
-        # Descriptor (High Sierra) was parsed
-        parsedPrimaryVolumeDescriptor = False
-        parsedSFSVolumeDescriptor = False
-
-        # Skip to byte 32768, which is where actual ISO 9660/HSF fields start
-        byteStart = 32768
-
-        if containsISO9660Signature:
-
-            # Create element to store properties of ISO9660 filesystem
-            fsISO = ET.Element("fileSystem")
-
-            # Read through all 2048-byte ISO volume descriptors, until Volume Descriptor
-            # Set Terminator is found (or unexpected EOF, which will result in -9999
-            # value for volumeDescriptorType)
-            while volumeDescriptorType != 255 and volumeDescriptorType != -9999:
-
-                volumeDescriptorType, volumeDescriptorData, byteEnd = \
-                    iso.getVolumeDescriptor(isoBytes, byteStart)
-                noISOVolumeDescriptors += 1
-
-                if volumeDescriptorType == 1:
-                    # Get info from Primary Volume Descriptor (as element object)
-                    try:
-                        pvdInfo = iso.parsePrimaryVolumeDescriptor(volumeDescriptorData)
-                        fsISO.append(pvdInfo)
-                        parsedPrimaryVolumeDescriptor = True
-                    except Exception:
-                        parsedPrimaryVolumeDescriptor = False
-                        # raise
-
-                    # shared.addProperty(tests, "parsedPrimaryVolumeDescriptor", \
-                    # str(parsedPrimaryVolumeDescriptor))
-                byteStart = byteEnd
-
-        if containsHSFSignature:
-
-            # Create element to store properties of High Sierra filesystem
-            fsHSF = ET.Element("fileSystem")
-
-            # Read through all 2048-byte volume descriptors, until Volume Descriptor
-            # Set Terminator is found (or unexpected EOF, which will result in -9999
-            # value for volumeDescriptorType)
-            while volumeDescriptorType != 255 and volumeDescriptorType != -9999:
-
-                volumeDescriptorType, volumeDescriptorData, byteEnd = \
-                    hsf.getVolumeDescriptor(isoBytes, byteStart)
-                
-                noHSFVolumeDescriptors += 1
-
-                if volumeDescriptorType == 1:
-                    # Get info from Standard File Structure Volume Descriptor (as element object)
-                    try:
-                        sfsvdInfo = hsf.parseSFSVolumeDescriptor(volumeDescriptorData)
-                        fsHSF.append(sfsvdInfo)
-                        parsedSFSVolumeDescriptor = True
-                    except Exception:
-                        parsedSFSVolumeDescriptor = False
-                        # raise
-
-                    # shared.addProperty(tests, "parsedPrimaryVolumeDescriptor", \
-                    # str(parsedPrimaryVolumeDescriptor))
-                byteStart = byteEnd
-
-        # Read through extended (UDF) volume descriptors (if present)
-        noExtendedVolumeDescriptors = 0
-        volumeDescriptorIdentifier = "CD001"
-
-        while volumeDescriptorIdentifier in ["CD001", "BEA01", "NSR02", "NSR03", "BOOT2", "TEA01"]:
-            volumeDescriptorIdentifier, volumeDescriptorData, byteEnd = \
-                udf.getExtendedVolumeDescriptor(isoBytes, byteStart)
-            if volumeDescriptorIdentifier in ["BEA01", "NSR02", "NSR03", "BOOT2", "TEA01"]:
-                noExtendedVolumeDescriptors += 1
-
-            byteStart = byteEnd
-
-        containsUDF = noExtendedVolumeDescriptors > 0
-
-        if containsUDF:
-
-            # Initialise flags 
-            parsedUDFLogicalVolumeDescriptor = False
-            parsedUDFLogicalVolumeIntegrityDescriptor = False
-            parsedUDFPartitionDescriptor = False
-
-            # Create element to store properties of UDF filesystem
-            fsUDF = ET.Element("fileSystem")
-
-            # Read Anchor Volume Descriptor Pointer; located at sector 256
-            byteStart = 256*2048
-            anchorVolumeDescriptorPointer = isoBytes[byteStart:byteStart + 512]
-            descriptorTag = anchorVolumeDescriptorPointer[0:16]
-            mainVolumeDescriptorSequenceExtent = anchorVolumeDescriptorPointer[16:24]
-            reserveVolumeDescriptorSequenceExtent = anchorVolumeDescriptorPointer[24:32]
-
-            # Descriptor tag fields
-            tagIdentifier = bc.bytesToUShortIntL(descriptorTag[0:2])
-            descriptorVersion = bc.bytesToUShortIntL(descriptorTag[2:4])
-
-            # Extent fields
-            extentLength = bc.bytesToUIntL(mainVolumeDescriptorSequenceExtent[0:4])
-            extentLocation = bc.bytesToUIntL(mainVolumeDescriptorSequenceExtent[4:8])
-
-            byteStart = 2048*extentLocation
-            noUDFVolumeDescriptors = 0
-
-            # Read through main Volume Descriptor Sequence
-            while tagIdentifier != 8 and tagIdentifier != -9999:
-                tagIdentifier, volumeDescriptorData, byteEnd = \
-                    udf.getVolumeDescriptor(isoBytes, byteStart)
-                # sys.stderr.write(str(tagIdentifier) + "\n")
-
-                if tagIdentifier == 6:
-
-                    # Logical Volume descriptor
-
-                    try:
-                        lvdInfo = udf.parseLogicalVolumeDescriptor(volumeDescriptorData)
-                        fsUDF.append(lvdInfo)
-                        parsedUDFLogicalVolumeDescriptor = True
-
-                        # Start sector and length of integrity sequence
-                        integritySequenceExtentLocation = \
-                            lvdInfo.find("integritySequenceExtentLocation").text
-                        integritySequenceExtentLength = \
-                            lvdInfo.find("integritySequenceExtentLength").text
-
-                        try:
-                            # Read Logical Volume Integrity Descriptor
-                            lvidTagIdentifier, lvidVolumeDescriptorData, lVIDbyteEnd = \
-                                udf.getVolumeDescriptor(isoBytes,
-                                                        2048 * integritySequenceExtentLocation)
-                            lvidInfo = udf.parseLogicalVolumeIntegrityDescriptor(lvidVolumeDescriptorData)
-                            fsUDF.append(lvidInfo)
-                            parsedUDFLogicalVolumeIntegrityDescriptor = True
-                        except Exception:
-                            parsedUDFLogicalVolumeIntegrityDescriptor = False
-                            # raise
-
-                    except Exception:
-                        parsedUDFLogicalVolumeDescriptor = False
-                        # raise
-
-                    # shared.addProperty(tests, "parsedUDFLogicalVolumeDescriptor", \
-                    # str(parsedUDFLogicalVolumeDescriptor))
-                    # shared.addProperty(tests, "parsedUDFLogicalVolumeIntegrityDescriptor", \
-                    # str(parsedUDFLogicalVolumeIntegrityDescriptor))
-
-                if tagIdentifier == 5:
-
-                    # Partition Descriptor
-
-                    try:
-                        pdInfo = udf.parsePartitionDescriptor(volumeDescriptorData)
-                        fsUDF.append(pdInfo)
-                        parsedUDFPartitionDescriptor = True
-
-                    except Exception:
-                        parsedUDFPartitionDescriptor = False
-                        # raise
-
-                    # shared.addProperty(tests, "parsedUDFPartitionDescriptor",
-                    # str(parsedUDFPartitionDescriptor))
-
-                noUDFVolumeDescriptors += 1
-                byteStart = byteEnd
-
-        # Append all fs-specific output to fileSystems element
-        if containsISO9660Signature:
-            fsISO.attrib["TYPE"] = "ISO 9660"
-            fileSystems.append(fsISO)
-        if containsHSFSignature:
-            fsHSF.attrib["TYPE"] = "High Sierra"
-            fileSystems.append(fsHSF)
-        if containsAppleFS:
-            fsApple.attrib["TYPE"] = fileSystemApple
-            fileSystems.append(fsApple)
-        if containsUDF:
-            fsUDF.attrib["TYPE"] = "UDF"
-            fileSystems.append(fsUDF)
-
-        # If no known file systems were found, report this in the tests element
-        if len(fileSystems) == 0:
-            containsKnownFileSystem = False
-        else:
-            containsKnownFileSystem = True
-
-        shared.addProperty(tests, "containsKnownFileSystem", str(containsKnownFileSystem))
-
-        # Expected ISO size (bytes) can now be calculated from 6 different places:
-        # PVD, High Sierra SFSVolumeDescriptor, Zero Block, Master Directory Block,
-        # HFS Plus header or UDF descriptors
-
-        # Intialise all estimates at 0
-        sizeExpectedPVD = 0
-        sizeExpectedSFSVD = 0
-        sizeExpectedZeroBlock = 0
-        sizeExpectedMDB = 0
-        sizeExpectedHFSPlus = 0
-        sizeExpectedUDF = 0
-
-        # Initialise flag
-        calculatedSizeExpected = False
-
-        if parsedPrimaryVolumeDescriptor:
-            # Calculate from Primary Volume Descriptor
-            # Subtracting offset from volumeSpaceSize gives the correct size in case of image
-            # from 2nd session of multisession disc
-            sizeExpectedPVD = (pvdInfo.find('volumeSpaceSize').text - offset) * \
-                pvdInfo.find('logicalBlockSize').text
-            # NOTE: this might be off if logicalBlockSize != 2048 (since Sys area and
-            # Volume Descriptors are ALWAYS multiples of 2048 bytes!). Also, even for
-            # non-hybrid FS actual size is sometimes slightly larger than expected size.
-            # Not entirely sure why (padding bytes?)
-        
-        if parsedSFSVolumeDescriptor:
-            # Calculate from Standard File Structure Volume Descriptor
-            # in case of HSF file system; calculation is identical to ISO 9660 case
-            sizeExpectedSFSVD = (sfsvdInfo.find('volumeSpaceSize').text - offset) * \
-                sfsvdInfo.find('logicalBlockSize').text
-
-        if containsApplePartitionMap and parsedAppleZeroBlock:
-            # Calculate from zero block in Apple partition
-            sizeExpectedZeroBlock = appleZeroBlockInfo.find('blockCount').text * \
-                appleZeroBlockInfo.find('blockSize').text
-
-        if containsAppleMasterDirectoryBlock and parsedMasterDirectoryBlock:
-            # Calculate from Apple Master Directory Block
-            sizeExpectedMDB = masterDirectoryBlockInfo.find('blockCount').text * \
-                masterDirectoryBlockInfo.find('blockSize').text
-
-        if containsHFSPlusVolumeHeader and parsedHFSPlusVolumeHeader:
-            # Calculate from HFS Plus volume Header
-            sizeExpectedHFSPlus = hfsPlusHeaderInfo.find('blockCount').text * \
-                hfsPlusHeaderInfo.find('blockSize').text
-
-        if containsUDF and parsedUDFLogicalVolumeDescriptor and \
-                parsedUDFLogicalVolumeIntegrityDescriptor:
-            # For UDF estimating the expected file size is not straightforward, because the fields
-            # in the Partition Descriptor and the Integrity Descriptor exclude the size occupied
-            # by descriptors before and after the partition. The number of sectors *before*
-            # the partition equals (partitionStartingLocation - 1). The number of sectors *after*
-            # the partition is more difficult to establish, but it must be at least 1 (Anchor
-            # Volume Descriptor Pointer). So a conservative estimate is:
-            #
-            # number of sectors =  partitionLength + partitionStartingLocation
-            #
-            # In reality this estimate may be too low because of additional descriptors after
-            # the partition.
-            sizeExpectedUDF = (pdInfo.find('partitionLength').text +
-                               pdInfo.find('partitionStartingLocation').text) * \
-                               lvdInfo.find('logicalBlockSize').text
-
-        # Assuming here that best estimate is largest out of the above values
-        sizeExpected = max([sizeExpectedPVD,
-                            sizeExpectedSFSVD,
-                            sizeExpectedZeroBlock,
-                            sizeExpectedMDB,
-                            sizeExpectedHFSPlus,
-                            sizeExpectedUDF])
-
-        # Size difference
-        diffSize = isoFileSize - sizeExpected
-
-        # Size difference, expressed in 2048-byte sectors
-        diffSizeSectors = diffSize / 2048
-
-        imageSmallerThanExpected = False
-
-        # If sizeExpected is 0 something is seriously wrong, shouldn't be flagged as expected
-        if diffSize == 0 and sizeExpected != 0:
-            imageHasExpectedSize = True
-        elif diffSize > 0:
-            # Image larger than expected, probably OK
-            imageHasExpectedSize = False
-        else:
-            # Image smaller than expected size, probably indicates a problem
-            imageHasExpectedSize = False
-            imageSmallerThanExpected = True
-
-        shared.addProperty(tests, "sizeExpected", sizeExpected)
-        shared.addProperty(tests, "sizeActual", isoFileSize)
-        shared.addProperty(tests, "sizeDifference", diffSize)
-        shared.addProperty(tests, "sizeDifferenceSectors", diffSizeSectors)
-        shared.addProperty(tests, "sizeAsExpected", imageHasExpectedSize)
-        shared.addProperty(tests, "smallerThanExpected", imageSmallerThanExpected)
+        # Raises BudgetExceeded if time ran out while the image was opened
+        budget.check()
+
+        # Raises IOError if image could not be opened
+        reader.checkOpen()
+
+        # Get file size in bytes (uncompressed size of compressed images)
+        isoFileSize = reader.size
+
+        if options.sessions:
+            from . import multisession
+            sessionList = multisession.findSessions(reader, profiler=profiler, budget=budget)
+            if offset == 0 and sessionList and sessionList[0].startSector == 0:
+                sectorOffset = sessionList[0].sectorOffset
+            profiler.checkpoint("sessions")
+
+        # Evaluate the file system detectors against the header window, and
+        # parse the file systems that are found (see the detect module)
+        detections = detect.detectFileSystems(reader, sectorOffset, profiler,
+                                              descriptorFields, budget)
+        fileSystems = [detection.fileSystem for detection in detections]
+
+        # Expected ISO size (bytes) can be calculated from each file system
+        # (PVD, High Sierra SFSVolumeDescriptor, Zero Block, Master Directory
+        # Block, HFS Plus header or UDF descriptors). Assuming here that best
+        # estimate is largest out of these values
+        sizeExpected = max([0] + [detection.sizeExpected for detection in detections])
+
+        tests = sizeTests(len(fileSystems) > 0, isoFileSize, sizeExpected)
+        profiler.checkpoint("sizeCalculation")
+
+        pvdDetails = [detection.details for detection in detections
+                      if "pvdData" in detection.details]
+        if options.truncationReport and tests.smallerThanExpected and pvdDetails:
+            # Find out which files and directories are lost
+            from . import iso9660 as iso
+            truncation = iso.truncationReport(reader, pvdDetails[0]["pvdInfo"],
+                                              pvdDetails[0]["pvdData"], sectorOffset,
+                                              isoFileSize, profiler)
+            profiler.checkpoint("truncation")
 
     except Exception as ex:
         success = False
@@ -751,6 +613,14 @@ def processImage(image, offset):
             failureMessage = "memory error (file size too large)"
         elif exceptionType == IOError:
             failureMessage = "I/O error (cannot open file)"
+        elif exceptionType == budgets.BudgetExceeded:
+            failureMessage = str(ex)
+            # The file systems are not reported, so the size tests are
+            # those of an image without known file systems (if its size is
+            # known)
+            fileSystems = []
+            if isoFileSize is not None:
+                tests = sizeTests(False, isoFileSize, 0)
         elif exceptionType == RuntimeError:
             failureMessage = "runtime error (please report to developers)"
         else:
@@ -758,77 +628,423 @@ def processImage(image, offset):
             raise
         printWarning(failureMessage)
 
+    finally:
+        profiler.addReaderCounts(reader)
+        reader.close()
+
+    if checksummer is not None:
+        try:
+            fileInfo.checksums = dict(checksummer.digests())
+        except OSError:
+            if success:
+                success = False
+                failureMessage = "I/O error (cannot compute checksums)"
+                printWarning(failureMessage)
+        profiler.checkpoint("checksum")
+
     # Add success outcome to status info
-    shared.addProperty(statusInfo, "success", str(success))
+    statusInfo.success = success
     if not success:
-        shared.addProperty(statusInfo, "failureMessage", failureMessage)
+        statusInfo.failureMessage = failureMessage
 
-    imageRoot.append(fileInfo)
-    imageRoot.append(statusInfo)
-    # Add offset value
-    shared.addProperty(imageRoot, "sectorOffset", str(offset))
-    imageRoot.append(tests)
-    imageRoot.append(fileSystems)
+    result = model.ImageResult(fileInfo, statusInfo, sectorOffset, tests, fileSystems,
+                               truncation, sessionList)
 
-    return imageRoot
+    if cache is not None:
+        storeCache(cache, image, imageStat, offset, result, readerClass, options)
 
+    return result
 
-def processImages(images, offset):
+
+def splitImageItem(item):
+    """Return (path, stat) tuple for item in list of images, which is either a
+    path, or a (path, stat) tuple as produced by the walker module
+    """
+    if isinstance(item, tuple):
+        return item
+    return item, None
+
+
+def processImageChunk(chunk, offset, readerClass=sr.PReadReader, profile=False,
+                      options=model.defaultOptions):
+    """Process chunk of (index, image, stat) tuples in worker process, with
+    options (a model.AnalysisOptions record), and
+    return list of (index, result, profile) tuples, where each result is an
+    ImageResult record, and profile is a dictionary with the image's profile
+    (or None if profile is False)
     """
-    Process list of images
+    results = []
+    for index, image, imageStat in chunk:
+        profiler = perf.Profiler() if profile else None
+        result = processImage(image, offset, readerClass, profiler, imageStat,
+                              options=options)
+        results.append((index, result, profiler.toDict() if profile else None))
+    return results
+
+
+def scheduleChunks(window, chunkSize):
+    """Sort window of (index, image, stat) tuples by image size, so that
+    the largest images are scheduled first and the pool is kept balanced, and
+    group them into chunks of chunkSize
+    """
+    tasks = []
+    for index, image, imageStat in window:
+        if imageStat is None:
+            try:
+                imageStat = os.stat(image)
+            except OSError:
+                imageStat = None
+        if imageStat is None or not isImageMode(imageStat.st_mode):
+            # Does image exist?
+            checkFileExists(image)
+        tasks.append((imageStat.st_size, index, image, imageStat))
+    tasks.sort(key=lambda task: (-task[0], task[1]))
+
+    return [[(index, image, imageStat) for _, index, image, imageStat in tasks[i:i + chunkSize]]
+            for i in range(0, len(tasks), chunkSize)]
+
+
+def processImagesParallel(images, offset, jobs, readerClass=sr.PReadReader, profile=False,
+                          chunkSize=8, windowSize=None, cache=None,
+                          options=model.defaultOptions):
+    """Process images (an iterable of paths or (path, stat) tuples) in a pool
+    of jobs worker processes, and yield (ImageResult, profile) tuples in the
+    same order as images. Images are consumed lazily in windows of windowSize
+    images; within each window the largest images are scheduled first. At
+    most two windows of images are in flight or waiting for an earlier image
+    at a time, so results do not pile up behind a slow image. Images are
+    sent to the workers in chunks of chunkSize, to limit
+    inter-process communication overhead for batches of many small images.
+    If a result cache is given, it is consulted (and updated) in this process,
+    so cached images are never sent to the workers. Images are analysed with
+    options (a model.AnalysisOptions record)
     """
 
-    global out
-    global err
+    if windowSize is None:
+        windowSize = 4 * jobs * chunkSize
+
+    items = ((index,) + splitImageItem(item) for index, item in enumerate(images))
+
+    # Results that arrive ahead of their turn are kept here until all
+    # preceding images are done
+    resultsBuffer = {}
+    nextIndex = 0
+    # Number of images taken from images
+    taken = 0
+
+    # Path and stat of images that are processed by the workers, by index
+    # (only used with a result cache)
+    pending = {}
+
+    import concurrent.futures
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = set()
+        exhausted = False
+        while True:
+            # Keep at most two windows of images in flight or in resultsBuffer
+            if not exhausted and taken - nextIndex <= windowSize:
+                window = list(itertools.islice(items, windowSize))
+                exhausted = len(window) < windowSize
+                taken += len(window)
+                if cache is not None:
+                    window = lookupWindow(cache, window, offset, readerClass, profile,
+                                          resultsBuffer, pending, options)
+                for chunk in scheduleChunks(window, chunkSize):
+                    futures.add(executor.submit(processImageChunk, chunk, offset,
+                                                readerClass, profile, options))
+            if not futures and nextIndex not in resultsBuffer:
+                break
+            if futures:
+                done, futures = concurrent.futures.wait(
+                    futures, return_when=concurrent.futures.FIRST_COMPLETED)
+            else:
+                done = []
+            for future in done:
+                for index, result, imageProfile in future.result():
+                    if cache is not None:
+                        image, imageStat = pending.pop(index)
+                        storeCache(cache, image, imageStat, offset, result, readerClass,
+                                   options)
+                    resultsBuffer[index] = (result, imageProfile)
+            while nextIndex in resultsBuffer:
+                yield resultsBuffer.pop(nextIndex)
+                nextIndex += 1
+
+
+def lookupWindow(cache, window, offset, readerClass, profile, resultsBuffer, pending,
+                 options=model.defaultOptions):
+    """Look up window of (index, image, stat) tuples in result cache (for
+    analyses with options and sector readers of class readerClass). Cached
+    results are added to resultsBuffer, and the (index, image, stat) tuples of
+    all other images are returned, after recording their path and stat in
+    pending
+    """
+    misses = []
+    for index, image, imageStat in window:
+        profiler = perf.Profiler() if profile else None
+        imageStat, result = lookupCache(cache, image, imageStat, offset, readerClass,
+                                        options)
+        if result is not None:
+            if profile:
+                profiler.checkpoint("cache")
+            resultsBuffer[index] = (result, profiler.toDict() if profile else None)
+        else:
+            pending[index] = (image, imageStat)
+            misses.append((index, image, imageStat))
+    return misses
 
-    out = codecs.getwriter("UTF-8")(sys.stdout.buffer)
-    err = codecs.getwriter("UTF-8")(sys.stderr.buffer)
 
-    # Create output element
-    root = ET.Element("isolyzer", {'xmlns': nsString,
-                                   'xmlns:xsi': xsiNsString,
-                                   'xsi:schemaLocation': schemaString})
+def processImagesSerial(images, offset, readerClass=sr.PReadReader, profile=False, cache=None,
+                        options=model.defaultOptions):
+    """Process images (an iterable of paths or (path, stat) tuples) in this
+    process with options (a model.AnalysisOptions record), and yield
+    (ImageResult, profile) tuples
+    """
+    for item in images:
+        image, imageStat = splitImageItem(item)
+        profiler = perf.Profiler() if profile else None
+        result = processImage(image, offset, readerClass, profiler, imageStat, cache, options)
+        yield result, profiler.toDict() if profile else None
+
+
+def startReport(writer):
+    """Start report with writer (a writers.Writer instance)"""
+
+    # Create output element (only the XML report has one, so ElementTree
+    # is not imported for other formats)
+    if isinstance(writer, writers.XMLWriter):
+        import xml.etree.ElementTree as ET
+        root = ET.Element("isolyzer", {'xmlns': nsString,
+                                       'xmlns:xsi': xsiNsString,
+                                       'xsi:schemaLocation': schemaString})
+    else:
+        root = None
 
     # Add some info on isolyzer and the version used
-    toolInfo = ET.Element('toolInfo')
-    shared.addProperty(toolInfo, "toolName", scriptName)
-    shared.addProperty(toolInfo, "toolVersion", __version__)
-    root.append(toolInfo)
+    toolInfo = model.ToolInfo(getScriptName(), __version__)
+    writer.start(root, toolInfo)
 
-    for image in images:
-        result = processImage(image, offset)
-        root.append(result)
 
-    # Write output
-    makeHumanReadable(root)
-    writeElement(root, out)
+def processImages(images, offset, jobs=1, outputFormat="xml", readerClass=sr.PReadReader,
+                  profileFile=None, cache=None, options=model.defaultOptions,
+                  anomaliesOnly=False):
+    """
+    Process images, which is an iterable of paths or of (path, stat) tuples
+    (as produced by the walker module). If jobs is larger than 1, images are processed
+    by a pool of jobs worker processes. The report is written to stdout in
+    outputFormat (xml, json, jsonl or csv). Images are read with sector
+    readers of class readerClass. If profileFile (a text file object) is
+    given, per-image stage timings and I/O counters and a batch summary are
+    written to it as JSON Lines. If a cache.ResultCache is given as cache,
+    unchanged images are not analysed again. Images are analysed with
+    options (a model.AnalysisOptions record, see processImage): if a list of
+    algorithms is given as its checksums, whole-image checksums are added to
+    the file info, and if a projection (see the projection module) is given
+    as its fields, the report only holds these fields. If anomaliesOnly is
+    True, only images whose analysis failed, that contain no known file
+    system or that are smaller than expected are reported. Raises
+    FileNotFoundError if an image does not exist, after ending the report
+    """
+
+    out = codecs.getwriter("UTF-8")(sys.stdout.buffer)
+
+    # Output is streamed: each image is written as soon as it is done
+    fields = options.fields
+    writer = writers.writerClasses[outputFormat](out, sys.stdout.buffer, fields=fields)
+    startReport(writer)
+
+    profile = profileFile is not None
+    if profile:
+        batchProfile = perf.BatchProfile(profileFile)
+
+    if jobs > 1:
+        results = processImagesParallel(images, offset, jobs, readerClass, profile,
+                                        cache=cache, options=options)
+    else:
+        results = processImagesSerial(images, offset, readerClass, profile, cache, options)
+
+    try:
+        for result, imageProfile in results:
+            filePath = result.fileInfo.filePath
+            if anomaliesOnly and not projection.isAnomaly(result):
+                if profile:
+                    batchProfile.addImage(filePath, imageProfile)
+                continue
+            if fields is not None:
+                result = projection.projectResult(result, fields)
+            if profile:
+                startTime = time.perf_counter()
+                writer.writeImage(result)
+                imageProfile["stages"]["serialisation"] = time.perf_counter() - startTime
+                batchProfile.addImage(filePath, imageProfile)
+            else:
+                writer.writeImage(result)
+    except FileNotFoundError:
+        # A missing image ends the batch, but the images that were already
+        # written are kept in a well-formed report
+        writer.end()
+        raise
+
+    writer.end()
+    if profile:
+        batchProfile.end()
+    if cache is not None:
+        cache.commit()
+
+
+def writeManifest(images, offset, outputFormat="jsonl", readerClass=sr.PReadReader):
+    """
+    Write manifest of the files and directories in the ISO 9660, Joliet and
+    UDF file trees of images (an iterable of paths or of (path, stat)
+    tuples) to stdout in outputFormat (jsonl or csv), with one entry per
+    line or row. Entries are written as they are found (see the manifest
+    module). Images that cannot be read are reported as warnings
+    """
+    from . import manifest
+
+    out = codecs.getwriter("UTF-8")(sys.stdout.buffer)
+    writer = writers.manifestWriterClasses[outputFormat](out, sys.stdout.buffer)
+    writer.start(None, None)
+
+    for item in images:
+        image, imageStat = splitImageItem(item)
+        reader, imageStat = openReader(image, readerClass, imageStat)
+        filePath = cleanFileName(os.path.abspath(image))
+        try:
+            reader.checkOpen()
+            for entry in manifest.iterManifest(reader, offset):
+                writer.writeEntry(filePath, entry)
+        except BrokenPipeError:
+            # Output errors are not image errors
+            raise
+        except (IOError, OSError) as ex:
+            printWarning("cannot read " + filePath + ": " + str(ex))
+        finally:
+            reader.close()
+        writer.flush()
+
+    writer.end()
 
 
 def main():
     """Main command line application"""
 
+    if sys.argv[1:2] == ["serve"]:
+        # Server mode; imported here, since it is not needed otherwise
+        from . import server
+        server.main(sys.argv[2:])
+        return
+
     # Get input from command line
-    args = parseCommandLine()
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Verify file size of ISO image and extract technical information")
+    args = parseCommandLine(parser)
+
+    if args.cacheFile is not None:
+        from . import cache as rc
+        cache = rc.ResultCache(args.cacheFile, __version__, args.cacheMode)
+        if args.cachePrune:
+            cache.prune()
+    else:
+        cache = None
+
+    if not (args.ISOImages or args.directories or args.inputLists):
+        if cache is not None and args.cachePrune:
+            # Only pruning the cache
+            cache.close()
+            return
+        parser.error("no input images (specify ISOImages, --recursive or --input-list)")
 
     # In Linux this works for wildcard expressions (but in Windows this is only a string!)
-    if platform.system() == "Windows":
+    if sys.platform == "win32":
         # Windows doesn't natively handle wildcard expansion, so we need to do it ourselves
-        try:
-            # This can result in a regex error if filename contains
-            # special character
-            ISOImages = glob.glob(args.ISOImages[0])
-        except re.error:
-            # In case of regex error use this fallback 
-            escaped = glob.escape(args.ISOImages[0])
-            ISOImages = glob.glob(escaped)
+        ISOImages = walker.expandWildcards(args.ISOImages)
     else:
         # In Linux the OS takes care of the wildcard expansion
         ISOImages = args.ISOImages
 
+    # Images are produced lazily, so processing starts with the first image
+    images = walker.walkInputs(ISOImages, args.directories, args.inputLists,
+                               args.includes, args.excludes)
+
     # Sector offset
     sectorOffset = args.sectorOffset
 
-    processImages(ISOImages, sectorOffset)
+    # Seek indexes of compressed images (the environment is inherited by
+    # worker processes)
+    if args.indexDir is not None:
+        os.environ["ISOLYZER_INDEX_DIR"] = os.path.abspath(args.indexDir)
+
+    # Number of worker processes
+    if args.jobs < 1:
+        errorExit("number of jobs must be 1 or more")
+
+    # Checksum algorithms
+    checksums = None
+    if args.checksums is not None:
+        from . import checksum
+        try:
+            checksums = checksum.parseAlgorithms(args.checksums)
+        except ValueError as ex:
+            errorExit(str(ex))
+
+    # Projection of the report
+    fields = None
+    if args.triage:
+        if args.fields is not None:
+            errorExit("--triage and --fields cannot be combined")
+        fields = projection.TRIAGE_FIELDS
+    elif args.fields is not None:
+        try:
+            fields = projection.parseFields(args.fields)
+        except ValueError as ex:
+            errorExit(str(ex))
+
+    # Budgets of the parsing of each image
+    if min(args.maxDescriptors, args.maxSectors, args.maxPartitionEntries) < 1:
+        errorExit("maximum numbers of descriptors, sectors and partition entries must be "
+                  "1 or more")
+    if args.timeout is not None and args.timeout <= 0:
+        errorExit("timeout must be more than 0")
+    limits = budgets.Limits(args.maxDescriptors, args.maxSectors, args.maxPartitionEntries,
+                            args.timeout)
+
+    options = model.AnalysisOptions(checksums, args.truncationReport, args.sessions, fields,
+                                    limits)
+
+    if args.manifest:
+        outputFormat = args.outputFormat or "jsonl"
+        if outputFormat not in writers.manifestWriterClasses:
+            errorExit("manifests can only be written as jsonl or csv")
+        try:
+            writeManifest(images, sectorOffset, outputFormat, sr.readerClasses[args.reader])
+        except FileNotFoundError as ex:
+            errorExit(str(ex))
+        if cache is not None:
+            # Manifests are not cached
+            cache.close()
+        return
+
+    if args.profileFile is not None:
+        profileFile = open(args.profileFile, "w", encoding="utf-8")
+    else:
+        profileFile = None
+
+    try:
+        processImages(images, sectorOffset, args.jobs, args.outputFormat or "xml",
+                      sr.readerClasses[args.reader], profileFile, cache, options,
+                      args.anomaliesOnly)
+    except FileNotFoundError as ex:
+        errorExit(str(ex))
+
+    if profileFile is not None:
+        profileFile.close()
+
+    if cache is not None:
+        sys.stderr.write("Result cache: %d hits, %d misses (hit rate %.1f%%)\n" %
+                         (cache.hits, cache.misses, 100 * cache.hitRate()))
+        cache.close()
 
 
 if __name__ == "__main__":
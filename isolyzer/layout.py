@@ -0,0 +1,209 @@
+#! /usr/bin/env python3
+"""Declarative descriptor layouts
+
+A descriptor layout is a table of fields, each of which is a tuple:
+
+    (name, offset, fieldType)
+    (name, offset, fieldType, length)
+    (name, offset, fieldType, length, convert)
+
+Field types:
+
+- uint8, uint16be, uint16le, uint32be, uint32le: unsigned integers
+- uint16both, uint32both: integers that are recorded as a little-endian
+  and big-endian pair (ISO 9660 style); offset is the start of the pair,
+  and the big-endian value is reported
+- text: length bytes, decoded with textconv.decodeText (UTF-8, without
+  control characters and leading and trailing white space)
+- dstring: length bytes, decoded as a fixed-length OSTA CS0 dstring with
+  textconv.dstringToText
+- bytes: length bytes, converted with function convert
+- pascal: length byte followed by text (only the length byte is part of
+  the struct; the text is sliced from the data, since its length varies)
+
+Each layout is compiled to a single struct.Struct, which unpacks all fields
+straight from the descriptor data (bytes, bytearray or memoryview) in one
+call. Integers whose byte order differs from that of the struct are unpacked
+as raw bytes and byte swapped. If the data are too short for the struct
+(e.g. a descriptor at the end of a truncated image), fields are unpacked
+one by one, with the same results as the byteconv functions: -9999 for
+integers that cannot be read, and (shorter) text for text fields.
+
+A field name may occur more than once; the descriptor records (see
+model.Descriptor) then have one property for that name, whose value is the
+tuple of all its field values.
+
+A projection of a layout (see Layout.project) is a layout with only some of
+its fields, which is compiled to a struct that skips all other fields; fields
+that are not needed are then not converted (e.g. text is not decoded).
+"""
+
+import struct
+from . import byteconv as bc
+from . import textconv
+
+
+# Integer field types as (size, byte order, struct format character,
+# offset of the value within the field)
+INTEGER_TYPES = {
+    "uint8": (1, None, "B", 0),
+    "uint16be": (2, ">", "H", 0),
+    "uint16le": (2, "<", "H", 0),
+    "uint32be": (4, ">", "I", 0),
+    "uint32le": (4, "<", "I", 0),
+    "uint16both": (4, ">", "H", 2),
+    "uint32both": (8, ">", "I", 4)
+}
+
+# Byte order names as used by int.from_bytes
+BYTE_ORDER_NAMES = {">": "big", "<": "little"}
+
+
+class Layout:
+    """Descriptor layout that is compiled to a single struct.Struct with
+    byteOrder ('>' or '<'). Fields must be listed in order of their offsets
+    """
+
+    def __init__(self, byteOrder, fields):
+        self.byteOrder = byteOrder
+        self.fields = fields
+
+        # Per-field converters (None for values that are used as unpacked)
+        self.converters = []
+        # Unique field names, in order of first occurrence, and the indices
+        # of the fields with each name
+        self.names = []
+        fieldIndices = {}
+        # Indices and text offsets of pascal fields
+        self.pascalFields = []
+        formatChars = [byteOrder]
+        position = 0
+        for index, field in enumerate(fields):
+            name, offset, fieldType = field[:3]
+            start, fieldFormat, convert = self.compileField(field)
+            if offset + start < position:
+                raise ValueError("field " + name + " overlaps previous field")
+            if offset + start > position:
+                formatChars.append("%dx" % (offset + start - position))
+            formatChars.append(fieldFormat)
+            position = offset + start + struct.calcsize("=" + fieldFormat)
+            self.converters.append(convert)
+            if fieldType == "pascal":
+                self.pascalFields.append((index, offset + 1))
+            if name not in fieldIndices:
+                self.names.append(name)
+                fieldIndices[name] = []
+            fieldIndices[name].append(index)
+
+        self.names = tuple(self.names)
+        # Field indices per name, or None if all names are unique
+        if len(self.names) < len(fields):
+            self.nameIndices = [fieldIndices[name] for name in self.names]
+        else:
+            self.nameIndices = None
+
+        self.struct = struct.Struct("".join(formatChars))
+        self.size = self.struct.size
+        # Projections by (frozen) set of names
+        self.projections = {}
+
+    def project(self, names):
+        """Return layout with only the fields whose name is in names (in the
+        same order); projections are compiled once, and then reused
+        """
+        names = frozenset(names)
+        projection = self.projections.get(names)
+        if projection is None:
+            projection = Layout(self.byteOrder, [field for field in self.fields
+                                                 if field[0] in names])
+            # Position of each name of the projection in names of this layout
+            projection.positions = [self.names.index(name) for name in projection.names]
+            self.projections[names] = projection
+        return projection
+
+    def compileField(self, field):
+        """Return (start within field, struct format, converter) for field"""
+        fieldType = field[2]
+        if fieldType in INTEGER_TYPES:
+            size, fieldOrder, formatChar, start = INTEGER_TYPES[fieldType]
+            if fieldOrder is None or fieldOrder == self.byteOrder:
+                return start, formatChar, None
+            # Byte order differs from that of struct: unpack raw bytes and swap
+            byteOrderName = BYTE_ORDER_NAMES[fieldOrder]
+            return (start, "%ds" % (size - start),
+                    lambda value: int.from_bytes(value, byteOrderName))
+        elif fieldType == "text":
+            return 0, "%ds" % field[3], textconv.decodeText
+        elif fieldType == "dstring":
+            return 0, "%ds" % field[3], textconv.dstringToText
+        elif fieldType == "bytes":
+            return 0, "%ds" % field[3], field[4]
+        elif fieldType == "pascal":
+            # Only the length byte; the text is resolved by resolvePascal
+            return 0, "B", None
+        raise ValueError("unknown field type " + fieldType)
+
+    def unpackValues(self, bytesData):
+        """Unpack fields from bytesData, and return list of values (one per
+        field)
+        """
+        if len(bytesData) < self.size:
+            values = self.unpackFields(bytesData)
+        else:
+            values = [value if convert is None else convert(value)
+                      for convert, value in zip(self.converters,
+                                                self.struct.unpack_from(bytesData))]
+        if self.pascalFields:
+            self.resolvePascal(bytesData, values)
+        return values
+
+    def unpack(self, bytesData):
+        """Unpack fields from bytesData, and return list of (name, value)
+        tuples
+        """
+        return [(field[0], value) for field, value in zip(self.fields,
+                                                          self.unpackValues(bytesData))]
+
+    def recordValues(self, bytesData):
+        """Unpack fields from bytesData, and return list of values with one
+        value per name in names (a tuple for names that occur more than once)
+        """
+        values = self.unpackValues(bytesData)
+        if self.nameIndices is None:
+            return values
+        return [values[indices[0]] if len(indices) == 1 else
+                tuple(values[index] for index in indices) for indices in self.nameIndices]
+
+    def resolvePascal(self, bytesData, values):
+        """Replace length of pascal fields by the text that follows it"""
+        for index, start in self.pascalFields:
+            length = values[index]
+            values[index] = textconv.decodeText(bytesData[start:start + length])
+
+    def unpackFields(self, bytesData):
+        """Unpack fields from bytesData one by one (slow path for data that
+        are shorter than the struct), and return list of values
+        """
+        values = []
+        for field in self.fields:
+            offset, fieldType = field[1:3]
+            if fieldType in INTEGER_TYPES:
+                size, fieldOrder, formatChar, start = INTEGER_TYPES[fieldType]
+                fieldData = bytes(bytesData[offset + start:offset + size])
+                value = bc._doConv(fieldData, fieldOrder or ">", formatChar)
+            elif fieldType == "pascal":
+                value = bc.bytesToUnsignedChar(bytes(bytesData[offset:offset + 1]))
+            else:
+                fieldData = bytes(bytesData[offset:offset + field[3]])
+                if fieldType == "text":
+                    value = textconv.decodeText(fieldData)
+                elif fieldType == "dstring":
+                    # Truncated dstring: its length byte is missing
+                    if len(fieldData) < field[3]:
+                        value = textconv.cs0ToText(fieldData)
+                    else:
+                        value = textconv.dstringToText(fieldData)
+                else:
+                    value = field[4](fieldData)
+            values.append(value)
+        return values
@@ -0,0 +1,240 @@
+#! /usr/bin/env python3
+"""Streaming file manifests of ISO 9660 (and UDF) images, from the path
+tables and directory records (the image does not need to be mounted)
+"""
+
+import struct
+from . import iso9660 as iso
+from . import model
+from . import textconv
+from . import udf
+
+
+# Maximum number of volume descriptors that are read before the Volume
+# Descriptor Set Terminator
+MAX_VOLUME_DESCRIPTORS = 256
+
+# Maximum number of System Use continuation areas ("CE" entries) that are
+# followed for one Directory Record
+MAX_CONTINUATION_AREAS = 8
+
+# Logical block size, path table size and location of the type L path
+# table in a Primary or Supplementary Volume Descriptor
+volumeDescriptorStruct = struct.Struct("<128xH2xI4xI")
+
+# Location, offset and length of a continuation area (the little-endian
+# halves of the both-byte order fields of a "CE" entry)
+continuationStruct = struct.Struct("<I4xI4xI")
+
+
+def volumeDescriptors(reader):
+    """Return (Primary Volume Descriptor, Joliet Supplementary Volume
+    Descriptor) tuple of the image that is read by sector reader reader,
+    with None for descriptors that are not found
+    """
+    primary = None
+    joliet = None
+    byteStart = 32768
+    for _ in range(MAX_VOLUME_DESCRIPTORS):
+        data = reader.read(byteStart, 2048)
+        if len(data) < 2048 or data[1:6] != b"CD001":
+            break
+        typeCode = data[0]
+        if typeCode == 1 and primary is None:
+            primary = data
+        elif typeCode == 2 and joliet is None and iso.isJoliet(data):
+            joliet = data
+        elif typeCode == 255:
+            break
+        byteStart += 2048
+    return primary, joliet
+
+
+def fileName(name):
+    """Strip version number from (decoded) file identifier, and the
+    separator of names without an extension
+    """
+    name = name.split(";")[0]
+    if name.endswith(".") and len(name) > 1:
+        name = name[:-1]
+    return name
+
+
+def systemUseEntries(reader, systemUse, offset, blockSize):
+    """Yield (signature, data) tuple for each SUSP entry in System Use area
+    systemUse, and in the continuation areas it points to
+    """
+    for _ in range(MAX_CONTINUATION_AREAS + 1):
+        continuation = None
+        for signature, data in iso.iterSystemUseEntries(systemUse):
+            if signature == b"CE" and len(data) >= continuationStruct.size:
+                continuation = data
+            else:
+                yield signature, data
+        if continuation is None:
+            return
+        location, areaOffset, length = continuationStruct.unpack_from(continuation)
+        if location < offset:
+            return
+        systemUse = reader.read((location - offset) * blockSize + areaOffset, length)
+
+
+def readDirectory(reader, location, offset, blockSize):
+    """Read directory extent at logical block location whose length is not
+    known, using the data length of its "." record
+    """
+    data = reader.read((location - offset) * blockSize, blockSize)
+    for _, dataLength, _, _ in iso.iterDirectoryRecords(data, blockSize):
+        if dataLength > blockSize:
+            data = reader.read((location - offset) * blockSize, dataLength)
+        else:
+            data = data[:dataLength]
+        break
+    return data
+
+
+def iterTree(reader, descriptor, offset, tree, decode, rockRidge):
+    """Yield a model.ManifestEntry for each file and directory in the
+    directory hierarchy of volume descriptor (data) descriptor. Identifiers
+    are decoded with function decode, and Rock Ridge names are looked up if
+    rockRidge is True
+    """
+    blockSize, pathTableSize, pathTableLocation = volumeDescriptorStruct.unpack_from(descriptor)
+    if blockSize not in (512, 1024, 2048):
+        blockSize = 2048
+    rootLocation, rootLength = iso.parseRootDirectoryRecord(descriptor)
+
+    pathTable = []
+    if pathTableLocation >= offset:
+        pathTable = iso.parsePathTable(
+            reader.read((pathTableLocation - offset) * blockSize, pathTableSize))
+    if not pathTable:
+        # Without a path table, only the root directory is listed
+        pathTable = [(rootLocation, 1, b"\x00")]
+    pathTable[0] = (rootLocation, 1, b"\x00")
+
+    # Extents of directories (from the records in their parent directory),
+    # their Rock Ridge names, and the paths of the directories that have been
+    # read, by directory number - 1
+    extents = {rootLocation: rootLength}
+    rockRidgeNames = {}
+    paths = [None] * len(pathTable)
+    rockRidgePaths = [None] * len(pathTable)
+    skipLength = None
+    maxBatch = iso.MAX_BATCH_SECTORS * 2048 // blockSize
+
+    number = 0
+    while number < len(pathTable):
+        # Batch of directories that are next in the path table, and whose
+        # extents are known and adjacent
+        location = pathTable[number][0]
+        start = location
+        end = start + -(-extents.get(location, blockSize) // blockSize)
+        last = number + 1
+        while last < len(pathTable) and pathTable[last][0] == end and \
+                pathTable[last - 1][0] in extents and pathTable[last][0] in extents:
+            blocks = -(-extents[pathTable[last][0]] // blockSize)
+            if end + blocks - start > maxBatch:
+                break
+            end += blocks
+            last += 1
+
+        if start < offset:
+            # Extents before the image (e.g. in an earlier session)
+            data = None
+        elif start in extents:
+            data = reader.read((start - offset) * blockSize, (end - start) * blockSize)
+        else:
+            data = readDirectory(reader, start, offset, blockSize)
+
+        for index in range(number, last):
+            location, parent, identifier = pathTable[index]
+            if index > 0:
+                if not 1 <= parent <= index or paths[parent - 1] is None:
+                    continue
+                name = decode(identifier)
+                paths[index] = paths[parent - 1] + "/" + name
+                if rockRidgePaths[parent - 1] is not None:
+                    rockRidgePaths[index] = rockRidgePaths[parent - 1] + "/" + \
+                        rockRidgeNames.pop(location, name)
+            else:
+                paths[index] = ""
+            if data is None:
+                continue
+
+            begin = (location - start) * blockSize
+            extent = data[begin:begin + extents.get(location, len(data))]
+            directoryPath = paths[index]
+            rockRidgePath = rockRidgePaths[index]
+            pending = None
+
+            for position, length, childLocation, dataLength, flags, identifierLength in \
+                    iso.iterRecordPositions(extent, blockSize):
+                identifierEnd = position + 33 + identifierLength
+                identifier = bytes(extent[position + 33:identifierEnd])
+                if rockRidge:
+                    # System Use area follows the (padded) identifier
+                    systemUse = extent[identifierEnd + 1 - (identifierLength & 1):
+                                       position + length]
+                if identifier in (b"\x00", b"\x01"):
+                    if index == 0 and identifier == b"\x00" and rockRidge:
+                        skipLength = iso.rockRidgeSkipLength(systemUse)
+                        if skipLength is not None:
+                            rockRidgePaths[0] = rockRidgePath = ""
+                    continue
+
+                isDirectory = bool(flags & iso.FLAG_DIRECTORY)
+                name = decode(identifier)
+                if not isDirectory:
+                    name = fileName(name)
+                alternateName = None
+                if skipLength is not None:
+                    alternateName = iso.rockRidgeName(systemUseEntries(
+                        reader, systemUse[skipLength:], offset, blockSize))
+                if isDirectory:
+                    extents.setdefault(childLocation, dataLength)
+                    if alternateName is not None:
+                        rockRidgeNames[childLocation] = alternateName
+
+                if pending is not None:
+                    if pending[0] == identifier:
+                        # Next extent of a multi-extent file
+                        pending[1].size += dataLength
+                        if not flags & iso.FLAG_MULTI_EXTENT:
+                            yield pending[1]
+                            pending = None
+                        continue
+                    yield pending[1]
+                    pending = None
+
+                entry = model.ManifestEntry(
+                    tree, directoryPath + "/" + name,
+                    "directory" if isDirectory else "file", dataLength, childLocation,
+                    iso.recordingDateTime(extent[position + 18:position + 25]),
+                    None if rockRidgePath is None else
+                    rockRidgePath + "/" + (alternateName or name))
+                if flags & iso.FLAG_MULTI_EXTENT and not isDirectory:
+                    pending = (identifier, entry)
+                else:
+                    yield entry
+            if pending is not None:
+                yield pending[1]
+        number = last
+
+
+def iterManifest(reader, offset=0):
+    """Yield a model.ManifestEntry for each file and directory in the ISO
+    9660 directory hierarchy of the image that is read by (open) sector
+    reader reader, followed by those in the Joliet hierarchy and in the UDF
+    file tree (see udf.walkFileTree), if there are any. The first sector of
+    the image is logical block offset (this only applies to ISO 9660).
+    Directories are enumerated from the path table, and each directory is
+    read once. Entries are yielded as they are found, so memory use depends
+    on the number of directories, not on the number of files
+    """
+    primary, joliet = volumeDescriptors(reader)
+    if primary is not None:
+        yield from iterTree(reader, primary, offset, "ISO 9660", textconv.decodeText, True)
+    if joliet is not None:
+        yield from iterTree(reader, joliet, offset, "Joliet", textconv.ucs2ToText, False)
+    yield from udf.walkFileTree(reader)
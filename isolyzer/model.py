@@ -0,0 +1,358 @@
+#! /usr/bin/env python3
+"""Result model
+
+processImage returns an ImageResult record, which is made up of the
+following records:
+
+- ImageResult: fileInfo (FileInfo), statusInfo (StatusInfo), sectorOffset
+  (int), tests (Tests), fileSystems (list of FileSystem records),
+  truncationReport (TruncationReport, or None) and sessions (list of
+  Session records, or None if sessions were not looked for)
+- FileInfo: fileName, filePath, fileSizeInBytes, fileLastModified,
+  checksums (dictionary of hexadecimal digests by algorithm, or None) and
+  deviceInfo (DeviceInfo, or None if the image was not read as a device)
+- DeviceInfo: blockDevice, logicalBlockSize, physicalBlockSize and
+  numberOfBlocks
+- StatusInfo: success (bool) and failureMessage (None if successful)
+- Tests: containsKnownFileSystem, sizeExpected, sizeActual, sizeDifference,
+  sizeDifferenceSectors, sizeAsExpected and smallerThanExpected
+- FileSystem: type (e.g. 'ISO 9660') and descriptors (list of descriptor
+  records, in the order in which they were read)
+- TruncationReport (only if requested, for truncated ISO 9660 images):
+  directoriesWalked, filesWalked, highestSectorReferenced,
+  directoriesBeyondEOF, filesBeyondEOF, bytesBeyondEOF and extentsBeyondEOF
+  (list of ExtentBeyondEOF records: path, type, extentLocation, dataLength
+  and bytesBeyondEOF)
+- Session: startSector, sectorOffset, volumeIdentifier, volumeSpaceSize,
+  containsUDF, sizeExpected, sizeDifference, sizeDifferenceSectors,
+  sizeAsExpected and smallerThanExpected
+
+processImage takes the options of the analysis as an AnalysisOptions
+record: checksums (list of algorithms, or None), truncationReport (bool),
+sessions (bool), fields (projection, or None for all fields) and limits
+(budgets.Limits, or None for the default limits).
+
+The manifest module yields ManifestEntry records (tree, path, type, size,
+extentLocation, recordingDateTime and rockRidgePath), which are written
+directly, without an ImageResult.
+
+Descriptor records are defined by the parser modules:
+iso9660.PrimaryVolumeDescriptor, hsf.SFSVolumeDescriptor,
+udf.LogicalVolumeDescriptor, udf.LogicalVolumeIntegrityDescriptor,
+udf.PartitionDescriptor, apple.ZeroBlock, apple.PartitionMap,
+apple.MasterDirectoryBlock and apple.HFSPlusVolumeHeader. Their properties
+are the fields of their layouts (see the layout module).
+
+All records have one attribute per property, with a native value (int,
+float, bool or str). Properties that occur more than once (e.g.
+optionalPathTableLocation in the High Sierra descriptor) are tuples.
+Text values are stored without control characters and leading/trailing
+white space, so they can be serialised as-is. Properties that are None
+are not reported.
+
+Records are converted to XML, JSON or CSV only when the report is written
+(see the writers module); toElement() returns an ElementTree element with
+the same structure as the XML report.
+"""
+
+
+# Record classes by name, used to restore records from plain values
+recordClasses = {}
+
+
+def textValue(value):
+    """Return text representation of property value"""
+    if type(value) == str:
+        return value
+    return str(value)
+
+
+class Record:
+    """Base class of result records. Subclasses list their properties in
+    __slots__, in report order, and the name of their element in tag.
+    Records can be created from property values in slot order, or by name
+    """
+
+    __slots__ = ()
+    tag = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        recordClasses[cls.__name__] = cls
+
+    def __init__(self, *values, **properties):
+        names = self.__slots__
+        if len(values) > len(names):
+            raise TypeError("%s takes at most %d values" % (type(self).__name__, len(names)))
+        for name, value in zip(names, values):
+            setattr(self, name, value)
+        for name in names[len(values):]:
+            setattr(self, name, properties.pop(name, None))
+        if properties:
+            raise TypeError("unknown properties: " + ", ".join(properties))
+
+    def values(self):
+        """Return tuple of all property values, in slot order"""
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def items(self):
+        """Yield (name, value) tuples of all properties that are not None,
+        in report order
+        """
+        for name in self.__slots__:
+            value = getattr(self, name)
+            if value is not None:
+                yield name, value
+
+    def attributes(self):
+        """Return dictionary of XML attributes of the record's element"""
+        return {}
+
+    def toElement(self, tag=None):
+        """Return element (with tag tag, or the record's own tag) with one
+        child element per property, and property values as text
+        """
+        # ElementTree is only imported when needed: the report writers
+        # serialise records directly
+        import xml.etree.ElementTree as ET
+        element = ET.Element(tag or self.tag, self.attributes())
+        for name, value in self.items():
+            appendValue(element, name, value)
+        return element
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.values() == other.values()
+
+    def __repr__(self):
+        return "%s(%s)" % (type(self).__name__,
+                           ", ".join("%s=%r" % item for item in self.items()))
+
+    def __reduce__(self):
+        return (type(self), self.values())
+
+
+def appendValue(element, name, value):
+    """Append property name with value value to element"""
+    if isinstance(value, Record):
+        element.append(value.toElement(name))
+    elif isinstance(value, tuple):
+        for item in value:
+            appendValue(element, name, item)
+    elif isinstance(value, list):
+        container = subElement(element, name)
+        for record in value:
+            container.append(record.toElement())
+    elif isinstance(value, dict):
+        container = subElement(element, name)
+        for key, item in value.items():
+            appendValue(container, key, item)
+    else:
+        subElement(element, name).text = textValue(value)
+
+
+def subElement(element, name):
+    """Append empty child element name to element, and return it"""
+    child = element.makeelement(name, {})
+    element.append(child)
+    return child
+
+
+class Descriptor(Record):
+    """Base class of descriptor records, whose properties are unpacked with
+    layout (a layout.Layout; its names are used as __slots__)
+    """
+
+    __slots__ = ()
+    layout = None
+
+    @classmethod
+    def fromBytes(cls, bytesData, names=None):
+        """Unpack descriptor from bytesData. If a set of property names is
+        given as names, only these properties are unpacked (all others are
+        None)
+        """
+        if names is None:
+            return cls(*cls.layout.recordValues(bytesData))
+        projection = cls.layout.project(names)
+        values = [None] * len(cls.layout.names)
+        for position, value in zip(projection.positions, projection.recordValues(bytesData)):
+            values[position] = value
+        return cls(*values)
+
+    @classmethod
+    def projection(cls, fields, required=()):
+        """Return the names of the properties to unpack, given fields, a
+        dictionary with sets of requested property names by descriptor tag
+        (None if all properties are requested), and the names of the
+        properties that are required regardless (e.g. for the size tests).
+        Returns None if all properties are to be unpacked
+        """
+        if fields is None:
+            return None
+        return set(required).union(fields.get(cls.tag, ()))
+
+
+class ToolInfo(Record):
+    """Name and version of isolyzer"""
+
+    __slots__ = ("toolName", "toolVersion")
+    tag = "toolInfo"
+
+
+class FileInfo(Record):
+    """General file properties of an image, and its checksums (if requested)"""
+
+    __slots__ = ("fileName", "filePath", "fileSizeInBytes", "fileLastModified", "checksums",
+                 "deviceInfo")
+    tag = "fileInfo"
+
+
+class DeviceInfo(Record):
+    """Geometry of an image that is read as a device (see
+    sectorreader.DeviceReader); blockDevice is False for regular files
+    """
+
+    __slots__ = ("blockDevice", "logicalBlockSize", "physicalBlockSize", "numberOfBlocks")
+    tag = "deviceInfo"
+
+
+class StatusInfo(Record):
+    """Outcome of the analysis of an image"""
+
+    __slots__ = ("success", "failureMessage")
+    tag = "statusInfo"
+
+
+class Tests(Record):
+    """Outcome of the size tests. Properties that could not be established
+    (because the analysis failed) are None
+    """
+
+    __slots__ = ("containsKnownFileSystem", "sizeExpected", "sizeActual", "sizeDifference",
+                 "sizeDifferenceSectors", "sizeAsExpected", "smallerThanExpected")
+    tag = "tests"
+
+
+class TruncationReport(Record):
+    """Impact of the truncation of an image on its ISO 9660 file system:
+    number of directories and files in the directory hierarchy, highest
+    sector that any of their extents occupies, and the extents that run past
+    the end of the image (list of ExtentBeyondEOF records, in order of their
+    end offsets)
+    """
+
+    __slots__ = ("directoriesWalked", "filesWalked", "highestSectorReferenced",
+                 "directoriesBeyondEOF", "filesBeyondEOF", "bytesBeyondEOF", "extentsBeyondEOF")
+    tag = "truncationReport"
+
+
+class ExtentBeyondEOF(Record):
+    """File or directory (type) whose extent runs past the end of the image,
+    with the number of its bytes that are missing
+    """
+
+    __slots__ = ("path", "type", "extentLocation", "dataLength", "bytesBeyondEOF")
+    tag = "extent"
+
+
+class Session(Record):
+    """Session of a multisession image (see the multisession module): the
+    image sector where its volume descriptor set starts, its sector offset,
+    properties of its Primary Volume Descriptor, and the outcome of its size
+    tests (sizes in bytes, counted from the start of the image)
+    """
+
+    __slots__ = ("startSector", "sectorOffset", "volumeIdentifier", "volumeSpaceSize",
+                 "containsUDF", "sizeExpected", "sizeDifference", "sizeDifferenceSectors",
+                 "sizeAsExpected", "smallerThanExpected")
+    tag = "session"
+
+
+class ManifestEntry(Record):
+    """File or directory (type) in the directory hierarchy (tree) of an
+    image, with its path, size in bytes, extent location (logical block
+    number), recording date and time, and its path with Rock Ridge names
+    (only for images with Rock Ridge extensions)
+    """
+
+    __slots__ = ("tree", "path", "type", "size", "extentLocation", "recordingDateTime",
+                 "rockRidgePath")
+    tag = "entry"
+
+
+class FileSystem(Record):
+    """File system of type type, with its descriptor records. The type is
+    reported as the TYPE attribute of the fileSystem element, and each
+    descriptor as a child element
+    """
+
+    __slots__ = ("type", "descriptors")
+    tag = "fileSystem"
+
+    def __init__(self, type=None, descriptors=None):
+        self.type = type
+        self.descriptors = [] if descriptors is None else descriptors
+
+    def append(self, descriptor):
+        """Append descriptor record"""
+        self.descriptors.append(descriptor)
+
+    def items(self):
+        for descriptor in self.descriptors:
+            yield descriptor.tag, descriptor
+
+    def attributes(self):
+        return {"TYPE": self.type}
+
+
+class ImageResult(Record):
+    """Result of the analysis of one image"""
+
+    __slots__ = ("fileInfo", "statusInfo", "sectorOffset", "tests", "fileSystems",
+                 "truncationReport", "sessions")
+    tag = "image"
+
+
+class AnalysisOptions(Record):
+    """Options of the analysis of images, which processImage and the batch
+    functions take as one record (see processImage). Options that are not
+    given are None, which is the default of each. The batch functions pass
+    the same instance to every image, and to every worker process
+    """
+
+    __slots__ = ("checksums", "truncationReport", "sessions", "fields", "limits")
+    tag = "options"
+
+
+# Shared instance that is used when no options are given
+defaultOptions = AnalysisOptions()
+
+
+def toPlain(value):
+    """Convert property value (or record) to plain value that can be
+    serialised to JSON, and restored with fromPlain
+    """
+    if isinstance(value, Record):
+        return {"record": type(value).__name__, "values": [toPlain(item) for item in value.values()]}
+    elif isinstance(value, tuple):
+        return {"tuple": [toPlain(item) for item in value]}
+    elif isinstance(value, list):
+        return [toPlain(item) for item in value]
+    elif isinstance(value, dict):
+        return {"dict": {key: toPlain(item) for key, item in value.items()}}
+    return value
+
+
+def fromPlain(value):
+    """Restore property value (or record) from plain value produced by toPlain.
+    The modules that define the descriptor records must have been imported
+    """
+    if isinstance(value, list):
+        return [fromPlain(item) for item in value]
+    elif isinstance(value, dict):
+        if "record" in value:
+            return recordClasses[value["record"]](*[fromPlain(item) for item in value["values"]])
+        elif "tuple" in value:
+            return tuple(fromPlain(item) for item in value["tuple"])
+        return {key: fromPlain(item) for key, item in value["dict"].items()}
+    return value
@@ -0,0 +1,255 @@
+#! /usr/bin/env python3
+"""Detection of the sessions of multisession images
+
+Each session of a multisession disc has its own volume descriptor set, whose
+Primary Volume Descriptor is 16 sectors after the start of the session.
+Sessions are found with a sector-aligned scan of the whole image for the
+signature of a Primary Volume Descriptor. The image is read in large chunks,
+which (for large images) are read by several threads at once, so the scan
+takes about as long as reading the image sequentially.
+
+Logical block numbers in a session are counted from the start of the disc,
+not from the start of the image. The sector offset of a session (the logical
+block number of the first sector of the image, as passed with --offset) is
+derived from its root directory: this is the sector whose "." record points
+to the location of the root directory in the Primary Volume Descriptor.
+
+The scan is charged to the budget of the image (see the budgets module): the
+sectors of the scan itself are not counted (there are as many as the image
+has), but its time is, and so are the sectors that are read to find the
+root directories and the UDF file systems of the sessions.
+"""
+
+import os
+import struct
+import collections
+import concurrent.futures
+from . import budgets
+from . import iso9660 as iso
+from . import model
+from . import perf
+from . import sectorreader as sr
+from . import udf
+
+
+# Size of the sectors that are scanned (and of the logical blocks of the
+# sessions that can be detected)
+SECTOR_SIZE = 2048
+
+# Signature of a Primary Volume Descriptor (type code, standard identifier
+# and version), at the start of a sector
+PVD_SIGNATURE = b"\x01CD001\x01"
+
+# Size of the chunks in which the image is scanned
+SCAN_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Images of at least this size are scanned by SCAN_THREADS threads
+PARALLEL_SCAN_SIZE = 64 * 1024 * 1024
+SCAN_THREADS = 4
+
+# Maximum distance (in sectors) between a Primary Volume Descriptor and the
+# root directory, when the root directory is searched for
+MAX_ROOT_DISTANCE = 32768
+
+# Maximum number of Primary Volume Descriptors that are examined (images
+# may contain many ISO images as files)
+MAX_CANDIDATES = 1024
+
+
+def iterChunks(reader, start, end, jobs=1, budget=None):
+    """Yield (byte offset, data) tuple for each chunk of the image between
+    byte offsets start and end, in order. If jobs is more than 1, chunks are
+    read ahead by as many threads (only for readers with positional reads).
+    If a budget is given, the chunks are exempted from its count of sectors
+    read, and it is checked after each chunk
+    """
+    offsets = range(start, end, SCAN_CHUNK_SIZE)
+    if jobs <= 1 or not isinstance(reader, sr.PReadReader) or not hasattr(os, "pread"):
+        for offset in offsets:
+            data = reader.read(offset, min(SCAN_CHUNK_SIZE, end - offset))
+            exemptChunk(budget, data)
+            yield offset, data
+        return
+
+    # os.pread releases the GIL, so chunks are read while earlier chunks are
+    # searched; the read counters are only updated by this thread
+    reader.checkOpen()
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=jobs,
+                                                     thread_name_prefix="isolyzer-scan")
+    pending = collections.deque()
+    try:
+        for offset in offsets:
+            pending.append((offset, executor.submit(
+                os.pread, reader.fd, min(SCAN_CHUNK_SIZE, end - offset), offset)))
+            if len(pending) > 2 * jobs:
+                offset, future = pending.popleft()
+                data = future.result()
+                reader.reads += 1
+                reader.bytesRead += len(data)
+                exemptChunk(budget, data)
+                yield offset, data
+        while pending:
+            offset, future = pending.popleft()
+            data = future.result()
+            reader.reads += 1
+            reader.bytesRead += len(data)
+            exemptChunk(budget, data)
+            yield offset, data
+    finally:
+        for _, future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+def exemptChunk(budget, data):
+    """Exempt chunk data from the count of sectors read of budget (if
+    any), and check budget
+    """
+    if budget is not None:
+        budget.exempt(len(data))
+        budget.check()
+
+
+def scanSectors(reader, pattern, position, firstSector, lastSector, jobs=1, budget=None):
+    """Yield (sector number, sector data) tuple for each sector between
+    firstSector and lastSector (exclusive) that contains pattern at byte
+    position position. If a budget is given, the sectors that are scanned
+    are not counted as read by it (see iterChunks)
+    """
+    end = min(lastSector * SECTOR_SIZE, reader.size)
+    first = pattern[:1]
+    for chunkOffset, data in iterChunks(reader, firstSector * SECTOR_SIZE, end, jobs,
+                                        budget):
+        # Only the byte at position of each sector is searched (a strided
+        # slice is a fraction of the chunk); candidates are then compared
+        # with the whole pattern
+        candidates = data[position::SECTOR_SIZE]
+        sector = candidates.find(first)
+        while sector != -1:
+            start = sector * SECTOR_SIZE
+            if data[start + position:start + position + len(pattern)] == pattern:
+                yield chunkOffset // SECTOR_SIZE + sector, data[start:start + SECTOR_SIZE]
+            sector = candidates.find(first, sector + 1)
+
+
+def rootRecordPattern(rootLocation):
+    """Return location field (both byte orders) of the "." record of a root
+    directory at logical block rootLocation
+    """
+    return struct.pack("<I", rootLocation) + struct.pack(">I", rootLocation)
+
+
+def isRootRecord(data, rootLocation):
+    """Return True if data starts with the "." record of the root directory
+    at logical block rootLocation
+    """
+    return len(data) >= 34 and data[0] >= 34 and \
+        data[2:10] == rootRecordPattern(rootLocation) and data[32:34] == b"\x01\x00"
+
+
+def sessionOffset(reader, start, pvdData, offsets):
+    """Return sector offset of session that starts at image sector start,
+    with Primary Volume Descriptor pvdData, or None if its root directory is
+    not found. The offsets in list offsets (e.g. those of earlier sessions)
+    are tried first; otherwise the root directory is searched for
+    """
+    rootLocation, _ = iso.parseRootDirectoryRecord(pvdData)
+    pvdSector = start + 16
+    for offset in offsets:
+        rootSector = rootLocation - offset
+        if rootSector > pvdSector and \
+                isRootRecord(reader.read(rootSector * SECTOR_SIZE, 34), rootLocation):
+            return offset
+
+    # Sector offsets are never negative, so the root directory is somewhere
+    # between the Primary Volume Descriptor and logical block rootLocation
+    lastSector = min(rootLocation, pvdSector + MAX_ROOT_DISTANCE) + 1
+    for sector, data in scanSectors(reader, rootRecordPattern(rootLocation), 2,
+                                    pvdSector + 1, lastSector):
+        if isRootRecord(data, rootLocation):
+            return rootLocation - sector
+    return None
+
+
+def udfSizeExpected(reader, start, offset):
+    """Return expected size (in bytes, counted from the start of the image)
+    of the UDF file system of session that starts at image sector start, or
+    0 if the session does not contain UDF
+    """
+    anchor = reader.read((start + 256) * SECTOR_SIZE, 32)
+    if len(anchor) < 32 or udf.tagStruct.unpack_from(anchor)[0] != \
+            udf.TAG_ANCHOR_VOLUME_DESCRIPTOR_POINTER:
+        return 0
+    extentLength, extentLocation = udf.extentStruct.unpack_from(anchor, 16)
+    if extentLocation < offset:
+        return 0
+
+    lvdInfo = None
+    pdInfo = None
+    byteStart = (extentLocation - offset) * SECTOR_SIZE
+    for _ in range(min(extentLength // SECTOR_SIZE, udf.MAX_SEQUENCE_SECTORS)):
+        tagIdentifier, volumeDescriptorData, byteStart = udf.getVolumeDescriptor(reader, byteStart)
+        if tagIdentifier == udf.TAG_LOGICAL_VOLUME_DESCRIPTOR and lvdInfo is None:
+            lvdInfo = udf.parseLogicalVolumeDescriptor(volumeDescriptorData)
+        elif tagIdentifier == udf.TAG_PARTITION_DESCRIPTOR and pdInfo is None:
+            pdInfo = udf.parsePartitionDescriptor(volumeDescriptorData)
+        elif tagIdentifier == udf.TAG_TERMINATING_DESCRIPTOR:
+            break
+    if lvdInfo is None or pdInfo is None:
+        return 0
+    # Same (conservative) estimate as for the image as a whole
+    return max(pdInfo.partitionLength + pdInfo.partitionStartingLocation - offset, 0) * \
+        lvdInfo.logicalBlockSize
+
+
+def findSessions(reader, jobs=None, profiler=None, budget=budgets.nullBudget):
+    """Return list of model.Session records for the sessions of the image
+    that is read by (open) sector reader reader, in order of their start
+    sectors. The image is scanned by jobs threads (by default SCAN_THREADS for
+    images of at least PARALLEL_SCAN_SIZE bytes). Sessions whose logical
+    block size is not 2048 bytes, or whose root directory is not found, are
+    not reported. Primary Volume Descriptors are counted by perf.Profiler
+    profiler. The scan is charged to budget (see the module docstring).
+    Raises budgets.BudgetExceeded if the budget is exceeded
+    """
+    if profiler is None:
+        profiler = perf.nullProfiler
+    if jobs is None:
+        jobs = SCAN_THREADS if reader.size >= PARALLEL_SCAN_SIZE else 1
+    imageSize = reader.size
+    sessions = []
+    offsets = [0]
+    candidates = 0
+
+    for pvdSector, pvdData in scanSectors(reader, PVD_SIGNATURE, 0, 16,
+                                          -(-imageSize // SECTOR_SIZE), jobs, budget):
+        candidates += 1
+        if candidates > MAX_CANDIDATES:
+            break
+        profiler.countDescriptors()
+        if len(pvdData) < SECTOR_SIZE:
+            continue
+        try:
+            pvdInfo = iso.parsePrimaryVolumeDescriptor(pvdData)
+        except Exception:
+            continue
+        if pvdInfo.logicalBlockSize != SECTOR_SIZE:
+            continue
+        start = pvdSector - 16
+        offset = sessionOffset(reader, start, pvdData, offsets)
+        if offset is None or pvdInfo.volumeSpaceSize <= start + offset:
+            # Not a session (e.g. an ISO image that is stored as a file)
+            continue
+        if offset not in offsets:
+            offsets.append(offset)
+
+        sizeExpectedUDF = udfSizeExpected(reader, start, offset)
+        budget.check()
+        sizeExpected = max((pvdInfo.volumeSpaceSize - offset) * SECTOR_SIZE, sizeExpectedUDF)
+        diffSize = imageSize - sizeExpected
+        sessions.append(model.Session(
+            start, offset, pvdInfo.volumeIdentifier, pvdInfo.volumeSpaceSize,
+            sizeExpectedUDF > 0, sizeExpected, diffSize, diffSize / SECTOR_SIZE,
+            diffSize == 0, diffSize < 0))
+
+    return sessions
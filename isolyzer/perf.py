@@ -0,0 +1,120 @@
+#! /usr/bin/env python3
+"""Opt-in per-stage profiling and I/O accounting
+
+A Profiler records, for one image, the wall time spent in each stage of
+processImage (and the serialisation of its result), the number of read
+calls and bytes read, and the number of descriptors visited. Stages are
+delimited with checkpoint(), which attributes the time elapsed since the
+previous checkpoint to the named stage. When profiling is off, processImage
+uses a NullProfiler, whose methods do nothing.
+"""
+
+import time
+
+
+class Profiler:
+    """Stage timings and I/O counters of one image"""
+
+    def __init__(self):
+        self.stages = {}
+        self.reads = 0
+        self.bytesRead = 0
+        self.descriptorsVisited = 0
+        self.lastTime = time.perf_counter()
+
+    def start(self):
+        """(Re)start clock for the first stage"""
+        self.lastTime = time.perf_counter()
+
+    def checkpoint(self, stage):
+        """Attribute time elapsed since previous checkpoint to stage"""
+        now = time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0.0) + now - self.lastTime
+        self.lastTime = now
+
+    def countDescriptors(self, number=1):
+        """Add number to count of visited descriptors"""
+        self.descriptorsVisited += number
+
+    def addReaderCounts(self, reader):
+        """Add I/O counters of sector reader"""
+        self.reads += reader.reads
+        self.bytesRead += reader.bytesRead
+
+    def toDict(self):
+        """Return profile as dictionary"""
+        return {"stages": dict(self.stages),
+                "reads": self.reads,
+                "bytesRead": self.bytesRead,
+                "descriptorsVisited": self.descriptorsVisited}
+
+
+class NullProfiler(Profiler):
+    """Profiler that records nothing"""
+
+    def __init__(self):
+        pass
+
+    def start(self):
+        pass
+
+    def checkpoint(self, stage):
+        pass
+
+    def countDescriptors(self, number=1):
+        pass
+
+    def addReaderCounts(self, reader):
+        pass
+
+
+# Shared instance that is used when profiling is off
+nullProfiler = NullProfiler()
+
+
+class BatchProfile:
+    """Writes per-image profiles to a JSON Lines sidecar file, and a
+    batch-level summary with throughput in images/s and MB of headers read
+    per second as the last line
+    """
+
+    def __init__(self, sidecar):
+        # Only imported when profiling, which is opt-in
+        import json
+        self.dumps = json.dumps
+        self.sidecar = sidecar
+        self.noImages = 0
+        self.reads = 0
+        self.bytesRead = 0
+        self.descriptorsVisited = 0
+        self.stages = {}
+        self.startTime = time.perf_counter()
+
+    def addImage(self, filePath, profile):
+        """Add profile (as returned by Profiler.toDict) of one image"""
+        self.noImages += 1
+        self.reads += profile["reads"]
+        self.bytesRead += profile["bytesRead"]
+        self.descriptorsVisited += profile["descriptorsVisited"]
+        for stage, seconds in profile["stages"].items():
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        record = {"filePath": filePath}
+        record.update(profile)
+        self.sidecar.write(self.dumps(record) + "\n")
+
+    def summary(self):
+        """Return batch summary as dictionary"""
+        wallTime = time.perf_counter() - self.startTime
+        return {"images": self.noImages,
+                "wallTime": wallTime,
+                "imagesPerSecond": self.noImages / wallTime if wallTime else 0.0,
+                "reads": self.reads,
+                "bytesRead": self.bytesRead,
+                "headerMBPerSecond": self.bytesRead / 1e6 / wallTime if wallTime else 0.0,
+                "descriptorsVisited": self.descriptorsVisited,
+                "stages": self.stages}
+
+    def end(self):
+        """Write batch summary"""
+        self.sidecar.write(self.dumps({"summary": self.summary()}) + "\n")
+        self.sidecar.flush()
@@ -0,0 +1,134 @@
+#! /usr/bin/env python3
+"""Field projection of reports
+
+A projection is a list of field names (in the order of the CSV columns):
+
+- the properties of the fileInfo (fileName, filePath, fileSizeInBytes and
+  fileLastModified), statusInfo and tests elements, and sectorOffset
+- fileSystems: the types of the file systems
+- descriptor properties, as descriptor tag and property name separated by a
+  dot (e.g. primaryVolumeDescriptor.volumeIdentifier)
+
+These are also the column names of the CSV report. With a projection,
+processImage only unpacks the descriptor properties that are needed for the
+size tests and those in the projection (see model.Descriptor.projection),
+and the report only holds the projected fields (see projectResult).
+"""
+
+from . import model
+
+
+# Fields of the triage report
+TRIAGE_FIELDS = ["filePath", "success", "failureMessage", "containsKnownFileSystem",
+                 "sizeExpected", "sizeDifferenceSectors", "smallerThanExpected"]
+
+# Records of ImageResult whose properties can be projected, by property name
+sectionClasses = {"fileInfo": model.FileInfo, "statusInfo": model.StatusInfo,
+                  "tests": model.Tests}
+
+# Image fields that can be projected, with the property of ImageResult that
+# holds them (None for properties of ImageResult itself)
+imageFields = dict([(name, "fileInfo") for name in model.FileInfo.__slots__[:4]] +
+                   [(name, "statusInfo") for name in model.StatusInfo.__slots__] +
+                   [("sectorOffset", None)] +
+                   [(name, "tests") for name in model.Tests.__slots__])
+
+
+def descriptorClasses():
+    """Return dictionary with descriptor record classes by tag (this imports
+    all parser modules)
+    """
+    from . import apple, hsf, iso9660, udf
+    return {recordClass.tag: recordClass for recordClass in model.recordClasses.values()
+            if issubclass(recordClass, model.Descriptor) and recordClass.layout is not None}
+
+
+def parseFields(text):
+    """Return projection from comma-separated list of field names. Raises
+    ValueError for unknown fields
+    """
+    fields = [field.strip() for field in text.split(",") if field.strip()]
+    if not fields:
+        raise ValueError("no fields specified")
+    classes = None
+    for field in fields:
+        if field in imageFields or field == "fileSystems":
+            continue
+        tag, _, name = field.partition(".")
+        if classes is None:
+            classes = descriptorClasses()
+        if tag not in classes or name not in classes[tag].__slots__:
+            raise ValueError("unknown field " + field)
+    return fields
+
+
+def descriptorFields(fields):
+    """Return dictionary with the sets of projected descriptor properties by
+    descriptor tag, or None if fields is None (all properties)
+    """
+    if fields is None:
+        return None
+    properties = {}
+    for field in fields:
+        tag, dot, name = field.partition(".")
+        if dot:
+            properties.setdefault(tag, set()).add(name)
+    return properties
+
+
+def projectResult(result, fields):
+    """Return copy of ImageResult result with only the fields in projection
+    fields (all other properties are None, so they are not reported)
+    """
+    sections = {section: {} for section in sectionClasses}
+    sectorOffset = None
+    for field in fields:
+        section = imageFields.get(field, "")
+        if section is None:
+            sectorOffset = result.sectorOffset
+        elif section:
+            sections[section][field] = getattr(getattr(result, section), field)
+
+    fileSystems = None
+    properties = descriptorFields(fields)
+    if "fileSystems" in fields or properties:
+        fileSystems = []
+        for fileSystem in result.fileSystems:
+            descriptors = [type(descriptor)(**{name: getattr(descriptor, name)
+                                               for name in properties[descriptor.tag]})
+                           for descriptor in fileSystem.descriptors
+                           if descriptor.tag in properties]
+            fileSystems.append(model.FileSystem(fileSystem.type, descriptors))
+
+    records = {section: sectionClasses[section](**values) if values else None
+               for section, values in sections.items()}
+    return model.ImageResult(records["fileInfo"], records["statusInfo"], sectorOffset,
+                             records["tests"], fileSystems)
+
+
+def fieldValue(result, field):
+    """Return value of field in ImageResult result as CSV column value (an
+    empty string if the result does not have it)
+    """
+    if field == "fileSystems":
+        return ";".join(fileSystem.type for fileSystem in result.fileSystems or [])
+    tag, dot, name = field.partition(".")
+    if dot:
+        for fileSystem in result.fileSystems or []:
+            for descriptor in fileSystem.descriptors:
+                if descriptor.tag == tag:
+                    value = getattr(descriptor, name)
+                    return "" if value is None else value
+        return ""
+    section = imageFields[field]
+    record = result if section is None else getattr(result, section)
+    value = None if record is None else getattr(record, field)
+    return "" if value is None else value
+
+
+def isAnomaly(result):
+    """Return True if the analysis of the image failed, if it contains no
+    known file system, or if it is smaller than expected
+    """
+    return not result.statusInfo.success or not result.tests.containsKnownFileSystem or \
+        bool(result.tests.smallerThanExpected)
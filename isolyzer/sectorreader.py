@@ -0,0 +1,357 @@
+#! /usr/bin/env python3
+"""Sector readers that provide random access to the contents of an image
+
+All I/O on an image goes through a SectorReader. A reader is opened
+explicitly (which takes one fstat of the image), serves reads of arbitrary
+byte ranges, and is closed explicitly. Reads past the end of the image
+return a short (possibly empty) result, just like slicing a bytes object.
+Readers keep count of the number of read calls and the number of bytes read.
+If a budget (see the budgets module) is set as the budget of a reader, it is
+checked before each read from the image, so that the analysis of an image
+stops as soon as it runs out of time or sectors.
+"""
+
+import os
+import sys
+import mmap
+import stat as st
+
+
+# Size of the sectors that are cached by prefetchSectors
+SECTOR_SIZE = 2048
+
+# Maximum number of cached sectors
+MAX_CACHED_SECTORS = 256
+
+# Logical block size that DeviceReader assumes if it cannot be queried
+# (e.g. for regular files)
+DEFAULT_BLOCK_SIZE = 512
+
+# Block device ioctls on Linux (see linux/fs.h)
+BLKSSZGET = 0x1268
+BLKPBSZGET = 0x127b
+BLKGETSIZE64 = 0x80081272
+
+
+class SectorReader:
+    """Base class for sector readers"""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.fd = None
+        self.stat = None
+        self.size = 0
+        # Number of read calls and bytes read
+        self.reads = 0
+        self.bytesRead = 0
+        # Budget that is checked before each read from the image (if any)
+        self.budget = None
+        # Sectors read by prefetchSectors, by sector number
+        self.sectorCache = {}
+        # Sectors read by readSectors, as one block, and its byte offset
+        self.window = b''
+        self.windowOffset = 0
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def open(self, stat=None):
+        """Open image, and return its stat result. If the stat result is
+        already known (e.g. from a directory scan) it can be passed as stat,
+        which saves the fstat call
+        """
+        self.fd = os.open(self.filename, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+        if stat is None:
+            try:
+                stat = os.fstat(self.fd)
+            except OSError:
+                self.close()
+                raise
+        self.stat = stat
+        self.size = stat.st_size
+        return stat
+
+    def close(self):
+        """Close image and discard cached sectors"""
+        self.sectorCache = {}
+        self.window = b''
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def checkOpen(self):
+        """Raise IOError if reader is not open"""
+        if self.fd is None:
+            raise IOError("cannot read from closed image " + self.filename)
+
+    def checkBudget(self):
+        """Raise budgets.BudgetExceeded if the reader has a budget, and it
+        is exceeded
+        """
+        if self.budget is not None:
+            self.budget.check()
+
+    def readRaw(self, offset, length):
+        """Read length bytes from offset; to be implemented by subclasses"""
+        raise NotImplementedError
+
+    def readRawSectors(self, firstSector, count):
+        """Read count sectors starting at firstSector, and return list of
+        sectors (the last one may be short at the end of the image)
+        """
+        data = self.readRaw(firstSector * SECTOR_SIZE, count * SECTOR_SIZE)
+        return [data[i:i + SECTOR_SIZE] for i in range(0, len(data), SECTOR_SIZE)]
+
+    def read(self, offset, length):
+        """Read length bytes from byte offset, and return result as bytes-like
+        object. The result is shorter than length if the end of the image is
+        reached
+        """
+        self.checkOpen()
+
+        if offset < 0 or offset >= self.size or length <= 0:
+            return b''
+        length = min(length, self.size - offset)
+
+        # Serve from window or sector cache if possible
+        start = offset - self.windowOffset
+        if start >= 0 and start + length <= len(self.window):
+            return self.window[start:start + length]
+        if self.sectorCache:
+            firstSector, startInSector = divmod(offset, SECTOR_SIZE)
+            lastSector = (offset + length - 1) // SECTOR_SIZE
+            sectors = [self.sectorCache.get(sector) for sector in range(firstSector, lastSector + 1)]
+            if None not in sectors:
+                if len(sectors) == 1:
+                    sector = sectors[0]
+                    if startInSector == 0 and length == len(sector):
+                        return sector
+                    return sector[startInSector:startInSector + length]
+                return b''.join(sectors)[startInSector:startInSector + length]
+
+        self.checkBudget()
+        return self.readRaw(offset, length)
+
+    def prefetchSectors(self, firstSector, count):
+        """Read count sectors starting at firstSector in as few calls as
+        possible, and keep them in the sector cache so that subsequent reads
+        within these sectors do not touch the image again
+        """
+        self.checkOpen()
+
+        # Limit to sectors that are not cached yet and exist in the image
+        lastSector = min(firstSector + count, -(-self.size // SECTOR_SIZE))
+        while firstSector < lastSector and firstSector in self.sectorCache:
+            firstSector += 1
+        if firstSector >= lastSector:
+            return
+
+        if len(self.sectorCache) + lastSector - firstSector > MAX_CACHED_SECTORS:
+            self.sectorCache = {}
+
+        self.checkBudget()
+        for sector, data in enumerate(self.readRawSectors(firstSector, lastSector - firstSector),
+                                      firstSector):
+            self.sectorCache[sector] = data
+
+
+    def readSectors(self, firstSector, count):
+        """Read count sectors starting at firstSector with one call, and
+        return them as one bytes-like object (which is shorter at the end of
+        the image). The sectors are kept as the reader's window (which
+        replaces the previous one), so that subsequent reads within these
+        sectors do not touch the image again
+        """
+        self.checkOpen()
+        count = min(count, -(-self.size // SECTOR_SIZE) - firstSector)
+        if count <= 0:
+            return b''
+        self.checkBudget()
+        self.window = self.readRaw(firstSector * SECTOR_SIZE, count * SECTOR_SIZE)
+        self.windowOffset = firstSector * SECTOR_SIZE
+        return self.window
+
+
+class PReadReader(SectorReader):
+    """Sector reader that uses positional reads (os.pread), and os.preadv
+    to read several sectors in one call. Kernel readahead is disabled where
+    possible, so only the requested bytes are fetched from (network) storage
+    """
+
+    def open(self, stat=None):
+        """Open image, and return its stat result"""
+        stat = SectorReader.open(self, stat)
+        if hasattr(os, 'posix_fadvise'):
+            try:
+                os.posix_fadvise(self.fd, 0, 0, os.POSIX_FADV_RANDOM)
+            except OSError:
+                pass
+        return stat
+
+    def readRaw(self, offset, length):
+        """Read length bytes from offset"""
+        self.reads += 1
+        if hasattr(os, 'pread'):
+            data = os.pread(self.fd, length, offset)
+        else:
+            # No positional reads on this platform (e.g. Windows)
+            os.lseek(self.fd, offset, os.SEEK_SET)
+            data = os.read(self.fd, length)
+        self.bytesRead += len(data)
+        return data
+
+    def readRawSectors(self, firstSector, count):
+        """Read count sectors starting at firstSector with one os.preadv call,
+        and return list of sectors
+        """
+        if not hasattr(os, 'preadv'):
+            return SectorReader.readRawSectors(self, firstSector, count)
+
+        buffers = [bytearray(SECTOR_SIZE) for _ in range(count)]
+        self.reads += 1
+        noBytes = os.preadv(self.fd, buffers, firstSector * SECTOR_SIZE)
+        self.bytesRead += noBytes
+
+        # Drop (parts of) buffers beyond end of image
+        noFull, remainder = divmod(noBytes, SECTOR_SIZE)
+        sectors = buffers[:noFull]
+        if remainder:
+            sectors.append(buffers[noFull][:remainder])
+        return sectors
+
+
+class MMapReader(SectorReader):
+    """Sector reader that maps the image to memory. The mapping is advised
+    for random access (MADV_RANDOM) where supported, which limits the amount
+    of data that page faults pull in
+    """
+
+    def __init__(self, filename):
+        SectorReader.__init__(self, filename)
+        self.map = None
+
+    def open(self, stat=None):
+        """Open and map image, and return its stat result"""
+        stat = SectorReader.open(self, stat)
+        try:
+            if sys.platform == "win32":
+                self.map = mmap.mmap(self.fd, 0, access=mmap.ACCESS_READ)
+            else:
+                self.map = mmap.mmap(self.fd, 0, mmap.MAP_SHARED, mmap.PROT_READ)
+            if hasattr(self.map, 'madvise') and hasattr(mmap, 'MADV_RANDOM'):
+                self.map.madvise(mmap.MADV_RANDOM)
+        except ValueError:
+            # mmap fails on empty files
+            self.map = None
+        return stat
+
+    def close(self):
+        """Unmap and close image"""
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        SectorReader.close(self)
+
+    def readRaw(self, offset, length):
+        """Read length bytes from offset"""
+        self.reads += 1
+        if self.map is None:
+            return b''
+        data = self.map[offset:offset + length]
+        self.bytesRead += len(data)
+        return data
+
+
+def ioctlValue(fd, request, fmt):
+    """Return value (unpacked with struct format fmt) returned by ioctl
+    request on fd, or None if the request is not supported
+    """
+    if not sys.platform.startswith("linux"):
+        return None
+    import fcntl
+    import struct
+    try:
+        return struct.unpack(fmt, fcntl.ioctl(fd, request, bytes(struct.calcsize(fmt))))[0]
+    except OSError:
+        return None
+
+
+def deviceGeometry(fd):
+    """Return (size, logicalBlockSize, physicalBlockSize) tuple of the block
+    device (or file) open as fd. Block sizes that cannot be queried are None
+    """
+    size = ioctlValue(fd, BLKGETSIZE64, "Q")
+    if size is None:
+        # Works for block devices on all platforms, and for regular files
+        size = os.lseek(fd, 0, os.SEEK_END)
+    return size, ioctlValue(fd, BLKSSZGET, "i"), ioctlValue(fd, BLKPBSZGET, "I")
+
+
+class DeviceReader(PReadReader):
+    """Sector reader for block devices (e.g. optical drives, loop devices or
+    LVM volumes), whose size is not reported by stat. The size and block
+    sizes are queried from the device, and all reads are aligned to its
+    logical block size. Regular files are read in the same way, with a
+    logical block size of blockSize
+    """
+
+    def __init__(self, filename, blockSize=DEFAULT_BLOCK_SIZE):
+        PReadReader.__init__(self, filename)
+        self.defaultBlockSize = blockSize
+        self.isDevice = False
+        self.blockSize = blockSize
+        self.physicalBlockSize = blockSize
+
+    def open(self, stat=None):
+        """Open device, query its geometry, and return its stat result"""
+        stat = PReadReader.open(self, stat)
+        self.isDevice = st.S_ISBLK(stat.st_mode)
+        try:
+            self.size, logicalBlockSize, physicalBlockSize = deviceGeometry(self.fd)
+        except OSError:
+            self.close()
+            raise
+        self.blockSize = logicalBlockSize or self.defaultBlockSize
+        self.physicalBlockSize = physicalBlockSize or self.blockSize
+        return stat
+
+    def readRaw(self, offset, length):
+        """Read length bytes from offset, with a read of whole logical blocks"""
+        start = offset - offset % self.blockSize
+        end = -(-(offset + length) // self.blockSize) * self.blockSize
+        data = PReadReader.readRaw(self, start, end - start)
+        if start == offset and len(data) <= length:
+            return data
+        return data[offset - start:offset - start + length]
+
+    def readRawSectors(self, firstSector, count):
+        """Read count sectors starting at firstSector, and return list of
+        sectors
+        """
+        if SECTOR_SIZE % self.blockSize == 0:
+            return PReadReader.readRawSectors(self, firstSector, count)
+        # Sectors are smaller than the logical blocks (e.g. 4096 byte blocks)
+        return SectorReader.readRawSectors(self, firstSector, count)
+
+
+# Reader classes by name
+readerClasses = {
+    "pread": PReadReader,
+    "mmap": MMapReader,
+    "device": DeviceReader
+}
+
+
+def readerName(readerClass):
+    """Return name of readerClass, or of the nearest of its base classes
+    that has a name (or the name of the class itself if none has)
+    """
+    for baseClass in readerClass.__mro__:
+        for name, namedClass in readerClasses.items():
+            if namedClass is baseClass:
+                return name
+    return readerClass.__name__
@@ -0,0 +1,504 @@
+#! /usr/bin/env python3
+"""Server mode: keep isolyzer running as a local service
+
+The server speaks HTTP over a Unix domain socket, or over TCP on localhost,
+and analyses images in a pool of worker processes that is started once and
+kept warm between requests. Endpoints:
+
+- POST /analyze: body is a JSON object with "paths" (list of absolute
+  paths), and optionally "offset" (sector offset, default 0), "format"
+  (xml, json, jsonl or csv, default xml) and "checksums" (list of checksum
+  algorithm names). The response is the report in the requested format, with
+  the images in the same order as paths.
+- GET /status: JSON object with the version, pool size, queue limit and
+  request counters.
+
+At most queueLimit analysis requests are admitted at the same time; the
+server answers further requests with 503 (Service Unavailable) and a
+Retry-After header, so clients back off instead of piling up. On SIGTERM or
+SIGINT the server stops accepting connections, finishes the requests that
+are in progress, and then shuts down the worker pool.
+
+Usage: isolyzer serve (--socket PATH | --port PORT) [--jobs N] [--queue-limit N]
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import stat
+import signal
+import socket
+import codecs
+import argparse
+import threading
+import socketserver
+import http.server
+import concurrent.futures
+import concurrent.futures.process
+from . import isolyzer
+from . import checksum
+from . import model
+from . import writers
+
+
+# Maximum number of analysis requests that are admitted at the same time
+DEFAULT_QUEUE_LIMIT = 64
+
+# Maximum number of paths in one request
+MAX_BATCH_SIZE = 10000
+
+# Maximum size of a request body in bytes
+MAX_BODY_SIZE = 16 * 1024 * 1024
+
+# Connections that are idle for this many seconds are closed
+IDLE_TIMEOUT = 10
+
+# Value of Retry-After header (in seconds) of 503 responses
+RETRY_AFTER = 1
+
+# Content types by output format
+contentTypes = {
+    "xml": "application/xml; charset=utf-8",
+    "json": "application/json; charset=utf-8",
+    "jsonl": "application/jsonl; charset=utf-8",
+    "csv": "text/csv; charset=utf-8"
+}
+
+
+def ignoreInterrupts():
+    """Initializer of worker processes: interrupts are handled by the server
+    process, which shuts the pool down in an orderly way
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def parseRequest(request):
+    """Validate analysis request (a dictionary decoded from JSON), and return
+    (paths, offset, outputFormat, checksums) tuple. Raises ValueError for
+    invalid requests
+    """
+    if not isinstance(request, dict):
+        raise ValueError("request must be a JSON object")
+    paths = request.get("paths")
+    if not isinstance(paths, list) or not all(isinstance(path, str) for path in paths):
+        raise ValueError("paths must be a list of strings")
+    if len(paths) > MAX_BATCH_SIZE:
+        raise ValueError("too many paths (maximum is %d)" % MAX_BATCH_SIZE)
+    if not all(os.path.isabs(path) for path in paths):
+        # Relative paths would be resolved against the server's working
+        # directory, which is most likely not what the client meant
+        raise ValueError("paths must be absolute")
+    offset = request.get("offset", 0)
+    if not isinstance(offset, int) or isinstance(offset, bool):
+        raise ValueError("offset must be an integer")
+    outputFormat = request.get("format", "xml")
+    if outputFormat not in writers.writerClasses:
+        raise ValueError("unsupported format " + str(outputFormat))
+    checksums = request.get("checksums")
+    if checksums is not None:
+        if not isinstance(checksums, list) or \
+                not all(isinstance(name, str) for name in checksums):
+            raise ValueError("checksums must be a list of strings")
+        checksums = checksum.parseAlgorithms(",".join(checksums)) or None
+    return paths, offset, outputFormat, checksums
+
+
+class AnalysisService:
+    """Analyses batches of images in a persistent pool of jobs worker
+    processes, and keeps track of admitted requests. At most queueLimit
+    requests are admitted at the same time
+    """
+
+    def __init__(self, jobs, queueLimit=DEFAULT_QUEUE_LIMIT, verbose=False):
+        if jobs < 1:
+            raise ValueError("number of jobs must be 1 or more")
+        if queueLimit < 1:
+            raise ValueError("queue limit must be 1 or more")
+        self.jobs = jobs
+        self.queueLimit = queueLimit
+        self.verbose = verbose
+        self.draining = False
+        self.lock = threading.Lock()
+        self.active = 0
+        self.requests = 0
+        self.rejected = 0
+        self.images = 0
+        self.startTime = time.time()
+        self.executor = self.startPool()
+
+    def startPool(self):
+        """Start worker pool, and wait until all workers are running"""
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.jobs,
+                                                          initializer=ignoreInterrupts)
+        # Workers are started on demand; submitting one task per worker
+        # starts all of them, so the first request does not pay for it
+        warmUp = [executor.submit(os.getpid) for _ in range(self.jobs)]
+        concurrent.futures.wait(warmUp)
+        return executor
+
+    def admit(self):
+        """Admit a request if the queue limit allows it, and return True if
+        it was admitted. Each admitted request must be released with release()
+        """
+        with self.lock:
+            if self.draining or self.active >= self.queueLimit:
+                self.rejected += 1
+                return False
+            self.active += 1
+            self.requests += 1
+            return True
+
+    def release(self):
+        """Release admitted request"""
+        with self.lock:
+            self.active -= 1
+
+    def status(self):
+        """Return dictionary with server status"""
+        with self.lock:
+            return {"version": isolyzer.__version__,
+                    "jobs": self.jobs,
+                    "queueLimit": self.queueLimit,
+                    "active": self.active,
+                    "requests": self.requests,
+                    "rejected": self.rejected,
+                    "images": self.images,
+                    "draining": self.draining,
+                    "uptime": round(time.time() - self.startTime, 3)}
+
+    def analyse(self, paths, offset=0, outputFormat="xml", checksums=None):
+        """Analyse images at paths, and return report in outputFormat as
+        UTF-8 encoded bytes. Raises FileNotFoundError if an image does not
+        exist
+        """
+        for path in paths:
+            isolyzer.checkFileExists(path)
+
+        stream = io.BytesIO()
+        writer = writers.writerClasses[outputFormat](codecs.getwriter("UTF-8")(stream))
+        isolyzer.startReport(writer)
+
+        options = model.AnalysisOptions(checksums=checksums)
+        executor = self.executor
+        futures = []
+        try:
+            for path in paths:
+                futures.append(executor.submit(isolyzer.processImage, path, offset,
+                                               options=options))
+            for future in futures:
+                writer.writeImage(future.result())
+        except concurrent.futures.process.BrokenProcessPool:
+            # A worker died (e.g. it was killed); replace the pool, so
+            # that later requests can be served again
+            self.restartPool(executor)
+            raise
+        finally:
+            for future in futures:
+                future.cancel()
+        writer.end()
+
+        with self.lock:
+            self.images += len(paths)
+        return stream.getvalue()
+
+    def restartPool(self, brokenExecutor):
+        """Replace brokenExecutor with a new pool, unless another request
+        already did so
+        """
+        executor = self.startPool()
+        with self.lock:
+            if self.executor is brokenExecutor:
+                self.executor, executor = executor, brokenExecutor
+        executor.shutdown(wait=False)
+
+    def close(self):
+        """Shut down worker pool"""
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+
+
+class RequestHandler(http.server.BaseHTTPRequestHandler):
+    """Handler for requests to the analysis service"""
+
+    protocol_version = "HTTP/1.1"
+    server_version = "isolyzer/" + isolyzer.__version__
+    timeout = IDLE_TIMEOUT
+
+    def setup(self):
+        http.server.BaseHTTPRequestHandler.setup(self)
+        # True while a request is read and handled, False while waiting
+        # for the next request
+        self.busy = False
+        self.server.trackConnection(self, True)
+
+    def finish(self):
+        self.server.trackConnection(self, False)
+        http.server.BaseHTTPRequestHandler.finish(self)
+
+    def handle_one_request(self):
+        self.busy = False
+        if self.server.service.draining:
+            self.close_connection = True
+            return
+        http.server.BaseHTTPRequestHandler.handle_one_request(self)
+
+    def parse_request(self):
+        self.busy = True
+        return http.server.BaseHTTPRequestHandler.parse_request(self)
+
+    def address_string(self):
+        # Clients of a Unix domain socket have no address
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        return "local"
+
+    def log_message(self, format, *args):
+        # pylint: disable=redefined-builtin
+        if self.server.service.verbose:
+            http.server.BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def sendBody(self, code, body, contentType, headers=()):
+        """Send response with status code and body (bytes)"""
+        self.send_response(code)
+        self.send_header("Content-Type", contentType)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        if self.server.service.draining:
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        self.end_headers()
+        self.wfile.write(body)
+
+    def sendJSON(self, code, value, headers=()):
+        """Send response with status code and value as JSON body"""
+        self.sendBody(code, json.dumps(value).encode("utf-8") + b"\n",
+                      contentTypes["json"], headers)
+
+    def sendError(self, code, message, headers=()):
+        """Send error response with JSON body"""
+        self.sendJSON(code, {"error": message}, headers)
+
+    def do_GET(self):
+        # pylint: disable=invalid-name
+        if self.path == "/status":
+            self.sendJSON(200, self.server.service.status())
+        else:
+            self.sendError(404, "unknown endpoint " + self.path)
+
+    def do_POST(self):
+        # pylint: disable=invalid-name
+        if self.path != "/analyze":
+            self.sendError(404, "unknown endpoint " + self.path)
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", ""))
+        except ValueError:
+            self.sendError(411, "Content-Length required")
+            return
+        if length < 0 or length > MAX_BODY_SIZE:
+            self.close_connection = True
+            self.sendError(413, "request body too large")
+            return
+        body = self.rfile.read(length)
+
+        try:
+            paths, offset, outputFormat, checksums = parseRequest(json.loads(body))
+        except ValueError as ex:
+            self.sendError(400, str(ex))
+            return
+
+        service = self.server.service
+        if not service.admit():
+            self.sendError(503, "server busy" if not service.draining else "server shutting down",
+                           [("Retry-After", str(RETRY_AFTER))])
+            return
+        try:
+            report = service.analyse(paths, offset, outputFormat, checksums)
+        except FileNotFoundError as ex:
+            self.sendError(404, str(ex))
+        except Exception as ex:  # pylint: disable=broad-except
+            self.sendError(500, "analysis failed: %s: %s" % (type(ex).__name__, ex))
+        else:
+            self.sendBody(200, report, contentTypes[outputFormat])
+        finally:
+            service.release()
+
+
+class GracefulMixIn(socketserver.ThreadingMixIn):
+    """Mix-in for servers that handle each connection in its own thread, and
+    keep track of connections. Request threads are joined on server_close(),
+    so requests in progress are finished on shutdown
+    """
+    daemon_threads = False
+    block_on_close = True
+
+    def trackConnection(self, handler, isOpen):
+        """Add handler to (or remove it from) set of open connections"""
+        with self.connectionsLock:
+            if isOpen:
+                self.connections.add(handler)
+            else:
+                self.connections.discard(handler)
+
+    def closeIdleConnections(self):
+        """Close connections that are waiting for their next request, so
+        that keep-alive clients do not hold up shutdown
+        """
+        with self.connectionsLock:
+            idle = [handler for handler in self.connections if not handler.busy]
+        for handler in idle:
+            try:
+                handler.connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+class TCPServer(GracefulMixIn, http.server.HTTPServer):
+    """Threaded HTTP server on a TCP socket of localhost"""
+
+
+if hasattr(socket, "AF_UNIX"):
+    class UnixServer(GracefulMixIn, socketserver.UnixStreamServer):
+        """Threaded HTTP server on a Unix domain socket"""
+
+        def server_bind(self):
+            socketserver.UnixStreamServer.server_bind(self)
+            # Only the owner and group of the server may connect
+            os.chmod(self.server_address, 0o660)
+            self.server_name = "localhost"
+            self.server_port = 0
+else:
+    UnixServer = None
+
+
+def removeStaleSocket(path):
+    """Remove socket file at path if no server is listening on it. Raises
+    OSError if path is in use, or is not a socket
+    """
+    try:
+        mode = os.stat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise OSError("%s exists and is not a socket" % path)
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except ConnectionRefusedError:
+        os.unlink(path)
+        return
+    finally:
+        probe.close()
+    raise OSError("%s is in use by another server" % path)
+
+
+def createServer(service, socketPath=None, port=None):
+    """Create server for service on Unix domain socket socketPath, or on TCP
+    port port of localhost (0 selects a free port)
+    """
+    if socketPath is not None:
+        if UnixServer is None:
+            raise OSError("Unix domain sockets are not supported on this platform")
+        removeStaleSocket(socketPath)
+        server = UnixServer(socketPath, RequestHandler)
+    else:
+        server = TCPServer(("127.0.0.1", port), RequestHandler)
+    server.service = service
+    server.connections = set()
+    server.connectionsLock = threading.Lock()
+    return server
+
+
+def shutdown(server, service, socketPath=None):
+    """Shut down server gracefully: stop accepting requests, finish requests
+    in progress, and shut down the worker pool of service
+    """
+    service.draining = True
+    server.shutdown()
+    server.closeIdleConnections()
+    server.server_close()
+    service.close()
+    if socketPath is not None and os.path.exists(socketPath):
+        os.unlink(socketPath)
+
+
+def parseCommandLine(parser, argv):
+    """Parse server arguments argv with argparse.ArgumentParser parser"""
+    address = parser.add_mutually_exclusive_group(required=True)
+    address.add_argument('--socket', '-s',
+                         type=str,
+                         help="listen on this Unix domain socket",
+                         action='store',
+                         dest='socketPath')
+    address.add_argument('--port', '-p',
+                         type=int,
+                         help="listen on this TCP port of localhost",
+                         action='store',
+                         dest='port')
+    parser.add_argument('--jobs', '-j',
+                        type=int,
+                        help="number of worker processes (default: number of CPUs)",
+                        action='store',
+                        dest='jobs',
+                        default=os.cpu_count() or 1)
+    parser.add_argument('--queue-limit',
+                        type=int,
+                        help="maximum number of analysis requests that are handled at \
+                        the same time; further requests are refused with 503 \
+                        (default: %d)" % DEFAULT_QUEUE_LIMIT,
+                        action='store',
+                        dest='queueLimit',
+                        default=DEFAULT_QUEUE_LIMIT)
+    parser.add_argument('--verbose',
+                        help="log requests to stderr",
+                        action='store_true',
+                        dest='verbose')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Run server until it receives SIGTERM or SIGINT"""
+    parser = argparse.ArgumentParser(
+        prog="isolyzer serve",
+        description="Serve isolyzer analyses over a Unix domain socket or localhost HTTP")
+    args = parseCommandLine(parser, argv)
+
+    try:
+        service = AnalysisService(args.jobs, args.queueLimit, args.verbose)
+    except ValueError as ex:
+        isolyzer.errorExit(str(ex))
+    try:
+        server = createServer(service, args.socketPath, args.port)
+    except OSError as ex:
+        service.close()
+        isolyzer.errorExit(str(ex))
+
+    stopEvent = threading.Event()
+    for signalNumber in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signalNumber, lambda *_: stopEvent.set())
+
+    thread = threading.Thread(target=server.serve_forever, name="isolyzer-server")
+    thread.start()
+    if args.socketPath is not None:
+        address = args.socketPath
+    else:
+        address = "http://127.0.0.1:%d" % server.server_address[1]
+    sys.stderr.write("isolyzer %s serving on %s with %d workers\n" %
+                     (isolyzer.__version__, address, args.jobs))
+    sys.stderr.flush()
+
+    # Wait with a timeout, so signals are handled on all platforms
+    while not stopEvent.wait(0.5):
+        pass
+
+    sys.stderr.write("isolyzer server shutting down\n")
+    shutdown(server, service, args.socketPath)
+    thread.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+#! /usr/bin/env python3
+"""Decoding of text fields in descriptors
+
+Text is decoded into strings that can be written to XML as-is: control
+characters (Unicode category C, except tab, newline and carriage return)
+are removed with a translate table instead of a per-character category
+lookup. Entries of the table for ASCII and Latin-1 characters are
+precomputed; other characters are looked up once, on first use.
+
+Supported encodings:
+
+- decodeText: UTF-8 (ISO 9660 / High Sierra a- and d-characters, Apple
+  names and other ASCII-based identifiers)
+- cs0ToText, dstringToText: OSTA Compressed Unicode (CS0) as used by UDF,
+  with 8-bit and 16-bit compression IDs
+- ucs2ToText: big-endian UCS-2 as used by Joliet
+
+Identifier fields often have the same contents across images (or are
+empty), so the decoders memoise their results in a bounded LRU cache.
+isACharacters and isDCharacters validate ISO 9660 a- and d-characters (see
+iso9660.nonConformingIdentifiers).
+"""
+
+import functools
+import unicodedata
+
+
+# Maximum number of decoded byte strings kept per decoder
+IDENTIFIER_CACHE_SIZE = 1024
+
+# Control characters that are allowed in XML
+ALLOWED_CONTROL_CHARACTERS = "\t\n\r"
+
+# ISO 9660 d-characters and a-characters (ECMA-119, section 7.4)
+D_CHARACTERS = b"0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_"
+A_CHARACTERS = D_CHARACTERS + b" !\"%&'()*+,-./:;<=>?"
+
+
+class ControlCharacterTable(dict):
+    """Translate table for str.translate that deletes control characters,
+    and maps all other characters to themselves. Characters that are not in
+    the table yet are classified on first use
+    """
+
+    def __init__(self):
+        dict.__init__(self)
+        for ordinal in range(256):
+            self.classify(ordinal)
+
+    def classify(self, ordinal):
+        """Add entry for character ordinal to table, and return it"""
+        character = chr(ordinal)
+        if unicodedata.category(character)[0] == "C" and \
+                character not in ALLOWED_CONTROL_CHARACTERS:
+            self[ordinal] = None
+        else:
+            self[ordinal] = ordinal
+        return self[ordinal]
+
+    def __missing__(self, ordinal):
+        return self.classify(ordinal)
+
+
+controlCharacterTable = ControlCharacterTable()
+
+
+def removeControlCharacters(string):
+    """Remove control characters from string"""
+    return string.translate(controlCharacterTable)
+
+
+@functools.lru_cache(maxsize=IDENTIFIER_CACHE_SIZE)
+def _decodeText(bytesData):
+    return bytesData.decode("utf-8", "ignore").translate(controlCharacterTable).strip()
+
+
+def decodeText(bytesData):
+    """Decode UTF-8 text field, and remove control characters and leading
+    and trailing white space
+    """
+    return _decodeText(bytes(bytesData))
+
+
+@functools.lru_cache(maxsize=IDENTIFIER_CACHE_SIZE)
+def _ucs2ToText(bytesData):
+    # An odd trailing byte cannot be decoded; unpaired surrogates (which
+    # are not valid UCS-2) are ignored
+    bytesData = bytesData[:len(bytesData) & ~1]
+    return bytesData.decode("utf-16-be", "ignore").translate(controlCharacterTable).strip()
+
+
+def ucs2ToText(bytesData):
+    """Decode big-endian UCS-2 text field (Joliet), and remove control
+    characters and leading and trailing white space
+    """
+    return _ucs2ToText(bytes(bytesData))
+
+
+@functools.lru_cache(maxsize=IDENTIFIER_CACHE_SIZE)
+def _cs0ToText(bytesData):
+    if not bytesData:
+        return ""
+    compressionID = bytesData[0]
+    if compressionID in (8, 254):
+        # One byte per character (the first 256 Unicode code points)
+        text = bytesData[1:].decode("latin-1")
+    elif compressionID in (16, 255):
+        return _ucs2ToText(bytesData[1:])
+    else:
+        # Compression IDs other than the above are not defined
+        return ""
+    return text.translate(controlCharacterTable).strip()
+
+
+def cs0ToText(bytesData):
+    """Decode OSTA CS0 characters (a compression ID byte followed by the
+    characters), and remove control characters and leading and trailing
+    white space. Compression IDs 8 and 254 use 8 bits per character, 16 and
+    255 use 16 bits per character (big-endian). Other compression IDs
+    result in an empty string
+    """
+    return _cs0ToText(bytes(bytesData))
+
+
+def dstringToText(bytesData):
+    """Decode fixed-length OSTA CS0 dstring field, whose last byte is the
+    number of bytes used (including the compression ID)
+    """
+    bytesData = bytes(bytesData)
+    if not bytesData:
+        return ""
+    length = min(bytesData[-1], len(bytesData) - 1)
+    return _cs0ToText(bytesData[:length])
+
+
+def isDCharacters(bytesData):
+    """Return True if bytesData only contains ISO 9660 d-characters, not
+    counting trailing spaces (which are used as padding)
+    """
+    return not bytes(bytesData).rstrip(b" ").translate(None, D_CHARACTERS)
+
+
+def isACharacters(bytesData):
+    """Return True if bytesData only contains ISO 9660 a-characters"""
+    return not bytes(bytesData).translate(None, A_CHARACTERS)
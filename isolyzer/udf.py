@@ -1,27 +1,33 @@
 #! /usr/bin/env python3
 """Parser functions for the UDF file system"""
 
-import xml.etree.ElementTree as ET
+import bisect
+import struct
+from collections import deque, OrderedDict
+from . import budgets
 from . import byteconv as bc
-from . import shared as shared
+from . import detect
+from . import layout
+from . import model
+from . import textconv
 
 
-def getExtendedVolumeDescriptor(bytesData, byteStart):
+def getExtendedVolumeDescriptor(reader, byteStart):
 
-    """Read one 2048-byte extended (UDF only) volume descriptor and return its descriptor
-    code and contents
+    """Read one 2048-byte extended (UDF only) volume descriptor from sector reader
+    and return its descriptor code and contents
     """
     byteEnd = byteStart + 2048
-    volumeDescriptorIdentifier = bc.bytesToText(bytesData[byteStart+1:byteStart+6])
-    volumeDescriptorData = bytesData[byteStart:byteEnd]
+    volumeDescriptorData = reader.read(byteStart, 2048)
+    volumeDescriptorIdentifier = bc.bytesToText(volumeDescriptorData[1:6])
 
     return(volumeDescriptorIdentifier, volumeDescriptorData, byteEnd)
 
 
-def getVolumeDescriptor(bytesData, byteStart):
-    """Return Volume Descriptor data from defined byte offset"""
+def getVolumeDescriptor(reader, byteStart):
+    """Read Volume Descriptor data from sector reader at defined byte offset"""
     byteEnd = byteStart + 2048
-    volumeDescriptorData = bytesData[byteStart:byteEnd]
+    volumeDescriptorData = reader.read(byteStart, 2048)
 
     # Descriptor tag
     descriptorTag = volumeDescriptorData[0:16]
@@ -31,114 +37,641 @@ def getVolumeDescriptor(bytesData, byteStart):
     return(tagIdentifier, volumeDescriptorData, byteEnd)
 
 
-def parseLogicalVolumeDescriptor(bytesData):
-
-    """Parse Logical Volume Descriptor and return extracted properties"""
-
-    # Set up elemement object to store extracted properties
-    properties = ET.Element("logicalVolumeDescriptor")
-    shared.addProperty(properties, "tagIdentifier",
-                       bc.bytesToUShortIntL(bytesData[0:2]))
-    shared.addProperty(properties, "descriptorVersion",
-                       bc.bytesToUShortIntL(bytesData[2:4]))
-    shared.addProperty(properties, "tagSerialNumber",
-                       bc.bytesToUShortIntL(bytesData[6:8]))
-    shared.addProperty(properties, "volumeSequenceNumber",
-                       bc.bytesToUIntL(bytesData[16:20]))
-    # TODO: really don't know how to interpret descriptorCharacterSet, report as
-    # binhex for now
-    # shared.addProperty(properties, "descriptorCharacterSet", bc.bytesToHex(bytesData[64:84]))
-    # TODO: is bytesToText encoding-safe here? Don't really understand this OSTA compressed
-    # Unicode at all!
-    # shared.addProperty(properties, "compressionID", bc.bytesToUnsignedCharL(bytesData[84:85]))
-    # Below line works for UTF-8
-    shared.addProperty(properties, "logicalVolumeIdentifier",
-                       bc.bytesToText(bytesData[85:212]))
-    shared.addProperty(properties, "logicalBlockSize",
-                       bc.bytesToUIntL(bytesData[212:216]))
-    shared.addProperty(properties, "domainIdentifier",
-                       bc.bytesToText(bytesData[216:248]))
-    shared.addProperty(properties, "mapTableLength",
-                       bc.bytesToUIntL(bytesData[264:268]))
-    shared.addProperty(properties, "numberOfPartitionMaps",
-                       bc.bytesToUIntL(bytesData[268:272]))
-    shared.addProperty(properties, "implementationIdentifier",
-                       bc.bytesToText(bytesData[272:304]))
-    shared.addProperty(properties, "integritySequenceExtentLength",
-                       bc.bytesToUIntL(bytesData[432:436]))
-    shared.addProperty(properties, "integritySequenceExtentLocation",
-                       bc.bytesToUIntL(bytesData[436:440]))
-    return properties
-
-
-def parseLogicalVolumeIntegrityDescriptor(bytesData):
-
-    """Parse Logical Volume Integrity Descriptor and return extracted properties"""
-
-    # Note: parser based on ECMA TR/71 DVD Read-Only Disk - File System Specifications
-    # Link: https://www.ecma-international.org/publications/techreports/E-TR-071.htm
-    #
-    # This puts constraint that *freeSpaceTable* and *sizeTable* describe one partition only!
-    # Not 100% sure this applies to *all* DVDs (since TR/71 only defines UDF Bridge format!)
-    # If not, make these fields repeatable, iterating over *numberOfPartitions*!
-
-    # Set up elemement object to store extracted properties
-    properties = ET.Element("logicalVolumeIntegrityDescriptor")
-    shared.addProperty(properties, "tagIdentifier",
-                       bc.bytesToUShortIntL(bytesData[0:2]))
-    shared.addProperty(properties, "descriptorVersion",
-                       bc.bytesToUShortIntL(bytesData[2:4]))
-    shared.addProperty(properties, "tagSerialNumber",
-                       bc.bytesToUShortIntL(bytesData[6:8]))
-
-    # Read timestamp fields and reformat to date/time string (ignoring centiseconds ...
-    # microseconds)
-    year = bc.bytesToUShortIntL(bytesData[18:20])
-    month = bc.bytesToUnsignedCharL(bytesData[20:21])
-    day = bc.bytesToUnsignedCharL(bytesData[21:22])
-    hour = bc.bytesToUnsignedCharL(bytesData[22:23])
-    minute = bc.bytesToUnsignedCharL(bytesData[23:24])
-    second = bc.bytesToUnsignedCharL(bytesData[24:25])
+# Year, month, day, hour, minute and second fields of timestamp
+timestampStruct = struct.Struct("<H5B")
+
+
+def timestampToDate(timestamp):
+    """Convert 12-byte timestamp to formatted date-time string (ignoring
+    centiseconds ... microseconds)
+    """
+    if len(timestamp) >= 9:
+        year, month, day, hour, minute, second = timestampStruct.unpack_from(timestamp, 2)
+    else:
+        year = bc.bytesToUShortIntL(timestamp[2:4])
+        month, day, hour, minute, second = [bc.bytesToUnsignedCharL(timestamp[i:i + 1])
+                                            for i in range(4, 9)]
     dateString = "%d/%02d/%02d" % (year, month, day)
     timeString = "%02d:%02d:%02d" % (hour, minute, second)
-    dateTimeString = "%s, %s" % (dateString, timeString)
-    shared.addProperty(properties, "timeStamp", dateTimeString)
-
-    shared.addProperty(properties, "integrityType",
-                       bc.bytesToUIntL(bytesData[28:32]))
-    shared.addProperty(properties, "numberOfPartitions",
-                       bc.bytesToUIntL(bytesData[72:76]))
-    shared.addProperty(properties, "lengthOfImplementationUse",
-                       bc.bytesToUIntL(bytesData[76:80]))
-    shared.addProperty(properties, "freeSpaceTable",
-                       bc.bytesToUIntL(bytesData[80:84]))
-    shared.addProperty(properties, "sizeTable",
-                       bc.bytesToUIntL(bytesData[84:88]))
-
-    return properties
-
-
-def parsePartitionDescriptor(bytesData):
-
-    """Parse Partition Descriptor and return extracted properties"""
-
-    # Set up elemement object to store extracted properties
-    properties = ET.Element("partitionDescriptor")
-    shared.addProperty(properties, "tagIdentifier",
-                       bc.bytesToUShortIntL(bytesData[0:2]))
-    shared.addProperty(properties, "descriptorVersion",
-                       bc.bytesToUShortIntL(bytesData[2:4]))
-    shared.addProperty(properties, "tagSerialNumber",
-                       bc.bytesToUShortIntL(bytesData[6:8]))
-    shared.addProperty(properties, "volumeDescriptorSequenceNumber",
-                       bc.bytesToUIntL(bytesData[16:20]))
-    shared.addProperty(properties, "partitionNumber",
-                       bc.bytesToUShortIntL(bytesData[22:24]))
-    shared.addProperty(properties, "accessType",
-                       bc.bytesToUIntL(bytesData[184:188]))
-    shared.addProperty(properties, "partitionStartingLocation",
-                       bc.bytesToUIntL(bytesData[188:192]))
-    shared.addProperty(properties, "partitionLength",
-                       bc.bytesToUIntL(bytesData[192:196]))
-
-    return properties
+    return "%s, %s" % (dateString, timeString)
+
+# Layout of the Logical Volume Descriptor
+logicalVolumeDescriptorLayout = layout.Layout("<", [
+    ("tagIdentifier", 0, "uint16le"),
+    ("descriptorVersion", 2, "uint16le"),
+    ("tagSerialNumber", 6, "uint16le"),
+    ("volumeSequenceNumber", 16, "uint32le"),
+    # TODO: really don't know how to interpret descriptorCharacterSet (64:84)
+    # Logical volume identifier is a dstring in OSTA Compressed Unicode
+    ("logicalVolumeIdentifier", 84, "dstring", 128),
+    ("logicalBlockSize", 212, "uint32le"),
+    ("domainIdentifier", 216, "text", 32),
+    ("mapTableLength", 264, "uint32le"),
+    ("numberOfPartitionMaps", 268, "uint32le"),
+    ("implementationIdentifier", 272, "text", 32),
+    ("integritySequenceExtentLength", 432, "uint32le"),
+    ("integritySequenceExtentLocation", 436, "uint32le")
+])
+
+# Layout of the Logical Volume Integrity Descriptor.
+#
+# Note: layout based on ECMA TR/71 DVD Read-Only Disk - File System Specifications
+# Link: https://www.ecma-international.org/publications/techreports/E-TR-071.htm
+#
+# This puts constraint that *freeSpaceTable* and *sizeTable* describe one partition only!
+# Not 100% sure this applies to *all* DVDs (since TR/71 only defines UDF Bridge format!)
+# If not, make these fields repeatable, iterating over *numberOfPartitions*!
+logicalVolumeIntegrityDescriptorLayout = layout.Layout("<", [
+    ("tagIdentifier", 0, "uint16le"),
+    ("descriptorVersion", 2, "uint16le"),
+    ("tagSerialNumber", 6, "uint16le"),
+    ("timeStamp", 16, "bytes", 12, timestampToDate),
+    ("integrityType", 28, "uint32le"),
+    ("numberOfPartitions", 72, "uint32le"),
+    ("lengthOfImplementationUse", 76, "uint32le"),
+    ("freeSpaceTable", 80, "uint32le"),
+    ("sizeTable", 84, "uint32le")
+])
+
+# Layout of the Partition Descriptor
+partitionDescriptorLayout = layout.Layout("<", [
+    ("tagIdentifier", 0, "uint16le"),
+    ("descriptorVersion", 2, "uint16le"),
+    ("tagSerialNumber", 6, "uint16le"),
+    ("volumeDescriptorSequenceNumber", 16, "uint32le"),
+    ("partitionNumber", 22, "uint16le"),
+    ("accessType", 184, "uint32le"),
+    ("partitionStartingLocation", 188, "uint32le"),
+    ("partitionLength", 192, "uint32le")
+])
+
+
+class LogicalVolumeDescriptor(model.Descriptor):
+    """Logical Volume Descriptor, with one property per field of
+    logicalVolumeDescriptorLayout
+    """
+
+    __slots__ = logicalVolumeDescriptorLayout.names
+    tag = "logicalVolumeDescriptor"
+    layout = logicalVolumeDescriptorLayout
+
+
+class LogicalVolumeIntegrityDescriptor(model.Descriptor):
+    """Logical Volume Integrity Descriptor, with one property per field of
+    logicalVolumeIntegrityDescriptorLayout
+    """
+
+    __slots__ = logicalVolumeIntegrityDescriptorLayout.names
+    tag = "logicalVolumeIntegrityDescriptor"
+    layout = logicalVolumeIntegrityDescriptorLayout
+
+
+class PartitionDescriptor(model.Descriptor):
+    """Partition Descriptor, with one property per field of
+    partitionDescriptorLayout
+    """
+
+    __slots__ = partitionDescriptorLayout.names
+    tag = "partitionDescriptor"
+    layout = partitionDescriptorLayout
+
+
+def parseLogicalVolumeDescriptor(bytesData, names=None):
+
+    """Parse Logical Volume Descriptor and return LogicalVolumeDescriptor record"""
+
+    return LogicalVolumeDescriptor.fromBytes(bytesData, names)
+
+
+def parseLogicalVolumeIntegrityDescriptor(bytesData, names=None):
+
+    """Parse Logical Volume Integrity Descriptor and return
+    LogicalVolumeIntegrityDescriptor record
+    """
+
+    return LogicalVolumeIntegrityDescriptor.fromBytes(bytesData, names)
+
+
+def parsePartitionDescriptor(bytesData, names=None):
+
+    """Parse Partition Descriptor and return PartitionDescriptor record"""
+
+    return PartitionDescriptor.fromBytes(bytesData, names)
+
+
+# Tag identifiers of the descriptors that are read by the file tree walk
+# (ECMA-167, Parts 3 and 4)
+TAG_ANCHOR_VOLUME_DESCRIPTOR_POINTER = 2
+TAG_PARTITION_DESCRIPTOR = 5
+TAG_LOGICAL_VOLUME_DESCRIPTOR = 6
+TAG_TERMINATING_DESCRIPTOR = 8
+TAG_FILE_SET_DESCRIPTOR = 256
+TAG_FILE_IDENTIFIER_DESCRIPTOR = 257
+TAG_ALLOCATION_EXTENT_DESCRIPTOR = 258
+TAG_INDIRECT_ENTRY = 259
+TAG_FILE_ENTRY = 261
+TAG_EXTENDED_FILE_ENTRY = 266
+
+# File types in the ICB tag
+FILE_TYPE_DIRECTORY = 4
+
+# File characteristics of File Identifier Descriptors
+CHARACTERISTIC_DIRECTORY = 0x02
+CHARACTERISTIC_DELETED = 0x04
+CHARACTERISTIC_PARENT = 0x08
+
+# Extent type of allocation descriptors that point to the next extent of
+# allocation descriptors, and of extents that are recorded
+EXTENT_NEXT = 3
+EXTENT_RECORDED = 0
+
+# Allocation descriptor type (ICB tag flags) of data that is embedded in
+# the (Extended) File Entry
+ALLOCATION_EMBEDDED = 3
+
+# Maximum number of sectors of the Volume Descriptor Sequence that are read,
+# of Allocation Extent Descriptors that are followed for one File Entry, and
+# of Indirect Entries that are followed for one ICB
+MAX_SEQUENCE_SECTORS = 64
+MAX_ALLOCATION_EXTENTS = 256
+MAX_INDIRECT_ENTRIES = 8
+
+# Maximum size of a directory that is read (larger directories are skipped)
+MAX_DIRECTORY_SIZE = 64 * 1024 * 1024
+
+# Number of blocks that the block cache reads at once, and maximum number of
+# these runs that it keeps
+CACHE_RUN_BLOCKS = 16
+MAX_CACHED_RUNS = 256
+
+# Descriptor tag identifier
+tagStruct = struct.Struct("<H")
+
+# Location of extent (length, location) in Anchor Volume Descriptor Pointer
+extentStruct = struct.Struct("<II")
+
+# long_ad: extent length, logical block number and partition reference number
+longADStruct = struct.Struct("<IIH")
+
+# Fixed part of a File Identifier Descriptor (after the descriptor tag):
+# file version number, file characteristics, length of file identifier,
+# ICB (long_ad) and length of implementation use
+fileIdentifierStruct = struct.Struct("<HBBIIH6xH")
+
+# Fields of File Entries and Extended File Entries: file type (in the ICB
+# tag), ICB flags, information length, and offsets of the modification
+# time, the length of the extended attributes and the length of the
+# allocation descriptors
+fileEntryOffsets = {TAG_FILE_ENTRY: (84, 168), TAG_EXTENDED_FILE_ENTRY: (92, 208)}
+
+
+class BlockCache:
+    """Least recently used cache of the logical blocks of an image, which
+    are read in runs of CACHE_RUN_BLOCKS blocks. File Entries of adjacent
+    files are usually recorded in adjacent blocks, so a run serves many of
+    them. Memory use is bounded by MAX_CACHED_RUNS runs
+    """
+
+    def __init__(self, reader, blockSize):
+        self.reader = reader
+        self.blockSize = blockSize
+        # Cached runs by run number, least recently used first
+        self.runs = OrderedDict()
+
+    def run(self, runNumber):
+        """Return run runNumber (short at the end of the image)"""
+        run = self.runs.get(runNumber)
+        if run is not None:
+            self.runs.move_to_end(runNumber)
+            return run
+        runSize = CACHE_RUN_BLOCKS * self.blockSize
+        run = bytes(self.reader.read(runNumber * runSize, runSize))
+        self.runs[runNumber] = run
+        if len(self.runs) > MAX_CACHED_RUNS:
+            self.runs.popitem(last=False)
+        return run
+
+    def read(self, block, count=1):
+        """Read count blocks from logical block block (of the image).
+        Extents longer than a run are read directly
+        """
+        if count > CACHE_RUN_BLOCKS:
+            return self.reader.read(block * self.blockSize, count * self.blockSize)
+        runNumber, start = divmod(block, CACHE_RUN_BLOCKS)
+        data = self.run(runNumber)[start * self.blockSize:(start + count) * self.blockSize]
+        if start + count > CACHE_RUN_BLOCKS:
+            end = start + count - CACHE_RUN_BLOCKS
+            data += self.run(runNumber + 1)[:end * self.blockSize]
+        return data
+
+
+class LogicalVolume:
+    """Partition maps of a UDF logical volume, which translate (partition
+    reference number, logical block number) addresses to blocks of the
+    image. Type 1 maps and sparable partitions (without their sparing
+    tables) are mapped to the start of their Partition Descriptor's
+    partition, and metadata partitions (UDF 2.50) through the extents of
+    their Metadata File. Virtual partitions (VAT) are not supported
+    """
+
+    def __init__(self, cache, blockSize):
+        self.cache = cache
+        self.blockSize = blockSize
+        # Start of each partition by partition number
+        self.partitionStarts = {}
+        # By partition reference number: (partition number, metadata
+        # extents) tuple, where metadata extents is None for partitions that
+        # are not metadata partitions, and otherwise a sorted list of (first
+        # block in metadata partition, first block in physical partition,
+        # number of blocks) tuples
+        self.maps = []
+
+    def addPartitionMaps(self, lvdData):
+        """Add partition maps from Logical Volume Descriptor lvdData. Metadata
+        partitions are resolved later (see resolveMetadata)
+        """
+        numberOfMaps = struct.unpack_from("<I", lvdData, 268)[0]
+        position = 440
+        for _ in range(min(numberOfMaps, 64)):
+            if position + 2 > len(lvdData):
+                break
+            mapType, mapLength = lvdData[position], lvdData[position + 1]
+            if mapLength < 6:
+                break
+            data = lvdData[position:position + mapLength]
+            if mapType == 1:
+                self.maps.append((struct.unpack_from("<H", data, 4)[0], None))
+            elif mapType == 2 and len(data) >= 64:
+                partitionNumber = struct.unpack_from("<H", data, 38)[0]
+                identifier = bytes(data[5:28]).rstrip(b"\x00")
+                if identifier == b"*UDF Metadata Partition":
+                    # Locations of the Metadata File and its mirror
+                    self.maps.append((partitionNumber, struct.unpack_from("<II", data, 40)))
+                elif identifier == b"*UDF Sparable Partition":
+                    self.maps.append((partitionNumber, None))
+                else:
+                    self.maps.append((None, None))
+            else:
+                self.maps.append((None, None))
+            position += mapLength
+
+    def resolveMetadata(self):
+        """Replace the Metadata File locations of metadata partitions by
+        the extents of the Metadata File (or of its mirror, if the Metadata
+        File cannot be read)
+        """
+        for reference, (partitionNumber, locations) in enumerate(self.maps):
+            if not isinstance(locations, tuple):
+                continue
+            extents = []
+            for location in locations:
+                physical = self.maps.index((partitionNumber, None)) \
+                    if (partitionNumber, None) in self.maps else None
+                if physical is None:
+                    break
+                entry = readFileEntry(self, physical, location)
+                if entry is not None:
+                    position = 0
+                    for extentType, extentReference, block, length in entry[4]:
+                        blocks = length // self.blockSize
+                        if extentType == EXTENT_RECORDED:
+                            extents.append((position, block, blocks))
+                        position += blocks
+                    break
+            self.maps[reference] = (partitionNumber, extents)
+
+    def block(self, reference, block):
+        """Return block of the image that holds logical block block of the
+        partition with reference number reference, or None if it cannot be
+        mapped
+        """
+        if not 0 <= reference < len(self.maps):
+            return None
+        partitionNumber, extents = self.maps[reference]
+        start = self.partitionStarts.get(partitionNumber)
+        if start is None:
+            return None
+        if extents is None:
+            return start + block
+        # Metadata partition
+        index = bisect.bisect_right(extents, (block, float("inf"))) - 1
+        if index < 0:
+            return None
+        first, physicalBlock, count = extents[index]
+        if block - first >= count:
+            return None
+        return start + physicalBlock + block - first
+
+    def read(self, reference, block, count=1):
+        """Read count logical blocks from block of partition reference, or
+        return None if they cannot be mapped. Blocks must be contiguous in
+        the image (which they are within one extent)
+        """
+        imageBlock = self.block(reference, block)
+        if imageBlock is None:
+            return None
+        return self.cache.read(imageBlock, count)
+
+
+def parseAllocationDescriptors(volume, data, adType, reference):
+    """Return list of (extent type, partition reference, logical block,
+    length in bytes) tuples of the allocation descriptors in data, of
+    allocation descriptor type adType (0: short_ad, 1: long_ad, 2: ext_ad).
+    short_ad extents are in partition reference. Allocation Extent
+    Descriptors (extents of type EXTENT_NEXT) are followed
+    """
+    extents = []
+    for _ in range(MAX_ALLOCATION_EXTENTS):
+        position = 0
+        nextExtent = None
+        while True:
+            if adType == 0 and position + 8 <= len(data):
+                length, block = extentStruct.unpack_from(data, position)
+                extentReference = reference
+                position += 8
+            elif adType == 1 and position + 16 <= len(data):
+                length, block, extentReference = longADStruct.unpack_from(data, position)
+                position += 16
+            elif adType == 2 and position + 20 <= len(data):
+                length = struct.unpack_from("<I", data, position)[0]
+                block, extentReference = struct.unpack_from("<IH", data, position + 12)
+                position += 20
+            else:
+                break
+            extentType, length = length >> 30, length & 0x3fffffff
+            if length == 0:
+                break
+            if extentType == EXTENT_NEXT:
+                nextExtent = (extentReference, block)
+                break
+            extents.append((extentType, extentReference, block, length))
+        if nextExtent is None:
+            break
+        # Allocation Extent Descriptor: tag, previous location, length of
+        # allocation descriptors, allocation descriptors
+        data = volume.read(nextExtent[0], nextExtent[1])
+        if not data or len(data) < 24 or \
+                tagStruct.unpack_from(data)[0] != TAG_ALLOCATION_EXTENT_DESCRIPTOR:
+            break
+        reference = nextExtent[0]
+        data = data[24:24 + struct.unpack_from("<I", data, 20)[0]]
+    return extents
+
+
+def readFileEntry(volume, reference, block):
+    """Read (Extended) File Entry at logical block block of partition
+    reference, and return (file type, information length, modification
+    time, embedded data, extents) tuple, where embedded data is None unless
+    the data is embedded in the entry, and extents is a list of allocation
+    descriptors (see parseAllocationDescriptors). Indirect Entries are
+    followed. Returns None if there is no File Entry
+    """
+    for _ in range(MAX_INDIRECT_ENTRIES):
+        data = volume.read(reference, block)
+        if not data or len(data) < 176:
+            return None
+        tagIdentifier = tagStruct.unpack_from(data)[0]
+        if tagIdentifier == TAG_INDIRECT_ENTRY:
+            _, block, reference = longADStruct.unpack_from(data, 36)
+            continue
+        if tagIdentifier not in fileEntryOffsets:
+            return None
+        timeOffset, lengthsOffset = fileEntryOffsets[tagIdentifier]
+        fileType = data[27]
+        adType = struct.unpack_from("<H", data, 34)[0] & 0x07
+        informationLength = struct.unpack_from("<Q", data, 56)[0]
+        extendedAttributesLength, descriptorsLength = struct.unpack_from("<II", data, lengthsOffset)
+        start = lengthsOffset + 8 + extendedAttributesLength
+        descriptors = data[start:start + descriptorsLength]
+        timestamp = data[timeOffset:timeOffset + 12]
+        modified = timestampToDate(timestamp) if any(timestamp[2:9]) else ""
+        if adType == ALLOCATION_EMBEDDED:
+            return fileType, informationLength, modified, bytes(descriptors), []
+        extents = parseAllocationDescriptors(volume, descriptors, adType, reference)
+        return fileType, informationLength, modified, None, extents
+    return None
+
+
+def readExtents(volume, extents, length):
+    """Return the first length bytes of the data in extents (allocation
+    descriptors, see parseAllocationDescriptors); unrecorded extents read as
+    zero bytes
+    """
+    blockSize = volume.blockSize
+    parts = []
+    remaining = length
+    for extentType, reference, block, extentLength in extents:
+        if remaining <= 0:
+            break
+        extentLength = min(extentLength, remaining)
+        if extentType == EXTENT_RECORDED:
+            data = volume.read(reference, block, -(-extentLength // blockSize))
+            data = bytes(data or b"")[:extentLength]
+            parts.append(data.ljust(extentLength, b"\x00"))
+        else:
+            parts.append(bytes(extentLength))
+        remaining -= extentLength
+    return b"".join(parts)
+
+
+def iterFileIdentifiers(data):
+    """Yield (characteristics, identifier, partition reference, logical
+    block) tuple of each File Identifier Descriptor in directory data
+    """
+    position = 0
+    end = len(data) - 16 - fileIdentifierStruct.size
+    while position <= end:
+        if tagStruct.unpack_from(data, position)[0] != TAG_FILE_IDENTIFIER_DESCRIPTOR:
+            break
+        _, characteristics, identifierLength, _, block, reference, useLength = \
+            fileIdentifierStruct.unpack_from(data, position + 16)
+        start = position + 38 + useLength
+        yield characteristics, data[start:start + identifierLength], reference, block
+        position += (38 + useLength + identifierLength + 3) & ~3
+
+
+def openLogicalVolume(reader):
+    """Read the Anchor Volume Descriptor Pointer and the main Volume
+    Descriptor Sequence of the image that is read by sector reader reader,
+    and return (LogicalVolume, File Set Descriptor location) tuple, where
+    the location is a (partition reference, logical block) tuple. Returns
+    None if there is no (usable) Logical Volume Descriptor
+    """
+    anchor = reader.read(256 * 2048, 512)
+    if len(anchor) < 24 or tagStruct.unpack_from(anchor)[0] != TAG_ANCHOR_VOLUME_DESCRIPTOR_POINTER:
+        return None
+    sequenceLength, sequenceLocation = extentStruct.unpack_from(anchor, 16)
+    sequenceSectors = min(-(-sequenceLength // 2048), MAX_SEQUENCE_SECTORS)
+    sequence = reader.read(sequenceLocation * 2048, sequenceSectors * 2048)
+
+    lvdData = None
+    partitionStarts = {}
+    for position in range(0, len(sequence) - 511, 2048):
+        tagIdentifier = tagStruct.unpack_from(sequence, position)[0]
+        if tagIdentifier == TAG_PARTITION_DESCRIPTOR:
+            number = struct.unpack_from("<H", sequence, position + 22)[0]
+            partitionStarts.setdefault(number, struct.unpack_from("<I", sequence, position + 188)[0])
+        elif tagIdentifier == TAG_LOGICAL_VOLUME_DESCRIPTOR and lvdData is None:
+            lvdData = sequence[position:position + 2048]
+        elif tagIdentifier == TAG_TERMINATING_DESCRIPTOR:
+            break
+    if lvdData is None:
+        return None
+
+    blockSize = struct.unpack_from("<I", lvdData, 212)[0]
+    if blockSize not in (512, 1024, 2048, 4096):
+        blockSize = 2048
+    volume = LogicalVolume(BlockCache(reader, blockSize), blockSize)
+    volume.partitionStarts = partitionStarts
+    volume.addPartitionMaps(lvdData)
+    volume.resolveMetadata()
+    # File Set Descriptor (long_ad in the logical volume contents use field)
+    _, block, reference = longADStruct.unpack_from(lvdData, 248)
+    return volume, (reference, block)
+
+
+def walkFileTree(reader, profiler=None):
+    """Yield a model.ManifestEntry for each file and directory in the UDF
+    file tree of the image that is read by sector reader reader, starting
+    from the root directory of the (first) File Set Descriptor. Directories
+    are walked breadth-first from a queue (so memory use does not grow with
+    the depth of the tree), and each directory is read once. File Entries
+    are read through a BlockCache. The extent location of an entry is the
+    image block of its first recorded extent (None for empty files and
+    data that is embedded in the File Entry)
+    """
+    logicalVolume = openLogicalVolume(reader)
+    if logicalVolume is None:
+        return
+    volume, (reference, block) = logicalVolume
+    fileSetDescriptor = volume.read(reference, block)
+    if not fileSetDescriptor or len(fileSetDescriptor) < 416 or \
+            tagStruct.unpack_from(fileSetDescriptor)[0] != TAG_FILE_SET_DESCRIPTOR:
+        return
+    _, block, reference = longADStruct.unpack_from(fileSetDescriptor, 400)
+
+    pending = deque([("", reference, block)])
+    visited = {(reference, block)}
+    while pending:
+        directoryPath, reference, block = pending.popleft()
+        entry = readFileEntry(volume, reference, block)
+        if entry is None:
+            continue
+        _, informationLength, _, embedded, extents = entry
+        if informationLength > MAX_DIRECTORY_SIZE:
+            continue
+        if embedded is not None:
+            data = embedded[:informationLength]
+        else:
+            data = readExtents(volume, extents, informationLength)
+        if profiler is not None:
+            profiler.countDescriptors()
+
+        for characteristics, identifier, childReference, childBlock in iterFileIdentifiers(data):
+            if characteristics & (CHARACTERISTIC_DELETED | CHARACTERISTIC_PARENT):
+                continue
+            path = directoryPath + "/" + textconv.cs0ToText(identifier)
+            child = readFileEntry(volume, childReference, childBlock)
+            if child is None:
+                continue
+            fileType, size, modified, embedded, extents = child
+            isDirectory = fileType == FILE_TYPE_DIRECTORY or \
+                bool(characteristics & CHARACTERISTIC_DIRECTORY)
+            location = None
+            for extentType, extentReference, extentBlock, _ in extents:
+                if extentType == EXTENT_RECORDED:
+                    location = volume.block(extentReference, extentBlock)
+                    break
+            yield model.ManifestEntry("UDF", path, "directory" if isDirectory else "file",
+                                      size, location, modified)
+            if isDirectory and (childReference, childBlock) not in visited:
+                visited.add((childReference, childBlock))
+                pending.append((path, childReference, childBlock))
+
+
+def parseFileSystem(reader, offset, profiler, fields=None, budget=budgets.nullBudget):
+    """Read through the main Volume Descriptor Sequence, and parse the
+    Logical Volume, Logical Volume Integrity and Partition Descriptors
+    (parse callback of the UDF detector, see the detect module)
+    """
+    lvdNames = LogicalVolumeDescriptor.projection(fields, ("logicalBlockSize",
+                                                           "integritySequenceExtentLocation"))
+    lvidNames = LogicalVolumeIntegrityDescriptor.projection(fields)
+    pdNames = PartitionDescriptor.projection(fields, ("partitionLength",
+                                                      "partitionStartingLocation"))
+    # Create element to store properties of UDF filesystem
+    fsUDF = model.FileSystem(type="UDF")
+    parsedLogicalVolumeDescriptor = False
+    parsedLogicalVolumeIntegrityDescriptor = False
+
+    # Read Anchor Volume Descriptor Pointer; located at sector 256
+    anchorVolumeDescriptorPointer = reader.read(256 * 2048, 512)
+    tagIdentifier = bc.bytesToUShortIntL(anchorVolumeDescriptorPointer[0:2])
+    extentLength = bc.bytesToUIntL(anchorVolumeDescriptorPointer[16:20])
+    extentLocation = bc.bytesToUIntL(anchorVolumeDescriptorPointer[20:24])
+
+    # Read (up to 32 sectors of) the main Volume Descriptor Sequence in one call
+    reader.prefetchSectors(extentLocation, min(extentLength // 2048, 32))
+
+    # Read through main Volume Descriptor Sequence
+    byteStart = 2048 * extentLocation
+    while tagIdentifier != TAG_TERMINATING_DESCRIPTOR and tagIdentifier != -9999:
+        tagIdentifier, volumeDescriptorData, byteStart = getVolumeDescriptor(reader, byteStart)
+
+        if tagIdentifier == TAG_LOGICAL_VOLUME_DESCRIPTOR:
+            try:
+                lvdInfo = parseLogicalVolumeDescriptor(volumeDescriptorData, lvdNames)
+                fsUDF.append(lvdInfo)
+                parsedLogicalVolumeDescriptor = True
+
+                if lvidNames is not None and not lvidNames:
+                    # None of its properties are requested, and the size
+                    # tests do not use them: the Logical Volume Integrity
+                    # Descriptor is not read
+                    parsedLogicalVolumeIntegrityDescriptor = True
+                else:
+                    try:
+                        # Read Logical Volume Integrity Descriptor
+                        _, lvidVolumeDescriptorData, _ = getVolumeDescriptor(
+                            reader, 2048 * lvdInfo.integritySequenceExtentLocation)
+                        lvidInfo = parseLogicalVolumeIntegrityDescriptor(lvidVolumeDescriptorData,
+                                                                         lvidNames)
+                        fsUDF.append(lvidInfo)
+                        parsedLogicalVolumeIntegrityDescriptor = True
+                    except budgets.BudgetExceeded:
+                        raise
+                    except Exception:
+                        parsedLogicalVolumeIntegrityDescriptor = False
+
+            except budgets.BudgetExceeded:
+                raise
+            except Exception:
+                parsedLogicalVolumeDescriptor = False
+
+        if tagIdentifier == TAG_PARTITION_DESCRIPTOR:
+            try:
+                pdInfo = parsePartitionDescriptor(volumeDescriptorData, pdNames)
+                fsUDF.append(pdInfo)
+            except Exception:
+                pass
+
+        profiler.countDescriptors()
+        budget.countDescriptors("UDF")
+
+    sizeExpected = 0
+    if parsedLogicalVolumeDescriptor and parsedLogicalVolumeIntegrityDescriptor:
+        # For UDF estimating the expected file size is not straightforward, because the fields
+        # in the Partition Descriptor and the Integrity Descriptor exclude the size occupied
+        # by descriptors before and after the partition. The number of sectors *before*
+        # the partition equals (partitionStartingLocation - 1). The number of sectors *after*
+        # the partition is more difficult to establish, but it must be at least 1 (Anchor
+        # Volume Descriptor Pointer). So a conservative estimate is:
+        #
+        # number of sectors =  partitionLength + partitionStartingLocation
+        #
+        # In reality this estimate may be too low because of additional descriptors after
+        # the partition.
+        sizeExpected = (pdInfo.partitionLength + pdInfo.partitionStartingLocation) * \
+            lvdInfo.logicalBlockSize
+
+    return detect.Detection(fsUDF, sizeExpected)
@@ -0,0 +1,163 @@
+#! /usr/bin/env python3
+"""Lazy input walkers that yield images to process
+
+All walkers are generators that yield (path, stat) tuples, where stat is
+the stat result of the image if it is already known (e.g. from a directory
+scan), or None otherwise. Paths are produced one at a time, so memory use
+does not depend on the number of images, and the first image can be
+processed as soon as it is found.
+"""
+
+import os
+import sys
+
+
+# Maximum number of bytes read per call from input lists
+LIST_CHUNK_SIZE = 65536
+
+
+def nameMatches(name, includes, excludes):
+    """Return True if name matches any of the include patterns (or if there
+    are none), and none of the exclude patterns
+    """
+    if not includes and not excludes:
+        return True
+    # Only imported when patterns are used, as it pulls in the re module
+    import fnmatch
+    if includes and not any(fnmatch.fnmatch(name, pattern) for pattern in includes):
+        return False
+    return not any(fnmatch.fnmatch(name, pattern) for pattern in excludes)
+
+
+def walkDirectory(directory, includes=None, excludes=None):
+    """Recursively walk directory with os.scandir, and yield (path, stat)
+    tuples for all files whose names match the include and exclude patterns.
+    Directories whose names match an exclude pattern are skipped. The stat
+    result of each DirEntry is passed on, so images are not stat'ed twice
+    """
+    includes = includes or []
+    excludes = excludes or []
+
+    # Directories that still need to be scanned
+    pending = [directory]
+
+    while pending:
+        currentDir = pending.pop()
+        try:
+            entries = os.scandir(currentDir)
+        except OSError as ex:
+            sys.stderr.write("User warning: cannot scan directory " + currentDir +
+                             " (" + str(ex) + ")\n")
+            continue
+        with entries:
+            subDirs = []
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if nameMatches(entry.name, [], excludes):
+                            subDirs.append(entry.path)
+                    elif entry.is_file() and nameMatches(entry.name, includes, excludes):
+                        yield entry.path, entry.stat()
+                except OSError:
+                    # Entry vanished or is inaccessible; leave it to processImage
+                    yield entry.path, None
+            # Reversed, so subdirectories are visited in scan order
+            pending.extend(reversed(subDirs))
+
+
+def readInputList(stream):
+    """Yield paths from binary stream that contains a list of paths. Paths
+    are NUL-delimited if the first path ends with a NUL byte, and
+    newline-delimited if it ends with a newline. Empty entries are skipped.
+    Reads return whatever data is available (with read1, if the stream has
+    it), and each path is yielded as soon as its delimiter arrives, so the
+    paths from a pipe are processed while its producer is still writing
+    """
+    read = getattr(stream, "read1", stream.read)
+    delimiter = None
+    remainder = b''
+
+    while True:
+        chunk = read(LIST_CHUNK_SIZE)
+        if not chunk:
+            break
+        remainder += chunk
+        if delimiter is None:
+            # The delimiter is the first NUL or newline in the stream
+            nul = remainder.find(b'\0')
+            newline = remainder.find(b'\n')
+            if nul == -1 and newline == -1:
+                continue
+            delimiter = b'\0' if newline == -1 or -1 < nul < newline else b'\n'
+        items = remainder.split(delimiter)
+        # Last item is incomplete
+        remainder = items.pop()
+        for path in decodeItems(items, delimiter):
+            yield path
+
+    # Last item if it is not followed by a delimiter
+    for path in decodeItems([remainder], delimiter):
+        yield path
+
+
+def decodeItems(items, delimiter):
+    """Yield paths from list items (bytes) of an input list, skipping
+    empty ones
+    """
+    for item in items:
+        if delimiter != b'\0':
+            item = item.rstrip(b'\r')
+        if item:
+            yield os.fsdecode(item)
+
+
+def walkInputList(listFile, includes=None, excludes=None):
+    """Yield (path, None) tuples for all paths in listFile ('-' for stdin)
+    whose names match the include and exclude patterns
+    """
+    includes = includes or []
+    excludes = excludes or []
+
+    if listFile == "-":
+        stream = sys.stdin.buffer
+    else:
+        stream = open(listFile, "rb")
+    try:
+        for path in readInputList(stream):
+            if nameMatches(os.path.basename(path), includes, excludes):
+                yield path, None
+    finally:
+        if stream is not sys.stdin.buffer:
+            stream.close()
+
+
+def expandWildcards(patterns):
+    """Yield the paths that match each of patterns, in order. Used on
+    Windows, where the shell passes wildcard expressions on unexpanded
+    """
+    import glob
+    import re
+    for pattern in patterns:
+        try:
+            # This can result in a regex error if the pattern contains
+            # special characters
+            paths = glob.glob(pattern)
+        except re.error:
+            # In case of regex error match the pattern literally
+            paths = glob.glob(glob.escape(pattern))
+        for path in paths:
+            yield path
+
+
+def walkInputs(paths=None, directories=None, listFiles=None, includes=None, excludes=None):
+    """Yield (path, stat) tuples for explicitly named paths, files in
+    directories (recursively) and paths in list files, in that order
+    """
+    for path in paths or []:
+        yield path, None
+    for directory in directories or []:
+        for item in walkDirectory(directory, includes, excludes):
+            yield item
+    for listFile in listFiles or []:
+        for item in walkInputList(listFile, includes, excludes):
+            yield item
@@ -0,0 +1,412 @@
+#! /usr/bin/env python3
+"""Output writers for isolyzer reports"""
+
+from . import model
+from . import projection
+
+# The json and csv modules are imported by the writers that use them, so
+# they are not loaded for XML output
+
+
+# Descriptor fields that are included in CSV output, as (descriptor, field)
+# tuples. If an image contains multiple instances of a descriptor, the first
+# one is used
+csvDescriptorFields = [
+    ("primaryVolumeDescriptor", "volumeIdentifier"),
+    ("primaryVolumeDescriptor", "volumeSpaceSize"),
+    ("primaryVolumeDescriptor", "logicalBlockSize"),
+    ("primaryVolumeDescriptor", "volumeCreationDateAndTime"),
+    ("standardFileStructureVolumeDescriptor", "volumeIdentifier"),
+    ("standardFileStructureVolumeDescriptor", "volumeSpaceSize"),
+    ("standardFileStructureVolumeDescriptor", "logicalBlockSize"),
+    ("logicalVolumeDescriptor", "logicalVolumeIdentifier"),
+    ("logicalVolumeDescriptor", "logicalBlockSize"),
+    ("partitionDescriptor", "partitionStartingLocation"),
+    ("partitionDescriptor", "partitionLength"),
+    ("appleZeroBlock", "blockSize"),
+    ("appleZeroBlock", "blockCount"),
+    ("masterDirectoryBlock", "volumeName"),
+    ("masterDirectoryBlock", "blockSize"),
+    ("masterDirectoryBlock", "blockCount"),
+    ("hfsPlusVolumeheader", "blockSize"),
+    ("hfsPlusVolumeheader", "blockCount")
+]
+
+# Per-image fields that are included in CSV output, as (section, field) tuples
+csvImageFields = [
+    ("fileInfo", "fileName"),
+    ("fileInfo", "filePath"),
+    ("fileInfo", "fileSizeInBytes"),
+    ("fileInfo", "fileLastModified"),
+    ("statusInfo", "success"),
+    ("statusInfo", "failureMessage"),
+    (None, "sectorOffset"),
+    ("tests", "containsKnownFileSystem"),
+    ("tests", "sizeExpected"),
+    ("tests", "sizeActual"),
+    ("tests", "sizeDifference"),
+    ("tests", "sizeDifferenceSectors"),
+    ("tests", "sizeAsExpected"),
+    ("tests", "smallerThanExpected")
+]
+
+# Columns of CSV manifests (after the image path); these are the properties
+# of model.ManifestEntry
+manifestFields = list(model.ManifestEntry.__slots__)
+
+
+def jsonValue(value):
+    """Convert property value to value that can be serialised to JSON"""
+    if isinstance(value, model.Record):
+        return recordToDict(value)
+    elif isinstance(value, tuple):
+        return [jsonValue(item) for item in value]
+    elif isinstance(value, list):
+        return [recordToDict(record) for record in value]
+    elif isinstance(value, dict):
+        return {key: jsonValue(item) for key, item in value.items()}
+    return value
+
+
+def recordToDict(record):
+    """Convert record to dictionary with the same structure as its XML
+    element: attributes and properties are keys, and if a property occurs
+    more than once, its values are collected in a list
+    """
+    properties = record.attributes()
+    for name, value in record.items():
+        value = jsonValue(value)
+        if name in properties:
+            if not isinstance(properties[name], list):
+                properties[name] = [properties[name]]
+            properties[name].append(value)
+        else:
+            properties[name] = value
+    return properties
+
+
+def imageToRow(image):
+    """Flatten ImageResult to list of CSV column values"""
+
+    row = []
+    for section, field in csvImageFields:
+        record = image if section is None else getattr(image, section)
+        value = getattr(record, field)
+        row.append("" if value is None else value)
+
+    # List of all file system types
+    row.append(";".join(fileSystem.type for fileSystem in image.fileSystems))
+
+    for descriptor, field in csvDescriptorFields:
+        row.append(descriptorValue(image, descriptor, field))
+    return row
+
+
+def descriptorValue(image, descriptor, field):
+    """Return value of field in first descriptor with tag descriptor in image,
+    or an empty string if the image does not contain it
+    """
+    for fileSystem in image.fileSystems:
+        for record in fileSystem.descriptors:
+            if record.tag == descriptor:
+                return getattr(record, field)
+    return ""
+
+
+def csvHeader():
+    """Return list of CSV column names"""
+    header = [field for _, field in csvImageFields]
+    header.append("fileSystems")
+    header += [descriptor + "." + field for descriptor, field in csvDescriptorFields]
+    return header
+
+
+def escapeXML(text):
+    """Escape special characters in text or attribute value"""
+
+    # Line endings are normalised to what an XML parser would report
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(
+        "\"", "&quot;").replace(">", "&gt;")
+
+
+def startTag(element):
+    """Return start tag of element, including its attributes (without the
+    closing bracket)
+    """
+    attributes = "".join(" %s=\"%s\"" % (name, escapeXML(value))
+                         for name, value in element.attrib.items())
+    return "<" + element.tag + attributes
+
+
+def prettyLines(element, level, indent, lines):
+    """Append indented serialisation of element (and all its descendants)
+    to list lines. The layout is identical to that of minidom's toprettyxml
+    """
+    prefix = indent * level
+    tag = startTag(element)
+
+    if len(element) == 0:
+        if element.text:
+            lines.append("%s%s>%s</%s>\n" % (prefix, tag, escapeXML(element.text),
+                                             element.tag))
+        else:
+            lines.append("%s%s/>\n" % (prefix, tag))
+    else:
+        lines.append("%s%s>\n" % (prefix, tag))
+        for child in element:
+            prettyLines(child, level + 1, indent, lines)
+        lines.append("%s</%s>\n" % (prefix, element.tag))
+
+
+def prettyXML(element, level=0, indent='    '):
+    """Return indented XML serialisation of element, starting at indentation
+    level level
+    """
+    lines = []
+    prettyLines(element, level, indent, lines)
+    return "".join(lines)
+
+
+def recordLines(record, tag, level, indent, lines):
+    """Append indented serialisation of record as element with tag tag to
+    list lines, with the same layout as prettyLines
+    """
+    prefix = indent * level
+    attributes = "".join(" %s=\"%s\"" % (name, escapeXML(value))
+                         for name, value in record.attributes().items())
+    start = len(lines)
+    lines.append(None)
+    for name, value in record.items():
+        valueLines(name, value, level + 1, indent, lines)
+    if len(lines) == start + 1:
+        lines[start] = "%s<%s%s/>\n" % (prefix, tag, attributes)
+    else:
+        lines[start] = "%s<%s%s>\n" % (prefix, tag, attributes)
+        lines.append("%s</%s>\n" % (prefix, tag))
+
+
+def valueLines(name, value, level, indent, lines):
+    """Append indented serialisation of property name with value value to
+    list lines
+    """
+    if isinstance(value, model.Record):
+        recordLines(value, name, level, indent, lines)
+    elif isinstance(value, tuple):
+        for item in value:
+            valueLines(name, item, level, indent, lines)
+    elif isinstance(value, (list, dict)):
+        prefix = indent * level
+        if not value:
+            lines.append("%s<%s/>\n" % (prefix, name))
+            return
+        lines.append("%s<%s>\n" % (prefix, name))
+        if isinstance(value, list):
+            for record in value:
+                recordLines(record, record.tag, level + 1, indent, lines)
+        else:
+            for key, item in value.items():
+                valueLines(key, item, level + 1, indent, lines)
+        lines.append("%s</%s>\n" % (prefix, name))
+    else:
+        text = model.textValue(value)
+        if text:
+            lines.append("%s<%s>%s</%s>\n" % (indent * level, name, escapeXML(text), name))
+        else:
+            lines.append("%s<%s/>\n" % (indent * level, name))
+
+
+def prettyRecord(record, level=0, indent='    '):
+    """Return indented XML serialisation of record, starting at indentation
+    level level
+    """
+    lines = []
+    recordLines(record, record.tag, level, indent, lines)
+    return "".join(lines)
+
+
+class Writer:
+    """Base class for streaming report writers. The report is started with
+    start(), after which each image is written with writeImage(), and
+    flushed as soon as it is written. Images are ImageResult records as they
+    are returned by processImage, and toolInfo is a ToolInfo record. Only
+    the XML writer uses the root element that is passed to start(); other
+    writers are started with root None. If a projection (see the projection
+    module) is given as fields, the CSV writer writes one column per field
+    """
+
+    def __init__(self, codec, stream=None, fields=None):
+        self.codec = codec
+        self.stream = stream
+        self.fields = fields
+
+    def flush(self):
+        """Flush underlying stream"""
+        if self.stream is not None:
+            self.stream.flush()
+
+    def start(self, root, toolInfo):
+        """Start report"""
+
+    def writeImage(self, image):
+        """Write one image"""
+
+    def end(self):
+        """End report"""
+
+
+class XMLWriter(Writer):
+    """Streaming writer for the XML report. The header, root element and
+    toolInfo are written when the writer is started, and each image is
+    serialised and flushed as soon as it is written, so memory use does
+    not depend on the number of images
+    """
+
+    def __init__(self, codec, stream=None, indent='    ', fields=None):
+        Writer.__init__(self, codec, stream, fields)
+        self.indent = indent
+        self.root = None
+
+    def start(self, root, toolInfo):
+        """Write XML declaration, start tag of root and toolInfo element"""
+        self.root = root
+        self.codec.write("<?xml version=\"1.0\" ?>\n")
+        self.codec.write(startTag(root) + ">\n")
+        self.codec.write(prettyRecord(toolInfo, 1, self.indent))
+        self.flush()
+
+    def writeImage(self, image):
+        """Write one image element"""
+        self.codec.write(prettyRecord(image, 1, self.indent))
+        self.flush()
+
+    def end(self):
+        """Write end tag of root"""
+        self.codec.write("</%s>\n" % self.root.tag)
+        self.flush()
+
+
+class JSONWriter(Writer):
+    """Streaming writer for a JSON report, which consists of one object with
+    a toolInfo object and an images array
+    """
+
+    def __init__(self, codec, stream=None, fields=None):
+        import json
+        Writer.__init__(self, codec, stream, fields)
+        self.dumps = json.dumps
+        self.noImages = 0
+
+    def start(self, root, toolInfo):
+        """Write toolInfo and start of images array"""
+        self.codec.write("{\"toolInfo\": %s, \"images\": [" %
+                         self.dumps(recordToDict(toolInfo)))
+        self.flush()
+
+    def writeImage(self, image):
+        """Write one image object"""
+        separator = ",\n" if self.noImages else "\n"
+        self.codec.write(separator + self.dumps(recordToDict(image)))
+        self.noImages += 1
+        self.flush()
+
+    def end(self):
+        """Close images array and report object"""
+        self.codec.write("\n]}\n")
+        self.flush()
+
+
+class JSONLinesWriter(Writer):
+    """Streaming writer for JSON Lines output, with one JSON object
+    per image
+    """
+
+    def __init__(self, codec, stream=None, fields=None):
+        import json
+        Writer.__init__(self, codec, stream, fields)
+        self.dumps = json.dumps
+
+    def writeImage(self, image):
+        """Write one image object as one line"""
+        self.codec.write(self.dumps(recordToDict(image)) + "\n")
+        self.flush()
+
+
+class CSVWriter(Writer):
+    """Streaming writer for CSV output, with one row per image. Tests
+    are flattened to columns, along with a fixed set of key descriptor fields
+    (see csvDescriptorFields)
+    """
+
+    def __init__(self, codec, stream=None, fields=None):
+        import csv
+        Writer.__init__(self, codec, stream, fields)
+        self.csvWriter = csv.writer(codec)
+
+    def start(self, root, toolInfo):
+        """Write header row"""
+        self.csvWriter.writerow(csvHeader() if self.fields is None else self.fields)
+        self.flush()
+
+    def writeImage(self, image):
+        """Write one image row"""
+        if self.fields is None:
+            self.csvWriter.writerow(imageToRow(image))
+        else:
+            self.csvWriter.writerow([projection.fieldValue(image, field) for field in self.fields])
+        self.flush()
+
+
+class ManifestJSONLinesWriter(Writer):
+    """Streaming writer for manifests in JSON Lines format, with one JSON
+    object per file or directory. Entries are written with writeEntry(), and
+    the stream is flushed after each image with flush()
+    """
+
+    def __init__(self, codec, stream=None):
+        import json
+        Writer.__init__(self, codec, stream)
+        self.dumps = json.dumps
+
+    def writeEntry(self, image, entry):
+        """Write ManifestEntry entry of image (path) as one line"""
+        properties = {"image": image}
+        properties.update(recordToDict(entry))
+        self.codec.write(self.dumps(properties) + "\n")
+
+
+class ManifestCSVWriter(Writer):
+    """Streaming writer for manifests in CSV format, with one row per file
+    or directory (see manifestFields)
+    """
+
+    def __init__(self, codec, stream=None):
+        import csv
+        Writer.__init__(self, codec, stream)
+        self.csvWriter = csv.writer(codec)
+
+    def start(self, root, toolInfo):
+        """Write header row"""
+        self.csvWriter.writerow(["image"] + manifestFields)
+        self.flush()
+
+    def writeEntry(self, image, entry):
+        """Write ManifestEntry entry of image (path) as one row"""
+        self.csvWriter.writerow([image] + ["" if value is None else value
+                                           for value in entry.values()])
+
+
+# Manifest writer classes by output format
+manifestWriterClasses = {
+    "jsonl": ManifestJSONLinesWriter,
+    "csv": ManifestCSVWriter
+}
+
+
+# Writer classes by output format
+writerClasses = {
+    "xml": XMLWriter,
+    "json": JSONWriter,
+    "jsonl": JSONLinesWriter,
+    "csv": CSVWriter
+}
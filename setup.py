@@ -34,6 +34,7 @@ TEST_DEPS = [
 ]
 EXTRAS = {
     'testing': TEST_DEPS,
+    'batch': ['numpy'],
 }
 
 setup(name='isolyzer',
@@ -56,6 +57,7 @@ setup(name='isolyzer',
       package_data={'isolyzer': ['*.*']},
       entry_points={'console_scripts': [
           'isolyzer = isolyzer.isolyzer:main',
+          'isolyzer-client = isolyzer.client:main',
       ]},
       classifiers=[
           'Environment :: Console',
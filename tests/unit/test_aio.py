@@ -0,0 +1,119 @@
+#! /usr/bin/env python3
+# pylint: disable=missing-docstring
+"""
+Tests for the asyncio API.
+"""
+
+import os
+import glob
+import asyncio
+import threading
+
+import pytest
+
+from isolyzer import aio
+from isolyzer import isolyzer
+from isolyzer import model
+from isolyzer.isolyzer import processImage
+
+# Directory that contains this script
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+
+# Root dir of isolyzer repo
+ISOLYZER_DIR = os.path.split(os.path.split(SCRIPT_DIR)[0])[0]
+
+# Directory with test files
+testFilesDir = os.path.join(ISOLYZER_DIR, "testFiles")
+
+# All files in test files dir, excluding .md file
+testFiles = sorted(glob.glob(os.path.join(testFilesDir, '*.iso')))
+
+def test_analyze_image():
+    result = asyncio.run(aio.analyzeImage(testFiles[0]))
+    assert result == processImage(testFiles[0], 0)
+
+def test_analyze_image_options():
+    options = model.AnalysisOptions(checksums=["md5"], sessions=True)
+    result = asyncio.run(aio.analyzeImage(testFiles[0], options=options))
+    assert result == processImage(testFiles[0], 0, options=options)
+    assert set(result.fileInfo.checksums) == {"md5"}
+    assert result.sessions is not None
+
+def test_snake_case_names():
+    """
+    The asyncio API is also available under PEP 8 names, with a
+    keyword-only offset
+    """
+    async def run():
+        return [path async for path, _ in aio.analyze_images(testFiles, concurrency=2, offset=0)]
+
+    assert sorted(asyncio.run(run())) == testFiles
+    assert asyncio.run(aio.analyze_image(testFiles[0], offset=0)) == processImage(testFiles[0], 0)
+    with pytest.raises(TypeError):
+        asyncio.run(aio.analyze_image(testFiles[0], 0))
+
+def test_many_concurrent_analyses():
+    """
+    Hundreds of analyses in one event loop give the same results as
+    serial analyses
+    """
+    expected = {image: processImage(image, 0) for image in testFiles}
+    paths = testFiles * 25
+
+    async def run():
+        results = []
+        async for path, result in aio.analyzeImages(paths, concurrency=32):
+            results.append((path, result))
+        # Single analyses, all scheduled at once on the default executor
+        single = await asyncio.gather(*[aio.analyzeImage(path) for path in paths])
+        return results, single
+
+    results, single = asyncio.run(run())
+    assert len(results) == len(paths)
+    assert sorted(path for path, _ in results) == sorted(paths)
+    for path, result in results:
+        assert result == expected[path]
+    assert single == [expected[path] for path in paths]
+
+def test_concurrency_is_bounded(monkeypatch):
+    lock = threading.Lock()
+    counts = {"active": 0, "max": 0}
+
+    def countingProcessImage(*args, **kwargs):
+        with lock:
+            counts["active"] += 1
+            counts["max"] = max(counts["max"], counts["active"])
+        try:
+            return processImage(*args, **kwargs)
+        finally:
+            with lock:
+                counts["active"] -= 1
+
+    monkeypatch.setattr(isolyzer, "processImage", countingProcessImage)
+
+    async def run():
+        return [path async for path, _ in aio.analyzeImages(testFiles * 10, concurrency=3)]
+
+    assert len(asyncio.run(run())) == len(testFiles) * 10
+    assert 1 <= counts["max"] <= 3
+
+def test_asynchronous_input():
+    async def generatePaths():
+        for path in testFiles:
+            await asyncio.sleep(0)
+            yield path
+
+    async def run():
+        return [path async for path, _ in aio.analyzeImages(generatePaths(), concurrency=2)]
+
+    assert sorted(asyncio.run(run())) == testFiles
+
+def test_missing_image_raises():
+    async def run():
+        async for _ in aio.analyzeImages(testFiles + ["missing.iso"], concurrency=4):
+            pass
+
+    with pytest.raises(FileNotFoundError):
+        asyncio.run(run())
+    with pytest.raises(FileNotFoundError):
+        asyncio.run(aio.analyzeImage("missing.iso"))
@@ -0,0 +1,113 @@
+#! /usr/bin/env python3
+# pylint: disable=missing-docstring
+"""
+Tests for the columnar batch analysis: the columns of the fast path must be
+identical to those of processImage.
+"""
+
+import os
+import sys
+import glob
+import gzip
+import shutil
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from isolyzer import batch
+from isolyzer.isolyzer import processImage
+
+# Directory that contains this script
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+
+# Root dir of isolyzer repo
+ISOLYZER_DIR = os.path.split(os.path.split(SCRIPT_DIR)[0])[0]
+
+# Directory with test files
+testFilesDir = os.path.join(ISOLYZER_DIR, "testFiles")
+
+# All files in test files dir, excluding .md file
+testFiles = sorted(glob.glob(os.path.join(testFilesDir, '*.iso')))
+
+sys.path.insert(0, os.path.join(ISOLYZER_DIR, "benchmarks"))
+
+import synthimage
+
+MB = 1024 ** 2
+
+def assertColumnsMatch(columns, paths, offset):
+    assert [name for name in columns] == [name for name, _ in batch.COLUMNS]
+    for row, path in enumerate(paths):
+        expected = batch.resultRow(processImage(path, offset))
+        for name, value in expected.items():
+            if name != "scalar":
+                assert columns[name][row] == value, (path, name)
+
+def writeSynthetic(directory):
+    builders = {
+        "iso": lambda: synthimage.ImageBuilder(8 * MB).addISO9660(),
+        "udf": lambda: synthimage.ImageBuilder(8 * MB).addUDF(),
+        "isoudf": lambda: synthimage.ImageBuilder(8 * MB).addISO9660(supplementary=3).addUDF(),
+        "udfmetadata": lambda: synthimage.ImageBuilder(8 * MB).addUDF(revision=3, metadata=True),
+        "udfiuds": lambda: synthimage.ImageBuilder(8 * MB).addUDF(
+            implementationUseDescriptors=40),
+        "hsfudf": lambda: synthimage.ImageBuilder(8 * MB).addHighSierra().addUDF(),
+        "session": lambda: synthimage.ImageBuilder(8 * MB, sessionStart=1000).addISO9660()}
+    paths = []
+    for name, builder in builders.items():
+        for truncate in (None, 300 * 2048, 2 * MB):
+            path = os.path.join(directory, "%s_%s.iso" % (name, truncate))
+            paths.append(builder().write(path, truncate=truncate))
+    for name in synthimage.ADVERSARIAL_IMAGES:
+        paths.append(synthimage.writeAdversarial(os.path.join(directory, name + ".iso"),
+                                                 name, 64 * MB))
+    return paths
+
+@pytest.mark.parametrize('offset', [0, 1000])
+
+def test_test_files(offset):
+    assertColumnsMatch(batch.analyzeBatch(testFiles, offset), testFiles, offset)
+
+@pytest.mark.parametrize('offset', [0, 1000])
+
+def test_synthetic_images(tmp_path, offset):
+    paths = writeSynthetic(str(tmp_path))
+    columns = batch.analyzeBatch(paths, offset, chunkSize=5)
+    assertColumnsMatch(columns, paths, offset)
+    assert not columns["scalar"].all()
+
+def test_fast_path():
+    names = ["iso9660.iso", "udf.iso", "iso9660_udf.iso", "hfs.iso"]
+    paths = [os.path.join(testFilesDir, name) for name in names]
+    columns = batch.analyzeBatch(paths)
+    assert list(columns["scalar"]) == [False, False, False, True]
+    assert list(columns["iso9660"]) == [True, False, True, False]
+    assert list(columns["udf"]) == [False, True, True, False]
+    assertColumnsMatch(columns, paths, 0)
+
+def test_compressed_image(tmp_path):
+    path = str(tmp_path / "iso9660.iso.gz")
+    with open(os.path.join(testFilesDir, "iso9660.iso"), "rb") as fIn:
+        with gzip.open(path, "wb") as fOut:
+            shutil.copyfileobj(fIn, fOut)
+    columns = batch.analyzeBatch([path])
+    assert columns["scalar"][0]
+    assertColumnsMatch(columns, [path], 0)
+
+def test_chunks_share_header_buffer():
+    # Rows of images that take the scalar path must not show data of the
+    # images in earlier chunks
+    paths = testFiles * 3
+    columns = batch.analyzeBatch(paths, chunkSize=4)
+    reference = batch.analyzeBatch(paths)
+    for name, column in columns.items():
+        assert (column == reference[name]).all(), name
+
+def test_empty_batch():
+    columns = batch.analyzeBatch([])
+    assert all(len(column) == 0 for column in columns.values())
+
+def test_missing_image():
+    with pytest.raises(FileNotFoundError):
+        batch.analyzeBatch([testFiles[0], os.path.join(testFilesDir, "missing.iso")])
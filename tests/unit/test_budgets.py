@@ -0,0 +1,156 @@
+#! /usr/bin/env python3
+# pylint: disable=missing-docstring
+"""
+Tests for the parsing budgets, with a corpus of adversarial synthetic images.
+"""
+
+import os
+import sys
+import glob
+import time
+
+import pytest
+from lxml import etree
+
+from isolyzer import budgets
+from isolyzer import model
+from isolyzer import sectorreader as sr
+from isolyzer.isolyzer import processImage
+from isolyzer.isolyzer import processImages
+
+# Directory that contains this script
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+
+# Root dir of isolyzer repo
+ISOLYZER_DIR = os.path.split(os.path.split(SCRIPT_DIR)[0])[0]
+
+# XSD file (path resolved from SCRIPT_DIR)
+xsdFile = os.path.join(ISOLYZER_DIR, "xsd/isolyzer-v-1-0.xsd")
+
+# Directory with test files
+testFilesDir = os.path.join(ISOLYZER_DIR, "testFiles")
+
+# All files in test files dir, excluding .md file
+testFiles = sorted(glob.glob(os.path.join(testFilesDir, '*.iso')))
+
+sys.path.insert(0, os.path.join(ISOLYZER_DIR, "benchmarks"))
+
+import synthimage
+
+MB = 1024 ** 2
+
+# Time within which each adversarial image must be analysed (seconds)
+TIME_BOUND = 2.0
+
+def writeAdversarial(tmp_path, name):
+    return synthimage.writeAdversarial(str(tmp_path / (name + ".iso")), name, 256 * MB)
+
+@pytest.mark.parametrize('name, message', [
+    ("unterminatedISO9660", "more than 1024 ISO 9660 volume descriptors"),
+    ("isoDescriptorChain", "more than 1024 ISO 9660 volume descriptors"),
+    ("unterminatedHighSierra", "more than 1024 High Sierra volume descriptors"),
+    ("unterminatedUDF", "more than 1024 UDF volume descriptors"),
+    ("applePartitionEntries", "more than 1024 partition map entries")])
+
+def test_adversarial_images(tmp_path, capsys, name, message):
+    path = writeAdversarial(tmp_path, name)
+    startTime = time.perf_counter()
+    result = processImage(path, 0)
+    assert time.perf_counter() - startTime < TIME_BOUND
+    assert not result.statusInfo.success
+    assert result.statusInfo.failureMessage == "budget exceeded: " + message
+    # Size tests as for an image without known file systems
+    assert result.fileSystems == []
+    assert result.tests.values() == (False, 0, 256 * MB, 256 * MB, 256 * MB / 2048,
+                                     False, False)
+    processImages([path], 0)
+    xmlschema = etree.XMLSchema(etree.parse(xsdFile))
+    xml_doc = etree.fromstring(capsys.readouterr().out.encode())
+    assert xmlschema.validate(xml_doc), xmlschema.error_log
+
+def test_sector_budget(tmp_path):
+    path = writeAdversarial(tmp_path, "unterminatedUDF")
+    limits = budgets.Limits(maxDescriptors=10 ** 9, maxSectors=4096)
+    result = processImage(path, 0, options=model.AnalysisOptions(limits=limits))
+    assert result.statusInfo.failureMessage == \
+        "budget exceeded: more than 4096 sectors read"
+
+def test_timeout(tmp_path):
+    path = writeAdversarial(tmp_path, "unterminatedISO9660")
+    limits = budgets.Limits(maxDescriptors=10 ** 9, maxSectors=10 ** 9, timeout=0.05)
+    startTime = time.perf_counter()
+    result = processImage(path, 0, options=model.AnalysisOptions(limits=limits))
+    assert time.perf_counter() - startTime < TIME_BOUND
+    assert result.statusInfo.failureMessage == \
+        "budget exceeded: analysis took more than 0.05 seconds"
+
+def test_partition_entry_budget(tmp_path):
+    path = synthimage.ImageBuilder(4 * MB).addApplePartitionMap(partitionEntries=8).write(
+        str(tmp_path / "apm.iso"))
+    options = model.AnalysisOptions(limits=budgets.Limits(maxPartitionEntries=7))
+    assert processImage(path, 0, options=options).statusInfo.success
+    options = model.AnalysisOptions(limits=budgets.Limits(maxPartitionEntries=6))
+    result = processImage(path, 0, options=options)
+    assert result.statusInfo.failureMessage == \
+        "budget exceeded: more than 6 partition map entries"
+
+@pytest.mark.parametrize('image', testFiles)
+
+def test_default_limits_do_not_change_results(image):
+    unlimited = budgets.Limits(10 ** 9, 10 ** 9, 10 ** 9)
+    result = processImage(image, 0)
+    assert result.statusInfo.success
+    assert result == processImage(image, 0, options=model.AnalysisOptions(limits=unlimited))
+
+def test_budget_counts_from_creation():
+    with sr.PReadReader(testFiles[0]) as reader:
+        reader.read(0, 64 * 2048)
+        budget = budgets.Budget(reader, budgets.Limits(maxSectors=16))
+        reader.read(64 * 2048, 16 * 2048)
+        budget.check()
+        reader.read(80 * 2048, 2048)
+        with pytest.raises(budgets.BudgetExceeded):
+            budget.check()
+
+def test_null_budget():
+    for _ in range(10000):
+        budgets.nullBudget.countDescriptors("ISO 9660")
+        budgets.nullBudget.countPartitionEntries()
+    budgets.nullBudget.check()
+
+def test_session_scan_budget(tmp_path):
+    path = writeAdversarial(tmp_path, "sessionCandidates")
+    startTime = time.perf_counter()
+    result = processImage(path, 0, options=model.AnalysisOptions(sessions=True))
+    assert time.perf_counter() - startTime < TIME_BOUND
+    assert result.statusInfo.failureMessage == \
+        "budget exceeded: more than 65536 sectors read"
+    assert result.sessions is None
+
+def test_session_scan_timeout(tmp_path):
+    path = writeAdversarial(tmp_path, "sessionCandidates")
+    limits = budgets.Limits(maxSectors=10 ** 9, timeout=0.05)
+    startTime = time.perf_counter()
+    result = processImage(path, 0, options=model.AnalysisOptions(sessions=True, limits=limits))
+    assert time.perf_counter() - startTime < TIME_BOUND
+    assert result.statusInfo.failureMessage == \
+        "budget exceeded: analysis took more than 0.05 seconds"
+
+def test_session_scan_sectors_are_exempt(tmp_path):
+    # The scan of the whole image (16384 sectors) is not counted as sectors
+    # read, only the search for the root directory (about 1000 sectors)
+    path = synthimage.ImageBuilder(32 * MB, sessionStart=1000).addISO9660().write(
+        str(tmp_path / "session.iso"))
+    options = model.AnalysisOptions(sessions=True, limits=budgets.Limits(maxSectors=2048))
+    result = processImage(path, 0, options=options)
+    assert result.statusInfo.success
+    assert [session.sectorOffset for session in result.sessions] == [1000]
+
+def test_reader_checks_budget():
+    with sr.PReadReader(testFiles[0]) as reader:
+        reader.budget = budgets.Budget(reader, budgets.Limits(timeout=0))
+        time.sleep(0.01)
+        with pytest.raises(budgets.BudgetExceeded):
+            reader.read(0, 2048)
+        reader.budget = None
+        assert len(reader.read(0, 2048)) == 2048
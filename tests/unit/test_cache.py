@@ -0,0 +1,163 @@
+#! /usr/bin/env python3
+# pylint: disable=missing-docstring
+"""
+Tests for the persistent result cache.
+"""
+
+import os
+import glob
+import shutil
+import types
+
+from isolyzer import budgets
+from isolyzer import cache as rc
+from isolyzer import model
+from isolyzer import sectorreader as sr
+from isolyzer.isolyzer import cacheOptions
+from isolyzer.isolyzer import processImage
+from isolyzer.isolyzer import processImagesParallel
+
+# Directory that contains this script
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+
+# Root dir of isolyzer repo
+ISOLYZER_DIR = os.path.split(os.path.split(SCRIPT_DIR)[0])[0]
+
+# Directory with test files
+testFilesDir = os.path.join(ISOLYZER_DIR, "testFiles")
+
+# All files in test files dir, excluding .md file
+testFiles = sorted(glob.glob(os.path.join(testFilesDir, '*.iso')))
+
+# Cache key of the options of a default analysis
+DEFAULT_OPTIONS = cacheOptions()
+
+class FailingReader(sr.PReadReader):
+    """Reader that fails the test if an image is opened"""
+    def open(self, stat=None):
+        raise AssertionError("image opened despite cache hit")
+
+def test_cache_hit_does_not_open_image(tmp_path):
+    image = testFiles[0]
+    with rc.ResultCache(str(tmp_path / "cache.db"), "test") as cache:
+        first = processImage(image, 0, cache=cache)
+        second = processImage(image, 0, FailingReader, cache=cache)
+        assert (cache.hits, cache.misses) == (1, 1)
+    assert first == second
+
+def test_cache_persists_and_keys_on_offset_and_version(tmp_path):
+    dbFile = str(tmp_path / "cache.db")
+    image = testFiles[0]
+    with rc.ResultCache(dbFile, "test") as cache:
+        processImage(image, 0, cache=cache)
+    with rc.ResultCache(dbFile, "test") as cache:
+        assert cache.lookup(os.stat(image), 0, DEFAULT_OPTIONS) is not None
+        assert cache.lookup(os.stat(image), 1, DEFAULT_OPTIONS) is None
+    with rc.ResultCache(dbFile, "other") as cache:
+        assert cache.lookup(os.stat(image), 0, DEFAULT_OPTIONS) is None
+
+def test_changed_image_is_analysed_again(tmp_path):
+    image = str(tmp_path / "image.iso")
+    shutil.copyfile(testFiles[0], image)
+    with rc.ResultCache(str(tmp_path / "cache.db"), "test") as cache:
+        processImage(image, 0, cache=cache)
+        imageStat = os.stat(image)
+        os.utime(image, ns=(imageStat.st_atime_ns, imageStat.st_mtime_ns + 1000))
+        processImage(image, 0, cache=cache)
+        assert (cache.hits, cache.misses) == (0, 2)
+
+def test_revalidate_and_rebuild_modes(tmp_path):
+    dbFile = str(tmp_path / "cache.db")
+    image = testFiles[0]
+    with rc.ResultCache(dbFile, "test") as cache:
+        processImage(image, 0, cache=cache)
+    with rc.ResultCache(dbFile, "test", "revalidate") as cache:
+        processImage(image, 0, cache=cache)
+        assert cache.misses == 1
+    with rc.ResultCache(dbFile, "test", "rebuild") as cache:
+        cache.mode = "use"
+        assert cache.lookup(os.stat(image), 0, DEFAULT_OPTIONS) is None
+
+def test_prune(tmp_path):
+    image = str(tmp_path / "image.iso")
+    shutil.copyfile(testFiles[0], image)
+    with rc.ResultCache(str(tmp_path / "cache.db"), "test") as cache:
+        processImage(image, 0, cache=cache)
+        processImage(testFiles[0], 0, cache=cache)
+        os.remove(image)
+        assert cache.prune() == 1
+        assert cache.lookup(os.stat(testFiles[0]), 0, DEFAULT_OPTIONS) is not None
+
+def test_parallel_with_cache(tmp_path):
+    """
+    Parallel results are identical with a cold and a warm cache, and
+    cached images are not sent to the workers
+    """
+    with rc.ResultCache(str(tmp_path / "cache.db"), "test") as cache:
+        cold = [result for result, _ in
+                processImagesParallel(testFiles, 0, 2, cache=cache, windowSize=4)]
+        warm = [result for result, _ in
+                processImagesParallel(testFiles, 0, 2, FailingReader, cache=cache,
+                                      windowSize=4)]
+        assert cache.hits == len(testFiles)
+    assert cold == warm
+
+def test_checksum_options_are_part_of_key(tmp_path):
+    image = testFiles[0]
+    with rc.ResultCache(str(tmp_path / "cache.db"), "test") as cache:
+        processImage(image, 0, cache=cache)
+        options = model.AnalysisOptions(checksums=["md5"])
+        result = processImage(image, 0, cache=cache, options=options)
+        assert "md5" in result.fileInfo.checksums
+        processImage(image, 0, FailingReader, cache=cache, options=options)
+        assert (cache.hits, cache.misses) == (1, 2)
+
+def test_limits_are_part_of_key(tmp_path):
+    image = os.path.join(testFilesDir, "iso9660.iso")
+    tight = model.AnalysisOptions(limits=budgets.Limits(maxSectors=1))
+    with rc.ResultCache(str(tmp_path / "cache.db"), "test") as cache:
+        assert processImage(image, 0, cache=cache).fileSystems
+        # A result within the default limits is not served within tighter
+        # limits, within which the analysis fails
+        result = processImage(image, 0, cache=cache, options=tight)
+        assert not result.statusInfo.success
+        assert (cache.hits, cache.misses) == (0, 2)
+
+def test_reader_is_part_of_key(tmp_path):
+    image = os.path.join(testFilesDir, "iso9660.iso")
+    with rc.ResultCache(str(tmp_path / "cache.db"), "test") as cache:
+        assert processImage(image, 0, cache=cache).fileInfo.deviceInfo is None
+        assert processImage(image, 0, sr.DeviceReader, cache=cache).fileInfo.deviceInfo is not None
+        assert processImage(image, 0, sr.MMapReader, cache=cache).fileInfo.deviceInfo is None
+        # Subclasses of a reader share its results
+        processImage(image, 0, FailingReader, cache=cache)
+        assert (cache.hits, cache.misses) == (1, 3)
+
+def withoutInode(imageStat):
+    """Stat result as given by os.DirEntry.stat() on Windows"""
+    return types.SimpleNamespace(st_mode=imageStat.st_mode, st_ino=0, st_dev=0,
+                                 st_size=imageStat.st_size, st_mtime=imageStat.st_mtime,
+                                 st_mtime_ns=imageStat.st_mtime_ns)
+
+def test_images_without_inode_are_not_confused(tmp_path):
+    # Two images with the same size and modification time
+    images = [str(tmp_path / "a.iso"), str(tmp_path / "b.iso")]
+    for image, volumeIdentifier in zip(images, [b"VOLUME_A", b"VOLUME_B"]):
+        shutil.copyfile(os.path.join(testFilesDir, "iso9660.iso"), image)
+        with open(image, "r+b") as f:
+            f.seek(16 * 2048 + 40)
+            f.write(volumeIdentifier.ljust(32))
+        os.utime(image, ns=(1600000000000000000, 1600000000000000000))
+
+    with rc.ResultCache(str(tmp_path / "cache.db"), "test") as cache:
+        results = [processImage(image, 0, imageStat=withoutInode(os.stat(image)), cache=cache)
+                   for image in images]
+        volumeIdentifiers = [result.fileSystems[0].descriptors[0].volumeIdentifier
+                             for result in results]
+        assert volumeIdentifiers == ["VOLUME_A", "VOLUME_B"]
+
+        # Stat results without inode number only match the stored path
+        imageStat = withoutInode(os.stat(images[0]))
+        cache.store(imageStat, 0, os.path.abspath(images[0]), results[0])
+        assert cache.lookup(imageStat, 0, path=os.path.abspath(images[0])) == results[0]
+        assert cache.lookup(imageStat, 0, path=os.path.abspath(images[1])) is None
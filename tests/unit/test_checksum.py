@@ -0,0 +1,60 @@
+#! /usr/bin/env python3
+# pylint: disable=missing-docstring
+"""
+Tests for whole-image checksums.
+"""
+
+import os
+import glob
+import hashlib
+
+import pytest
+
+from isolyzer import checksum
+from isolyzer import model
+from isolyzer.isolyzer import processImage
+
+# Directory that contains this script
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+
+# Root dir of isolyzer repo
+ISOLYZER_DIR = os.path.split(os.path.split(SCRIPT_DIR)[0])[0]
+
+# Directory with test files
+testFilesDir = os.path.join(ISOLYZER_DIR, "testFiles")
+
+# All files in test files dir, excluding .md file
+testFiles = sorted(glob.glob(os.path.join(testFilesDir, '*.iso')))
+
+def fileDigest(fileName, algorithm):
+    with open(fileName, "rb") as f:
+        return hashlib.new(algorithm, f.read()).hexdigest()
+
+def test_parse_algorithms():
+    assert checksum.parseAlgorithms("SHA256, md5") == ["md5", "sha256"]
+    with pytest.raises(ValueError):
+        checksum.parseAlgorithms("md5,crc32")
+
+@pytest.mark.parametrize("chunkSize", [4096, 12345, checksum.CHUNK_SIZE])
+def test_checksummer_digests(chunkSize):
+    algorithms = ["md5", "sha1", "sha256"]
+    for testFile in testFiles:
+        checksummer = checksum.Checksummer(testFile, algorithms, chunkSize)
+        checksummer.start()
+        assert checksummer.digests() == [(name, fileDigest(testFile, name))
+                                         for name in algorithms]
+        assert checksummer.bytesHashed == os.path.getsize(testFile)
+
+def test_checksummer_missing_file(tmp_path):
+    checksummer = checksum.Checksummer(str(tmp_path / "missing.iso"), ["md5"])
+    checksummer.start()
+    with pytest.raises(OSError):
+        checksummer.digests()
+
+def test_process_image_checksums():
+    testFile = testFiles[0]
+    result = processImage(testFile, 0, options=model.AnalysisOptions(checksums=["md5", "sha256"]))
+    assert result.fileInfo.checksums == {"md5": fileDigest(testFile, "md5"),
+                                         "sha256": fileDigest(testFile, "sha256")}
+    # No checksums unless asked for
+    assert processImage(testFile, 0).fileInfo.checksums is None
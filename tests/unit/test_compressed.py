@@ -0,0 +1,246 @@
+#! /usr/bin/env python3
+# pylint: disable=missing-docstring
+"""
+Tests for the analysis of gzip- and xz-compressed images.
+"""
+
+import os
+import glob
+import gzip
+import lzma
+import time
+import zlib
+import random
+
+import pytest
+
+from isolyzer import budgets
+from isolyzer import isolyzer
+from isolyzer import compressed
+from isolyzer import inflate
+from isolyzer import model
+from isolyzer import perf
+
+# Directory that contains this script
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+
+# Root dir of isolyzer repo
+ISOLYZER_DIR = os.path.split(os.path.split(SCRIPT_DIR)[0])[0]
+
+# Directory with test files
+testFilesDir = os.path.join(ISOLYZER_DIR, "testFiles")
+
+# All files in test files dir, excluding .md file
+testFiles = sorted(glob.glob(os.path.join(testFilesDir, '*.iso')))
+
+@pytest.fixture(autouse=True)
+def indexDir(tmp_path, monkeypatch):
+    directory = tmp_path / "seekindex"
+    monkeypatch.setenv("ISOLYZER_INDEX_DIR", str(directory))
+    return directory
+
+def writeFile(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+    return str(path)
+
+def readFile(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+def compress(data, compression, pieces=1):
+    """Compress data as pieces concatenated gzip members or xz streams"""
+    size = -(-len(data) // pieces)
+    function = gzip.compress if compression == "gzip" else lzma.compress
+    return b"".join(function(data[i:i + size]) for i in range(0, len(data), size))
+
+def bgzip(data, pieces):
+    """Compress data as pieces gzip members with their compressed sizes in
+    the header, and an empty member at the end, like bgzip does"""
+    size = -(-len(data) // pieces)
+    members = []
+    for piece in [data[i:i + size] for i in range(0, len(data), size)] + [b""]:
+        deflater = zlib.compressobj(6, zlib.DEFLATED, -15)
+        body = deflater.compress(piece) + deflater.flush()
+        blockSize = 18 + len(body) + 8 - 1
+        members.append(b"\x1f\x8b\x08\x04" + bytes(4) + b"\x00\xff\x06\x00BC\x02\x00" +
+                       blockSize.to_bytes(2, "little") + body +
+                       zlib.crc32(piece).to_bytes(4, "little") + len(piece).to_bytes(4, "little"))
+    return b"".join(members)
+
+def randomData(size):
+    # Compressible, but not trivially so
+    generator = random.Random(42)
+    words = [bytes(generator.randrange(256) for _ in range(16)) for _ in range(64)]
+    return b"".join(generator.choice(words) for _ in range(size // 16))
+
+def withoutFileInfo(result):
+    return [model.toPlain(value) for value in result.values()[1:]]
+
+@pytest.mark.parametrize('image', testFiles)
+@pytest.mark.parametrize('suffix', ['.gz', '.xz'])
+
+def test_same_result_as_uncompressed(image, suffix, tmp_path):
+    data = readFile(image)
+    function = gzip.compress if suffix == ".gz" else lzma.compress
+    path = writeFile(tmp_path / (os.path.basename(image) + suffix), function(data))
+    expected = isolyzer.processImage(image, 0)
+    result = isolyzer.processImage(path, 0)
+    assert withoutFileInfo(result) == withoutFileInfo(expected)
+    assert result.tests.sizeActual == len(data)
+    assert result.fileInfo.fileSizeInBytes == os.path.getsize(path)
+
+@pytest.mark.parametrize('compression', ['gzip', 'xz'])
+@pytest.mark.parametrize('pieces', [1, 5])
+
+def test_random_reads(compression, pieces, tmp_path, monkeypatch):
+    # Small chunks and snapshot and checkpoint intervals, so reads cross
+    # chunks, members, blocks, snapshots and checkpoints
+    monkeypatch.setattr(compressed, "CHUNK_SIZE", 4096)
+    monkeypatch.setattr(compressed, "MAX_CACHED_CHUNKS", 8)
+    monkeypatch.setattr(compressed, "READ_BEHIND", 2)
+    monkeypatch.setattr(compressed, "SNAPSHOT_INTERVAL", 16)
+    monkeypatch.setattr(compressed, "CHECKPOINT_INTERVAL", 32768)
+    data = randomData(400000)
+    suffix = ".gz" if compression == "gzip" else ".xz"
+    path = writeFile(tmp_path / ("image.iso" + suffix), compress(data, compression, pieces))
+    generator = random.Random(1)
+    with compressed.readerFor(path) as reader:
+        assert reader.size == len(data)
+        if compression == "xz":
+            assert len(reader.points) == pieces
+        for _ in range(300):
+            offset = generator.randrange(len(data) + 100)
+            length = generator.randrange(1, 20000)
+            assert reader.read(offset, length) == data[offset:offset + length]
+
+def test_gzip_index_is_reused(tmp_path, indexDir):
+    data = randomData(200000)
+    path = writeFile(tmp_path / "image.iso.gz", compress(data, "gzip", 3))
+    with compressed.readerFor(path) as reader:
+        assert not reader.indexLoaded
+        # Members after the first are restart points
+        assert len(reader.points) == 3
+        assert reader.bytesDecompressed == len(data)
+    assert len(os.listdir(str(indexDir))) == 1
+    with compressed.readerFor(path) as reader:
+        assert reader.indexLoaded
+        assert reader.size == len(data)
+        assert len(reader.points) == 3
+        assert reader.bytesDecompressed == 0
+        assert reader.read(150000, 100) == data[150000:150100]
+    # A changed image is scanned again
+    writeFile(path, compress(data[:100000], "gzip"))
+    with compressed.readerFor(path) as reader:
+        assert not reader.indexLoaded
+        assert reader.size == 100000
+
+@pytest.mark.skipif(not inflate.available(), reason="zlib library cannot be loaded")
+
+def test_gzip_checkpoints_are_reused(tmp_path, monkeypatch):
+    monkeypatch.setattr(compressed, "CHECKPOINT_INTERVAL", 65536)
+    data = randomData(3000000)
+    path = writeFile(tmp_path / "image.iso.gz", compress(data, "gzip"))
+    with compressed.readerFor(path) as reader:
+        checkpoints = reader.checkpoints
+        assert len(checkpoints) > 4
+        assert reader.snapshots == []
+    with compressed.readerFor(path) as reader:
+        assert reader.indexLoaded
+        assert reader.checkpoints == checkpoints
+        # Reads near the end resume at the last checkpoint before them
+        assert reader.read(2900000, 5000) == data[2900000:2905000]
+        start = max(checkpoint[0] for checkpoint in checkpoints if checkpoint[0] <= 2900000)
+        assert reader.bytesDecompressed <= 2905000 + compressed.CHUNK_SIZE - start
+        assert reader.read(1000, 100) == data[1000:1100]
+
+def test_bgzip_size_from_trailers(tmp_path):
+    data = randomData(400000)
+    packed = bgzip(data, 7)
+    path = writeFile(tmp_path / "image.iso.gz", packed)
+    with compressed.readerFor(path) as reader:
+        assert reader.size == len(data)
+        assert len(reader.points) == 7
+        assert reader.bytesDecompressed == 0
+        assert reader.read(300000, 5000) == data[300000:305000]
+    # A truncated file is scanned instead
+    path = writeFile(tmp_path / "truncated.iso.gz", packed[:len(packed) // 2])
+    with compressed.readerFor(path) as reader:
+        assert 0 < reader.size < len(data)
+        assert reader.bytesDecompressed == reader.size
+
+def test_only_headers_are_decompressed(tmp_path):
+    # 1 GB of zeros after the ISO 9660 test image, in xz blocks of 8 MB
+    data = readFile(os.path.join(testFilesDir, "iso9660.iso"))
+    filters = [{"id": lzma.FILTER_LZMA2, "preset": 0}]
+    blocks = [data] + [bytes(8 * 1024 * 1024)] * 128
+    path = writeFile(tmp_path / "large.iso.xz",
+                     b"".join(lzma.compress(block, filters=filters) for block in blocks))
+    with compressed.readerFor(path) as reader:
+        size = reader.size
+        # Read the header sectors that processImage reads
+        reader.read(32768, 4096)
+        reader.read(256 * 2048, 512)
+        assert reader.bytesDecompressed < 2 * 1024 * 1024
+    result = isolyzer.processImage(path, 0)
+    assert result.tests.sizeActual == size == len(data) + 128 * 8 * 1024 * 1024
+    assert result.fileSystems[0].type == "ISO 9660"
+
+@pytest.mark.parametrize('compression', ['gzip', 'xz'])
+
+def test_truncated_file(compression, tmp_path):
+    data = readFile(os.path.join(testFilesDir, "iso9660.iso")) + randomData(300000)
+    packed = compress(data, compression)
+    suffix = ".gz" if compression == "gzip" else ".xz"
+    path = writeFile(tmp_path / ("image.iso" + suffix), packed[:len(packed) // 2])
+    result = isolyzer.processImage(path, 0)
+    assert result.statusInfo.success
+    assert 0 < result.tests.sizeActual < len(data)
+
+def test_invalid_files(tmp_path):
+    path = writeFile(tmp_path / "plain.iso.gz", readFile(testFiles[0]))
+    result = isolyzer.processImage(path, 0)
+    assert not result.statusInfo.success
+    packed = bytearray(gzip.compress(randomData(100000)))
+    packed[100:200] = bytes(100)
+    path = writeFile(tmp_path / "corrupt.iso.gz", bytes(packed))
+    result = isolyzer.processImage(path, 0)
+    assert not result.statusInfo.success
+    assert result.statusInfo.failureMessage.startswith("I/O error")
+
+def test_budget_covers_opening(tmp_path):
+    # Two gzip members, so the image is decompressed when it is opened
+    path = writeFile(tmp_path / "zeros.iso.gz", compress(bytes(32 * 1024 * 1024), "gzip", 2))
+    reader = compressed.readerFor(path)
+    budgets.Budget(limits=budgets.Limits(timeout=0)).attach(reader)
+    time.sleep(0.01)
+    with pytest.raises(budgets.BudgetExceeded):
+        reader.open()
+    assert reader.bytesDecompressed == 0
+    options = model.AnalysisOptions(limits=budgets.Limits(timeout=0.001))
+    result = isolyzer.processImage(path, 0, options=options)
+    assert result.statusInfo.failureMessage == \
+        "budget exceeded: analysis took more than 0.001 seconds"
+    assert result.tests.sizeActual is None
+    assert isolyzer.processImage(path, 0).statusInfo.success
+
+def test_budget_counts_uncompressed_sectors(tmp_path):
+    # The compressed data is exempt from the budget, and the sectors of the
+    # image are counted as if it were not compressed
+    image = os.path.join(testFilesDir, "iso9660.iso")
+    path = writeFile(tmp_path / "image.iso.gz", compress(readFile(image), "gzip", 4))
+    profiler = perf.Profiler()
+    isolyzer.processImage(image, 0, profiler=profiler)
+    sectorsRead = profiler.bytesRead // 2048
+    for maxSectors in [sectorsRead - 1, sectorsRead]:
+        options = model.AnalysisOptions(limits=budgets.Limits(maxSectors=maxSectors))
+        expected = isolyzer.processImage(image, 0, options=options)
+        result = isolyzer.processImage(path, 0, options=options)
+        assert result.statusInfo.success == expected.statusInfo.success == \
+            (maxSectors == sectorsRead)
+
+def test_suffixes():
+    assert compressed.compressionFormat("a.iso.GZ") == "gzip"
+    assert compressed.compressionFormat("a.iso.xz") == "xz"
+    assert compressed.compressionFormat("a.iso") is None
+    assert compressed.readerFor("a.iso") is None
@@ -0,0 +1,130 @@
+#! /usr/bin/env python3
+# pylint: disable=missing-docstring
+"""
+Tests for the file system detector registry.
+"""
+
+import os
+import sys
+import glob
+import subprocess
+
+import pytest
+
+from isolyzer import detect
+from isolyzer import model
+from isolyzer import perf
+from isolyzer import sectorreader as sr
+from isolyzer.isolyzer import processImage
+
+# Directory that contains this script
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+
+# Root dir of isolyzer repo
+ISOLYZER_DIR = os.path.split(os.path.split(SCRIPT_DIR)[0])[0]
+
+# Directory with test files
+testFilesDir = os.path.join(ISOLYZER_DIR, "testFiles")
+
+# All files in test files dir, excluding .md file
+testFiles = glob.glob(os.path.join(testFilesDir, '*.iso'))
+
+sys.path.insert(0, os.path.join(ISOLYZER_DIR, "benchmarks"))
+
+from synthimage import ImageBuilder
+
+MB = 1024 ** 2
+
+def detectorNames(path, reads=1):
+    with sr.PReadReader(path) as reader:
+        header = detect.readHeaderWindow(reader)
+        names = [detector.name for detector in detect.detectors
+                 if detector.matches(header, reader)]
+        # All detectors are evaluated against one read
+        assert reader.reads == reads
+    return names
+
+@pytest.mark.parametrize('name, expected', [
+    ("iso9660.iso", ["ISO 9660"]),
+    ("hfs.iso", ["Apple"]),
+    ("hfsplus.iso", ["Apple"]),
+    ("udf.iso", ["UDF"]),
+    ("iso9660_udf.iso", ["ISO 9660", "UDF"]),
+    ("iso9660_udf_hfs.iso", ["ISO 9660", "Apple", "UDF"]),
+    ("iso9660_hfs_part.iso", ["ISO 9660", "Apple"])])
+
+def test_detectors(name, expected):
+    assert detectorNames(os.path.join(testFilesDir, name)) == expected
+
+def test_high_sierra_udf(tmp_path):
+    # The Volume Recognition Sequence follows the High Sierra descriptors
+    path = ImageBuilder(4 * MB).addHighSierra().addUDF().write(str(tmp_path / "hsf_udf.img"))
+    assert detectorNames(path) == ["High Sierra", "UDF"]
+
+def test_long_descriptor_chain(tmp_path):
+    # The Volume Recognition Sequence starts beyond the header window, and
+    # is read a window (two more calls) at a time
+    path = ImageBuilder(64 * MB).addISO9660(supplementary=50).addUDF().write(
+        str(tmp_path / "chain.img"))
+    assert detectorNames(path, reads=3) == ["ISO 9660", "UDF"]
+
+@pytest.mark.parametrize('name', ["iso9660.iso", "hfs.iso", "iso9660_hfs_part.iso"])
+
+def test_one_read_without_udf(name):
+    # Images without UDF are analysed with the one read of the header window
+    profiler = perf.Profiler()
+    processImage(os.path.join(testFilesDir, name), 0, profiler=profiler)
+    assert profiler.reads == 1
+
+def test_empty_image(tmp_path):
+    path = str(tmp_path / "empty.iso")
+    open(path, "wb").close()
+    assert detectorNames(path, reads=0) == []
+    result = processImage(path, 0)
+    assert result.statusInfo.success
+    assert result.fileSystems == []
+    assert not result.tests.containsKnownFileSystem
+
+def test_parsers_load_on_match():
+    result = subprocess.run([sys.executable, "-c",
+                             "import sys; from isolyzer import isolyzer; "
+                             "isolyzer.processImage(sys.argv[1], 0); "
+                             "sys.stderr.write('\\n'.join(sys.modules))",
+                             os.path.join(testFilesDir, "hfsplus.iso")],
+                            cwd=ISOLYZER_DIR, stderr=subprocess.PIPE,
+                            universal_newlines=True, check=True)
+    modules = set(result.stderr.splitlines())
+    assert "isolyzer.apple" in modules
+    for name in ["isolyzer.iso9660", "isolyzer.hsf", "isolyzer.udf"]:
+        assert name not in modules
+
+def parseTestFileSystem(reader, offset, profiler, fields=None, budget=None):
+    data = reader.read(16384 + 8, 8)
+    return detect.Detection(model.FileSystem(type="Test"), int(data) * 2048,
+                            {"offset": offset})
+
+def test_register(tmp_path, monkeypatch):
+    monkeypatch.setattr(detect, "detectors", list(detect.detectors))
+    detect.register(detect.Detector("Test", __name__, "parseTestFileSystem", "test",
+                                    [(16384, b"TESTFS01")]), before="UDF")
+    path = ImageBuilder(4 * MB).addUDF().write(str(tmp_path / "test.img"))
+    with open(path, "r+b") as f:
+        f.seek(16384)
+        f.write(b"TESTFS0100004096")
+
+    profiler = perf.Profiler()
+    result = processImage(path, 0, profiler=profiler)
+    assert [fileSystem.type for fileSystem in result.fileSystems] == ["Test", "UDF"]
+    assert result.tests.sizeExpected == 4096 * 2048
+    assert "test" in profiler.stages
+    assert [detector.name for detector in detect.detectors][-2:] == ["Test", "UDF"]
+
+def test_results_unchanged_by_registry_order(monkeypatch):
+    # Parse callbacks are independent of each other
+    expected = {path: processImage(path, 0) for path in testFiles}
+    monkeypatch.setattr(detect, "detectors", list(reversed(detect.detectors)))
+    for path in testFiles:
+        result = processImage(path, 0)
+        assert result.tests == expected[path].tests
+        assert sorted(result.fileSystems, key=lambda fileSystem: fileSystem.type) == \
+            sorted(expected[path].fileSystems, key=lambda fileSystem: fileSystem.type)
@@ -0,0 +1,59 @@
+#! /usr/bin/env python3
+# pylint: disable=missing-docstring
+"""
+Tests for declarative descriptor layouts.
+"""
+
+import struct
+
+import pytest
+
+from isolyzer import layout
+from isolyzer import apple
+
+testLayout = layout.Layout(">", [
+    ("code", 0, "uint8"),
+    ("name", 1, "text", 5),
+    ("size", 8, "uint32both"),
+    ("blocks", 16, "uint16both"),
+    ("location", 20, "uint32le"),
+    ("flags", 24, "uint16be")
+])
+
+testData = (b"\x07ABC\x00\x01\x00\x00" + struct.pack("<I", 1234) + struct.pack(">I", 1234) +
+            struct.pack("<H", 7) + struct.pack(">H", 7) + struct.pack("<I", 99) +
+            struct.pack(">H", 513))
+
+def test_unpack():
+    assert testLayout.size == len(testData)
+    expected = [("code", 7), ("name", "ABC"), ("size", 1234), ("blocks", 7),
+                ("location", 99), ("flags", 513)]
+    assert testLayout.unpack(testData) == expected
+    assert testLayout.unpack(bytearray(testData + bytes(100))) == expected
+    assert testLayout.unpack(memoryview(testData)) == expected
+
+def test_little_endian_layout_swaps_big_endian_fields():
+    leLayout = layout.Layout("<", [("a", 0, "uint32le"), ("b", 4, "uint16be")])
+    assert leLayout.unpack(b"\x01\x00\x00\x00\x01\x02") == [("a", 1), ("b", 258)]
+
+def test_short_data_falls_back_to_per_field_unpack():
+    values = dict(testLayout.unpack(testData[:19]))
+    assert values["size"] == 1234
+    assert values["blocks"] == -9999
+    assert values["location"] == -9999
+    assert values["name"] == "ABC"
+    assert testLayout.unpack(b"") == [("code", -9999), ("name", ""), ("size", -9999),
+                                      ("blocks", -9999), ("location", -9999),
+                                      ("flags", -9999)]
+
+def test_pascal_string():
+    data = bytearray(512)
+    data[0:2] = b"BD"
+    data[36:42] = b"\x05Hello"
+    properties = apple.parseMasterDirectoryBlock(data)
+    assert properties.volumeName == "Hello"
+    assert apple.parseMasterDirectoryBlock(data[:40]).volumeName == "Hel"
+
+def test_overlapping_fields_are_rejected():
+    with pytest.raises(ValueError):
+        layout.Layout(">", [("a", 0, "uint32be"), ("b", 2, "uint16be")])
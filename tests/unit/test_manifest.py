@@ -0,0 +1,164 @@
+#! /usr/bin/env python3
+# pylint: disable=missing-docstring
+"""
+Tests for the file manifests (ISO 9660 path table and directory records).
+"""
+
+import os
+import io
+import sys
+import csv
+import json
+import struct
+
+import pytest
+
+from isolyzer import isolyzer
+from isolyzer import iso9660
+from isolyzer import manifest
+from isolyzer import sectorreader as sr
+
+# Directory that contains this script
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+
+# Root dir of isolyzer repo
+ISOLYZER_DIR = os.path.split(os.path.split(SCRIPT_DIR)[0])[0]
+
+# Directory with test files
+testFilesDir = os.path.join(ISOLYZER_DIR, "testFiles")
+
+sys.path.insert(0, os.path.join(ISOLYZER_DIR, "benchmarks"))
+
+from synthimage import ImageBuilder
+
+MB = 1024 ** 2
+
+# Test files with ISO 9660, Joliet and Rock Ridge, and with ISO 9660 and
+# Joliet only, with the extent locations of NIMBIE.JPG and README.TXT
+rockRidgeFiles = {"iso9660.iso": (31, 65), "iso9660_apple.iso": (31, 65),
+                  "iso9660_udf.iso": (274, 308)}
+jolietFiles = {"is9660_udf_imgburn.iso": (564, 598), "iso9660_roxioecc.iso": (45, 44)}
+
+def entries(path, offset=0):
+    with sr.PReadReader(path) as reader:
+        return list(manifest.iterManifest(reader, offset))
+
+def treeImage(tmp_path, directories, filesPerDirectory, size=64 * MB):
+    builder = ImageBuilder(size).addISO9660(directories=directories,
+                                               filesPerDirectory=filesPerDirectory)
+    return builder.write(str(tmp_path / "tree.img"))
+
+@pytest.mark.parametrize('name', sorted(rockRidgeFiles) + sorted(jolietFiles))
+
+def test_test_files(name):
+    result = entries(os.path.join(testFilesDir, name))
+    nimbie, readme = rockRidgeFiles.get(name) or jolietFiles[name]
+    primary = [entry for entry in result if entry.tree == "ISO 9660"]
+    joliet = [entry for entry in result if entry.tree == "Joliet"]
+    assert [(entry.path, entry.type, entry.size, entry.extentLocation) for entry in primary] == \
+        [("/NIMBIE.JPG", "file", 69424, nimbie), ("/README.TXT", "file", 37, readme)]
+    assert [(entry.path, entry.size, entry.extentLocation) for entry in joliet] == \
+        [("/nimbie.jpg", 69424, nimbie), ("/readme.txt", 37, readme)]
+    assert primary[1].recordingDateTime.startswith("2017/11/01")
+    if name in rockRidgeFiles:
+        assert [entry.rockRidgePath for entry in primary] == ["/nimbie.jpg", "/readme.txt"]
+    else:
+        assert all(entry.rockRidgePath is None for entry in primary)
+    assert all(entry.rockRidgePath is None for entry in joliet)
+
+@pytest.mark.parametrize('name', ["hfs.iso", "udf.iso", "iso9660_nopvd.iso"])
+
+def test_no_iso9660_hierarchy(name):
+    assert entries(os.path.join(testFilesDir, name)) == []
+
+def test_tree(tmp_path):
+    path = treeImage(tmp_path, 40, 100)
+    result = entries(path)
+    directories = [entry for entry in result if entry.type == "directory"]
+    files = [entry for entry in result if entry.type == "file"]
+    assert len(directories) == 40
+    assert len(files) == 4000
+    assert files[0].path == "/DIR00000/FILE00000.DAT"
+    assert files[-1].path == "/DIR00039/FILE00099.DAT"
+    # The manifest lists the same extents as the directory walk
+    with sr.PReadReader(path) as reader:
+        location, dataLength = iso9660.parseRootDirectoryRecord(reader.read(16 * 2048, 2048))
+        index = iso9660.walkDirectories(reader, location, dataLength, 2048)
+    assert {(entry.path, entry.extentLocation, entry.size) for entry in result} == \
+        {(index.path(i), index.locations[i], index.dataLengths[i]) for i in range(1, len(index))}
+
+def test_entries_are_streamed(tmp_path):
+    path = treeImage(tmp_path, 400, 100, 1024 * MB)
+    with sr.PReadReader(path) as reader:
+        iterator = manifest.iterManifest(reader)
+        next(iterator)
+        readsFirst = reader.reads
+        assert reader.bytesRead < MB
+        assert sum(1 for _ in iterator) == 400 * 101 - 1
+        # Adjacent directories are read in batches
+        assert reader.reads - readsFirst < 400 / 4
+
+def test_multi_extent_file(tmp_path):
+    path = treeImage(tmp_path, 1, 3)
+    with sr.PReadReader(path) as reader:
+        location = manifest.iterManifest(reader).__next__().extentLocation
+        extent = bytearray(reader.read(location * 2048, 2048))
+    records = list(iso9660.iterRecordPositions(extent, 2048))
+    # First two files become two extents of FILE00000.DAT
+    first, second = records[2][0], records[3][0]
+    extent[first + 25] |= iso9660.FLAG_MULTI_EXTENT
+    extent[second + 33:second + 48] = b"FILE00000.DAT;1"
+    with open(path, "r+b") as f:
+        f.seek(location * 2048)
+        f.write(extent)
+    files = [entry for entry in entries(path) if entry.type == "file"]
+    assert [entry.path for entry in files] == ["/DIR00000/FILE00000.DAT", "/DIR00000/FILE00002.DAT"]
+    assert files[0].size == 2 * files[1].size
+    assert files[0].extentLocation == records[2][2]
+
+def suspEntry(signature, data):
+    return signature + bytes([len(data) + 4, 1]) + data
+
+class BytesReader:
+    def __init__(self, data):
+        self.data = data
+
+    def read(self, offset, length):
+        return self.data[offset:offset + length]
+
+def test_rock_ridge_continuation_area():
+    # Name is split over the System Use area and a continuation area at
+    # byte 100 of block 3
+    data = bytearray(4 * 2048)
+    area = suspEntry(b"NM", b"\x00" + b"name.txt")
+    data[3 * 2048 + 100:3 * 2048 + 100 + len(area)] = area
+    continuation = struct.pack("<I4xI4xI4x", 3, 100, len(area))
+    systemUse = suspEntry(b"PX", bytes(36)) + suspEntry(b"NM", b"\x01" + b"a_") + \
+        suspEntry(b"CE", continuation)
+    reader = BytesReader(bytes(data))
+    assert iso9660.rockRidgeName(
+        manifest.systemUseEntries(reader, systemUse, 0, 2048)) == "a_name.txt"
+    # Continuation areas that point to each other are followed only so often
+    loop = suspEntry(b"CE", struct.pack("<I4xI4xI4x", 0, 0, 28))
+    reader = BytesReader(loop)
+    assert iso9660.rockRidgeName(manifest.systemUseEntries(reader, loop, 0, 2048)) is None
+
+@pytest.mark.parametrize('outputFormat', ['jsonl', 'csv'])
+
+def test_write_manifest(outputFormat, tmp_path, monkeypatch):
+    path = treeImage(tmp_path, 3, 5)
+    stdout = io.TextIOWrapper(io.BytesIO(), encoding="utf-8")
+    monkeypatch.setattr(sys, "stdout", stdout)
+    images = [os.path.join(testFilesDir, "iso9660.iso"), path,
+              os.path.join(testFilesDir, "udf.iso")]
+    isolyzer.writeManifest(images, 0, outputFormat)
+    text = stdout.buffer.getvalue().decode("utf-8")
+    if outputFormat == "jsonl":
+        rows = [json.loads(line) for line in text.splitlines()]
+    else:
+        rows = list(csv.DictReader(io.StringIO(text)))
+    assert len(rows) == 4 + 3 * 6
+    assert rows[0]["image"] == os.path.abspath(images[0])
+    assert rows[0]["rockRidgePath"] == "/nimbie.jpg"
+    assert rows[-1]["path"] == "/DIR00002/FILE00004.DAT"
+    assert str(rows[-1]["extentLocation"]).isdigit()
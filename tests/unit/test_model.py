@@ -0,0 +1,81 @@
+#! /usr/bin/env python3
+# pylint: disable=missing-docstring
+"""
+Tests for the result model.
+"""
+
+import os
+import glob
+import json
+import pickle
+
+import pytest
+
+from isolyzer import model
+from isolyzer import writers
+from isolyzer import hsf
+from isolyzer import iso9660 as iso
+from isolyzer.isolyzer import processImage
+
+# Directory that contains this script
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+
+# Root dir of isolyzer repo
+ISOLYZER_DIR = os.path.split(os.path.split(SCRIPT_DIR)[0])[0]
+
+# Directory with test files
+testFilesDir = os.path.join(ISOLYZER_DIR, "testFiles")
+
+# All files in test files dir, excluding .md file
+testFiles = sorted(glob.glob(os.path.join(testFilesDir, '*.iso')))
+
+def readSector(fileName, sector):
+    with open(os.path.join(testFilesDir, fileName), "rb") as f:
+        f.seek(2048 * sector)
+        return f.read(2048)
+
+def test_descriptor_values_are_typed():
+    pvd = iso.parsePrimaryVolumeDescriptor(readSector("iso9660.iso", 16))
+    assert isinstance(pvd, iso.PrimaryVolumeDescriptor)
+    assert pvd.volumeSpaceSize == 216
+    assert pvd.logicalBlockSize == 2048
+    assert pvd.volumeIdentifier == "ISO9660 only"
+    assert not hasattr(pvd, "__dict__")
+
+def test_repeated_fields_are_tuples():
+    data = bytearray(readSector("iso9660.iso", 16))
+    sfsvd = hsf.parseSFSVolumeDescriptor(data)
+    assert hsf.SFSVolumeDescriptor.__slots__.count("optionalPathTableLocation") == 1
+    assert len(sfsvd.optionalPathTableLocation) == 6
+    names = [name for name, _ in sfsvd.items()]
+    assert names.index("secondMandatoryPathTableLocation") > \
+        names.index("optionalPathTableLocation")
+
+def test_record_constructor():
+    tests = model.Tests(True, sizeActual=4096)
+    assert tests.containsKnownFileSystem is True
+    assert tests.sizeActual == 4096
+    assert tests.sizeExpected is None
+    assert list(tests.items()) == [("containsKnownFileSystem", True), ("sizeActual", 4096)]
+    with pytest.raises(TypeError):
+        model.StatusInfo(True, "message", "extra")
+    with pytest.raises(TypeError):
+        model.StatusInfo(unknown=1)
+
+@pytest.mark.parametrize('input', testFiles)
+
+def test_plain_and_pickle_round_trip(input):
+    result = processImage(input, 0, options=model.AnalysisOptions(checksums=["md5"]))
+    plain = json.loads(json.dumps(model.toPlain(result)))
+    assert model.fromPlain(plain) == result
+    assert pickle.loads(pickle.dumps(result)) == result
+
+@pytest.mark.parametrize('input', testFiles)
+
+def test_xml_writer_matches_element(input):
+    """
+    Serialising a record directly gives the same XML as serialising
+    the element returned by its toElement method
+    """
+    result = processImage(input, 0)
+    assert writers.prettyRecord(result) == writers.prettyXML(result.toElement())
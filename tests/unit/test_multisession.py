@@ -0,0 +1,187 @@
+#! /usr/bin/env python3
+# pylint: disable=missing-docstring
+"""
+Tests for the detection of sessions in multisession images.
+"""
+
+import os
+import io
+import sys
+import gzip
+import shutil
+
+import pytest
+from lxml import etree
+
+from isolyzer import isolyzer
+from isolyzer import model
+from isolyzer import multisession
+from isolyzer import sectorreader as sr
+
+# Directory that contains this script
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+
+# Root dir of isolyzer repo
+ISOLYZER_DIR = os.path.split(os.path.split(SCRIPT_DIR)[0])[0]
+
+# Directory with test files
+testFilesDir = os.path.join(ISOLYZER_DIR, "testFiles")
+
+xsdFile = os.path.join(ISOLYZER_DIR, "xsd/isolyzer-v-1-0.xsd")
+
+sys.path.insert(0, os.path.join(ISOLYZER_DIR, "benchmarks"))
+
+from synthimage import ImageBuilder, writeSessions
+
+MB = 1024 ** 2
+
+# Options of an analysis with session scan
+SESSIONS = model.AnalysisOptions(sessions=True)
+
+def discImage(path, gap=1000):
+    """Write image of a disc with three sessions (the first one with UDF),
+    with gap sectors between the first and the second session, and return
+    the builders of the sessions
+    """
+    first = ImageBuilder(4 * MB).addISO9660("FIRST").addUDF()
+    second = ImageBuilder(8 * MB, sessionStart=first.sectors + gap).addISO9660(
+        "SECOND", directories=2, filesPerDirectory=3)
+    third = ImageBuilder(2 * MB, sessionStart=second.sessionStart + second.sectors).addISO9660(
+        "THIRD", supplementary=1)
+    writeSessions(path, [first, second, third])
+    return first, second, third
+
+def test_later_session(tmp_path):
+    # Image of the second session of a disc, which starts at sector 21917
+    path = ImageBuilder(4 * MB, sessionStart=21917).addISO9660(
+        directories=3, filesPerDirectory=4).write(str(tmp_path / "session.iso"))
+    assert isolyzer.processImage(path, 0).tests.sizeDifferenceSectors == -21917
+    result = isolyzer.processImage(path, 0, options=SESSIONS)
+    assert result.sectorOffset == 21917
+    assert result.tests.sizeAsExpected
+    session, = result.sessions
+    assert (session.startSector, session.sectorOffset, session.volumeSpaceSize) == \
+        (0, 21917, 21917 + 2048)
+    assert session.sizeAsExpected and not session.containsUDF
+    # An offset that is given explicitly is not replaced
+    result = isolyzer.processImage(path, 21000, options=SESSIONS)
+    assert result.sectorOffset == 21000
+    assert result.tests.sizeDifferenceSectors == -917
+    assert result.sessions[0].sectorOffset == 21917
+
+def test_disc_image(tmp_path):
+    first, second, third = discImage(str(tmp_path / "disc.iso"))
+    result = isolyzer.processImage(str(tmp_path / "disc.iso"), 0, options=SESSIONS)
+    assert result.sectorOffset == 0
+    assert [(session.startSector, session.sectorOffset, session.volumeIdentifier)
+            for session in result.sessions] == \
+        [(0, 0, "FIRST"), (second.sessionStart, 0, "SECOND"), (third.sessionStart, 0, "THIRD")]
+    assert [session.containsUDF for session in result.sessions] == [True, False, False]
+    imageSize = (third.sessionStart + third.sectors) * 2048
+    assert [session.sizeExpected for session in result.sessions] == \
+        [first.sizeExpected(), third.sessionStart * 2048, imageSize]
+    assert [session.sizeAsExpected for session in result.sessions] == [False, False, True]
+    assert not any(session.smallerThanExpected for session in result.sessions)
+
+def test_sessions_without_gaps(tmp_path):
+    # Sessions that are written back to back, while their logical block
+    # numbers leave a gap
+    first = ImageBuilder(4 * MB).addISO9660("FIRST")
+    second = ImageBuilder(4 * MB, sessionStart=first.sectors + 11400).addISO9660("SECOND")
+    path = str(tmp_path / "disc.iso")
+    writeSessions(path, [first, second])
+    with open(path, "r+b") as f:
+        f.seek(second.sessionStart * 2048)
+        data = f.read()
+        f.seek(first.size)
+        f.truncate()
+        f.write(data)
+    sessions = isolyzer.processImage(path, 0, options=SESSIONS).sessions
+    assert [(session.startSector, session.sectorOffset) for session in sessions] == \
+        [(0, 0), (first.sectors, 11400)]
+    assert sessions[1].sizeAsExpected
+
+def test_image_files_are_not_sessions(tmp_path):
+    # ISO image that is stored as a file in the image, at sector 1000
+    path = ImageBuilder(8 * MB).addISO9660("OUTER").write(str(tmp_path / "outer.iso"))
+    inner = ImageBuilder(1 * MB).addISO9660("INNER").write(str(tmp_path / "inner.iso"))
+    with open(path, "r+b") as f, open(inner, "rb") as g:
+        f.seek(1000 * 2048)
+        f.write(g.read())
+    sessions = isolyzer.processImage(path, 0, options=SESSIONS).sessions
+    assert [session.volumeIdentifier for session in sessions] == ["OUTER"]
+
+@pytest.mark.parametrize('name', ["iso9660.iso", "iso9660_udf.iso", "hfs.iso"])
+
+def test_test_files(name):
+    path = os.path.join(testFilesDir, name)
+    result = isolyzer.processImage(path, 0, options=SESSIONS)
+    plain = isolyzer.processImage(path, 0)
+    assert result.tests == plain.tests
+    if name == "hfs.iso":
+        assert result.sessions == []
+    else:
+        session, = result.sessions
+        assert (session.startSector, session.sectorOffset) == (0, 0)
+        assert session.containsUDF == (name == "iso9660_udf.iso")
+
+def test_parallel_scan(tmp_path, monkeypatch):
+    monkeypatch.setattr(multisession, "SCAN_CHUNK_SIZE", 1 * MB)
+    path = str(tmp_path / "disc.iso")
+    discImage(path, gap=30000)
+    with sr.PReadReader(path) as reader:
+        serial = multisession.findSessions(reader, jobs=1)
+    with sr.PReadReader(path) as reader:
+        parallel = multisession.findSessions(reader, jobs=4)
+        # The image is read once, in whole chunks
+        assert reader.bytesRead < reader.size + 64 * 2048
+        assert reader.reads < reader.size // MB + 16
+    assert len(serial) == 3
+    assert parallel == serial
+
+def test_scan_alignment():
+    data = bytearray(10 * 2048)
+    for position in (5 * 2048 + 1, 6 * 2048, 7 * 2048 - 3, 9 * 2048):
+        data[position:position + 7] = multisession.PVD_SIGNATURE
+
+    class BytesReader(sr.SectorReader):
+        def __init__(self):
+            sr.SectorReader.__init__(self, "bytes")
+            self.fd = 0
+            self.size = len(data)
+
+        def readRaw(self, offset, length):
+            return bytes(data[offset:offset + length])
+
+    sectors = [sector for sector, _ in
+               multisession.scanSectors(BytesReader(), multisession.PVD_SIGNATURE, 0, 0, 10)]
+    assert sectors == [6, 9]
+    sectors = [sector for sector, _ in
+               multisession.scanSectors(BytesReader(), multisession.PVD_SIGNATURE, 0, 7, 9)]
+    assert sectors == []
+
+def test_compressed_image(tmp_path):
+    path = str(tmp_path / "disc.iso")
+    discImage(path)
+    with open(path, "rb") as f, gzip.open(path + ".gz", "wb") as g:
+        shutil.copyfileobj(f, g)
+    assert isolyzer.processImage(path + ".gz", 0, options=SESSIONS).sessions == \
+        isolyzer.processImage(path, 0, options=SESSIONS).sessions
+
+def test_report_validates(tmp_path, monkeypatch):
+    path = str(tmp_path / "disc.iso")
+    discImage(path)
+    stdout = io.TextIOWrapper(io.BytesIO(), encoding="utf-8")
+    monkeypatch.setattr(sys, "stdout", stdout)
+    isolyzer.processImages([path, os.path.join(testFilesDir, "hfs.iso")], 0, options=SESSIONS)
+    stdout.flush()
+    xmlschema = etree.XMLSchema(etree.parse(xsdFile))
+    document = etree.fromstring(stdout.buffer.getvalue())
+    assert xmlschema.validate(document)
+    namespace = {"i": "http://kb.nl/ns/isolyzer/v1/"}
+    assert len(document.findall("i:image/i:sessions/i:session", namespace)) == 3
+
+def test_cache_options():
+    assert isolyzer.cacheOptions(model.AnalysisOptions(["md5"], False, True)).startswith(
+        "md5;sessions;")
+    assert isolyzer.cacheOptions(model.AnalysisOptions(["md5"])).startswith("md5;limits=")
@@ -0,0 +1,51 @@
+#! /usr/bin/env python3
+# pylint: disable=missing-docstring
+"""
+Tests for isolyzer profiling.
+"""
+
+import io
+import os
+import glob
+import json
+
+from isolyzer import perf
+from isolyzer.isolyzer import processImage
+from isolyzer.isolyzer import processImages
+
+# Directory that contains this script
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+
+# Root dir of isolyzer repo
+ISOLYZER_DIR = os.path.split(os.path.split(SCRIPT_DIR)[0])[0]
+
+# Directory with test files
+testFilesDir = os.path.join(ISOLYZER_DIR, "testFiles")
+
+# All files in test files dir, excluding .md file
+testFiles = glob.glob(os.path.join(testFilesDir, '*.iso'))
+
+def test_profiler_records_stages():
+    profiler = perf.Profiler()
+    processImage(os.path.join(testFilesDir, "iso9660_udf.iso"), 0, profiler=profiler)
+    profile = profiler.toDict()
+    for stage in ["open", "detection", "apple", "iso9660", "udf", "sizeCalculation"]:
+        assert profile["stages"][stage] >= 0
+    assert profile["reads"] > 0
+    assert profile["bytesRead"] > 0
+    # At least PVD, terminator, BEA01, NSR02, TEA01 and UDF VDS descriptors
+    assert profile["descriptorsVisited"] >= 6
+
+def test_profile_sidecar(capsys):
+    sidecar = io.StringIO()
+    processImages(testFiles, 0, profileFile=sidecar)
+    capsys.readouterr()
+    records = [json.loads(line) for line in sidecar.getvalue().splitlines()]
+    assert len(records) == len(testFiles) + 1
+    for record, input in zip(records, testFiles):
+        assert record["filePath"] == os.path.abspath(input)
+        assert "serialisation" in record["stages"]
+    summary = records[-1]["summary"]
+    assert summary["images"] == len(testFiles)
+    assert summary["bytesRead"] == sum(record["bytesRead"] for record in records[:-1])
+    assert summary["imagesPerSecond"] > 0
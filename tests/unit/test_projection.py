@@ -0,0 +1,138 @@
+#! /usr/bin/env python3
+# pylint: disable=missing-docstring
+"""
+Tests for triage mode and field projection.
+"""
+
+import os
+import csv
+import glob
+import json
+
+import pytest
+
+from isolyzer import model
+from isolyzer import projection
+from isolyzer import iso9660
+from isolyzer import cache as rc
+from isolyzer.isolyzer import processImage, processImages, cacheOptions
+
+# Directory that contains this script
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+
+# Root dir of isolyzer repo
+ISOLYZER_DIR = os.path.split(os.path.split(SCRIPT_DIR)[0])[0]
+
+# Directory with test files
+testFilesDir = os.path.join(ISOLYZER_DIR, "testFiles")
+
+# All files in test files dir, excluding .md file
+testFiles = sorted(glob.glob(os.path.join(testFilesDir, '*.iso')))
+
+# Options of an analysis in triage mode
+TRIAGE = model.AnalysisOptions(fields=projection.TRIAGE_FIELDS)
+
+def test_layout_projection():
+    pvdLayout = iso9660.PrimaryVolumeDescriptor.layout
+    projected = pvdLayout.project({"volumeSpaceSize", "volumeIdentifier"})
+    # Fields keep the order of the layout
+    assert list(projected.names) == ["volumeIdentifier", "volumeSpaceSize"]
+    assert projected.positions == [pvdLayout.names.index(name) for name in projected.names]
+    # Projections are compiled once
+    assert pvdLayout.project(["volumeIdentifier", "volumeSpaceSize"]) is projected
+
+def test_descriptor_from_projection():
+    with open(os.path.join(testFilesDir, "iso9660.iso"), "rb") as f:
+        f.seek(32768)
+        data = f.read(2048)
+    full = iso9660.parsePrimaryVolumeDescriptor(data)
+    projected = iso9660.parsePrimaryVolumeDescriptor(data, {"volumeSpaceSize"})
+    assert projected.volumeSpaceSize == full.volumeSpaceSize
+    assert list(projected.items()) == [("volumeSpaceSize", full.volumeSpaceSize)]
+
+@pytest.mark.parametrize('text, expected', [
+    ("filePath,success", ["filePath", "success"]),
+    (" sizeExpected , fileSystems ,", ["sizeExpected", "fileSystems"]),
+    ("primaryVolumeDescriptor.volumeIdentifier,sectorOffset",
+     ["primaryVolumeDescriptor.volumeIdentifier", "sectorOffset"])])
+
+def test_parse_fields(text, expected):
+    assert projection.parseFields(text) == expected
+
+@pytest.mark.parametrize('text', ["", " , ", "fileSize", "primaryVolumeDescriptor",
+                                  "primaryVolumeDescriptor.size", "noDescriptor.volumeIdentifier",
+                                  "checksums"])
+
+def test_parse_fields_rejects_unknown_fields(text):
+    with pytest.raises(ValueError):
+        projection.parseFields(text)
+
+@pytest.mark.parametrize('image', testFiles)
+
+def test_triage_sizes_match_full_mode(image):
+    full = processImage(image, 0)
+    triage = processImage(image, 0, options=TRIAGE)
+    assert triage.statusInfo == full.statusInfo
+    assert triage.tests == full.tests
+    assert [fileSystem.type for fileSystem in triage.fileSystems] == \
+        [fileSystem.type for fileSystem in full.fileSystems]
+
+def test_project_result():
+    fields = ["fileName", "sizeExpected", "sectorOffset",
+              "primaryVolumeDescriptor.volumeIdentifier"]
+    image = os.path.join(testFilesDir, "iso9660_udf.iso")
+    full = processImage(image, 0)
+    result = processImage(image, 0, options=model.AnalysisOptions(fields=fields))
+    result = projection.projectResult(result, fields)
+    assert list(result.fileInfo.items()) == [("fileName", "iso9660_udf.iso")]
+    assert result.statusInfo is None
+    assert list(result.tests.items()) == [("sizeExpected", full.tests.sizeExpected)]
+    assert result.sectorOffset == 0
+    # Only descriptors with projected properties are kept
+    assert [fileSystem.type for fileSystem in result.fileSystems] == ["ISO 9660", "UDF"]
+    descriptors = result.fileSystems[0].descriptors
+    assert [descriptor.tag for descriptor in descriptors] == ["primaryVolumeDescriptor"]
+    assert descriptors[0].volumeIdentifier == full.fileSystems[0].descriptors[0].volumeIdentifier
+    assert result.fileSystems[1].descriptors == []
+
+def test_project_result_without_file_systems():
+    image = os.path.join(testFilesDir, "iso9660.iso")
+    result = projection.projectResult(processImage(image, 0), ["filePath"])
+    assert result.fileSystems is None
+    assert list(result.items()) == [("fileInfo", result.fileInfo)]
+
+def test_csv_columns(capsys):
+    fields = ["fileName", "fileSystems", "primaryVolumeDescriptor.volumeSpaceSize",
+              "smallerThanExpected"]
+    images = [os.path.join(testFilesDir, name) for name in ("iso9660.iso", "hfs.iso")]
+    processImages(images, 0, outputFormat="csv", options=model.AnalysisOptions(fields=fields))
+    rows = list(csv.reader(capsys.readouterr().out.splitlines()))
+    assert rows[0] == fields
+    full = processImage(images[0], 0)
+    assert rows[1] == ["iso9660.iso", "ISO 9660",
+                       str(full.fileSystems[0].descriptors[0].volumeSpaceSize), "False"]
+    # Properties of descriptors that are not there are empty
+    assert rows[2] == ["hfs.iso", "HFS", "", "False"]
+
+def test_anomalies_only(capsys):
+    processImages(testFiles, 0, outputFormat="jsonl", options=TRIAGE, anomaliesOnly=True)
+    lines = capsys.readouterr().out.splitlines()
+    reported = [json.loads(line)["fileInfo"]["filePath"] for line in lines]
+    expected = [os.path.abspath(image) for image in testFiles
+                if projection.isAnomaly(processImage(image, 0))]
+    assert reported == expected
+    assert os.path.abspath(os.path.join(testFilesDir, "iso9660_trunc.iso")) in reported
+    for line in lines:
+        assert sorted(json.loads(line)) == ["fileInfo", "statusInfo", "tests"]
+
+def test_cache_options_include_fields(tmp_path):
+    assert cacheOptions() == ";limits=1024,65536,1024,None;reader=pread"
+    assert cacheOptions(model.AnalysisOptions(fields=["filePath", "success"])) == \
+        ";fields=filePath,success;limits=1024,65536,1024,None;reader=pread"
+    image = os.path.join(testFilesDir, "iso9660.iso")
+    with rc.ResultCache(str(tmp_path / "cache.db"), "test") as cache:
+        triage = processImage(image, 0, cache=cache, options=TRIAGE)
+        # A projected result is not returned for a full analysis
+        full = processImage(image, 0, cache=cache)
+        assert full.fileSystems[0].descriptors[0].volumeIdentifier is not None
+        assert triage.fileSystems[0].descriptors[0].volumeIdentifier is None
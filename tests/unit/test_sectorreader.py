@@ -0,0 +1,131 @@
+#! /usr/bin/env python3
+# pylint: disable=missing-docstring
+"""
+Tests for isolyzer sector readers.
+"""
+
+import os
+import glob
+import pytest
+
+from isolyzer import sectorreader as sr
+from isolyzer.isolyzer import processImage
+
+# Directory that contains this script
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+
+# Root dir of isolyzer repo
+ISOLYZER_DIR = os.path.split(os.path.split(SCRIPT_DIR)[0])[0]
+
+# Directory with test files
+testFilesDir = os.path.join(ISOLYZER_DIR, "testFiles")
+
+# All files in test files dir, excluding .md file
+testFiles = glob.glob(os.path.join(testFilesDir, '*.iso'))
+
+readerClasses = [sr.PReadReader, sr.MMapReader]
+
+@pytest.mark.parametrize('readerClass', readerClasses)
+
+def test_read_matches_file_contents(readerClass):
+    """
+    Reads (including reads served from prefetched sectors and reads
+    past the end of the image) return the same bytes as slicing the file
+    """
+    fileIn = os.path.join(testFilesDir, "iso9660_trunc.iso")
+    with open(fileIn, "rb") as f:
+        contents = f.read()
+
+    with readerClass(fileIn) as reader:
+        assert reader.size == len(contents)
+        reader.prefetchSectors(16, 8)
+        for offset, length in [(0, 2), (32769, 5), (32768, 2048), (34000, 3000),
+                               (len(contents) - 10, 2048), (len(contents) + 10, 10)]:
+            assert reader.read(offset, length) == contents[offset:offset + length]
+
+def test_reader_counts_reads():
+    """
+    Prefetched sectors are read in one call, and reads within them
+    do not touch the image again
+    """
+    fileIn = os.path.join(testFilesDir, "iso9660.iso")
+    with sr.PReadReader(fileIn) as reader:
+        reader.prefetchSectors(16, 8)
+        assert reader.reads == 1
+        assert reader.bytesRead == 8 * 2048
+        reader.read(32769, 5)
+        reader.read(34816, 2048)
+        assert reader.reads == 1
+        reader.read(0, 2)
+        assert reader.reads == 2
+
+def test_closed_reader_raises():
+    reader = sr.PReadReader(os.path.join(testFilesDir, "iso9660.iso"))
+    with pytest.raises(IOError):
+        reader.read(0, 2)
+
+@pytest.mark.parametrize('input', testFiles)
+
+def test_readers_give_identical_results(input):
+    """
+    processImage results do not depend on the reader class
+    """
+    resultPRead = processImage(input, 0, sr.PReadReader)
+    resultMMap = processImage(input, 0, sr.MMapReader)
+    assert resultPRead == resultMMap
+
+@pytest.mark.parametrize('blockSize', [512, 2048, 4096])
+
+def test_device_reader_aligns_reads(blockSize, monkeypatch):
+    """
+    The device reader reads whole logical blocks only, and returns the
+    same bytes as slicing the file
+    """
+    fileIn = os.path.join(testFilesDir, "iso9660_trunc.iso")
+    with open(fileIn, "rb") as f:
+        contents = f.read()
+
+    reads = []
+    pread, preadv = os.pread, os.preadv
+
+    def recordPRead(fd, length, offset):
+        reads.append((offset, length))
+        return pread(fd, length, offset)
+
+    def recordPReadV(fd, buffers, offset):
+        reads.append((offset, sum(len(buffer) for buffer in buffers)))
+        return preadv(fd, buffers, offset)
+
+    monkeypatch.setattr(os, "pread", recordPRead)
+    monkeypatch.setattr(os, "preadv", recordPReadV)
+
+    with sr.DeviceReader(fileIn, blockSize) as reader:
+        assert reader.size == len(contents)
+        assert not reader.isDevice
+        assert reader.blockSize == blockSize
+        reader.prefetchSectors(16, 8)
+        for offset, length in [(0, 2), (1024, 2), (32769, 5), (34000, 3000),
+                               (len(contents) - 10, 2048), (len(contents) + 10, 10)]:
+            assert reader.read(offset, length) == contents[offset:offset + length]
+
+    assert reads
+    for offset, length in reads:
+        assert offset % blockSize == 0
+        assert length % blockSize == 0
+
+@pytest.mark.parametrize('input', testFiles)
+
+def test_device_reader_gives_identical_results(input):
+    """
+    Regular files read as devices give the same results, and report
+    their geometry
+    """
+    resultPRead = processImage(input, 0, sr.PReadReader)
+    resultDevice = processImage(input, 0, sr.DeviceReader)
+    assert resultPRead.fileInfo.deviceInfo is None
+    deviceInfo = resultDevice.fileInfo.deviceInfo
+    assert not deviceInfo.blockDevice
+    assert deviceInfo.logicalBlockSize == deviceInfo.physicalBlockSize == 512
+    assert deviceInfo.numberOfBlocks == -(-os.path.getsize(input) // 512)
+    resultDevice.fileInfo.deviceInfo = None
+    assert resultPRead == resultDevice
@@ -0,0 +1,167 @@
+#! /usr/bin/env python3
+# pylint: disable=missing-docstring
+"""
+Tests for server mode and its client.
+"""
+
+import os
+import glob
+import json
+import threading
+
+import pytest
+
+from isolyzer import client as ic
+from isolyzer import server
+from isolyzer import isolyzer
+from isolyzer import model
+
+# Directory that contains this script
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+
+# Root dir of isolyzer repo
+ISOLYZER_DIR = os.path.split(os.path.split(SCRIPT_DIR)[0])[0]
+
+# Directory with test files
+testFilesDir = os.path.join(ISOLYZER_DIR, "testFiles")
+
+# All files in test files dir, excluding .md file
+testFiles = sorted(glob.glob(os.path.join(testFilesDir, '*.iso')))
+
+@pytest.fixture(scope="module")
+def service():
+    service = server.AnalysisService(2, queueLimit=2)
+    yield service
+    service.close()
+
+def startServer(service, socketPath=None, port=None):
+    httpServer = server.createServer(service, socketPath, port)
+    thread = threading.Thread(target=httpServer.serve_forever)
+    thread.start()
+    return httpServer, thread
+
+@pytest.fixture
+def client(service, tmp_path):
+    socketPath = str(tmp_path / "isolyzer.sock")
+    httpServer, thread = startServer(service, socketPath)
+    client = ic.Client(socketPath, retries=0)
+    yield client
+    client.close()
+    httpServer.shutdown()
+    httpServer.server_close()
+    thread.join()
+
+@pytest.mark.parametrize('outputFormat', ['xml', 'json', 'jsonl', 'csv'])
+
+def test_report_matches_command_line(client, capsysbinary, outputFormat):
+    isolyzer.processImages(testFiles, 0, 1, outputFormat)
+    expected = capsysbinary.readouterr().out
+    assert client.analyse(testFiles, outputFormat=outputFormat) == expected
+
+def test_offset_and_checksums(client, capsysbinary):
+    isolyzer.processImages(testFiles[:2], 16, 1, "jsonl",
+                           options=model.AnalysisOptions(checksums=["md5", "sha256"]))
+    expected = capsysbinary.readouterr().out
+    assert client.analyse(testFiles[:2], 16, "jsonl", ["sha256", "md5"]) == expected
+
+def test_keep_alive(client):
+    for _ in range(3):
+        client.analyse(testFiles[:1], outputFormat="jsonl")
+    connection = client.connection
+    client.analyse(testFiles[:1], outputFormat="jsonl")
+    assert client.connection is connection
+
+def test_invalid_requests(client):
+    for request in [[], {}, {"paths": "a.iso"}, {"paths": ["relative.iso"]},
+                    {"paths": [testFiles[0]], "offset": "1"},
+                    {"paths": [testFiles[0]], "format": "html"},
+                    {"paths": [testFiles[0]], "checksums": ["crc64"]}]:
+        status, _, data = client.request("POST", "/analyze", json.dumps(request).encode())
+        assert status == 400
+        assert "error" in json.loads(data.decode())
+    status, _, _ = client.request("POST", "/analyze", b"{not json")
+    assert status == 400
+    status, _, _ = client.request("GET", "/unknown")
+    assert status == 404
+
+def test_missing_image(client):
+    with pytest.raises(ic.ServerError) as excinfo:
+        client.analyse([testFiles[0], os.path.join(testFilesDir, "missing.iso")])
+    assert excinfo.value.status == 404
+    assert "does not exist" in str(excinfo.value)
+
+def test_queue_limit(client, service):
+    # Fill the queue, as if two long requests were in progress
+    assert service.admit() and service.admit()
+    try:
+        status, response, _ = client.request(
+            "POST", "/analyze", json.dumps({"paths": testFiles[:1]}).encode())
+        assert status == 503
+        assert response.getheader("Retry-After") == str(server.RETRY_AFTER)
+        assert service.status()["rejected"] >= 1
+    finally:
+        service.release()
+        service.release()
+    assert client.analyse(testFiles[:1])
+
+def test_client_retries_while_busy(client, service, monkeypatch):
+    monkeypatch.setattr(ic.time, "sleep", lambda delay: service.release())
+    client.retries = 1
+    service.admit()
+    service.admit()
+    try:
+        # The first attempt is refused; the queue is freed up before the retry
+        assert client.analyse(testFiles[:1])
+    finally:
+        service.release()
+
+def test_status(client, service):
+    client.analyse(testFiles[:1])
+    status = client.status()
+    assert status["version"] == isolyzer.__version__
+    assert status["jobs"] == 2
+    assert status["active"] == 0
+    assert status["images"] >= 1
+
+def test_tcp(service):
+    httpServer, thread = startServer(service, port=0)
+    client = ic.Client(port=httpServer.server_address[1])
+    try:
+        assert client.status()["queueLimit"] == 2
+        assert client.analyse(testFiles[:1], outputFormat="csv").startswith(b"fileName,")
+    finally:
+        client.close()
+        httpServer.shutdown()
+        httpServer.server_close()
+        thread.join()
+
+def test_graceful_shutdown(tmp_path):
+    socketPath = str(tmp_path / "isolyzer.sock")
+    service = server.AnalysisService(1)
+    httpServer, thread = startServer(service, socketPath)
+    client = ic.Client(socketPath)
+    assert client.analyse(testFiles[:1])
+    server.shutdown(httpServer, service, socketPath)
+    thread.join()
+    client.close()
+    assert not os.path.exists(socketPath)
+    assert not service.admit()
+
+def test_stale_socket_is_replaced(service, tmp_path):
+    socketPath = str(tmp_path / "isolyzer.sock")
+    # A server that was killed leaves its socket file behind
+    httpServer, thread = startServer(service, socketPath)
+    httpServer.shutdown()
+    httpServer.server_close()
+    thread.join()
+    assert os.path.exists(socketPath)
+    httpServer, thread = startServer(service, socketPath)
+    try:
+        # A socket that is in use is not taken over
+        with pytest.raises(OSError):
+            server.createServer(service, socketPath)
+        assert ic.Client(socketPath).status()
+    finally:
+        httpServer.shutdown()
+        httpServer.server_close()
+        thread.join()
@@ -0,0 +1,82 @@
+#! /usr/bin/env python3
+# pylint: disable=missing-docstring
+"""
+Tests for the modules that are imported at start-up.
+"""
+
+import os
+import sys
+import argparse
+import subprocess
+
+import pytest
+
+from isolyzer import isolyzer
+from isolyzer import cache
+from isolyzer import checksum
+
+# Directory that contains this script
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+
+# Root dir of isolyzer repo
+ISOLYZER_DIR = os.path.split(os.path.split(SCRIPT_DIR)[0])[0]
+
+# Directory with test files
+testFilesDir = os.path.join(ISOLYZER_DIR, "testFiles")
+
+# Script that runs isolyzer with the arguments it is given, and writes the
+# names of all imported modules to stderr
+LIST_MODULES = """
+import sys
+sys.argv = ["isolyzer"] + sys.argv[1:]
+from isolyzer import isolyzer
+isolyzer.main()
+sys.stderr.write("\\n".join(sorted(sys.modules)))
+"""
+
+def importedModules(*args):
+    result = subprocess.run([sys.executable, "-c", LIST_MODULES] + list(args),
+                            cwd=ISOLYZER_DIR, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    return set(result.stderr.splitlines())
+
+def test_import_is_lazy():
+    result = subprocess.run([sys.executable, "-c", "import sys, isolyzer.isolyzer; "
+                             "sys.stderr.write('\\n'.join(sys.modules))"],
+                            cwd=ISOLYZER_DIR, stderr=subprocess.PIPE,
+                            universal_newlines=True, check=True)
+    modules = set(result.stderr.splitlines())
+    for name in ["argparse", "concurrent.futures", "json", "xml.etree.ElementTree",
+                 "isolyzer.iso9660", "isolyzer.udf", "isolyzer.cache", "isolyzer.checksum"]:
+        assert name not in modules
+
+@pytest.mark.parametrize('outputFormat', ['xml', 'json', 'csv'])
+
+def test_single_image_run(outputFormat):
+    modules = importedModules("-f", outputFormat, os.path.join(testFilesDir, "iso9660.iso"))
+    assert "isolyzer.iso9660" in modules
+    for name in ["concurrent.futures", "glob", "platform", "sqlite3", "hashlib",
+                 "isolyzer.cache", "isolyzer.checksum", "isolyzer.hsf", "isolyzer.apple",
+                 "isolyzer.compressed"]:
+        assert name not in modules
+    assert ("xml.etree.ElementTree" in modules) == (outputFormat == "xml")
+    assert ("json" in modules) == (outputFormat == "json")
+    assert ("csv" in modules) == (outputFormat == "csv")
+
+def test_parsers_load_on_signature():
+    modules = importedModules(os.path.join(testFilesDir, "hfs.iso"))
+    assert "isolyzer.apple" in modules
+    assert "isolyzer.iso9660" not in modules
+
+def test_command_line_lists_match_modules():
+    # Choices and help text are not taken from the (lazily imported) cache
+    # and checksum modules
+    parser = argparse.ArgumentParser()
+    sys.argv, argv = ["isolyzer"], sys.argv
+    try:
+        isolyzer.parseCommandLine(parser)
+    finally:
+        sys.argv = argv
+    actions = {action.dest: action for action in parser._actions}
+    assert actions["cacheMode"].choices == cache.CACHE_MODES
+    assert ", ".join(checksum.CHECKSUM_ALGORITHMS) in " ".join(actions["checksums"].help.split())
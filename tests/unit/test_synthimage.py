@@ -0,0 +1,131 @@
+#! /usr/bin/env python3
+# pylint: disable=missing-docstring
+"""
+Tests for the synthetic image builder and the benchmark suite comparison.
+"""
+
+import os
+import sys
+
+import pytest
+
+from isolyzer import isolyzer
+from isolyzer import perf
+
+# Directory that contains this script
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+
+# Root dir of isolyzer repo
+ISOLYZER_DIR = os.path.split(os.path.split(SCRIPT_DIR)[0])[0]
+
+sys.path.insert(0, os.path.join(ISOLYZER_DIR, "benchmarks"))
+
+import synthimage
+import bench_suite
+from synthimage import ImageBuilder
+
+MB = 1024 ** 2
+GB = 1024 ** 3
+
+builders = {
+    "iso9660": lambda: ImageBuilder(4 * GB).addISO9660(),
+    "joliet": lambda: ImageBuilder(GB).addISO9660(supplementary=1),
+    "hsf": lambda: ImageBuilder(650 * MB).addHighSierra(),
+    "udf": lambda: ImageBuilder(25 * GB).addUDF(revision=3),
+    "iso9660_udf": lambda: ImageBuilder(8 * GB).addISO9660().addUDF(),
+    "hsf_udf": lambda: ImageBuilder(GB).addHighSierra().addUDF(),
+    "hfs": lambda: ImageBuilder(GB).addHFS(),
+    "hfsplus": lambda: ImageBuilder(64 * GB).addHFSPlus(),
+    "apm": lambda: ImageBuilder(GB).addApplePartitionMap(),
+    "iso9660_apm": lambda: ImageBuilder(GB).addISO9660().addApplePartitionMap(2048),
+    "iso9660_hfs": lambda: ImageBuilder(GB).addISO9660().addHFS(),
+    "iso9660_udf_hfsplus": lambda: ImageBuilder(GB).addISO9660().addUDF().addHFSPlus(),
+    "iso9660_tree": lambda: ImageBuilder(GB).addISO9660(directories=100, filesPerDirectory=100),
+    "iso9660_udf_tree": lambda: ImageBuilder(GB).addISO9660(directories=10).addUDF(),
+    "udf_tree": lambda: ImageBuilder(GB).addUDF(directories=10, filesPerDirectory=10),
+    "udf_metadata": lambda: ImageBuilder(25 * GB).addUDF(revision=3, directories=10,
+                                                         filesPerDirectory=10, metadata=True),
+    "iso9660_udf_metadata": lambda: ImageBuilder(GB).addISO9660().addUDF(revision=3,
+                                                                        metadata=True),
+}
+
+@pytest.mark.parametrize('name', sorted(builders))
+
+def test_image_is_analysed_as_built(name, tmp_path):
+    builder = builders[name]()
+    path = builder.write(str(tmp_path / (name + ".img")))
+    # Only the structures take up space
+    assert os.stat(path).st_blocks * 512 < 4 * MB
+    result = isolyzer.processImage(path, 0)
+    assert result.statusInfo.success
+    assert [fileSystem.type for fileSystem in result.fileSystems] == builder.fileSystems()
+    assert result.tests.sizeActual == builder.size
+    assert result.tests.sizeExpected == builder.sizeExpected()
+    assert not result.tests.smallerThanExpected
+
+def test_images_are_reproducible(tmp_path):
+    first = builders["iso9660_udf_hfsplus"]().write(str(tmp_path / "first.img"))
+    second = builders["iso9660_udf_hfsplus"]().write(str(tmp_path / "second.img"))
+    with open(first, "rb") as f1, open(second, "rb") as f2:
+        assert f1.read() == f2.read()
+
+def countDescriptors(path):
+    profiler = perf.Profiler()
+    isolyzer.processImage(path, 0, profiler=profiler)
+    return profiler.descriptorsVisited
+
+def test_long_descriptor_chains(tmp_path):
+    # Primary and Supplementary Volume Descriptors, and Terminator
+    path = ImageBuilder(GB).addISO9660(supplementary=50).write(str(tmp_path / "chain.img"))
+    assert countDescriptors(path) == 52
+    # Primary, Implementation Use, Partition and Logical Volume Descriptors,
+    # and Terminating Descriptor (the Volume Recognition Sequence is matched
+    # in the header window, and is not counted)
+    path = ImageBuilder(GB).addUDF(implementationUseDescriptors=50).write(str(tmp_path / "vds.img"))
+    assert countDescriptors(path) == 54
+
+def test_large_partition_map(tmp_path):
+    path = ImageBuilder(GB).addApplePartitionMap(partitionEntries=500).write(
+        str(tmp_path / "apm.img"))
+    descriptors = isolyzer.processImage(path, 0).fileSystems[0].descriptors
+    assert sum(descriptor.tag == "applePartitionMap" for descriptor in descriptors) == 500
+
+def test_truncated_image(tmp_path):
+    builder = ImageBuilder(4 * GB).addISO9660().addUDF()
+    path = builder.write(str(tmp_path / "truncated.img"), truncate=MB)
+    result = isolyzer.processImage(path, 0)
+    assert result.tests.sizeActual == MB
+    assert result.tests.sizeExpected == builder.sizeExpected()
+    assert result.tests.smallerThanExpected
+
+def test_invalid_combinations():
+    with pytest.raises(ValueError):
+        ImageBuilder(GB).addISO9660().addHighSierra()
+    with pytest.raises(ValueError):
+        ImageBuilder(GB).addHFS().addHFSPlus()
+    with pytest.raises(ValueError):
+        # The VDS would run into the Anchor Volume Descriptor Pointer
+        ImageBuilder(GB).addUDF(implementationUseDescriptors=200).structures()
+    with pytest.raises(ValueError):
+        # The partition map would run into the ISO 9660 volume descriptors
+        ImageBuilder(GB).addISO9660().addApplePartitionMap(partitionEntries=100).structures()
+    with pytest.raises(ValueError):
+        # Both trees would start after the first anchor
+        ImageBuilder(GB).addISO9660(directories=1).addUDF(directories=1).structures()
+
+def test_parse_size():
+    assert synthimage.parseSize("650M") == 650 * MB
+    assert synthimage.parseSize("1.5g") == 3 * GB // 2
+    assert synthimage.parseSize("4096") == 4096
+
+def test_baseline_comparison(capsys):
+    baseline = {"scenarios": {"a": {"latencyP50": 1.0, "latencyP99": 2.0,
+                                    "imagesPerSecond": 100.0, "bytesReadPerImage": 20480}}}
+    same = {"a": {"latencyP50": 1.1, "latencyP99": 2.8, "imagesPerSecond": 90.0,
+                  "bytesReadPerImage": 20480}}
+    assert bench_suite.compare(baseline, same, 0.15) == []
+    worse = {"a": {"latencyP50": 1.2, "latencyP99": 2.0, "imagesPerSecond": 80.0,
+                   "bytesReadPerImage": 22528}, "b": {}}
+    assert bench_suite.compare(baseline, worse, 0.15) == [
+        ("a", "latencyP50"), ("a", "imagesPerSecond"), ("a", "bytesReadPerImage")]
+    assert "not in baseline" in capsys.readouterr().out
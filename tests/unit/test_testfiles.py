@@ -5,12 +5,16 @@ Tests on isolyzer test files.
 """
 
 import os
+import csv
 import glob
+import json
 import pytest
 from lxml import etree
 
 from isolyzer.isolyzer import processImage
 from isolyzer.isolyzer import processImages
+from isolyzer import model
+from isolyzer import projection
 
 sizeDifferenceSectors = {
 "hfs.iso":2.0,
@@ -79,22 +83,19 @@ def test_status(input):
     Tests for any internal errors based on statusInfo value
     """
     outIsolyzer = processImage(input, 0)
-    assert outIsolyzer.findtext('./statusInfo/success') == "True"
+    assert outIsolyzer.statusInfo.success is True
 
 @pytest.mark.parametrize('input', testFiles)
 
 def test_sizeDifference(input):
     """
     Tests size difference against known values
-    Note: not using findtext here, because that will fail on
-    zero values: https://github.com/python/cpython/issues/91447
     """
     fName = os.path.basename(input)
     outIsolyzer = processImage(input, 0)
     if fName in sizeDifferenceSectors.keys():
         sizeDif = sizeDifferenceSectors[fName]
-        sdElt = outIsolyzer.find('./tests/sizeDifferenceSectors')
-        assert sdElt.text == pytest.approx(sizeDif)
+        assert outIsolyzer.tests.sizeDifferenceSectors == pytest.approx(sizeDif)
 
 @pytest.mark.parametrize('input', testFiles)
 
@@ -110,8 +111,8 @@ def test_fileSystems(input):
         fsKnown = fileSystems[fName]
         # Set up list to store detected file systems
         fsDetected = []
-        for fileSystem in outIsolyzer.findall('./fileSystems/fileSystem'):
-            fsType = fileSystem.get('TYPE')
+        for fileSystem in outIsolyzer.fileSystems:
+            fsType = fileSystem.type
             # Add fs type to list of detected file systems
             fsDetected.append(fsType)
         # Test if file systems in both lists are identical
@@ -133,4 +134,99 @@ def test_xml_is_valid(capsys):
     xmlschema = etree.XMLSchema(xmlschema_doc)
     # Parse XML
     xml_doc = etree.fromstring(xmlOut.encode())
-    assert xmlschema.validate(xml_doc)
\ No newline at end of file
+    assert xmlschema.validate(xml_doc)
+
+@pytest.mark.parametrize('fields', [projection.TRIAGE_FIELDS,
+                                    ["fileName", "sectorOffset", "sizeActual", "fileSystems",
+                                     "primaryVolumeDescriptor.volumeIdentifier",
+                                     "logicalVolumeDescriptor.logicalVolumeIdentifier",
+                                     "applePartitionMap.partitionType"]])
+
+def test_projected_xml_is_valid(capsys, fields):
+    """
+    Run processImages function with a projection (as --triage and --fields
+    do) on all files in test corpus and verify resulting XML output
+    validates against XSD schema
+    """
+
+    processImages(testFiles, 0, options=model.AnalysisOptions(fields=fields))
+
+    xmlOut = capsys.readouterr().out
+    xmlschema = etree.XMLSchema(etree.parse(xsdFile))
+    xml_doc = etree.fromstring(xmlOut.encode())
+    assert xmlschema.validate(xml_doc), xmlschema.error_log
+
+@pytest.mark.parametrize('jobs', [1, 3])
+
+def test_report_closed_on_missing_image(capsys, jobs):
+    """
+    Verify a missing image in the middle of a batch leaves a well-formed
+    report with the images that precede it
+    """
+
+    images = testFiles[:2] + [os.path.join(testFilesDir, "missing.iso")] + testFiles[2:]
+    with pytest.raises(FileNotFoundError):
+        processImages(images, 0, jobs=jobs)
+    xml_doc = etree.fromstring(capsys.readouterr().out.encode())
+    assert xml_doc.tag == "{http://kb.nl/ns/isolyzer/v1/}isolyzer"
+    with pytest.raises(FileNotFoundError):
+        processImages(images, 0, outputFormat="json", jobs=jobs)
+    report = json.loads(capsys.readouterr().out)
+    assert len(report["images"]) <= 2
+
+def test_jobs_output_identical(capsys):
+    """
+    Run processImages function on all files in test corpus with
+    a pool of worker processes, and verify output is identical to
+    (and in the same order as) the output of a single-process run
+    """
+
+    processImages(testFiles, 0)
+    xmlSerial = capsys.readouterr().out
+    processImages(testFiles, 0, jobs=3)
+    xmlParallel = capsys.readouterr().out
+    assert xmlSerial == xmlParallel
+
+def test_json_output(capsys):
+    """
+    Run processImages function on all files in test corpus with JSON
+    output, and verify tests and file systems match known values
+    """
+
+    processImages(testFiles, 0, outputFormat="json")
+    report = json.loads(capsys.readouterr().out)
+    assert len(report["images"]) == len(testFiles)
+    for image in report["images"]:
+        fName = image["fileInfo"]["fileName"]
+        assert image["statusInfo"]["success"] is True
+        assert image["tests"]["sizeDifferenceSectors"] == pytest.approx(sizeDifferenceSectors[fName])
+        fsDetected = [fileSystem["TYPE"] for fileSystem in image["fileSystems"]]
+        assert set(fsDetected) == set(fileSystems[fName])
+
+def test_jsonl_output(capsys):
+    """
+    Run processImages function on all files in test corpus with JSON Lines
+    output, and verify there is one object per image, in input order
+    """
+
+    processImages(testFiles, 0, outputFormat="jsonl")
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == len(testFiles)
+    for line, input in zip(lines, testFiles):
+        image = json.loads(line)
+        assert image["fileInfo"]["fileName"] == os.path.basename(input)
+
+def test_csv_output(capsys):
+    """
+    Run processImages function on all files in test corpus with CSV
+    output, and verify flattened tests match known values
+    """
+
+    processImages(testFiles, 0, outputFormat="csv")
+    rows = list(csv.DictReader(capsys.readouterr().out.splitlines()))
+    assert len(rows) == len(testFiles)
+    for row in rows:
+        fName = row["fileName"]
+        assert float(row["sizeDifferenceSectors"]) == pytest.approx(sizeDifferenceSectors[fName])
+        fsDetected = [fsType for fsType in row["fileSystems"].split(";") if fsType]
+        assert set(fsDetected) == set(fileSystems[fName])
@@ -0,0 +1,77 @@
+#! /usr/bin/env python3
+# pylint: disable=missing-docstring
+"""
+Tests for text decoding.
+"""
+
+import unicodedata
+
+from isolyzer import iso9660
+from isolyzer import textconv
+
+def referenceRemove(string):
+    return "".join(ch for ch in string if unicodedata.category(ch)[0] != "C" or ch in "\t\n\r")
+
+def test_remove_control_characters_matches_category_lookup():
+    string = "".join(chr(i) for i in list(range(0x300)) + [0x200b, 0x2028, 0xe000, 0xfeff,
+                                                        0x10ffff, 0x1f600])
+    assert textconv.removeControlCharacters(string) == referenceRemove(string)
+
+def test_decode_text():
+    assert textconv.decodeText(b"CDROM\x00\x01   ") == "CDROM"
+    assert textconv.decodeText(bytearray(b"\xc3\xa9t\xc3\xa9 \x7f")) == "\xe9t\xe9"
+    assert textconv.decodeText(memoryview(b"bad \xff utf-8")) == "bad  utf-8"
+
+def test_cs0():
+    assert textconv.cs0ToText(b"\x08UDF Bridge\x00\x00") == "UDF Bridge"
+    assert textconv.cs0ToText(b"\x08caf\xe9") == "caf\xe9"
+    assert textconv.cs0ToText(b"\x10\x00T\x00E\x04\x14\x00") == "TEД"
+    assert textconv.cs0ToText(b"\x01abc") == ""
+    assert textconv.cs0ToText(b"") == ""
+
+def test_dstring_uses_length_byte():
+    field = bytearray(32)
+    field[0:9] = b"\x08LinuxUDF"
+    field[31] = 9
+    assert textconv.dstringToText(field) == "LinuxUDF"
+    # Characters beyond the recorded length are ignored
+    field[9:12] = b"XYZ"
+    assert textconv.dstringToText(field) == "LinuxUDF"
+    field[31] = 0
+    assert textconv.dstringToText(field) == ""
+    # Length larger than field is clamped
+    field[31] = 255
+    assert textconv.dstringToText(field[:12] + b"\xff") == "LinuxUDFXYZ"
+
+def test_ucs2():
+    assert textconv.ucs2ToText("Joliet é中 ".encode("utf-16-be")) == "Joliet é中"
+    # Odd trailing byte and unpaired surrogate are ignored
+    assert textconv.ucs2ToText(b"\x00A\xd8\x00\x00B\x00") == "AB"
+
+def test_a_and_d_characters():
+    assert textconv.isDCharacters(b"ISO9660_VOLUME   ")
+    assert not textconv.isDCharacters(b"ISO9660 VOLUME")
+    assert not textconv.isDCharacters(b"lowercase")
+    assert textconv.isACharacters(b"GENISOIMAGE (C) 1993, E.YOUNGDALE   ")
+    assert not textconv.isACharacters(b"tab\tseparated")
+    assert textconv.isDCharacters(b"") and textconv.isACharacters(b"")
+
+def test_pvd_non_conforming_identifiers():
+    pvd = bytearray(2048)
+    pvd[0:6] = b"\x01CD001"
+    pvd[8:702] = b" " * 694
+    pvd[8:13] = b"LINUX"
+    pvd[40:52] = b"VOLUME_LABEL"
+    pvd[574:589] = b"MKISOFS (C) 1.0"
+    assert iso9660.parsePrimaryVolumeDescriptor(pvd).nonConformingIdentifiers is None
+    pvd[40:52] = b"Volume label"
+    pvd[318:322] = b"ACME"
+    pvd[446:450] = b"A\tB\x00"
+    pvdInfo = iso9660.parsePrimaryVolumeDescriptor(pvd)
+    assert pvdInfo.nonConformingIdentifiers == "volumeIdentifier dataPreparerIdentifier"
+    # Only checked if it is projected
+    assert iso9660.parsePrimaryVolumeDescriptor(
+        pvd, {"volumeSpaceSize"}).nonConformingIdentifiers is None
+    assert iso9660.parsePrimaryVolumeDescriptor(
+        pvd, {"nonConformingIdentifiers"}).nonConformingIdentifiers == \
+        pvdInfo.nonConformingIdentifiers
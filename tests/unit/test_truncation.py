@@ -0,0 +1,166 @@
+#! /usr/bin/env python3
+# pylint: disable=missing-docstring
+"""
+Tests for the truncation report (ISO 9660 directory hierarchy walk).
+"""
+
+import os
+import sys
+
+import pytest
+
+from isolyzer import budgets
+from isolyzer import isolyzer
+from isolyzer import iso9660
+from isolyzer import model
+from isolyzer import perf
+from isolyzer import sectorreader as sr
+
+# Directory that contains this script
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+
+# Root dir of isolyzer repo
+ISOLYZER_DIR = os.path.split(os.path.split(SCRIPT_DIR)[0])[0]
+
+# Directory with test files
+testFilesDir = os.path.join(ISOLYZER_DIR, "testFiles")
+
+sys.path.insert(0, os.path.join(ISOLYZER_DIR, "benchmarks"))
+
+import synthimage
+from synthimage import ImageBuilder
+
+MB = 1024 ** 2
+
+# Options of an analysis with truncation report
+TRUNCATION_REPORT = model.AnalysisOptions(truncationReport=True)
+
+def fileExtents(path):
+    """Return dictionary with (location, data length) of all files in the
+    (complete) image at path, by path
+    """
+    with sr.PReadReader(path) as reader:
+        location, dataLength = iso9660.parseRootDirectoryRecord(reader.read(16 * 2048, 2048))
+        index = iso9660.walkDirectories(reader, location, dataLength, 2048)
+    return {index.path(i): (index.locations[i], index.dataLengths[i])
+            for i in range(len(index)) if not index.isDirectory[i]}
+
+@pytest.mark.parametrize('truncate', [40 * MB, 64 * MB - 4096, 3 * MB])
+
+def test_files_beyond_eof(truncate, tmp_path):
+    builder = ImageBuilder(64 * MB).addISO9660(directories=20, filesPerDirectory=50)
+    complete = builder.write(str(tmp_path / "complete.img"))
+    extents = fileExtents(complete)
+    assert len(extents) == 1000
+    expected = {path: min(location * 2048 + dataLength - truncate, dataLength)
+                for path, (location, dataLength) in extents.items()
+                if location * 2048 + dataLength > truncate}
+
+    path = builder.write(str(tmp_path / "truncated.img"), truncate=truncate)
+    report = isolyzer.processImage(path, 0, options=TRUNCATION_REPORT).truncationReport
+    assert report.directoriesWalked == 21
+    assert report.filesWalked == 1000
+    assert report.directoriesBeyondEOF == 0
+    assert {extent.path: extent.bytesBeyondEOF for extent in report.extentsBeyondEOF} == expected
+    assert report.filesBeyondEOF == len(expected)
+    assert report.bytesBeyondEOF == sum(expected.values())
+    # Reported in order of their end offsets
+    ends = [extent.extentLocation * 2048 + extent.dataLength
+            for extent in report.extentsBeyondEOF]
+    assert ends == sorted(ends)
+    assert report.highestSectorReferenced == max(
+        (location * 2048 + dataLength - 1) // 2048 for location, dataLength in extents.values())
+
+def test_directories_beyond_eof(tmp_path):
+    builder = ImageBuilder(64 * MB).addISO9660(directories=20, filesPerDirectory=50)
+    # Path tables at sectors 257 and 258, root directory at 259, and
+    # subdirectories of 2 sectors each from 260, of which 5 are complete
+    path = builder.write(str(tmp_path / "truncated.img"), truncate=270 * 2048)
+    report = isolyzer.processImage(path, 0, options=TRUNCATION_REPORT).truncationReport
+    directories = [extent.path for extent in report.extentsBeyondEOF
+                   if extent.type == "directory"]
+    assert directories[0] == "/DIR00005"
+    assert report.directoriesBeyondEOF == len(directories) == 15
+    assert report.directoriesWalked == 21
+    # Files in the missing directories are not known
+    assert report.filesWalked == 250
+    assert report.filesBeyondEOF == 250
+
+def test_only_for_truncated_images(tmp_path):
+    builder = ImageBuilder(64 * MB).addISO9660(directories=2, filesPerDirectory=2)
+    path = builder.write(str(tmp_path / "complete.img"))
+    assert isolyzer.processImage(path, 0, options=TRUNCATION_REPORT).truncationReport is None
+    path = builder.write(str(tmp_path / "truncated.img"), truncate=32 * MB)
+    assert isolyzer.processImage(path, 0).truncationReport is None
+    trunc = os.path.join(testFilesDir, "iso9660_trunc.iso")
+    report = isolyzer.processImage(trunc, 0, options=TRUNCATION_REPORT).truncationReport
+    assert [extent.path for extent in report.extentsBeyondEOF] == ["/"]
+
+def test_directories_are_read_in_batches(tmp_path):
+    builder = ImageBuilder(256 * MB).addISO9660(directories=500, filesPerDirectory=10)
+    path = builder.write(str(tmp_path / "truncated.img"), truncate=128 * MB)
+    profiler = perf.Profiler()
+    report = isolyzer.processImage(path, 0, profiler=profiler,
+                                   options=TRUNCATION_REPORT).truncationReport
+    assert report.filesWalked == 5000
+    # The root directory, and 500 directories of one sector each in batches
+    # of 64 sectors
+    complete = perf.Profiler()
+    isolyzer.processImage(path, 0, profiler=complete)
+    assert profiler.reads - complete.reads == 1 + 8
+
+def test_directory_loop(tmp_path):
+    # Root directory with a subdirectory that is the root directory itself
+    root = 20
+    records = [synthimage.directoryRecord(root, 2048, b"\x00"),
+               synthimage.directoryRecord(root, 2048, b"\x01"),
+               synthimage.directoryRecord(root, 2048, b"LOOP"),
+               synthimage.directoryRecord(root + 1, 100, b"A.TXT;1", flags=0)]
+    path = str(tmp_path / "loop.img")
+    synthimage.writeStructures(path, [(root * 2048, synthimage.directoryExtent(records))],
+                               30 * 2048)
+    with sr.PReadReader(path) as reader:
+        index = iso9660.walkDirectories(reader, root, 2048, 2048)
+    assert [index.path(i) for i in range(len(index))] == ["/", "/LOOP", "/A.TXT"]
+
+class LengthRecorder(sr.PReadReader):
+    """Reader that records the length of each read from the image"""
+    def __init__(self, filename):
+        sr.PReadReader.__init__(self, filename)
+        self.lengths = []
+
+    def readRaw(self, offset, length):
+        self.lengths.append(length)
+        return sr.PReadReader.readRaw(self, offset, length)
+
+def test_oversize_directory_is_not_read(tmp_path):
+    # Root directory with a subdirectory whose data length is corrupt
+    root = 20
+    records = [synthimage.directoryRecord(root, 2048, b"\x00"),
+               synthimage.directoryRecord(root, 2048, b"\x01"),
+               synthimage.directoryRecord(root + 1, 0xffffffff, b"HUGE")]
+    path = str(tmp_path / "huge.img")
+    synthimage.writeStructures(path, [(root * 2048, synthimage.directoryExtent(records))],
+                               20 * MB)
+    with LengthRecorder(path) as reader:
+        index = iso9660.walkDirectories(reader, root, 2048, 2048)
+        assert reader.lengths == [2048]
+    assert [index.path(i) for i in range(len(index))] == ["/", "/HUGE"]
+    with LengthRecorder(path) as reader:
+        index = iso9660.walkDirectories(reader, root + 1, 0xffffffff, 2048)
+        assert reader.lengths == []
+
+def test_truncation_report_budget(tmp_path):
+    builder = ImageBuilder(256 * MB).addISO9660(directories=500, filesPerDirectory=10)
+    path = builder.write(str(tmp_path / "truncated.img"), truncate=128 * MB)
+    complete = perf.Profiler()
+    isolyzer.processImage(path, 0, profiler=complete)
+    # The walk of the directories is charged to the same budget as the
+    # parsing of the file system
+    limits = budgets.Limits(maxSectors=complete.bytesRead // 2048 + 100)
+    options = model.AnalysisOptions(truncationReport=True, limits=limits)
+    result = isolyzer.processImage(path, 0, options=options)
+    assert not result.statusInfo.success
+    assert "sectors" in result.statusInfo.failureMessage
+    assert result.truncationReport is None
+    assert result.tests.smallerThanExpected is False
@@ -0,0 +1,120 @@
+#! /usr/bin/env python3
+# pylint: disable=missing-docstring
+"""
+Tests for the UDF file tree walk.
+"""
+
+import os
+import sys
+
+import pytest
+
+from isolyzer import isolyzer
+from isolyzer import manifest
+from isolyzer import udf
+from isolyzer import sectorreader as sr
+
+# Directory that contains this script
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+
+# Root dir of isolyzer repo
+ISOLYZER_DIR = os.path.split(os.path.split(SCRIPT_DIR)[0])[0]
+
+# Directory with test files
+testFilesDir = os.path.join(ISOLYZER_DIR, "testFiles")
+
+sys.path.insert(0, os.path.join(ISOLYZER_DIR, "benchmarks"))
+
+from synthimage import ImageBuilder
+
+GB = 1024 ** 3
+
+# Test files with a UDF file tree, with the image blocks of nimbie.jpg and
+# readme.txt
+udfFiles = {"is9660_udf_imgburn.iso": (564, 598), "iso9660_udf.iso": (274, 308),
+            "iso9660_udf_hfs.iso": (274, 308)}
+
+def walk(path):
+    with sr.PReadReader(path) as reader:
+        return list(udf.walkFileTree(reader))
+
+def treeImage(tmp_path, directories, filesPerDirectory, metadata):
+    builder = ImageBuilder(GB).addUDF(revision=3, directories=directories,
+                                      filesPerDirectory=filesPerDirectory, metadata=metadata)
+    return builder.write(str(tmp_path / "udf.img"))
+
+@pytest.mark.parametrize('name', sorted(udfFiles))
+
+def test_test_files(name):
+    path = os.path.join(testFilesDir, name)
+    entries = walk(path)
+    nimbie, readme = udfFiles[name]
+    assert [(entry.path, entry.type, entry.size, entry.extentLocation) for entry in entries] == \
+        [("/nimbie.jpg", "file", 69424, nimbie), ("/readme.txt", "file", 37, readme)]
+    assert entries[1].recordingDateTime.startswith("2017/11/01")
+    # The UDF tree follows the ISO 9660 and Joliet trees in the manifest
+    with sr.PReadReader(path) as reader:
+        trees = [entry.tree for entry in manifest.iterManifest(reader)]
+    assert trees[-2:] == ["UDF", "UDF"]
+
+@pytest.mark.parametrize('name', ["udf.iso", "iso9660.iso", "hfs.iso"])
+
+def test_no_files(name):
+    # udf.iso has an empty root directory (embedded in its File Entry)
+    assert walk(os.path.join(testFilesDir, name)) == []
+
+@pytest.mark.parametrize('metadata', [False, True])
+
+def test_tree(metadata, tmp_path):
+    path = treeImage(tmp_path, 20, 50, metadata)
+    entries = walk(path)
+    directories = [entry for entry in entries if entry.type == "directory"]
+    files = [entry for entry in entries if entry.type == "file"]
+    assert [entry.path for entry in directories] == ["/dir%05d" % i for i in range(20)]
+    assert len(files) == 1000
+    assert files[0].path == "/dir00000/file00000.dat"
+    assert files[-1].path == "/dir00019/file00049.dat"
+    # Files are spread over the partition, in the order of their paths
+    locations = [entry.extentLocation for entry in files]
+    assert locations == sorted(locations)
+    assert len(set(entry.size for entry in files)) == 1
+    assert (locations[-1] + files[-1].size // 2048) * 2048 <= GB
+    result = isolyzer.processImage(path, 0)
+    assert [fileSystem.type for fileSystem in result.fileSystems] == ["UDF"]
+
+def test_metadata_mirror(tmp_path):
+    # The Metadata File (first block of the partition) is unreadable, so the
+    # metadata partition is resolved through its mirror
+    path = treeImage(tmp_path, 2, 3, True)
+    start = ImageBuilder(GB).udfPartition()[0]
+    with open(path, "r+b") as f:
+        f.seek(start * 2048)
+        f.write(bytes(2048))
+    assert len(walk(path)) == 2 + 2 * 3
+
+def test_block_cache_is_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(udf, "MAX_CACHED_RUNS", 4)
+    path = treeImage(tmp_path, 10, 100, True)
+    with sr.PReadReader(path) as reader:
+        entries = list(udf.walkFileTree(reader))
+        # File Entries of adjacent files are read in runs
+        assert reader.reads < len(entries) / 4
+    assert len(entries) == 10 + 10 * 100
+    with sr.PReadReader(path) as reader:
+        cache = udf.BlockCache(reader, 2048)
+        for block in range(0, 100 * udf.CACHE_RUN_BLOCKS, udf.CACHE_RUN_BLOCKS):
+            cache.read(block)
+        assert len(cache.runs) == 4
+        # Reads across runs
+        assert cache.read(udf.CACHE_RUN_BLOCKS - 1, 2) == \
+            reader.read((udf.CACHE_RUN_BLOCKS - 1) * 2048, 4096)
+
+def test_allocation_descriptors():
+    # short_ad, long_ad and ext_ad; a zero length ends the list
+    shortADs = bytes.fromhex("00080000 0a000000" "00100040 14000000" "00000000 00000000")
+    assert udf.parseAllocationDescriptors(None, shortADs, 0, 3) == \
+        [(0, 3, 10, 2048), (1, 3, 20, 4096)]
+    longADs = bytes.fromhex("00080000 0a000000 0100 000000000000")
+    assert udf.parseAllocationDescriptors(None, longADs, 1, 0) == [(0, 1, 10, 2048)]
+    extADs = bytes.fromhex("00080000 00080000 00080000 0a000000 0200 0000")
+    assert udf.parseAllocationDescriptors(None, extADs, 2, 0) == [(0, 2, 10, 2048)]
@@ -0,0 +1,156 @@
+#! /usr/bin/env python3
+# pylint: disable=missing-docstring
+"""
+Tests for isolyzer input walkers.
+"""
+
+import io
+import os
+import glob
+import time
+import shutil
+import threading
+
+import pytest
+
+from isolyzer import isolyzer
+
+from isolyzer import walker
+from isolyzer import sectorreader as sr
+from isolyzer.isolyzer import processImagesParallel
+from isolyzer.isolyzer import processImagesSerial
+
+# Directory that contains this script
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+
+# Root dir of isolyzer repo
+ISOLYZER_DIR = os.path.split(os.path.split(SCRIPT_DIR)[0])[0]
+
+# Directory with test files
+testFilesDir = os.path.join(ISOLYZER_DIR, "testFiles")
+
+# All files in test files dir, excluding .md file
+testFiles = glob.glob(os.path.join(testFilesDir, '*.iso'))
+
+def makeTree(root):
+    """Create directory tree with some files"""
+    for relPath in ["a.iso", "b.txt", "sub/c.iso", "sub/deeper/d.iso", "skip/e.iso"]:
+        path = os.path.join(root, relPath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(b"x" * len(relPath))
+
+def test_walk_directory(tmp_path):
+    makeTree(str(tmp_path))
+    found = {os.path.relpath(path, str(tmp_path)): imageStat
+             for path, imageStat in walker.walkDirectory(str(tmp_path), ["*.iso"], ["skip"])}
+    assert set(found) == {"a.iso", os.path.join("sub", "c.iso"),
+                          os.path.join("sub", "deeper", "d.iso")}
+    # Stat results from the directory scan are passed on
+    for relPath, imageStat in found.items():
+        assert imageStat.st_size == len(relPath.replace(os.sep, "/"))
+
+def test_read_input_list_nul_delimited(monkeypatch):
+    monkeypatch.setattr(walker, "LIST_CHUNK_SIZE", 3)
+    stream = io.BytesIO(b"first path\0second\nname\0\0third")
+    assert list(walker.readInputList(stream)) == ["first path", "second\nname", "third"]
+
+def test_read_input_list_newline_delimited(monkeypatch):
+    monkeypatch.setattr(walker, "LIST_CHUNK_SIZE", 4)
+    stream = io.BytesIO(b"one.iso\r\ntwo.iso\n\nthree.iso\n")
+    assert list(walker.readInputList(stream)) == ["one.iso", "two.iso", "three.iso"]
+
+def test_read_input_list_first_delimiter_decides():
+    stream = io.BytesIO(b"one.iso\ntwo\0.iso\n")
+    assert list(walker.readInputList(stream)) == ["one.iso", "two\0.iso"]
+
+@pytest.mark.parametrize('delimiter', [b"\n", b"\0"])
+
+def test_input_list_from_pipe_is_streamed(delimiter):
+    """
+    The first image from a pipe is analysed while the producer is still
+    writing, before the end of the stream
+    """
+    readFd, writeFd = os.pipe()
+    firstDone = threading.Event()
+    analysedBeforeEnd = []
+
+    def produce():
+        with os.fdopen(writeFd, "wb", buffering=0) as pipe:
+            pipe.write(os.fsencode(testFiles[0]) + delimiter)
+            analysedBeforeEnd.append(firstDone.wait(10))
+            pipe.write(os.fsencode(testFiles[1]) + delimiter)
+
+    producer = threading.Thread(target=produce)
+    producer.start()
+    with os.fdopen(readFd, "rb") as stream:
+        paths = []
+        for result, _ in processImagesSerial(walker.readInputList(stream), 0):
+            paths.append(result.fileInfo.filePath)
+            firstDone.set()
+    producer.join()
+    assert analysedBeforeEnd == [True]
+    assert paths == [os.path.abspath(path) for path in testFiles[:2]]
+
+def test_expand_wildcards(tmp_path):
+    makeTree(str(tmp_path))
+    patterns = [os.path.join(str(tmp_path), "*.iso"), os.path.join(str(tmp_path), "sub", "*.iso"),
+                os.path.join(str(tmp_path), "none*.iso")]
+    found = [os.path.relpath(path, str(tmp_path)) for path in walker.expandWildcards(patterns)]
+    assert found == ["a.iso", os.path.join("sub", "c.iso")]
+    assert list(walker.expandWildcards([])) == []
+
+@pytest.mark.parametrize('arguments', [["-r", "{root}"],
+                                       ["{root}/*.iso", "{root}/sub/*.iso"]])
+
+def test_windows_wildcards(tmp_path, monkeypatch, capsys, arguments):
+    """
+    Wildcards are expanded on Windows for all positional arguments, and
+    --recursive works without any
+    """
+    makeTree(str(tmp_path))
+    monkeypatch.setattr(isolyzer.sys, "platform", "win32")
+    monkeypatch.setattr(isolyzer.sys, "argv", ["isolyzer", "-f", "jsonl"] +
+                        [argument.format(root=str(tmp_path)) for argument in arguments])
+    isolyzer.main()
+    lines = [line for line in capsys.readouterr().out.splitlines() if line]
+    assert any('"c.iso"' in line for line in lines)
+    assert any('"a.iso"' in line for line in lines)
+
+def test_parallel_lazy_input_keeps_order():
+    """
+    Images from a generator are processed in small windows by the pool,
+    and results are still reported in input order
+    """
+    images = (item for item in walker.walkInputs(testFiles * 3))
+    parallel = [result for result, _ in
+                processImagesParallel(images, 0, 2, chunkSize=2, windowSize=5)]
+    serial = [result for result, _ in processImagesSerial(testFiles * 3, 0)]
+    assert parallel == serial
+
+class SlowReader(sr.PReadReader):
+    """Reader that takes long to open images named slow.iso"""
+    def open(self, stat=None):
+        if os.path.basename(self.filename) == "slow.iso":
+            time.sleep(1)
+        return sr.PReadReader.open(self, stat)
+
+def test_parallel_results_are_bounded(tmp_path):
+    """
+    While the first image is slow, no more than two windows of images are
+    taken from the input
+    """
+    slowImage = str(tmp_path / "slow.iso")
+    shutil.copyfile(testFiles[0], slowImage)
+    taken = []
+
+    def generateImages():
+        for path in [slowImage] + testFiles * 20:
+            taken.append(path)
+            yield path
+
+    results = processImagesParallel(generateImages(), 0, 2, SlowReader, chunkSize=1,
+                                    windowSize=4)
+    next(results)
+    assert len(taken) <= 8
+    assert len(list(results)) == len(testFiles) * 20
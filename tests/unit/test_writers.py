@@ -0,0 +1,25 @@
+#! /usr/bin/env python3
+# pylint: disable=missing-docstring
+"""
+Tests for isolyzer output writers.
+"""
+
+import xml.etree.ElementTree as ET
+from xml.dom import minidom
+
+from isolyzer import writers
+
+
+def test_pretty_xml_matches_minidom():
+    """
+    Verify indented serialisation is identical to minidom's toprettyxml
+    output, including escaping of special characters and empty elements
+    """
+    root = ET.Element('fileSystem', {'TYPE': 'a&b"c<d>'})
+    for text in ['a&b<c>"d\'', 'x\r\ny\rz\tq', '', None, ' padded ', 'é中']:
+        ET.SubElement(root, 'property').text = text
+    ET.SubElement(ET.SubElement(root, 'nested'), 'property').text = '1'
+
+    xmlMinidom = minidom.parseString(ET.tostring(root, 'unicode', 'xml')).toprettyxml('    ')
+    xmlWriters = '<?xml version="1.0" ?>\n' + writers.prettyXML(root)
+    assert xmlWriters == xmlMinidom